@@ -27,14 +27,24 @@ def create_app():
     
     app = Flask(__name__, instance_relative_config=True) 
 
+    # Perfil de conexión (local / directo / pgbouncer) y pool según el entorno
+    from .conexiones import normalizar_url, opciones_motor, perfil_para
+    database_url = normalizar_url(os.environ.get('DATABASE_URL', 'sqlite:///instance/clinica.db'))
+
     # --- 1. CONFIGURACIÓN DE LA APP ---
     app.config.from_mapping(
         SECRET_KEY=os.environ.get('SECRET_KEY', os.urandom(24).hex()), 
-        SQLALCHEMY_DATABASE_URI=os.environ.get('DATABASE_URL', 'sqlite:///instance/clinica.db'), 
+        SQLALCHEMY_DATABASE_URI=database_url,
         SQLALCHEMY_TRACK_MODIFICATIONS=False,
-        SQLALCHEMY_POOL_RECYCLE=60,
-        SQLALCHEMY_POOL_SIZE=5,
-        SQLALCHEMY_ENGINE_OPTIONS={'pool_pre_ping': True},
+        DB_PERFIL=perfil_para(database_url),
+        SQLALCHEMY_ENGINE_OPTIONS=opciones_motor(database_url),
+        # Destino de las imágenes de pacientes: 'cloudinary' o 'local' (static/uploads, sin red)
+        UPLOAD_BACKEND=os.environ.get('UPLOAD_BACKEND', 'cloudinary'),
+        # Spool persistente (volumen) para subir en segundo plano; sin él se sube en la petición
+        SUBIDAS_DIR=os.environ.get('SUBIDAS_DIR'),
+        # Peticiones que se registran como lentas en el log (con sus sentencias más costosas)
+        INSTRUMENTACION_UMBRAL_MS=int(os.environ.get('INSTRUMENTACION_UMBRAL_MS', 500)),
+        INSTRUMENTACION_UMBRAL_CONSULTAS=int(os.environ.get('INSTRUMENTACION_UMBRAL_CONSULTAS', 50)),
         DEBUG=os.environ.get('FLASK_DEBUG') == '1' 
     )
 
@@ -57,6 +67,13 @@ def create_app():
         app.logger.setLevel(logging.DEBUG)
 
     app.logger.info(f"App initialized. DEBUG={app.debug}.")
+    opciones_pool = app.config['SQLALCHEMY_ENGINE_OPTIONS']
+    app.logger.info(f"DB: perfil {app.config['DB_PERFIL']}, pool_size={opciones_pool.get('pool_size', '-')}, "
+                    f"max_overflow={opciones_pool.get('max_overflow', '-')}.")
+
+    # Consultas, tiempo de BD y tamaño de respuesta por endpoint (ver /admin/metricas)
+    from .instrumentacion import instrumentar
+    instrumentar(app)
 
     # --- CORRECCIÓN CRÍTICA DE CLOUDINARY ---
     # Intentamos obtener la variable global
@@ -136,6 +153,8 @@ def create_app():
         from .routes.procedimientos import procedimientos_bp
         from .routes.api import api_bp
         from .routes.planes import planes_bp
+        from .routes.trabajos import trabajos_bp
+        from .routes.admin import admin_bp
         from clinica.routes.procedimientos_ajax import procedimientos_ajax_bp
 
 
@@ -154,11 +173,20 @@ def create_app():
         app.register_blueprint(procedimientos_bp)
         app.register_blueprint(api_bp)
         app.register_blueprint(planes_bp)
+        app.register_blueprint(trabajos_bp, url_prefix='/trabajos')
+        app.register_blueprint(admin_bp, url_prefix='/admin')
         app.register_blueprint(procedimientos_ajax_bp)
 
         @app.route('/awake')
         def awake():
             return "Render App Awake", 200
+
+    # --- 4. TAREAS PERIÓDICAS (solo en los procesos que atienden peticiones) ---
+    @app.before_request
+    def iniciar_tareas_periodicas():
+        if not app.testing:
+            from clinica.services.borrados_service import BorradoService
+            BorradoService.iniciar(app)
         
     return app
 
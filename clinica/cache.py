@@ -0,0 +1,72 @@
+# clinica/cache.py
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class CacheTTL:
+    """
+    Caché en memoria (por proceso) con tiempo de vida por entrada, segura
+    para los hilos de gunicorn (--threads). Las claves son tuplas, lo que
+    permite invalidar grupos por prefijo: ('panel', usuario_id, ...).
+
+    Cuando se llena descarta primero las entradas menos usadas.
+    """
+
+    def __init__(self, ttl=60, max_entradas=1000):
+        self.ttl = ttl
+        self.max_entradas = max_entradas
+        self._datos = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obtener(self, clave, por_defecto=None):
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is None:
+                return por_defecto
+            expira, valor = entrada
+            if expira < time.monotonic():
+                del self._datos[clave]
+                return por_defecto
+            self._datos.move_to_end(clave)
+            return valor
+
+    def guardar(self, clave, valor, ttl=None):
+        expira = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._datos[clave] = (expira, valor)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.max_entradas:
+                self._datos.popitem(last=False)
+
+    def obtener_o_calcular(self, clave, calcular, ttl=None):
+        """
+        Devuelve el valor guardado o lo calcula con `calcular()` y lo guarda.
+        El cálculo se hace fuera del lock: dos hilos pueden calcular a la vez
+        la misma clave, pero ninguno bloquea a los demás mientras consulta la BD.
+        """
+        faltante = object()
+        valor = self.obtener(clave, faltante)
+        if valor is faltante:
+            valor = calcular()
+            self.guardar(clave, valor, ttl)
+        return valor
+
+    def eliminar(self, clave):
+        with self._lock:
+            self._datos.pop(clave, None)
+
+    def eliminar_prefijo(self, prefijo):
+        """Elimina todas las claves (tuplas) que empiezan por `prefijo`."""
+        largo = len(prefijo)
+        with self._lock:
+            for clave in [c for c in self._datos if c[:largo] == prefijo]:
+                del self._datos[clave]
+
+    def limpiar(self):
+        with self._lock:
+            self._datos.clear()
+
+    def __len__(self):
+        return len(self._datos)
@@ -0,0 +1,177 @@
+# clinica/conexiones.py
+"""
+Conexión a la base de datos según el entorno.
+
+Perfiles (variable DB_PERFIL; si no se define se deduce de DATABASE_URL):
+
+- local:     SQLite de desarrollo y pruebas. Flask-SQLAlchemy elige el pool.
+- directo:   Postgres sin intermediario. Pool fijo de GUNICORN_THREADS
+             conexiones por proceso (un hilo nunca usa más de una), más
+             DB_MAX_OVERFLOW para los hilos de fondo (exportaciones, subidas,
+             borrados). Con DB_MAX_CONEXIONES se reparte ese tope entre los
+             WEB_CONCURRENCY workers para no agotar el servidor.
+- pgbouncer: Postgres detrás de pgbouncer en modo transacción. El pool lo
+             lleva pgbouncer: NullPool aquí y sin sentencias preparadas del
+             lado del servidor (psycopg2 no las usa; a psycopg 3 se le
+             desactivan).
+
+Las conexiones del pool se reciclan cada DB_POOL_RECYCLE segundos (30 min por
+defecto) en lugar de cada minuto: reconectar tras cada pausa corta añadía la
+latencia de abrir la conexión a la primera petición después de la pausa.
+"""
+
+import logging
+import os
+import time
+
+from sqlalchemy import event, exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import NullPool, QueuePool
+
+from .instrumentacion import EstadisticasPool
+
+logger = logging.getLogger(__name__)
+
+PERFILES = ('local', 'directo', 'pgbouncer')
+
+# Valores por defecto, pensados para una máquina pequeña de Fly (1 CPU compartida, 256 MB)
+HILOS_POR_DEFECTO = 8
+WORKERS_POR_DEFECTO = 1
+MAX_OVERFLOW_POR_DEFECTO = 2
+POOL_RECYCLE_POR_DEFECTO = 1800
+POOL_TIMEOUT_POR_DEFECTO = 10
+CONNECT_TIMEOUT_POR_DEFECTO = 5
+PRECALENTAR_POR_DEFECTO = 2
+
+
+class _MideEspera:
+    """Registra en EstadisticasPool cuánto tarda cada préstamo de conexión."""
+
+    def _do_get(self):
+        inicio = time.perf_counter()
+        try:
+            conexion = super()._do_get()
+        except exc.TimeoutError:
+            EstadisticasPool.registrar_espera(time.perf_counter() - inicio, agotado=True)
+            raise
+        EstadisticasPool.registrar_espera(time.perf_counter() - inicio)
+        return conexion
+
+
+class PoolMedido(_MideEspera, QueuePool):
+    """QueuePool que mide las esperas (perfil directo)."""
+
+
+class NullPoolMedido(_MideEspera, NullPool):
+    """NullPool que mide la apertura de cada conexión (perfil pgbouncer)."""
+
+
+@event.listens_for(PoolMedido, 'connect')
+@event.listens_for(NullPoolMedido, 'connect')
+def _contar_conexion(dbapi_connection, connection_record):
+    EstadisticasPool.registrar_conexion()
+
+
+def _entero(entorno, clave, defecto):
+    valor = entorno.get(clave)
+    return int(valor) if valor not in (None, '') else defecto
+
+
+def normalizar_url(url):
+    """Fly y Heroku entregan postgres://, que SQLAlchemy 2 ya no acepta."""
+    if url and url.startswith('postgres://'):
+        return 'postgresql://' + url[len('postgres://'):]
+    return url
+
+
+def perfil_para(url, entorno=None):
+    """Perfil de DB_PERFIL o, si no está definido, el que corresponde a la URL."""
+    entorno = os.environ if entorno is None else entorno
+    perfil = (entorno.get('DB_PERFIL') or '').strip().lower()
+    if perfil:
+        if perfil not in PERFILES:
+            raise ValueError(f"DB_PERFIL desconocido: {perfil!r} (opciones: {', '.join(PERFILES)})")
+        return perfil
+    return 'local' if make_url(url).get_backend_name() == 'sqlite' else 'directo'
+
+
+def tamano_pool(entorno=None):
+    """
+    (pool_size, max_overflow) por proceso. Sin DB_MAX_CONEXIONES: una conexión
+    por hilo más el desborde. Con él, el tope se divide entre los workers y el
+    desborde se recorta primero.
+    """
+    entorno = os.environ if entorno is None else entorno
+    hilos = max(_entero(entorno, 'GUNICORN_THREADS', HILOS_POR_DEFECTO), 1)
+    workers = max(_entero(entorno, 'WEB_CONCURRENCY', WORKERS_POR_DEFECTO), 1)
+    desborde = max(_entero(entorno, 'DB_MAX_OVERFLOW', MAX_OVERFLOW_POR_DEFECTO), 0)
+    maximo = _entero(entorno, 'DB_MAX_CONEXIONES', None)
+    if maximo is None:
+        return hilos, desborde
+
+    por_worker = max(maximo // workers, 1)
+    tamano = min(hilos, por_worker)
+    if tamano < hilos:
+        logger.warning(f"DB: {workers} worker(s) x {hilos} hilos no caben en DB_MAX_CONEXIONES={maximo}; "
+                       f"pool de {tamano} por worker, algunos hilos esperarán conexión.")
+    return tamano, min(desborde, por_worker - tamano)
+
+
+def opciones_motor(url, entorno=None):
+    """SQLALCHEMY_ENGINE_OPTIONS para la URL y el perfil del entorno."""
+    entorno = os.environ if entorno is None else entorno
+    perfil = perfil_para(url, entorno)
+    if perfil == 'local':
+        return {}
+
+    driver = make_url(url).get_driver_name()
+    connect_args = {'connect_timeout': _entero(entorno, 'DB_CONNECT_TIMEOUT', CONNECT_TIMEOUT_POR_DEFECTO)}
+
+    if perfil == 'pgbouncer':
+        if driver == 'psycopg':
+            # psycopg 3 prepara las sentencias repetidas; en modo transacción
+            # la siguiente transacción puede caer en otra conexión del servidor
+            connect_args['prepare_threshold'] = None
+        # Cada préstamo abre una conexión nueva contra pgbouncer: no hace falta ping
+        return {'poolclass': NullPoolMedido, 'connect_args': connect_args}
+
+    tamano, desborde = tamano_pool(entorno)
+    return {
+        'poolclass': PoolMedido,
+        'pool_size': tamano,
+        'max_overflow': desborde,
+        'pool_timeout': _entero(entorno, 'DB_POOL_TIMEOUT', POOL_TIMEOUT_POR_DEFECTO),
+        'pool_recycle': _entero(entorno, 'DB_POOL_RECYCLE', POOL_RECYCLE_POR_DEFECTO),
+        # El ping cuesta una ida y vuelta por préstamo; se puede apagar si la red es estable
+        'pool_pre_ping': entorno.get('DB_PRE_PING', '1') != '0',
+        'connect_args': connect_args,
+    }
+
+
+def precalentar_pool(app, cantidad=None):
+    """
+    Abre `cantidad` conexiones (DB_PRECALENTAR, 2 por defecto) y las devuelve
+    al pool, para que las primeras peticiones después de arrancar la máquina
+    no paguen la conexión. Se llama en cada worker de gunicorn
+    (post_worker_init); no hace nada con SQLite ni con NullPool.
+    """
+    from .extensions import db
+
+    if app.config.get('DB_PERFIL') != 'directo':
+        return 0
+    if cantidad is None:
+        cantidad = _entero(os.environ, 'DB_PRECALENTAR', PRECALENTAR_POR_DEFECTO)
+
+    with app.app_context():
+        cantidad = min(cantidad, db.engine.pool.size())
+        conexiones = []
+        try:
+            for _ in range(cantidad):
+                conexiones.append(db.engine.connect())
+        except Exception as e:
+            app.logger.warning(f"DB: no se pudo precalentar el pool ({len(conexiones)}/{cantidad}): {e}")
+        finally:
+            for conexion in conexiones:
+                conexion.close()
+    app.logger.info(f"DB: pool precalentado con {len(conexiones)} conexión(es).")
+    return len(conexiones)
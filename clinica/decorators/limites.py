@@ -3,10 +3,10 @@
 from functools import wraps
 from flask import flash, redirect, url_for, request, jsonify
 from flask_login import current_user
-from datetime import datetime
 import pytz
 from clinica.services.plan_service import PlanService
-from clinica.models import AuditoriaAcceso, db
+from clinica.models import AuditoriaAcceso
+from clinica.services.auditoria_service import AuditoriaService
 
 def verificar_limite_pacientes(f):
     """
@@ -30,19 +30,18 @@ def verificar_limite_pacientes(f):
             return redirect(url_for('main.index'))
         
         if not verificacion['puede_crear']:
-            # Registrar intento de exceder límite
-            auditoria = AuditoriaAcceso(
+            # Registrar intento de exceder límite (la petición no confirma nada: se encola ya)
+            AuditoriaService.registrar(
+                AuditoriaAcceso,
+                tras_commit=False,
                 usuario_id=current_user.id,
                 usuario_email=current_user.email,
                 tipo_accion='exceder_limite',
                 descripcion=f'Intento de crear paciente excediendo límite diario ({verificacion["limite_diario"].contador_pacientes}/{verificacion["limite_diario"].limite_actual})',
                 ip_address=request.remote_addr,
                 user_agent=request.user_agent.string,
-                recurso_tipo='paciente',
-                timestamp=datetime.utcnow()
+                recurso_tipo='paciente'
             )
-            db.session.add(auditoria)
-            db.session.commit()
             
             # Manejar según el tipo de solicitud
             if request.is_json or request.headers.get('X-Requested-With') == 'XMLHttpRequest':
@@ -67,22 +66,20 @@ def verificar_suscripcion_activa(f):
         if not current_user.is_authenticated:
             return redirect(url_for('main.login'))
         
-        # Verificar plan actual
-        plan_info = PlanService.obtener_plan_actual_usuario(current_user.id)
+        # Verificar plan actual (desde la caché de PlanService)
+        suscripcion = PlanService.obtener_estado_suscripcion(current_user.id)
         
-        if not plan_info:
+        if not suscripcion:
             flash('No tienes un plan activo. Por favor, suscríbete para continuar.', 'danger')
             return redirect(url_for('planes.mostrar_planes'))
         
-        usuario_plan = plan_info['usuario_plan']
-        
         # Verificar si el trial expiró
-        if usuario_plan.es_trial and usuario_plan.fecha_fin and usuario_plan.fecha_fin < datetime.utcnow():
+        if suscripcion.es_trial and suscripcion.vencido():
             flash('Tu periodo de prueba ha expirado. Por favor, suscríbete para continuar usando la aplicación.', 'warning')
             return redirect(url_for('planes.mostrar_planes'))
         
         # Verificar si la suscripción está vencida
-        if usuario_plan.fecha_fin and usuario_plan.fecha_fin < datetime.utcnow():
+        if suscripcion.vencido():
             flash('Tu suscripción ha expirado. Por favor, renueva tu plan.', 'warning')
             return redirect(url_for('planes.mostrar_planes'))
         
@@ -101,16 +98,14 @@ def solo_lectura_si_expirado(f):
         if not current_user.is_authenticated:
             return redirect(url_for('main.login'))
         
-        # Verificar plan actual
-        plan_info = PlanService.obtener_plan_actual_usuario(current_user.id)
+        # Verificar plan actual (desde la caché de PlanService)
+        suscripcion = PlanService.obtener_estado_suscripcion(current_user.id)
         
-        if not plan_info:
+        if not suscripcion:
             return f(*args, **kwargs)
         
-        usuario_plan = plan_info['usuario_plan']
-        
         # Si el plan expiró, solo permitir GET (lectura)
-        if usuario_plan.fecha_fin and usuario_plan.fecha_fin < datetime.utcnow():
+        if suscripcion.vencido():
             if request.method in ['POST', 'PUT', 'DELETE', 'PATCH']:
                 flash('Tu suscripción ha expirado. Solo puedes ver información. Suscríbete para editar.', 'warning')
                 return redirect(request.referrer or url_for('main.index'))
@@ -0,0 +1,256 @@
+# clinica/instrumentacion.py
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from flask import request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+_local = threading.local()
+
+# Sentencias que se muestran en el log de una petición lenta
+MAX_SENTENCIAS_LOG = 5
+# Largo máximo de cada sentencia en el log
+MAX_LARGO_SENTENCIA = 300
+
+
+class ContadorConsultas:
+    """Sentencias SQL ejecutadas dentro de un bloque contar_consultas()."""
+
+    def __init__(self):
+        self.sentencias = []
+
+    @property
+    def total(self):
+        return len(self.sentencias)
+
+
+class MetricasPeticion:
+    """Consultas y tiempo de BD de la petición en curso (una por hilo)."""
+
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.consultas = 0
+        self.tiempo_sql = 0.0
+        # Tiempo esperando una conexión del pool (o abriéndola, con NullPool)
+        self.espera_pool = 0.0
+        # sentencia -> [veces, segundos]
+        self.por_sentencia = {}
+
+    def registrar(self, sentencia, duracion):
+        self.consultas += 1
+        self.tiempo_sql += duracion
+        acumulado = self.por_sentencia.setdefault(sentencia, [0, 0.0])
+        acumulado[0] += 1
+        acumulado[1] += duracion
+
+    def principales(self, limite=MAX_SENTENCIAS_LOG):
+        """Sentencias que más tiempo sumaron: [(sentencia, veces, segundos)]."""
+        ordenadas = sorted(self.por_sentencia.items(), key=lambda item: item[1][1], reverse=True)
+        return [(sentencia, veces, segundos) for sentencia, (veces, segundos) in ordenadas[:limite]]
+
+
+class EstadisticasEndpoints:
+    """
+    Contadores agregados por endpoint desde que arrancó el proceso. Cada
+    worker de gunicorn tiene los suyos; /admin/metricas muestra los del
+    worker que atiende la consulta (incluye su pid).
+    """
+
+    _lock = threading.Lock()
+    _datos = {}
+    _desde = datetime.utcnow()
+
+    @classmethod
+    def registrar(cls, endpoint, consultas, tiempo_sql, tiempo_total, bytes_respuesta, lenta):
+        with cls._lock:
+            datos = cls._datos.get(endpoint)
+            if datos is None:
+                datos = cls._datos[endpoint] = {
+                    'peticiones': 0, 'lentas': 0, 'consultas': 0, 'consultas_max': 0,
+                    'tiempo_sql': 0.0, 'tiempo_total': 0.0, 'tiempo_max': 0.0, 'bytes': 0,
+                }
+            datos['peticiones'] += 1
+            datos['lentas'] += int(lenta)
+            datos['consultas'] += consultas
+            datos['consultas_max'] = max(datos['consultas_max'], consultas)
+            datos['tiempo_sql'] += tiempo_sql
+            datos['tiempo_total'] += tiempo_total
+            datos['tiempo_max'] = max(datos['tiempo_max'], tiempo_total)
+            datos['bytes'] += bytes_respuesta or 0
+
+    @classmethod
+    def resumen(cls):
+        """Lista por endpoint con promedios, ordenada por tiempo total acumulado."""
+        with cls._lock:
+            copia = {endpoint: dict(datos) for endpoint, datos in cls._datos.items()}
+        filas = []
+        for endpoint, datos in copia.items():
+            n = datos['peticiones']
+            filas.append({
+                'endpoint': endpoint,
+                'peticiones': n,
+                'lentas': datos['lentas'],
+                'consultas_promedio': round(datos['consultas'] / n, 1),
+                'consultas_max': datos['consultas_max'],
+                'sql_ms_promedio': round(datos['tiempo_sql'] * 1000 / n, 1),
+                'total_ms_promedio': round(datos['tiempo_total'] * 1000 / n, 1),
+                'total_ms_max': round(datos['tiempo_max'] * 1000, 1),
+                'bytes_promedio': datos['bytes'] // n,
+                'total_s': round(datos['tiempo_total'], 3),
+            })
+        filas.sort(key=lambda fila: fila['total_s'], reverse=True)
+        return {'desde': cls._desde.isoformat(), 'pid': os.getpid(), 'endpoints': filas}
+
+    @classmethod
+    def reiniciar(cls):
+        with cls._lock:
+            cls._datos = {}
+            cls._desde = datetime.utcnow()
+
+
+class EstadisticasPool:
+    """
+    Esperas al pedir una conexión al pool desde que arrancó el proceso (las
+    registran los pools de clinica.conexiones). Si el promedio sube o
+    aparecen agotamientos, hay más hilos que conexiones: ver DB_MAX_CONEXIONES
+    y GUNICORN_THREADS.
+    """
+
+    _lock = threading.Lock()
+    _datos = {'esperas': 0, 'espera_total': 0.0, 'espera_max': 0.0, 'agotados': 0, 'conexiones_nuevas': 0}
+
+    @classmethod
+    def registrar_espera(cls, segundos, agotado=False):
+        metricas = getattr(_local, 'peticion', None)
+        if metricas is not None:
+            metricas.espera_pool += segundos
+        with cls._lock:
+            datos = cls._datos
+            datos['esperas'] += 1
+            datos['espera_total'] += segundos
+            datos['espera_max'] = max(datos['espera_max'], segundos)
+            datos['agotados'] += int(agotado)
+
+    @classmethod
+    def registrar_conexion(cls):
+        with cls._lock:
+            cls._datos['conexiones_nuevas'] += 1
+
+    @classmethod
+    def resumen(cls, pool=None):
+        """Esperas acumuladas y, si se pasa el pool, su ocupación actual."""
+        with cls._lock:
+            datos = dict(cls._datos)
+        n = datos['esperas']
+        resumen = {
+            'esperas': n,
+            'espera_ms_promedio': round(datos['espera_total'] * 1000 / n, 2) if n else 0.0,
+            'espera_ms_max': round(datos['espera_max'] * 1000, 2),
+            'agotados': datos['agotados'],
+            'conexiones_nuevas': datos['conexiones_nuevas'],
+        }
+        if pool is not None:
+            resumen['clase'] = type(pool).__name__
+            # Solo los pools con cola (QueuePool) llevan ocupación
+            if hasattr(pool, 'checkedout'):
+                resumen.update({'tamano': pool.size(), 'en_uso': pool.checkedout(),
+                                'libres': pool.checkedin(), 'desborde': max(pool.overflow(), 0)})
+        return resumen
+
+    @classmethod
+    def reiniciar(cls):
+        with cls._lock:
+            cls._datos = {clave: type(valor)() for clave, valor in cls._datos.items()}
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _registrar_sentencia(conn, cursor, statement, parameters, context, executemany):
+    for contador in getattr(_local, 'contadores', ()):
+        contador.sentencias.append(statement)
+    if context is not None and getattr(_local, 'peticion', None) is not None:
+        context._inicio_instrumentacion = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _medir_sentencia(conn, cursor, statement, parameters, context, executemany):
+    metricas = getattr(_local, 'peticion', None)
+    inicio = getattr(context, '_inicio_instrumentacion', None)
+    if metricas is None or inicio is None:
+        return
+    metricas.registrar(statement, time.perf_counter() - inicio)
+
+
+@contextmanager
+def contar_consultas():
+    """
+    Cuenta las sentencias SQL que ejecuta este hilo dentro del bloque:
+
+        with contar_consultas() as consultas:
+            ...
+        assert consultas.total <= 2
+
+    Los bloques se pueden anidar; cada uno ve solo sus propias sentencias.
+    """
+    contador = ContadorConsultas()
+    pila = _local.__dict__.setdefault('contadores', [])
+    pila.append(contador)
+    try:
+        yield contador
+    finally:
+        pila.remove(contador)
+
+
+def instrumentar(app):
+    """
+    Mide cada petición: consultas SQL, tiempo en la BD, tiempo total y tamaño
+    de la respuesta, agregados por endpoint (EstadisticasEndpoints). Las
+    peticiones que superan INSTRUMENTACION_UMBRAL_MS o
+    INSTRUMENTACION_UMBRAL_CONSULTAS se registran en el log con sus
+    sentencias más costosas. Se desactiva con INSTRUMENTACION=False.
+    """
+    if not app.config.get('INSTRUMENTACION', True):
+        return
+
+    @app.before_request
+    def _iniciar_medicion():
+        _local.peticion = MetricasPeticion()
+
+    @app.after_request
+    def _cerrar_medicion(response):
+        metricas = getattr(_local, 'peticion', None)
+        if metricas is None:
+            return response
+        _local.peticion = None
+
+        tiempo_total = time.perf_counter() - metricas.inicio
+        umbral_ms = app.config.get('INSTRUMENTACION_UMBRAL_MS', 500)
+        umbral_consultas = app.config.get('INSTRUMENTACION_UMBRAL_CONSULTAS', 50)
+        lenta = tiempo_total * 1000 >= umbral_ms or metricas.consultas >= umbral_consultas
+        endpoint = request.endpoint or 'desconocido'
+        # Respuestas en streaming (exportaciones) no tienen largo conocido
+        tamano = None if response.is_streamed else response.calculate_content_length()
+
+        EstadisticasEndpoints.registrar(endpoint, metricas.consultas, metricas.tiempo_sql,
+                                        tiempo_total, tamano, lenta)
+        if lenta:
+            detalle = '\n'.join(
+                f"    {veces}x {segundos * 1000:.1f} ms  {' '.join(sentencia.split())[:MAX_LARGO_SENTENCIA]}"
+                for sentencia, veces, segundos in metricas.principales()
+            )
+            app.logger.warning(
+                f"PETICION_LENTA: {request.method} {request.path} ({endpoint}) -> {response.status_code} "
+                f"en {tiempo_total * 1000:.0f} ms; {metricas.consultas} consultas, "
+                f"{metricas.tiempo_sql * 1000:.0f} ms en SQL, {metricas.espera_pool * 1000:.0f} ms esperando "
+                f"conexión, {tamano or '?'} bytes\n{detalle}"
+            )
+        return response
+
+    @app.teardown_request
+    def _descartar_medicion(exc):
+        # Si la petición terminó en una excepción no manejada no pasa por after_request
+        _local.peticion = None
@@ -1,10 +1,17 @@
 from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime, date
+from sqlalchemy import event, inspect
+from datetime import datetime, date, timedelta
 from flask_login import UserMixin 
 from werkzeug.security import generate_password_hash, check_password_hash
 from .extensions import db
 import pytz
 
+# Condición de los índices parciales: solo filas fuera de la papelera, que es
+# lo que filtran todas las pantallas (SQLite guarda los booleanos como 0/1)
+SOLO_ACTIVOS_PG = db.text('is_deleted = false')
+SOLO_ACTIVOS_SQLITE = db.text('is_deleted = 0')
+
+
 class Paciente(db.Model):
     __tablename__ = 'paciente'
 
@@ -59,6 +66,9 @@ class Paciente(db.Model):
     imagen_1 = db.Column(db.String(200), nullable=True)
     imagen_2 = db.Column(db.String(200), nullable=True)
     dentigrama_canvas = db.Column(db.String(255), nullable=True)
+    # Estado estructurado del odontograma (ver DentigramaService) y su hash de contenido
+    dentigrama_estado = db.Column(db.JSON, nullable=True)
+    dentigrama_hash = db.Column(db.String(64), nullable=True)
     imagen_perfil_url = db.Column(db.String(255), nullable=True)
     odontologo_id = db.Column(db.Integer, db.ForeignKey('usuarios.id'), nullable=False)
     is_deleted = db.Column(db.Boolean, default=False, nullable=False, index=True)
@@ -82,10 +92,29 @@ class Paciente(db.Model):
     tipo_documento_rips = db.Column(db.String(2), nullable=True)  # CC, TI, RC, CE, PA
     genero_rips = db.Column(db.String(1), nullable=True)  # M, F
     tipo_vinculacion_rips = db.Column(db.String(1), nullable=True)  # C, S, P, O
+
+    # --- Campo de búsqueda (se calcula automáticamente) ---
+    # Nombres + apellidos + documento en minúsculas y sin tildes. En PostgreSQL
+    # tiene un índice trigram (pg_trgm) para que el ILIKE '%...%' no recorra la tabla.
+    busqueda_normalizada = db.Column(db.String(300), nullable=True)
     
     # --- RELACIONES ORIGINALES ---
     odontologo = db.relationship('Usuario', back_populates='pacientes')
     evoluciones = db.relationship('Evolucion', backref='paciente', lazy='dynamic')
+
+    # Índices de búsqueda (en SQLite se crean como índices normales)
+    __table_args__ = (
+        # Lista de pacientes (keyset por id) y selector (por apellidos) de cada odontólogo
+        db.Index('idx_paciente_odontologo_activos', 'odontologo_id', 'id',
+                 postgresql_where=SOLO_ACTIVOS_PG, sqlite_where=SOLO_ACTIVOS_SQLITE),
+        db.Index('idx_paciente_odontologo_apellidos', 'odontologo_id', 'apellidos', 'nombres',
+                 postgresql_where=SOLO_ACTIVOS_PG, sqlite_where=SOLO_ACTIVOS_SQLITE),
+        db.Index('idx_paciente_busqueda_trgm', 'busqueda_normalizada',
+                 postgresql_using='gin',
+                 postgresql_ops={'busqueda_normalizada': 'gin_trgm_ops'}),
+        db.Index('idx_paciente_documento_prefijo', 'documento',
+                 postgresql_ops={'documento': 'varchar_pattern_ops'}),
+    )
     
     # ============================================================
     # MÉTODOS HELPER PARA CONVERTIR A FORMATO RIPS
@@ -145,6 +174,19 @@ class Paciente(db.Model):
         self.genero_rips = self.get_genero_rips()
         self.tipo_vinculacion_rips = self.get_tipo_vinculacion_rips()
 
+    def actualizar_busqueda_normalizada(self):
+        """Recalcula el campo de búsqueda a partir de nombres, apellidos y documento."""
+        from .utils import normalizar_texto
+        partes = [self.nombres, self.apellidos, self.documento]
+        self.busqueda_normalizada = normalizar_texto(' '.join(p for p in partes if p))[:300]
+
+
+@event.listens_for(Paciente, 'before_insert')
+@event.listens_for(Paciente, 'before_update')
+def _sincronizar_busqueda_paciente(mapper, connection, paciente):
+    """Mantiene busqueda_normalizada al día en cualquier ruta que guarde pacientes."""
+    paciente.actualizar_busqueda_normalizada()
+
 
 class Evolucion(db.Model):
     __tablename__ = 'evolucion'
@@ -154,9 +196,30 @@ class Evolucion(db.Model):
     fecha = db.Column(db.DateTime, nullable=False)
     paciente_id = db.Column(db.Integer, db.ForeignKey('paciente.id'), nullable=False)        
 
+    # Perfil del paciente: evoluciones de un paciente ordenadas por fecha
+    __table_args__ = (
+        db.Index('idx_evolucion_paciente_fecha', 'paciente_id', 'fecha'),
+    )
+
 
 class Cita(db.Model):
     __tablename__ = 'cita'
+    __table_args__ = (
+        # El calendario filtra por rango de fechas y ordena por (fecha, hora)
+        db.Index('idx_cita_fecha_hora', 'fecha', 'hora'),
+        # Historial y resumen del paciente (última / próxima cita)
+        db.Index('idx_cita_paciente_fecha', 'paciente_id', 'fecha', 'hora',
+                 postgresql_where=SOLO_ACTIVOS_PG, sqlite_where=SOLO_ACTIVOS_SQLITE),
+        # Agenda de la semana del odontólogo en el panel
+        db.Index('idx_cita_odontologo_fecha', 'odontologo_id', 'fecha', 'hora',
+                 postgresql_where=SOLO_ACTIVOS_PG, sqlite_where=SOLO_ACTIVOS_SQLITE),
+        # Citas por facturar de un paciente (factura_id IS NULL)
+        db.Index('idx_cita_paciente_sin_factura', 'paciente_id',
+                 postgresql_where=db.text('factura_id IS NULL AND is_deleted = false'),
+                 sqlite_where=db.text('factura_id IS NULL AND is_deleted = 0')),
+        # Citas de una factura (ingresos, RIPS)
+        db.Index('idx_cita_factura', 'factura_id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     
@@ -171,13 +234,19 @@ class Cita(db.Model):
     hora = db.Column(db.Time, nullable=False)
     motivo = db.Column(db.String(255), nullable=True)
     doctor = db.Column(db.String(100), nullable=False)
-    odontologo_id = db.Column(db.Integer, db.ForeignKey('usuarios.id'), nullable=True)
+    # Dueño de la cita: el odontólogo del paciente o, sin paciente registrado,
+    # quien la creó. Lo mantiene _asignar_odontologo_cita; las agendas filtran por aquí
+    odontologo_id = db.Column(db.Integer, db.ForeignKey('usuarios.id'), nullable=False)
     odontologo = db.relationship('Usuario', backref='citas')
     observaciones = db.Column(db.Text, nullable=True)
     estado = db.Column(db.String(20), default='pendiente', nullable=False)
     factura_id = db.Column(db.Integer, db.ForeignKey('facturas.id'), nullable=True)
     is_deleted = db.Column(db.Boolean, default=False, nullable=False, index=True)
     deleted_at = db.Column(db.DateTime, nullable=True)
+
+    # Última modificación (UTC): cursor de la sincronización incremental de la agenda
+    updated_at = db.Column(db.DateTime, nullable=True, default=datetime.utcnow,
+                           onupdate=datetime.utcnow, index=True)
     
     # ============================================================
     # CAMPOS NUEVOS EXCLUSIVOS PARA RIPS (Archivo AC - Consultas)
@@ -199,6 +268,84 @@ class Cita(db.Model):
     paciente = db.relationship('Paciente', backref=db.backref('citas', lazy='dynamic'))
 
 
+class CitaBorrada(db.Model):
+    """
+    Lápida de una cita borrada de forma definitiva (no de las que van a la
+    papelera, que siguen en la tabla con is_deleted). La agenda incremental
+    la usa para avisar al calendario que quite la cita. Se conservan
+    RETENCION_CITAS_BORRADAS; un cursor más viejo recibe la agenda completa.
+    """
+    __tablename__ = 'citas_borradas'
+
+    id = db.Column(db.Integer, primary_key=True)
+    cita_id = db.Column(db.Integer, nullable=False)
+    # Dueño de la cita al borrar (NULL en lápidas anteriores a Cita.odontologo_id obligatorio)
+    odontologo_id = db.Column(db.Integer, nullable=True)
+    borrado_en = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+    @staticmethod
+    def registrar(*condiciones):
+        """
+        Registra las lápidas de las citas que cumplen `condiciones`. Para los
+        borrados masivos (query.delete) que no pasan por los eventos del ORM;
+        llamar antes del DELETE, en la misma transacción.
+        """
+        ahora = datetime.utcnow()
+        seleccion = db.select(Cita.id, Cita.odontologo_id, db.literal(ahora)).where(*condiciones)
+        db.session.execute(
+            db.insert(CitaBorrada).from_select(['cita_id', 'odontologo_id', 'borrado_en'], seleccion)
+        )
+        db.session.execute(db.delete(CitaBorrada).where(CitaBorrada.borrado_en < ahora - RETENCION_CITAS_BORRADAS))
+
+
+RETENCION_CITAS_BORRADAS = timedelta(days=7)
+
+
+@event.listens_for(Cita, 'after_delete')
+def _registrar_cita_borrada(mapper, connection, target):
+    """db.session.delete(cita): deja la lápida en la misma transacción."""
+    connection.execute(
+        CitaBorrada.__table__.insert().values(
+            cita_id=target.id, odontologo_id=target.odontologo_id, borrado_en=datetime.utcnow()
+        )
+    )
+
+
+@event.listens_for(Cita, 'before_insert')
+@event.listens_for(Cita, 'before_update')
+def _asignar_odontologo_cita(mapper, connection, cita):
+    """
+    Una cita con paciente pertenece al odontólogo del paciente, la cree quien
+    la cree (también un administrador). Sin paciente conserva el odontólogo
+    que le asignó la ruta.
+    """
+    if cita.paciente_id is None:
+        return
+    estado = inspect(cita)
+    if cita.odontologo_id is not None and not estado.attrs.paciente_id.history.has_changes():
+        return
+    # Solo si la relación ya está cargada: no se hacen consultas perezosas dentro del flush
+    paciente = estado.dict.get('paciente')
+    if paciente is not None and paciente.id == cita.paciente_id and paciente.odontologo_id:
+        cita.odontologo_id = paciente.odontologo_id
+    else:
+        cita.odontologo_id = connection.scalar(
+            db.select(Paciente.odontologo_id).where(Paciente.id == cita.paciente_id)
+        )
+
+
+@event.listens_for(Paciente, 'after_update')
+def _mover_citas_de_odontologo(mapper, connection, paciente):
+    """Si el paciente pasa a otro odontólogo, sus citas van con él."""
+    if not inspect(paciente).attrs.odontologo_id.history.has_changes():
+        return
+    connection.execute(
+        Cita.__table__.update()
+        .where(Cita.paciente_id == paciente.id, Cita.odontologo_id != paciente.odontologo_id)
+        .values(odontologo_id=paciente.odontologo_id, updated_at=datetime.utcnow())
+    )
+
+
 # ============================================================
 # TABLAS DE CÓDIGOS (NUEVAS - No afectan nada existente)
 # ============================================================
@@ -250,6 +397,22 @@ class EPS(db.Model):
         return f"<EPS {self.codigo}: {self.nombre}>"
     
 
+class CatalogoVersion(db.Model):
+    """
+    Versión de cada tabla de catálogo (eps, municipios, cups, cie10).
+    Los scripts importar_*.py la incrementan y los workers recargan su caché
+    en memoria (ver clinica/services/catalogo_cache.py) cuando cambia.
+    """
+    __tablename__ = 'catalogo_version'
+
+    nombre = db.Column(db.String(30), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=1)
+    actualizado_en = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<CatalogoVersion {self.nombre} v{self.version}>"
+
+
 class Usuario(UserMixin, db.Model):
     __tablename__ = 'usuarios'
     id = db.Column(db.Integer, primary_key=True)
@@ -320,6 +483,12 @@ class Factura(db.Model):
     # Esta relación es importante: una factura puede tener muchas citas/procedimientos.
     citas = db.relationship('Cita', backref='factura', lazy='dynamic')
 
+    __table_args__ = (
+        # Reportes por rango de fechas y facturas de un paciente
+        db.Index('idx_factura_fecha', 'fecha_factura'),
+        db.Index('idx_factura_paciente_fecha', 'paciente_id', 'fecha_factura'),
+    )
+
     def __repr__(self):
         return f"<Factura No: {self.numero_factura}>"
     
@@ -342,10 +511,55 @@ class Procedimiento(db.Model):
     descripcion = db.Column(db.String(255), nullable=True) # Ej: "Resina compuesta en pieza 24"
     valor = db.Column(db.Float, nullable=False, default=0.0)
 
+    __table_args__ = (
+        db.Index('idx_procedimiento_cita', 'cita_id'),
+    )
+
     def __repr__(self):
         return f"<Procedimiento CUPS: {self.codigo_cups} en Cita ID: {self.cita_id}>"
 
 
+class IngresoDiario(db.Model):
+    """
+    Total facturado por odontólogo y día (hora de Bogotá). Lo mantiene
+    IngresosService al confirmar cambios en facturas; los reportes de meses o
+    años suman estas filas en vez de recorrer las facturas.
+    """
+    __tablename__ = 'ingresos_diarios'
+
+    id = db.Column(db.Integer, primary_key=True)
+    odontologo_id = db.Column(db.Integer, db.ForeignKey('usuarios.id'), nullable=False)
+    fecha = db.Column(db.Date, nullable=False)
+    total = db.Column(db.Float, nullable=False, default=0.0)
+    facturas = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.UniqueConstraint('odontologo_id', 'fecha', name='uq_ingreso_diario_odontologo_fecha'),
+    )
+
+    def __repr__(self):
+        return f"<IngresoDiario {self.odontologo_id} {self.fecha}: {self.total}>"
+
+
+class IngresoProcedimientoMensual(db.Model):
+    """Valor y cantidad de procedimientos facturados por odontólogo, mes y código CUPS."""
+    __tablename__ = 'ingresos_procedimientos_mensuales'
+
+    id = db.Column(db.Integer, primary_key=True)
+    odontologo_id = db.Column(db.Integer, db.ForeignKey('usuarios.id'), nullable=False)
+    mes = db.Column(db.Date, nullable=False)  # Primer día del mes
+    codigo_cups = db.Column(db.String(20), nullable=False)
+    cantidad = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Float, nullable=False, default=0.0)
+
+    __table_args__ = (
+        db.UniqueConstraint('odontologo_id', 'mes', 'codigo_cups', name='uq_ingreso_procedimiento_mes'),
+    )
+
+    def __repr__(self):
+        return f"<IngresoProcedimientoMensual {self.odontologo_id} {self.mes} {self.codigo_cups}>"
+
+
 class CUPSCode(db.Model):
     __tablename__ = 'cups_codes'
     id = db.Column(db.Integer, primary_key=True)
@@ -552,4 +766,66 @@ class PagoPaciente(db.Model):
     paciente = db.relationship('Paciente', backref=db.backref('pagos_paciente', lazy='dynamic', cascade='all, delete-orphan'))
 
     def __repr__(self):
-        return f'<PagoPaciente {self.fecha} - ${self.monto}>'    
\ No newline at end of file
+        return f'<PagoPaciente {self.fecha} - ${self.monto}>'    
+
+class TrabajoExportacion(db.Model):
+    """
+    Exportación (RIPS, Excel o Word) generada en segundo plano.
+    Ver clinica/services/trabajos_service.py: el trabajo se encola, un hilo
+    del pool lo procesa y el archivo resultante queda en disco hasta expira_en.
+    """
+    __tablename__ = 'trabajos_exportacion'
+
+    id = db.Column(db.String(32), primary_key=True)  # uuid4 hex: no se puede adivinar
+    usuario_id = db.Column(db.Integer, db.ForeignKey('usuarios.id'), nullable=False, index=True)
+    tipo = db.Column(db.String(20), nullable=False)  # rips, excel, word
+    parametros = db.Column(db.JSON, nullable=True)
+
+    estado = db.Column(db.String(20), nullable=False, default='PENDIENTE')  # PENDIENTE, PROCESANDO, TERMINADO, ERROR
+    progreso = db.Column(db.Integer, nullable=False, default=0)  # 0 - 100
+    mensaje = db.Column(db.Text, nullable=True)
+
+    nombre_archivo = db.Column(db.String(255), nullable=True)  # Nombre de descarga
+    ruta_archivo = db.Column(db.String(500), nullable=True)    # Ruta en disco
+
+    creado_en = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    iniciado_en = db.Column(db.DateTime, nullable=True)
+    terminado_en = db.Column(db.DateTime, nullable=True)
+    expira_en = db.Column(db.DateTime, nullable=True, index=True)
+
+    usuario = db.relationship('Usuario', backref=db.backref('trabajos_exportacion', lazy='dynamic'))
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'tipo': self.tipo,
+            'estado': self.estado,
+            'progreso': self.progreso,
+            'mensaje': self.mensaje,
+            'nombre_archivo': self.nombre_archivo,
+            'creado_en': self.creado_en.isoformat() if self.creado_en else None,
+            'terminado_en': self.terminado_en.isoformat() if self.terminado_en else None,
+            'expira_en': self.expira_en.isoformat() if self.expira_en else None,
+        }
+
+    def __repr__(self):
+        return f"<TrabajoExportacion {self.id} {self.tipo} {self.estado}>"
+
+
+class BorradoPendiente(db.Model):
+    """
+    Imagen por borrar del almacenamiento (Cloudinary) — bandeja de salida.
+    La fila se inserta en la misma transacción que borra o reemplaza la imagen
+    en la BD; un hilo la procesa después por lotes (ver services/borrados_service.py).
+    """
+    __tablename__ = 'borrados_pendientes'
+
+    id = db.Column(db.Integer, primary_key=True)
+    public_id = db.Column(db.String(255), nullable=False)
+    intentos = db.Column(db.Integer, nullable=False, default=0)
+    ultimo_error = db.Column(db.Text, nullable=True)
+    creado_en = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    proximo_intento = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+    def __repr__(self):
+        return f"<BorradoPendiente {self.public_id} intentos={self.intentos}>"
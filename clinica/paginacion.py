@@ -0,0 +1,167 @@
+# clinica/paginacion.py
+
+import base64
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+from sqlalchemy import and_, func, or_
+
+from clinica.extensions import db
+
+# El conteo se detiene aquí: más allá se muestra "1000+" en vez de contar todo
+LIMITE_CONTEO = 1000
+
+
+class PaginaKeyset:
+    """Una página de resultados y los cursores para moverse a la anterior y la siguiente."""
+
+    def __init__(self, items, por_pagina, cursor_anterior=None, cursor_siguiente=None,
+                 total=None, total_es_minimo=False):
+        self.items = items
+        self.por_pagina = por_pagina
+        self.cursor_anterior = cursor_anterior
+        self.cursor_siguiente = cursor_siguiente
+        self.total = total
+        self.total_es_minimo = total_es_minimo
+
+    @property
+    def hay_anterior(self):
+        return self.cursor_anterior is not None
+
+    @property
+    def hay_siguiente(self):
+        return self.cursor_siguiente is not None
+
+
+def _codificar_valor(valor):
+    if isinstance(valor, datetime):
+        return {'dt': valor.isoformat()}
+    if isinstance(valor, date):
+        return {'d': valor.isoformat()}
+    return valor
+
+
+def _decodificar_valor(valor):
+    if isinstance(valor, dict):
+        if 'dt' in valor:
+            return datetime.fromisoformat(valor['dt'])
+        if 'd' in valor:
+            return date.fromisoformat(valor['d'])
+        raise ValueError('valor de cursor desconocido')
+    return valor
+
+
+def _valor_compatible(valor, expresion):
+    """
+    ¿El valor del cursor es del tipo de su columna? Un cursor editado a mano
+    con un texto donde va un id haría fallar la consulta en Postgres.
+    """
+    if valor is None or isinstance(valor, (bool, list, dict)):
+        return False
+    try:
+        esperado = expresion.type.python_type
+    except NotImplementedError:
+        # Tipo desconocido (p. ej. una expresión sin tipo): solo valores simples
+        return isinstance(valor, (int, float, str))
+    if esperado is datetime:
+        return isinstance(valor, datetime)
+    if esperado is date:
+        return isinstance(valor, date) and not isinstance(valor, datetime)
+    if esperado is int:
+        return isinstance(valor, int)
+    if esperado in (float, Decimal):
+        return isinstance(valor, (int, float))
+    return isinstance(valor, esperado)
+
+
+def codificar_cursor(direccion, valores):
+    """Cursor opaco (base64 URL-safe) con la dirección ('s'/'a') y la clave de la fila."""
+    datos = json.dumps([direccion, [_codificar_valor(v) for v in valores]], separators=(',', ':'))
+    return base64.urlsafe_b64encode(datos.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decodificar_cursor(cursor, orden):
+    """
+    Devuelve (direccion, valores) o None si el cursor falta o no es válido:
+    debe traer un valor por cada expresión de `orden`, del tipo de esa expresión.
+    """
+    if not cursor:
+        return None
+    try:
+        relleno = '=' * (-len(cursor) % 4)
+        direccion, valores = json.loads(base64.urlsafe_b64decode(cursor + relleno))
+        if direccion not in ('s', 'a') or len(valores) != len(orden):
+            return None
+        valores = [_decodificar_valor(v) for v in valores]
+    except (ValueError, TypeError):
+        return None
+    if not all(_valor_compatible(valor, expresion) for valor, (expresion, _) in zip(valores, orden)):
+        return None
+    return direccion, valores
+
+
+def _despues_de(orden, valores, invertir=False):
+    """
+    Condición "la fila va después de `valores`" según el orden dado, escrita
+    como comparación lexicográfica: (a < va) OR (a = va AND b < vb) ...
+    """
+    ramas = []
+    for i, (expresion, descendente) in enumerate(orden):
+        hacia_abajo = descendente != invertir
+        comparacion = expresion < valores[i] if hacia_abajo else expresion > valores[i]
+        iguales = [orden[j][0] == valores[j] for j in range(i)]
+        ramas.append(and_(*iguales, comparacion))
+    return or_(*ramas)
+
+
+def paginar_keyset(query, orden, cursor=None, por_pagina=20, contar=False):
+    """
+    Pagina `query` por clave (keyset) en lugar de OFFSET: cada página filtra
+    "después de la última fila vista" y cuesta lo mismo que la primera.
+
+    `orden` es una lista de (expresión, descendente) que debe identificar a
+    cada fila de forma única (terminar en el id). El orden que traiga la
+    consulta se reemplaza por este. Con contar=True se calcula el total hasta
+    LIMITE_CONTEO filas.
+    """
+    etiquetas = [expresion.label(f'_clave_{i}') for i, (expresion, _) in enumerate(orden)]
+    decodificado = decodificar_cursor(cursor, orden)
+    hacia_atras = decodificado is not None and decodificado[0] == 'a'
+
+    consulta = query.order_by(None)
+    if decodificado:
+        consulta = consulta.filter(_despues_de(orden, decodificado[1], invertir=hacia_atras))
+    consulta = consulta.order_by(*[
+        (expresion.desc() if descendente != hacia_atras else expresion.asc())
+        for expresion, descendente in orden
+    ])
+    filas = consulta.add_columns(*etiquetas).limit(por_pagina + 1).all()
+
+    hay_mas = len(filas) > por_pagina
+    filas = filas[:por_pagina]
+    if hacia_atras:
+        filas.reverse()
+
+    items = [fila[0] for fila in filas]
+    claves = [tuple(fila[1:]) for fila in filas]
+
+    if hacia_atras:
+        hay_anterior, hay_siguiente = hay_mas, True
+    else:
+        hay_anterior, hay_siguiente = decodificado is not None, hay_mas
+
+    total, total_es_minimo = None, False
+    if contar:
+        subconsulta = query.order_by(None).limit(LIMITE_CONTEO + 1).subquery()
+        conteo = db.session.query(func.count()).select_from(subconsulta).scalar()
+        total, total_es_minimo = min(conteo, LIMITE_CONTEO), conteo > LIMITE_CONTEO
+
+    return PaginaKeyset(
+        items,
+        por_pagina,
+        cursor_anterior=codificar_cursor('a', claves[0]) if items and hay_anterior else None,
+        cursor_siguiente=codificar_cursor('s', claves[-1]) if items and hay_siguiente else None,
+        total=total,
+        total_es_minimo=total_es_minimo,
+    )
@@ -0,0 +1,42 @@
+# clinica/routes/admin.py
+
+from flask import Blueprint, jsonify, abort, current_app
+from flask_login import login_required, current_user
+
+from ..extensions import db
+from ..instrumentacion import EstadisticasEndpoints, EstadisticasPool
+
+admin_bp = Blueprint('admin', __name__)
+
+
+# --- Métricas por endpoint del proceso que atiende la petición ---
+@admin_bp.route('/metricas', methods=['GET'])
+@login_required
+def metricas():
+    if not current_user.is_admin:
+        abort(403)
+
+    datos = EstadisticasEndpoints.resumen()
+    datos['pool'] = {'perfil': current_app.config.get('DB_PERFIL'), **EstadisticasPool.resumen(db.engine.pool)}
+    try:
+        from ..services.borrados_service import BorradoService
+        bandeja = BorradoService.metricas()
+        datos['borrados_pendientes'] = {
+            'pendientes': bandeja['pendientes'],
+            'con_error': bandeja['con_error'],
+            'max_intentos': bandeja['max_intentos'],
+            'mas_antiguo': bandeja['mas_antiguo'].isoformat() if bandeja['mas_antiguo'] else None,
+        }
+    except Exception as e:
+        current_app.logger.warning(f"ADMIN: no se pudo leer la bandeja de borrados: {e}")
+    return jsonify(datos)
+
+
+@admin_bp.route('/metricas/reiniciar', methods=['POST'])
+@login_required
+def reiniciar_metricas():
+    if not current_user.is_admin:
+        abort(403)
+    EstadisticasEndpoints.reiniciar()
+    EstadisticasPool.reiniciar()
+    return jsonify({'success': True})
@@ -4,9 +4,8 @@ API endpoints for autocomplete functionality.
 
 from flask import Blueprint, jsonify, request
 from flask_login import login_required
-from sqlalchemy import or_
-from ..models import CUPSCode, CIE10
-from ..extensions import db
+from ..services.catalogo_cache import CatalogoCache
+from ..utils import respuesta_json_cacheable
 
 api_bp = Blueprint('api', __name__, url_prefix='/api')
 
@@ -24,13 +23,8 @@ def search_cups():
     if not query_term or len(query_term) < 2:
         return jsonify([])
     
-    # Buscar en código o descripción
-    results = CUPSCode.query.filter(
-        or_(
-            CUPSCode.code.ilike(f'%{query_term}%'),
-            CUPSCode.description.ilike(f'%{query_term}%')
-        )
-    ).limit(20).all()
+    # Buscar en código o descripción (índice en memoria, sin consultar la BD)
+    results = CatalogoCache.buscar_cups(query_term, limite=20)
     
     # Formatear resultados
     cups_list = [
@@ -42,7 +36,7 @@ def search_cups():
         for cup in results
     ]
     
-    return jsonify(cups_list)
+    return respuesta_json_cacheable(cups_list, f"cups:{CatalogoCache.version('cups')}")
 
 
 @api_bp.route('/cie10/search', methods=['GET'])
@@ -58,13 +52,8 @@ def search_cie10():
     if not query_term or len(query_term) < 2:
         return jsonify([])
     
-    # Buscar en código o descripción
-    results = CIE10.query.filter(
-        or_(
-            CIE10.codigo.ilike(f'%{query_term}%'),
-            CIE10.descripcion.ilike(f'%{query_term}%')
-        )
-    ).limit(20).all()
+    # Buscar en código o descripción (índice en memoria, sin consultar la BD)
+    results = CatalogoCache.buscar_cie10(query_term, limite=20)
     
     # Formatear resultados
     cie10_list = [
@@ -77,4 +66,4 @@ def search_cie10():
         for cie in results
     ]
     
-    return jsonify(cie10_list)
+    return respuesta_json_cacheable(cie10_list, f"cie10:{CatalogoCache.version('cie10')}")
@@ -3,15 +3,17 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, current_app
 from datetime import date, datetime, time, timedelta
 import calendar
-from ..models import db, Cita, Paciente, AuditLog
-from sqlalchemy.orm import joinedload
-from sqlalchemy import or_, extract, func, exc as sqlalchemy_exc
+import hashlib
+from ..models import db, Cita, CitaBorrada, Paciente, AuditLog, RETENCION_CITAS_BORRADAS
+from sqlalchemy.orm import joinedload, load_only
+from sqlalchemy import or_, func, case, exc as sqlalchemy_exc
 from urllib.parse import urlparse, urljoin
 import uuid
 import os
 from flask_login import current_user, login_required
 from uuid import uuid4
 from ..utils import convertir_a_fecha
+from ..services.auditoria_service import AuditoriaService
 from urllib.parse import quote_plus
 
 import pytz  # <-- important import
@@ -24,6 +26,13 @@ NOMBRES_MESES_ESP = [
     "Julio", "Agosto", "Septiembre", "Octubre", "Noviembre", "Diciembre"
 ]
 
+# --- Agenda JSON (sincronización incremental del calendario) ---
+AGENDA_MAX_DIAS = 62
+# Margen para no perder citas guardadas por transacciones que terminan justo
+# después de la consulta: el cursor se retrasa estos segundos y el cliente
+# descarta duplicados por id.
+AGENDA_MARGEN_CURSOR = timedelta(seconds=5)
+
 # --- Función de utilidad para URL segura (se mantiene) ---
 def is_safe_url(target):
     ref_url = urlparse(request.host_url)
@@ -31,12 +40,16 @@ def is_safe_url(target):
     return test_url.scheme in ('http', 'https') and \
            ref_url.netloc == test_url.netloc
 
-# --- MODIFICACIÓN: La función construir_dias_del_mes ahora acepta la fecha actual localizada ---
-def construir_dias_del_mes(anio, mes, citas_del_mes_obj, dia_hoy_local, mes_hoy_local, anio_hoy_local):
+# --- Construye la grilla del mes a partir de las citas ya agrupadas por día ---
+def construir_dias_del_mes(anio, mes, citas_por_dia, dia_hoy_local, mes_hoy_local, anio_hoy_local):
+    """
+    citas_por_dia: {date: [cita_dict, ...]} ya ordenadas por hora.
+    Cada día se resuelve con una búsqueda en el diccionario (O(días)).
+    """
     dias_calendario = []
     primer_dia_obj = date(anio, mes, 1)
     total_dias_en_mes = calendar.monthrange(anio, mes)[1]
-    # dia_hoy = date.today()  # <-- eliminado
+    hoy_local = date(anio_hoy_local, mes_hoy_local, dia_hoy_local)
 
     dia_semana_inicio = (primer_dia_obj.weekday() + 1) % 7
 
@@ -45,31 +58,10 @@ def construir_dias_del_mes(anio, mes, citas_del_mes_obj, dia_hoy_local, mes_hoy_
 
     for dia_num in range(1, total_dias_en_mes + 1):
         fecha_actual_dia = date(anio, mes, dia_num)
-        citas_en_dia_actual = [c for c in citas_del_mes_obj if date.fromisoformat(c['fecha']) == fecha_actual_dia]
-        citas_preparadas = []
-        for cita_dict in citas_en_dia_actual:
-            citas_preparadas.append({
-                'id': cita_dict['id'],
-                'fecha': cita_dict['fecha'],
-                'hora': cita_dict['hora'],
-                'motivo': cita_dict['motivo'],
-                'doctor': cita_dict['doctor'],
-                'observaciones': cita_dict['observaciones'],
-                'estado': cita_dict['estado'],
-                'paciente_id': cita_dict['paciente_id'],
-                'paciente_nombre_completo': cita_dict['paciente_nombre_completo'],
-                'paciente_telefono_str': cita_dict['paciente_telefono_str'],
-                'edit_url': cita_dict['edit_url'],
-                'delete_url': cita_dict['delete_url'],
-                'next_url_encoded': cita_dict['next_url_encoded']
-            })
-        es_hoy = (fecha_actual_dia.day == dia_hoy_local and
-                  fecha_actual_dia.month == mes_hoy_local and
-                  fecha_actual_dia.year == anio_hoy_local)
         dias_calendario.append({
             'fecha': fecha_actual_dia,
-            'hoy': es_hoy,
-            'citas': citas_preparadas
+            'hoy': fecha_actual_dia == hoy_local,
+            'citas': citas_por_dia.get(fecha_actual_dia, [])
         })
 
     total_celdas_actual = len(dias_calendario)
@@ -78,6 +70,103 @@ def construir_dias_del_mes(anio, mes, citas_del_mes_obj, dia_hoy_local, mes_hoy_
         dias_calendario.append({'fecha': None, 'hoy': False, 'citas': []})
     return dias_calendario
 
+
+def rango_del_mes(anio, mes):
+    """Devuelve (primer día del mes, primer día del mes siguiente) para filtros sargables."""
+    inicio = date(anio, mes, 1)
+    fin = date(anio + 1, 1, 1) if mes == 12 else date(anio, mes + 1, 1)
+    return inicio, fin
+
+
+def query_citas_visibles(usuario, incluir_eliminadas=False):
+    """
+    Consulta base de las citas que `usuario` puede ver en el calendario, con
+    solo las columnas que usan la plantilla y la agenda JSON. Con
+    incluir_eliminadas=True también trae las citas en papelera (columna
+    cita_eliminada), para que la sincronización incremental pueda quitarlas.
+    """
+    query_citas = db.session.query(
+        Cita.id, Cita.fecha, Cita.hora, Cita.motivo, Cita.doctor, Cita.observaciones,
+        Cita.estado, Cita.paciente_id, Cita.paciente_nombres_str, Cita.paciente_apellidos_str,
+        Cita.paciente_telefono_str, Cita.is_deleted.label('cita_eliminada'), Cita.updated_at,
+        Paciente.nombres, Paciente.apellidos, Paciente.is_deleted
+    ).select_from(Cita).outerjoin(Paciente, Cita.paciente_id == Paciente.id)
+
+    if not incluir_eliminadas:
+        query_citas = query_citas.filter(Cita.is_deleted == False)
+
+    if not usuario.is_admin:
+        # Filtro sobre la propia tabla: rango por idx_cita_odontologo_fecha
+        query_citas = query_citas.filter(Cita.odontologo_id == usuario.id)
+    elif not incluir_eliminadas:
+        query_citas = query_citas.filter(or_(Paciente.is_deleted == False, Cita.paciente_id == None))
+    return query_citas
+
+
+def preparar_serializador_citas(current_full_path):
+    """
+    Devuelve una función que convierte una fila de query_citas_visibles en el
+    diccionario que usan la plantilla y calendar_popups.js.
+    """
+    # Las URLs se generan una vez con un id marcador y se completan por reemplazo,
+    # en lugar de llamar a url_for dos veces por cita
+    marcador = '999999999'
+    edit_url_base = url_for('calendario.editar_cita', cita_id=int(marcador), next=current_full_path)
+    delete_url_base = url_for('calendario.eliminar_cita', cita_id=int(marcador), next=current_full_path)
+    next_url_encoded = quote_plus(current_full_path)
+    textos_fecha = {}
+    textos_hora = {}
+
+    def serializar(fila):
+        paciente_nombre_completo = "Paciente sin registrar"
+        if fila.paciente_id and fila.nombres is not None and not fila.is_deleted:
+            paciente_nombre_completo = f"{fila.nombres} {fila.apellidos}"
+        elif fila.paciente_nombres_str and fila.paciente_apellidos_str:
+            paciente_nombre_completo = f"{fila.paciente_nombres_str} {fila.paciente_apellidos_str}"
+        elif fila.paciente_nombres_str:
+            paciente_nombre_completo = fila.paciente_nombres_str
+        fecha_texto = textos_fecha.get(fila.fecha)
+        if fecha_texto is None:
+            fecha_texto = textos_fecha[fila.fecha] = fila.fecha.strftime('%Y-%m-%d')
+        hora_texto = textos_hora.get(fila.hora)
+        if hora_texto is None:
+            hora_texto = textos_hora[fila.hora] = fila.hora.strftime('%H:%M')
+        cita_id = str(fila.id)
+        return {
+            'id': fila.id,
+            'fecha': fecha_texto,
+            'hora': hora_texto,
+            'motivo': fila.motivo,
+            'doctor': fila.doctor,
+            'observaciones': fila.observaciones,
+            'estado': fila.estado,
+            'paciente_id': fila.paciente_id,
+            'paciente_nombre_completo': paciente_nombre_completo,
+            'paciente_telefono_str': fila.paciente_telefono_str,
+            'edit_url': edit_url_base.replace(marcador, cita_id, 1),
+            'delete_url': delete_url_base.replace(marcador, cita_id, 1),
+            'next_url_encoded': next_url_encoded
+        }
+
+    return serializar
+
+
+def agrupar_citas_por_dia(anio, mes, usuario, current_full_path):
+    """
+    Trae las citas visibles del mes en una sola consulta filtrando por rango de
+    fechas, para aprovechar el índice (fecha, hora), y las agrupa por día en
+    una sola pasada.
+    """
+    inicio, fin = rango_del_mes(anio, mes)
+    query_citas = query_citas_visibles(usuario).filter(Cita.fecha >= inicio, Cita.fecha < fin)
+    serializar = preparar_serializador_citas(current_full_path)
+
+    citas_por_dia = {}
+    for fila in query_citas.order_by(Cita.fecha, Cita.hora):
+        citas_por_dia.setdefault(fila.fecha, []).append(serializar(fila))
+    return citas_por_dia
+
+
 @calendario_bp.route('/')
 @login_required
 def mostrar_calendario():
@@ -99,51 +188,13 @@ def mostrar_calendario():
         anio_actual = now_in_local_tz.year
         mes_actual = now_in_local_tz.month
 
-    query_citas = Cita.query.outerjoin(Paciente, Cita.paciente_id == Paciente.id).options(joinedload(Cita.paciente)).filter(
-        Cita.is_deleted == False,
-        extract('year', Cita.fecha) == anio_actual,
-        extract('month', Cita.fecha) == mes_actual
-    )
-
-    if not current_user.is_admin:
-        query_citas = query_citas.filter(
-            or_(
-                Paciente.odontologo_id == current_user.id,
-                Cita.paciente_id == None
-            )
-        )
-    else:
-        query_citas = query_citas.filter(or_(Paciente.is_deleted == False, Cita.paciente_id == None))
-
-    citas_del_mes = query_citas.order_by(Cita.fecha, Cita.hora).all()
     current_full_path_for_template = request.full_path
+    agenda_desde, agenda_hasta = rango_del_mes(anio_actual, mes_actual)
+    # Cursor para que calendar_popups.js pida solo los cambios posteriores al render
+    agenda_cursor = (datetime.utcnow() - AGENDA_MARGEN_CURSOR).isoformat()
+    citas_por_dia = agrupar_citas_por_dia(anio_actual, mes_actual, current_user, current_full_path_for_template)
 
-    citas_para_construir = []
-    for cita_obj in citas_del_mes:
-        paciente_nombre_completo = "Paciente sin registrar"
-        if cita_obj.paciente and not cita_obj.paciente.is_deleted:
-            paciente_nombre_completo = f"{cita_obj.paciente.nombres} {cita_obj.paciente.apellidos}"
-        elif cita_obj.paciente_nombres_str and cita_obj.paciente_apellidos_str:
-            paciente_nombre_completo = f"{cita_obj.paciente_nombres_str} {cita_obj.paciente_apellidos_str}"
-        elif cita_obj.paciente_nombres_str:
-            paciente_nombre_completo = cita_obj.paciente_nombres_str
-        citas_para_construir.append({
-            'id': cita_obj.id,
-            'fecha': cita_obj.fecha.strftime('%Y-%m-%d'),
-            'hora': cita_obj.hora.strftime('%H:%M'),
-            'motivo': cita_obj.motivo,
-            'doctor': cita_obj.doctor,
-            'observaciones': cita_obj.observaciones,
-            'estado': cita_obj.estado,
-            'paciente_id': cita_obj.paciente_id,
-            'paciente_nombre_completo': paciente_nombre_completo,
-            'paciente_telefono_str': cita_obj.paciente_telefono_str,
-            'edit_url': url_for('calendario.editar_cita', cita_id=cita_obj.id, next=current_full_path_for_template),
-            'delete_url': url_for('calendario.eliminar_cita', cita_id=cita_obj.id, next=current_full_path_for_template),
-            'next_url_encoded': quote_plus(current_full_path_for_template)
-        })
-
-    dias_render = construir_dias_del_mes(anio_actual, mes_actual, citas_para_construir,
+    dias_render = construir_dias_del_mes(anio_actual, mes_actual, citas_por_dia,
                                          dia_hoy_local, mes_hoy_local, anio_hoy_local)
     nombre_mes_actual_display = NOMBRES_MESES_ESP[mes_actual-1]
 
@@ -156,7 +207,101 @@ def mostrar_calendario():
                            anio_hoy=anio_hoy_local,
                            mes_hoy=mes_hoy_local,
                            dia_hoy=dia_hoy_local,
-                           current_full_path=current_full_path_for_template)
+                           current_full_path=current_full_path_for_template,
+                           agenda_desde=agenda_desde.isoformat(),
+                           agenda_hasta=agenda_hasta.isoformat(),
+                           agenda_cursor=agenda_cursor)
+
+
+# --- Agenda JSON por rango de fechas con sincronización incremental ---
+@calendario_bp.route('/agenda')
+@login_required
+def agenda():
+    """
+    Citas de un rango de fechas en JSON para calendar_popups.js.
+
+    Query params:
+        desde, hasta: fechas YYYY-MM-DD (hasta es exclusivo, máximo 62 días)
+        updated_since: cursor devuelto por la llamada anterior (ISO). Si se
+            envía, solo llegan las citas modificadas desde entonces; las que se
+            borraron (papelera o definitivo) o salieron del rango vienen en
+            'eliminadas'. Un cursor más viejo que RETENCION_CITAS_BORRADAS
+            recibe la agenda completa ('incremental': false).
+        next: URL a la que vuelven los enlaces de editar/eliminar.
+
+    Responde 304 si el ETag (If-None-Match) no cambió.
+    """
+    desde = convertir_a_fecha(request.args.get('desde'))
+    hasta = convertir_a_fecha(request.args.get('hasta'))
+    if not desde or not hasta or hasta <= desde or (hasta - desde).days > AGENDA_MAX_DIAS:
+        return jsonify({'error': f'Rango inválido: use desde/hasta (YYYY-MM-DD), máximo {AGENDA_MAX_DIAS} días.'}), 400
+
+    updated_since = None
+    if request.args.get('updated_since'):
+        try:
+            updated_since = datetime.fromisoformat(request.args['updated_since'])
+        except ValueError:
+            return jsonify({'error': 'updated_since inválido.'}), 400
+        if updated_since < datetime.utcnow() - RETENCION_CITAS_BORRADAS:
+            # Las lápidas de los borrados definitivos ya no cubren ese período
+            updated_since = None
+
+    # ETag barato: cantidad y última modificación de las citas del rango
+    # (incluye las de papelera para detectar borrados)
+    resumen = query_citas_visibles(current_user, incluir_eliminadas=True).filter(
+        Cita.fecha >= desde, Cita.fecha < hasta
+    ).with_entities(
+        func.count(Cita.id), func.sum(case((Cita.is_deleted == True, 1), else_=0)), func.max(Cita.updated_at)
+    ).one()
+    next_url = request.args.get('next') or url_for('.mostrar_calendario', anio=desde.year, mes=desde.month)
+    if not is_safe_url(next_url):
+        next_url = url_for('.mostrar_calendario', anio=desde.year, mes=desde.month)
+    # No depende de updated_since: si nada del rango cambió, el cliente conserva su cursor
+    etag = hashlib.md5(f"{current_user.id}|{desde}|{hasta}|{next_url}|{tuple(resumen)}".encode()).hexdigest()
+    if request.if_none_match.contains(etag):
+        return '', 304, {'ETag': f'"{etag}"', 'Cache-Control': 'private, no-cache'}
+
+    cursor = datetime.utcnow() - AGENDA_MARGEN_CURSOR
+    serializar = preparar_serializador_citas(next_url)
+
+    citas = []
+    eliminadas = []
+    if updated_since is None:
+        query_citas = query_citas_visibles(current_user).filter(Cita.fecha >= desde, Cita.fecha < hasta)
+        citas = [serializar(fila) for fila in query_citas.order_by(Cita.fecha, Cita.hora)]
+    else:
+        # Cambios sin filtrar por fecha: una cita movida fuera del rango también cuenta
+        borradas = CitaBorrada.query.with_entities(CitaBorrada.cita_id).filter(
+            CitaBorrada.borrado_en >= updated_since
+        )
+        if not current_user.is_admin:
+            borradas = borradas.filter(or_(CitaBorrada.odontologo_id == current_user.id,
+                                           CitaBorrada.odontologo_id == None))
+        eliminadas.extend(fila.cita_id for fila in borradas)
+        query_citas = query_citas_visibles(current_user, incluir_eliminadas=True).filter(
+            Cita.updated_at >= updated_since
+        )
+        for fila in query_citas.order_by(Cita.fecha, Cita.hora):
+            visible = not fila.cita_eliminada and desde <= fila.fecha < hasta and not (
+                current_user.is_admin and fila.paciente_id and fila.is_deleted
+            )
+            if visible:
+                citas.append(serializar(fila))
+            else:
+                eliminadas.append(fila.id)
+
+    respuesta = jsonify({
+        'desde': desde.isoformat(),
+        'hasta': hasta.isoformat(),
+        'cursor': cursor.isoformat(),
+        'incremental': updated_since is not None,
+        'citas': citas,
+        'eliminadas': eliminadas,
+    })
+    respuesta.set_etag(etag)
+    respuesta.headers['Cache-Control'] = 'private, no-cache'
+    return respuesta
+
 
 @calendario_bp.route('/registrar_cita', methods=['GET', 'POST'])
 @login_required
@@ -200,7 +345,7 @@ def registrar_cita():
             form_values.update({
                 'paciente_preseleccionado_id': paciente_id_seleccionado,
                 'paciente_preseleccionado_nombre': request.form.get('paciente_busqueda_input', ''),
-                'paciente_nonueva_cita = Citambres_val': nombres_pac_form,
+                'paciente_nombres_val': nombres_pac_form,
                 'paciente_apellidos_val': apellidos_pac_form,
                 'paciente_telefono_val': telefono_pac_form,
                 'fecha_val': fecha_str, 'hora_val': hora_str, 'doctor_val': doctor_form,
@@ -224,16 +369,21 @@ def registrar_cita():
                 doctor=doctor_form,
                 motivo=motivo_form or None,
                 observaciones=observaciones_form or None,
-                odontologo_id=current_user.id,  # <--- ¡ESTO ES LO QUE FALTABA!
+                odontologo_id=current_user.id,  # Sin paciente registrado, la cita es de quien la crea
                 paciente_id=None,
                 paciente_nombres_str=None,
                 paciente_apellidos_str=None,
                 paciente_telefono_str=None,
             )
             if paciente_id_seleccionado:
-                paciente_existente = Paciente.query.filter_by(id=paciente_id_seleccionado, is_deleted=False).first()
+                query_paciente = Paciente.query.filter_by(id=paciente_id_seleccionado, is_deleted=False)
+                if not current_user.is_admin:
+                    query_paciente = query_paciente.filter_by(odontologo_id=current_user.id)
+                paciente_existente = query_paciente.first()
                 if paciente_existente:
                     nueva_cita.paciente_id = paciente_existente.id
+                    # Con paciente, la cita es de su odontólogo (aunque la agende un administrador)
+                    nueva_cita.odontologo_id = paciente_existente.odontologo_id
                 else:
                     flash("El paciente seleccionado no es válido o ha sido eliminado.", "error")
                     return render_template('registrar_cita.html', form_values=form_values)
@@ -255,17 +405,33 @@ def registrar_cita():
             return render_template('registrar_cita.html', form_values=form_values)
     return render_template('registrar_cita.html', form_values=form_values)
 
+def _paciente_para_selector(paciente_id, cita_obj):
+    """Id y nombre del paciente preseleccionado en editar_cita.html, sin cargar la ficha completa."""
+    try:
+        paciente_id = int(paciente_id) if paciente_id else None
+    except (TypeError, ValueError):
+        return None
+    if paciente_id is None:
+        return None
+    if cita_obj.paciente is not None and cita_obj.paciente.id == paciente_id:
+        paciente = cita_obj.paciente
+    else:
+        query = Paciente.query.options(load_only(Paciente.id, Paciente.nombres, Paciente.apellidos))\
+            .filter(Paciente.id == paciente_id, Paciente.is_deleted == False)
+        if not current_user.is_admin:
+            query = query.filter(Paciente.odontologo_id == current_user.id)
+        paciente = query.first()
+    if paciente is None:
+        return None
+    return {'id': paciente.id, 'nombre': f"{paciente.nombres} {paciente.apellidos}"}
+
 @calendario_bp.route('/editar_cita/<int:cita_id>', methods=['GET', 'POST'])
 @login_required
 def editar_cita(cita_id):
     cita_obj = Cita.query.options(joinedload(Cita.paciente)).get_or_404(cita_id)
-    if not current_user.is_admin and cita_obj.paciente and cita_obj.paciente.odontologo_id != current_user.id:
+    if not current_user.is_admin and cita_obj.odontologo_id != current_user.id:
         flash("Acceso denegado. No tienes permiso para editar esta cita.", "danger")
         return redirect(url_for('.mostrar_calendario'))
-    query_pacientes_para_dropdown = Paciente.query.filter_by(is_deleted=False)
-    if not current_user.is_admin:
-        query_pacientes_para_dropdown = query_pacientes_para_dropdown.filter_by(odontologo_id=current_user.id)
-    todos_los_pacientes = query_pacientes_para_dropdown.order_by(Paciente.apellidos, Paciente.nombres).all()
     next_url_get = request.args.get('next')
     form_data_edit = {
         'selected_paciente_id': str(cita_obj.paciente_id) if cita_obj.paciente_id else '',
@@ -276,6 +442,13 @@ def editar_cita(cita_id):
         'observaciones_val': cita_obj.observaciones or '',
         'next_url': next_url_get
     }
+
+    def formulario():
+        # El selector carga la lista por AJAX (/pacientes/selector_ajax); aquí solo va el elegido
+        return render_template('editar_cita.html', cita=cita_obj, form_data=form_data_edit,
+                               paciente_seleccionado=_paciente_para_selector(
+                                   form_data_edit['selected_paciente_id'], cita_obj))
+
     if request.method == 'POST':
         current_next_url = request.form.get('next') or next_url_get
         form_data_edit['next_url'] = current_next_url
@@ -289,7 +462,7 @@ def editar_cita(cita_id):
             paciente_destino = Paciente.query.filter_by(id=int(paciente_id_form), odontologo_id=current_user.id, is_deleted=False).first()
             if not paciente_destino:
                 flash("Error: Se intentó asignar la cita a un paciente que no te pertenece o no existe.", "danger")
-                return render_template('editar_cita.html', cita=cita_obj, pacientes=todos_los_pacientes, form_data=form_data_edit)
+                return formulario()
         form_data_edit.update({
             'selected_paciente_id': paciente_id_form,
             'fecha_val': fecha_str,
@@ -300,14 +473,23 @@ def editar_cita(cita_id):
         })
         if not (fecha_str and hora_str and doctor_form):
             flash("Fecha, hora y doctor son campos obligatorios.", "error")
-            return render_template('editar_cita.html', cita=cita_obj, pacientes=todos_los_pacientes, form_data=form_data_edit)
+            return formulario()
         try:
-            cita_obj.paciente_id = int(paciente_id_form) if paciente_id_form else None
+            nuevo_paciente_id = int(paciente_id_form) if paciente_id_form else None
+            if nuevo_paciente_id and nuevo_paciente_id != cita_obj.paciente_id:
+                # La cita pasa al odontólogo del nuevo paciente
+                odontologo_destino = db.session.query(Paciente.odontologo_id).filter(
+                    Paciente.id == nuevo_paciente_id, Paciente.is_deleted == False).scalar()
+                if odontologo_destino is None:
+                    flash("El paciente seleccionado no es válido o ha sido eliminado.", "error")
+                    return formulario()
+                cita_obj.odontologo_id = odontologo_destino
+            cita_obj.paciente_id = nuevo_paciente_id
             cita_obj.fecha = datetime.strptime(fecha_str, "%Y-%m-%d").date()
             cita_obj.hora = datetime.strptime(hora_str, "%H:%M").time()
         except ValueError:
             flash("Formato de fecha u hora inválido.", "error")
-            return render_template('editar_cita.html', cita=cita_obj, pacientes=todos_los_pacientes, form_data=form_data_edit)
+            return formulario()
         cita_obj.doctor = doctor_form
         cita_obj.motivo = motivo_form or None
         cita_obj.observaciones = observaciones_form or None
@@ -318,11 +500,11 @@ def editar_cita(cita_id):
             db.session.rollback()
             flash(f"Error al actualizar la cita: {e}", "error")
             current_app.logger.error(f"Error detallado al editar cita: {e}", exc_info=True)
-            return render_template('editar_cita.html', cita=cita_obj, pacientes=todos_los_pacientes, form_data=form_data_edit)
+            return formulario()
         if form_data_edit['next_url'] and is_safe_url(form_data_edit['next_url']):
             return redirect(form_data_edit['next_url'])
         return redirect(url_for('.mostrar_calendario', anio=cita_obj.fecha.year, mes=cita_obj.fecha.month))
-    return render_template('editar_cita.html', cita=cita_obj, pacientes=todos_los_pacientes, form_data=form_data_edit)
+    return formulario()
 
 # --- RUTA: Historial de Citas por Paciente (CON MODIFICACIONES) ---
 @calendario_bp.route('/historial_citas_paciente/<int:paciente_id>', methods=['GET'])
@@ -364,7 +546,7 @@ def historial_citas_paciente(paciente_id):
 @login_required
 def eliminar_cita(cita_id):
     cita_a_mover_papelera = Cita.query.options(joinedload(Cita.paciente)).get_or_404(cita_id)
-    if not current_user.is_admin and cita_a_mover_papelera.paciente and cita_a_mover_papelera.paciente.odontologo_id != current_user.id:
+    if not current_user.is_admin and cita_a_mover_papelera.odontologo_id != current_user.id:
         flash("Acceso denegado. No tienes permiso para eliminar esta cita.", "danger")
         return redirect(url_for('.mostrar_calendario'))
     if cita_a_mover_papelera.is_deleted:
@@ -392,18 +574,16 @@ def eliminar_cita(cita_id):
     try:
         cita_a_mover_papelera.is_deleted = True
         cita_a_mover_papelera.deleted_at = datetime.now(pytz.timezone('America/Bogota'))
-        audit_entry = AuditLog(
+        autenticado = hasattr(current_user, 'is_authenticated') and current_user.is_authenticated
+        AuditoriaService.registrar(
+            AuditLog,
             action_type="SOFT_DELETE_CITA",
             description=f"Cita movida a la papelera: {log_descripcion_detalle}",
             target_model="Cita",
             target_id=cita_id_para_log,
+            user_id=current_user.id if autenticado else None,
+            user_username=current_user.username if autenticado else "Sistema/Desconocido",
         )
-        if hasattr(current_user, 'is_authenticated') and current_user.is_authenticated:
-            audit_entry.user_id = current_user.id
-            audit_entry.user_username = current_user.username
-        else:
-            audit_entry.user_username = "Sistema/Desconocido"
-        db.session.add(audit_entry)
         db.session.commit()
         flash("Cita movida a la papelera y acción registrada.", "success")
     except Exception as e:
@@ -427,7 +607,7 @@ def actualizar_estado_cita(cita_id):
     if not cita:
         return jsonify({'success': False, 'message': 'Cita no encontrada.'}), 404
     if not current_user.is_admin:
-        if cita.paciente and cita.paciente.odontologo_id != current_user.id:
+        if cita.odontologo_id != current_user.id:
             current_app.logger.warning(f"Intento de actualizar cita {cita_id} de paciente {cita.paciente_id} por usuario no autorizado {current_user.id}.")
             return jsonify({'success': False, 'message': 'No tienes permiso para actualizar el estado de esta cita.'}), 403
     data = request.get_json()
@@ -18,7 +18,7 @@ def registrar_cita(paciente_id):
             observaciones=request.form.get('observaciones'),
             
             # ▼▼▼ 2. AGREGAR ESTAS DOS LÍNEAS ▼▼▼
-            odontologo_id=current_user.id,        # Para que sume en el panel
+            odontologo_id=paciente.odontologo_id,  # Dueño de la cita: el odontólogo del paciente
             doctor=current_user.username          # Para llenar el campo de texto obligatorio
             # ▲▲▲ FIN DE LOS CAMBIOS ▲▲▲
         )
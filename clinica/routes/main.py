@@ -3,11 +3,14 @@ from flask import Blueprint, render_template, current_app, flash, request, redir
 from flask_login import login_required, current_user, login_user, logout_user
 from datetime import datetime, timedelta, time  # <--- AGREGADO timedelta y time
 import pytz
-from clinica.utils import get_index_panel_data
+from clinica.utils import strftime_es, MESES_ES
+from clinica.services.panel_service import PanelService
+from clinica.services.ingresos_service import IngresosService
 # Importamos los modelos
 from clinica.models import Cita, Paciente, Factura, Usuario
 from clinica import db
-from sqlalchemy import func, extract
+from sqlalchemy import func
+from sqlalchemy.orm import contains_eager
 
 main_bp = Blueprint('main', __name__)
 
@@ -17,20 +20,25 @@ def index():
     # 1. Fecha y Hora Local
     local_timezone = pytz.timezone('America/Bogota')
     now_in_local_tz = datetime.now(local_timezone)
-    fecha_actual_formateada = now_in_local_tz.strftime('%A, %d de %B de %Y')
+    fecha_actual_formateada = strftime_es(now_in_local_tz, '%A, %d de %B de %Y')
     
     # 2. Datos del Panel (Contadores existentes)
     try:
-        panel_data = get_index_panel_data(now_in_local_tz.date(), now_in_local_tz.time())
+        # Servido desde memoria; se invalida al guardar citas del odontólogo
+        panel_data = PanelService.obtener_datos(current_user, now_in_local_tz.date(), now_in_local_tz.time())
     except Exception as e:
         current_app.logger.error(f"Error panel: {e}")
         panel_data = {}
 
     # 3. Facturas Recientes (CORREGIDO CON FILTRO DE USUARIO)
     facturas_recientes = []
+    ingresos_mes = None
     try:
-        # Iniciamos la consulta base
-        query_facturas = Factura.query.join(Paciente)
+        # Factura y nombre del paciente en una consulta; las citas de las 5 en otra
+        query_facturas = db.session.query(
+            Factura.id, Factura.paciente_id, Factura.fecha_factura, Factura.valor_total,
+            Paciente.nombres, Paciente.apellidos
+        ).join(Paciente, Paciente.id == Factura.paciente_id)
 
         # Si NO es admin, filtramos para ver solo las facturas de SUS pacientes
         if not current_user.is_admin:
@@ -38,21 +46,25 @@ def index():
         
         # Ordenamos por fecha descendente y tomamos las 5 últimas
         facturas_db = query_facturas.order_by(Factura.fecha_factura.desc()).limit(5).all()
+        citas_por_factura = dict(
+            db.session.query(Cita.factura_id, func.count(Cita.id))
+            .filter(Cita.factura_id.in_([f.id for f in facturas_db]))
+            .group_by(Cita.factura_id)
+            .all()
+        ) if facturas_db else {}
 
         for f in facturas_db:
-            paciente_nombre = "Desconocido"
-            if f.paciente:
-                paciente_nombre = f"{f.paciente.nombres} {f.paciente.apellidos}"
-            
             facturas_recientes.append({
                 'id': f.id,
                 'paciente_id': f.paciente_id,
-                'nombre_paciente': paciente_nombre,
+                'nombre_paciente': f"{f.nombres} {f.apellidos}",
                 'fecha_obj': f.fecha_factura,
-                # Usamos f.citas.count() con paréntesis porque es una relación dinámica
-                'citas_count': f.citas.count(), 
+                'citas_count': citas_por_factura.get(f.id, 0),
                 'total': f.valor_total
             })
+
+        # Total del mes desde los agregados de ingresos
+        ingresos_mes, _ = IngresosService.total_mes(current_user.id, now_in_local_tz.year, now_in_local_tz.month)
     except Exception as e:
         current_app.logger.error(f"Error facturas: {e}")
 
@@ -94,6 +106,7 @@ def index():
     return render_template(
         "index.html",
         facturas_recientes=facturas_recientes,
+        ingresos_mes=ingresos_mes,
         fecha_actual_formateada=fecha_actual_formateada,
         estadisticas_plan=estadisticas_plan,
         total_citas_semana=total_citas_semana,  # <--- ¡AQUÍ ESTÁ LA MAGIA!
@@ -226,32 +239,29 @@ def perfil():
 @main_bp.route('/ingresos')
 @login_required
 def ver_ingresos():
-    # 1. Definir fechas actuales
+    # 1. Mes a mostrar (por defecto el actual, hora de Bogotá)
     local_timezone = pytz.timezone('America/Bogota')
     ahora = datetime.now(local_timezone)
-    mes_actual = ahora.month
-    anio_actual = ahora.year
-    nombre_mes = ahora.strftime('%B') # Nombre del mes (ej: December)
-
-    # 2. Calcular el TOTAL ganado este mes (Suma de Facturas)
-    # Hacemos JOIN con Paciente para asegurar que sean facturas de TUS pacientes
-    total_mes_consulta = db.session.query(func.sum(Factura.valor_total))\
-        .join(Paciente)\
-        .filter(
-            Paciente.odontologo_id == current_user.id,
-            extract('month', Factura.fecha_factura) == mes_actual,
-            extract('year', Factura.fecha_factura) == anio_actual
-        )
-    
-    # Si devuelve None (no hay facturas), lo convertimos a 0
-    total_ingresos_mes = total_mes_consulta.scalar() or 0.0
-
-    # 3. Obtener el detalle de las facturas de este mes para mostrarlas en lista
+    anio_actual = request.args.get('anio', default=ahora.year, type=int)
+    mes_actual = request.args.get('mes', default=ahora.month, type=int)
+    if not (1 <= mes_actual <= 12 and 2000 <= anio_actual <= ahora.year + 1):
+        anio_actual, mes_actual = ahora.year, ahora.month
+    nombre_mes = MESES_ES[mes_actual - 1].capitalize() # Nombre del mes (ej: Diciembre)
+
+    # 2. Totales desde los agregados (no recorre las facturas)
+    total_ingresos_mes, _ = IngresosService.total_mes(current_user.id, anio_actual, mes_actual)
+    comparativo = IngresosService.comparativo_anual(current_user.id, anio_actual)
+    procedimientos_mes = IngresosService.por_procedimiento(current_user.id, anio_actual, mes_actual)
+
+    # 3. Detalle de las facturas del mes (con el paciente en la misma consulta)
+    inicio_mes = local_timezone.localize(datetime(anio_actual, mes_actual, 1))
+    fin_mes = local_timezone.localize(datetime(anio_actual + mes_actual // 12, mes_actual % 12 + 1, 1))
     facturas_mes = Factura.query.join(Paciente)\
+        .options(contains_eager(Factura.paciente))\
         .filter(
             Paciente.odontologo_id == current_user.id,
-            extract('month', Factura.fecha_factura) == mes_actual,
-            extract('year', Factura.fecha_factura) == anio_actual
+            Factura.fecha_factura >= inicio_mes.astimezone(pytz.utc),
+            Factura.fecha_factura < fin_mes.astimezone(pytz.utc)
         )\
         .order_by(Factura.fecha_factura.desc())\
         .all()
@@ -260,7 +270,10 @@ def ver_ingresos():
         'ingresos.html', 
         total_ingresos_mes=total_ingresos_mes,
         facturas_mes=facturas_mes,
+        comparativo=comparativo,
+        procedimientos_mes=procedimientos_mes,
         nombre_mes=nombre_mes,
+        mes_actual=mes_actual,
         anio_actual=anio_actual
     )
 
@@ -5,15 +5,18 @@ Este módulo contiene solo las rutas HTTP, delegando la lógica de negocio
 a pacientes_services.py para mejor mantenibilidad.
 """
 
-from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, current_app
+from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, current_app, abort, send_file
 from flask_login import login_required, current_user
 from datetime import date, datetime
-from clinica.models import Paciente, PagoPaciente, EPS, Municipio
+from clinica.models import Paciente, PagoPaciente
 from ..extensions import db
 import json 
 from sqlalchemy import or_
-import cloudinary.uploader  # <--- AGREGA ESTO
 from clinica.decorators.limites import verificar_limite_pacientes
+from clinica.services.busqueda_service import BusquedaService
+from clinica.services.catalogo_cache import CatalogoCache
+from clinica.services.dentigrama_service import DentigramaService
+from clinica.services.subidas_service import SubidaService
 # Importar servicios
 from .pacientes_services import (
     listar_pacientes_service,
@@ -32,26 +35,11 @@ pacientes_bp = Blueprint('pacientes', __name__, url_prefix='/pacientes')
 @pacientes_bp.route('/lista', methods=['GET'])
 @login_required
 def lista_pacientes():
-    page = request.args.get('page', 1, type=int)
+    cursor = request.args.get('cursor')
     search_query = request.args.get('buscar', '').strip() # Obtener lo que escribes en el buscador
-    
-    # Consulta base
-    query = Paciente.query
-
-    # ▼▼▼ LÓGICA DE BÚSQUEDA (ESTO ES LO QUE PROBABLEMENTE FALTA) ▼▼▼
-    if search_query:
-        search_term = f"%{search_query}%"
-        query = query.filter(
-            or_(
-                Paciente.nombres.ilike(search_term),
-                Paciente.apellidos.ilike(search_term),
-                Paciente.documento.ilike(search_term)
-            )
-        )
-    # ▲▲▲ FIN LÓGICA DE BÚSQUEDA ▲▲▲
 
-    # Ordenar y paginar
-    pacientes = query.order_by(Paciente.id.desc()).paginate(page=page, per_page=6, error_out=False)
+    # Paginación por cursor (keyset): la página N cuesta lo mismo que la primera
+    pacientes = listar_pacientes_service(current_user, cursor, search_query, por_pagina=6)
 
     return render_template('pacientes.html', pacientes=pacientes, buscar=search_query)
 
@@ -85,15 +73,10 @@ def crear_paciente():
     """Crea un nuevo paciente y maneja respuestas tanto AJAX como normales."""
 
     # --- LÓGICA PARA CARGAR DATOS (tu código original, perfecto) ---
-    eps_list = EPS.query.filter_by(activa=True).order_by(EPS.nombre).all()
-    departamentos_query = db.session.query(
-        Municipio.codigo_departamento, 
-        Municipio.nombre_departamento
-    ).distinct().order_by(Municipio.nombre_departamento).all()
-    departamentos_list = [{'codigo': d.codigo_departamento, 'nombre': d.nombre_departamento} for d in departamentos_query]
-    
-    municipios = Municipio.query.order_by(Municipio.nombre).all()
-    municipios_json = json.dumps([m.to_dict() for m in municipios])
+    # Catálogos desde la caché en memoria (sin consultas por petición)
+    eps_list = CatalogoCache.eps_activas()
+    departamentos_list = CatalogoCache.departamentos()
+    municipios_json = CatalogoCache.municipios_json()
 
 
     # ===================================================================
@@ -114,10 +97,11 @@ def crear_paciente():
         else:
             # Si el servicio devolvió un error, creamos una respuesta JSON de error.
             # El JavaScript mostrará el 'error' en un alert.
+            # 429 si se alcanzó el límite diario del plan; 400 para errores del formulario
             return jsonify({
                 'success': False,
                 'error': resultado['message']
-            }), 400 # 400 es un código de "Bad Request", apropiado para un error de formulario.
+            }), 429 if resultado.get('limite_alcanzado') else 400
 
     # ===================================================================
     # ▲▲▲ FIN DE LA SECCIÓN POST MODIFICADA ▲▲▲
@@ -139,16 +123,10 @@ def editar_paciente(id):
 
     # --- LÓGICA PARA CARGAR DATOS DE LOS SELECTORES (AÑADIDA) ---
     # La necesitamos en el GET para mostrar el formulario y en el POST si hubiera un error que re-renderice
-    eps_list = EPS.query.filter_by(activa=True).order_by(EPS.nombre).all()
-    departamentos_query = db.session.query(
-        Municipio.codigo_departamento, 
-        Municipio.nombre_departamento
-    ).distinct().order_by(Municipio.nombre_departamento).all()
-    departamentos_list = [{'codigo': d.codigo_departamento, 'nombre': d.nombre_departamento} for d in departamentos_query]
-    
-    municipios = Municipio.query.order_by(Municipio.nombre).all()
-    # Asumiendo que tienes un método to_dict() en el modelo Municipio
-    municipios_json = json.dumps([m.to_dict() for m in municipios])
+    # Catálogos desde la caché en memoria (sin consultas por petición)
+    eps_list = CatalogoCache.eps_activas()
+    departamentos_list = CatalogoCache.departamentos()
+    municipios_json = CatalogoCache.municipios_json()
 
 
     # --- LÓGICA POST (sin cambios) ---
@@ -325,49 +303,112 @@ def borrar_pago_paciente(pago_id):
 
 
 @pacientes_bp.route('/upload_dentigrama', methods=['POST'])
+@login_required
 def upload_dentigrama():
     """
-    Sube un dentigrama a Cloudinary.
-    CONFIGURADO PARA SOBREESCRIBIR: Si hay patient_id, usa un nombre fijo
-    para que Cloudinary reemplace la imagen anterior automáticamente.
+    Recibe el dentigrama del editor y lo deja en el spool de subidas.
+    La subida a Cloudinary ocurre al guardar el paciente (SubidaService), con
+    el nombre fijo dentigrama_paciente_{id} para que reemplace la imagen anterior.
+
+    Respuesta: 'url' es la URL provisional /pacientes/subidas/<token> y
+    'public_id' es ese token del spool, no un public_id de Cloudinary.
     """
     try:
         data = request.get_json()
         image_data = data.get('image_data')
-        patient_id = data.get('patient_id')
 
         if not image_data:
             return jsonify({'error': 'No hay datos de imagen'}), 400
 
-        # LÓGICA DE NOMBRE ÚNICO (Public ID)
-        public_id = None
-        if patient_id and str(patient_id).strip() != "":
-            # Al usar siempre el mismo nombre para el ID, Cloudinary borra la vieja
-            public_id = f"dentigrama_paciente_{patient_id}"
-
-        # Subida directa a Cloudinary con configuración de sobreescritura
-        upload_result = cloudinary.uploader.upload(
-            image_data,
-            public_id=public_id,  # Nombre forzado (si existe ID)
-            overwrite=True,       # ¡Importante! Sobreescribe si ya existe
-            invalidate=True,      # Limpia la caché de la CDN para ver cambios inmediatos
-            folder="dentigramas_pacientes" # Carpeta en Cloudinary
-        )
+        url_spool = SubidaService.guardar_base64(image_data)
+        if not url_spool:
+            return jsonify({'error': 'La imagen del dentigrama no es válida'}), 400
 
-        # Obtenemos la URL segura
-        new_url = upload_result['secure_url']
-        public_id_created = upload_result['public_id'] # <--- NUEVO
-        
         return jsonify({
             'success': True, 
-            'url': new_url, 
-            'public_id': public_id_created, # <--- NUEVO: Lo devolvemos al front
+            'url': url_spool, 
+            'public_id': SubidaService.token_de_url(url_spool),
             'message': 'Dentigrama procesado correctamente'
         }), 200
-    
 
-    
+    except Exception as e:
+        current_app.logger.error(f"Error al recibir dentigrama: {e}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
+
+@pacientes_bp.route('/<int:paciente_id>/dentigrama', methods=['POST'])
+@login_required
+def guardar_dentigrama(paciente_id):
+    """
+    Guarda el estado del odontograma (JSON por diente y cara). Si el estado es
+    igual al guardado no se escribe nada y la URL de la imagen no cambia.
+    """
+    query = Paciente.query.filter_by(id=paciente_id, is_deleted=False)
+    if not current_user.is_admin:
+        query = query.filter_by(odontologo_id=current_user.id)
+    paciente = query.first_or_404()
 
+    data = request.get_json(silent=True) or {}
+    try:
+        cambio = DentigramaService.aplicar(paciente, data.get('estado'))
+        if cambio:
+            db.session.commit()
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
-        print(f"Error al subir dentigrama: {e}")
-        return jsonify({'error': str(e)}), 500
\ No newline at end of file
+        db.session.rollback()
+        current_app.logger.error(f"Error al guardar dentigrama del paciente {paciente_id}: {e}", exc_info=True)
+        return jsonify({'error': 'No se pudo guardar el dentigrama.'}), 500
+
+    return jsonify({
+        'success': True,
+        'sin_cambios': not cambio,
+        'hash': paciente.dentigrama_hash,
+        'url': DentigramaService.url_imagen(paciente),
+    }), 200
+
+
+@pacientes_bp.route('/<int:paciente_id>/dentigrama/<hash_estado>.svg')
+@login_required
+def imagen_dentigrama(paciente_id, hash_estado):
+    """
+    Imagen del odontograma dibujada en el servidor. La URL lleva el hash del
+    contenido: la respuesta no cambia nunca y se cachea como inmutable.
+    """
+    query = Paciente.query.filter_by(id=paciente_id, is_deleted=False)
+    if not current_user.is_admin:
+        query = query.filter_by(odontologo_id=current_user.id)
+    paciente = query.first_or_404()
+
+    if not paciente.dentigrama_hash:
+        abort(404)
+    if paciente.dentigrama_hash != hash_estado:
+        # URL de un estado anterior: se envía al actual
+        return redirect(DentigramaService.url_imagen(paciente))
+
+    capa = request.args.get('capa', type=int) == 1
+    svg = DentigramaService.renderizar(paciente.dentigrama_estado, hash_estado, capa=capa)
+    respuesta = current_app.response_class(svg, mimetype='image/svg+xml')
+    respuesta.set_etag(f"{hash_estado}-{int(capa)}")
+    # private: es información clínica, no debe quedar en cachés compartidas
+    respuesta.headers['Cache-Control'] = 'private, max-age=31536000, immutable'
+    return respuesta.make_conditional(request)
+
+
+@pacientes_bp.route('/subidas/<token>')
+@login_required
+def ver_subida(token):
+    """Sirve una imagen mientras sube (URL provisional) o redirige a su URL definitiva."""
+    resultado = SubidaService.resolver(token)
+    if resultado is None:
+        abort(404)
+    tipo, destino = resultado
+    if tipo == 'url':
+        return redirect(destino)
+    tipo_mime = SubidaService.tipo_mime(destino)
+    if tipo_mime is None:
+        abort(404)
+    respuesta = send_file(destino, mimetype=tipo_mime, max_age=0)
+    respuesta.headers['X-Content-Type-Options'] = 'nosniff'
+    return respuesta
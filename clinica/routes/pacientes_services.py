@@ -1,115 +1,79 @@
 
 import os
-import uuid
 from datetime import datetime, date
-import cloudinary
-import cloudinary.uploader
 import pytz
 from flask import request, jsonify, flash, current_app
 from sqlalchemy import or_
 from ..extensions import db
-# IMPORTANTE: Asegúrate de importar EPS y Municipio aquí
-from ..models import Paciente, Cita, Evolucion, AuditLog, EPS, Municipio
-from ..utils import allowed_file, convertir_a_fecha, extract_public_id_from_url
+from ..models import Paciente, Cita, Evolucion, AuditLog
+from ..utils import convertir_a_fecha, extract_public_id_from_url, strftime_es
+from ..services.busqueda_service import BusquedaService
+from ..services.catalogo_cache import CatalogoCache
+from ..services.subidas_service import SubidaService
+from ..services.borrados_service import BorradoService
+from ..services.auditoria_service import AuditoriaService
+from ..services.dentigrama_service import DentigramaService
+from ..services.plan_service import PlanService
+from ..instrumentacion import contar_consultas
+from ..paginacion import paginar_keyset
 
 
 # =========================================================================
 # === FUNCIONES AUXILIARES PARA CLOUDINARY ===
 # =========================================================================
 
-def upload_file_to_cloudinary(file, folder_name="general_uploads"):
-    """Sube un objeto FileStorage a Cloudinary y devuelve su URL segura."""
-    if not file or file.filename == '': return None
-    if not allowed_file(file.filename): return None
-
-    try:
-        file.seek(0)
-        upload_result = cloudinary.uploader.upload(file, folder=folder_name)
-        return upload_result.get('secure_url')
-    except Exception as e:
-        current_app.logger.error(f"CLOUDINARY ERROR: {str(e)}", exc_info=True)
-        return None
-
-
-def upload_base64_dentigrama(base64_string, patient_id, specific_public_id=None):
-    """Sube dentigrama evitando subir URLs y gestionando nombres fijos."""
-    if not base64_string: return None
-    
-    # --- CORRECCIÓN CRÍTICA: Si ya es una URL, NO SUBIR NADA ---
-    # Esto arregla el error de que la imagen se borre al editar
-    if base64_string.startswith('http'): 
-        return base64_string 
-
-    if base64_string.startswith('data:image'):
-        try:
-            # Lógica de nombre: Si hay ID de paciente, ÚSALO. Si no, usa el específico o temporal.
-            if patient_id and str(patient_id) != "new_patient":
-                public_id = f"dentigrama_paciente_{patient_id}"
-            else:
-                public_id = specific_public_id or f"temp_dentigrama_{uuid.uuid4().hex}"
-
-            # Limpiamos el nombre para evitar carpetas duplicadas si el ID ya trae la carpeta
-            if "/" in public_id:
-                public_id = public_id.split("/")[-1]
-
-            upload_result = cloudinary.uploader.upload(
-                base64_string,
-                folder="dentigramas_pacientes",
-                public_id=public_id,
-                overwrite=True,      # ¡Clave! Sobreescribe si existe
-                invalidate=True,     # Limpia la caché visual
-                resource_type="image"
-            )
-            return upload_result.get('secure_url')
-        except Exception as e:
-            current_app.logger.error(f"DENTIGRAMA ERROR: {e}")
-            return None
-    return None
-
 def delete_from_cloudinary(url):
-    """Borra un recurso de Cloudinary dada su URL."""
-    if url and 'cloudinary.com' in url:
-        public_id = extract_public_id_from_url(url)
-        if public_id:
-            try:
-                cloudinary.uploader.destroy(public_id)
-                return True
-            except Exception as e:
-                current_app.logger.error(f"Error al eliminar recurso Cloudinary: {e}")
-                return False
-    return False
+    """
+    Registra el borrado de un recurso de Cloudinary dada su URL. Se ejecuta
+    tras el commit de la petición, por lotes (ver BorradoService).
+    """
+    return BorradoService.encolar_urls([url]) > 0
 
 
 def eliminar_imagenes_paciente(paciente, log_prefix="PACIENTE"):
-    """Elimina todas las imágenes de un paciente de Cloudinary."""
+    """Registra el borrado de todas las imágenes de un paciente en Cloudinary."""
     imagenes = [paciente.imagen_perfil_url, paciente.imagen_1, paciente.imagen_2, paciente.dentigrama_canvas]
-    for url in imagenes:
-        delete_from_cloudinary(url)
+    encolados = BorradoService.encolar_urls(imagenes)
+    current_app.logger.info(f"{log_prefix}: {encolados} imagen(es) del paciente {paciente.id} en cola de borrado")
 
 
 # =========================================================================
 # === SERVICIOS DE LÓGICA DE NEGOCIO ===
 # =========================================================================
 
-def listar_pacientes_service(usuario, page, search_term):
+def listar_pacientes_service(usuario, cursor, search_term, por_pagina=7):
+    """
+    Lista paginada por clave (ver paginar_keyset): por id descendente, o por
+    relevancia cuando hay búsqueda. El total se cuenta hasta LIMITE_CONTEO.
+    """
     query = Paciente.query.filter(Paciente.is_deleted == False)
 
     if not usuario.is_admin:
         query = query.filter(Paciente.odontologo_id == usuario.id)
 
     if search_term:
-        query = query.filter(
-            or_(
-                Paciente.nombres.ilike(f"%{search_term}%"),
-                Paciente.apellidos.ilike(f"%{search_term}%"),
-                Paciente.documento.ilike(f"%{search_term}%")
-            )
-        )
+        # Sustituye el ilike('%...%') sobre tres columnas por la búsqueda indexada
+        query = BusquedaService.filtrar(query, search_term)
     
-    return query.order_by(Paciente.id.desc()).paginate(page=page, per_page=7, error_out=False)
+    return paginar_keyset(query, BusquedaService.orden_paginado(search_term), cursor,
+                          por_pagina=por_pagina, contar=True)
 
 
 def obtener_paciente_service(paciente_id, usuario):
+    """
+    Arma el perfil del paciente (mostrar_paciente.html) en un número fijo de
+    consultas: el paciente y sus evoluciones, ya ordenadas por la base. Los
+    nombres de EPS y municipio salen de CatalogoCache (sin consultas con la
+    caché caliente). El total queda en el log (DEBUG) y las pruebas lo
+    verifican con instrumentacion.contar_consultas.
+    """
+    with contar_consultas() as consultas:
+        perfil = _cargar_perfil_paciente(paciente_id, usuario)
+    current_app.logger.debug(f"Perfil del paciente {paciente_id}: {consultas.total} consultas SQL")
+    return perfil
+
+
+def _cargar_perfil_paciente(paciente_id, usuario):
     # 1. Buscar Paciente
     query = Paciente.query.filter_by(id=paciente_id, is_deleted=False)
     if not usuario.is_admin:
@@ -126,7 +90,7 @@ def obtener_paciente_service(paciente_id, usuario):
     if paciente.codigo_aseguradora:
         # Limpiamos espacios y buscamos ignorando mayúsculas/minúsculas (ilike)
         cod_eps = str(paciente.codigo_aseguradora).strip()
-        eps_obj = EPS.query.filter(EPS.codigo.ilike(cod_eps)).first()
+        eps_obj = CatalogoCache.buscar_eps(cod_eps)
         
         if eps_obj:
             nombre_eps_display = eps_obj.nombre
@@ -142,14 +106,8 @@ def obtener_paciente_service(paciente_id, usuario):
         cod_mpio = str(paciente.codigo_municipio).strip()
         cod_dpto = str(paciente.codigo_departamento).strip()
 
-        # Intento 1: Búsqueda exacta (ej: busca '47189')
-        mpio_obj = Municipio.query.filter_by(codigo=cod_mpio).first()
-        
-        # Intento 2: Si falló, intentar con código corto (últimos 3 dígitos)
-        # Esto arregla el caso donde el paciente tiene '47189' pero la BD tiene '189'
-        if not mpio_obj and len(cod_mpio) > 2:
-            cod_corto = cod_mpio[-3:] 
-            mpio_obj = Municipio.query.filter_by(codigo=cod_corto, codigo_departamento=cod_dpto).first()
+        # Búsqueda exacta (ej: '47189') y, si falla, por código corto ('189')
+        mpio_obj = CatalogoCache.buscar_municipio(cod_mpio, cod_dpto)
 
         if mpio_obj:
             nombre_municipio_display = mpio_obj.nombre
@@ -178,6 +136,7 @@ def obtener_paciente_service(paciente_id, usuario):
         
         # --- Imágenes ---
         'dentigrama_canvas': paciente.dentigrama_canvas,
+        'dentigrama_svg_url': DentigramaService.url_imagen(paciente),
         'imagen_perfil_url': paciente.imagen_perfil_url,
         'imagen_1': paciente.imagen_1,
         'imagen_2': paciente.imagen_2,
@@ -223,15 +182,19 @@ def obtener_paciente_service(paciente_id, usuario):
         'observaciones': paciente.observaciones or 'No especificado',
     }
 
+    # 2. Evoluciones: una consulta con solo las columnas que se muestran, ordenada
+    # por la base (antes se recorría la relación dinámica y se ordenaba en Python)
+    evoluciones_ordenadas = Evolucion.query.with_entities(
+        Evolucion.id, Evolucion.descripcion, Evolucion.fecha
+    ).filter_by(paciente_id=paciente.id).order_by(Evolucion.fecha.desc(), Evolucion.id.desc()).all()
+
     evoluciones_procesadas = []
-    if paciente.evoluciones:
-        evoluciones_ordenadas = sorted(paciente.evoluciones, key=lambda evo: evo.fecha, reverse=True)
-        for evolucion_obj in evoluciones_ordenadas:
-            evoluciones_procesadas.append({
-                'id': evolucion_obj.id,
-                'descripcion': evolucion_obj.descripcion,
-                'fecha_formateada': evolucion_obj.fecha.strftime('%d de %B, %Y') if isinstance(evolucion_obj.fecha, (date, datetime)) else 'N/A'
-            })
+    for evolucion_obj in evoluciones_ordenadas:
+        evoluciones_procesadas.append({
+            'id': evolucion_obj.id,
+            'descripcion': evolucion_obj.descripcion,
+            'fecha_formateada': strftime_es(evolucion_obj.fecha, '%d de %B, %Y') if isinstance(evolucion_obj.fecha, (date, datetime)) else 'N/A'
+        })
 
     full_public_id_trazos = None
     if paciente.dentigrama_canvas:
@@ -284,7 +247,7 @@ def crear_paciente_service(form_data, files, usuario):
         nombre_eps_guardar = form_data.get('aseguradora')
 
         if cod_eps:
-            eps_obj = EPS.query.filter_by(codigo=cod_eps).first()
+            eps_obj = CatalogoCache.buscar_eps(cod_eps)
             if eps_obj: nombre_eps_guardar = eps_obj.nombre
         
         # --- B. Procesar Municipio y Departamento ---
@@ -294,35 +257,18 @@ def crear_paciente_service(form_data, files, usuario):
         nombre_dpto_guardar = form_data.get('departamento')
 
         if cod_mpio:
-            mpio_obj = Municipio.query.filter_by(codigo=cod_mpio).first()
-            if not mpio_obj and len(cod_mpio) > 3 and cod_dpto:
-                short_code = cod_mpio[-3:]
-                mpio_obj = Municipio.query.filter_by(codigo=short_code, codigo_departamento=cod_dpto).first()
+            mpio_obj = CatalogoCache.buscar_municipio(cod_mpio, cod_dpto)
 
             if mpio_obj:
                 nombre_mpio_guardar = mpio_obj.nombre
                 nombre_dpto_guardar = mpio_obj.nombre_departamento
 
-        # ==============================================================================
-        # PROCESAMIENTO DENTIGRAMA (FASE 1: Subida inicial / Temporal)
-        # ==============================================================================
         primer_nombre = form_data.get('primer_nombre', '').strip()
         primer_apellido = form_data.get('primer_apellido', '').strip()
 
+        # --- C. Dentigrama: el PNG va al spool; la subida ocurre tras el commit ---
         raw_dentigrama = form_data.get('dentigrama_url') or form_data.get('dentigrama_canvas')
-        
-        # Corrección: Obtenemos el ID temporal que viene del input hidden del HTML
-        public_id_temporal = form_data.get('dentigrama_public_id') 
-
-        dentigrama_final_url = None
-        
-        if raw_dentigrama:
-             # Pasamos el ID temporal explícitamente para que Cloudinary sepa cuál es
-             dentigrama_final_url = upload_base64_dentigrama(
-                 raw_dentigrama, 
-                 "new_patient", 
-                 specific_public_id=public_id_temporal 
-             )
+        dentigrama_final_url = SubidaService.guardar_valor_dentigrama(raw_dentigrama)
 
         nuevo_paciente = Paciente(
             # --- Datos Personales ---
@@ -384,54 +330,37 @@ def crear_paciente_service(form_data, files, usuario):
             odontologo_id=usuario.id
         )
 
-        # 3. Subida de Imágenes Adicionales
+        # Estado del odontograma (JSON por diente; la imagen se dibuja en el servidor)
+        if form_data.get('dentigrama_estado'):
+            try:
+                DentigramaService.aplicar(nuevo_paciente, form_data.get('dentigrama_estado'))
+            except ValueError as e:
+                return {'success': False, 'message': str(e)}
+
+        # Cupo del día: se reserva en la misma transacción que el paciente, así el
+        # límite se cumple aunque dos peticiones pasen a la vez la verificación en caché.
+        # Sin plan activo no hay límite que aplicar.
+        cupo = PlanService.reservar_cupo_paciente(usuario.id)
+        if cupo.get('exito') is False:
+            db.session.rollback()
+            return {'success': False, 'limite_alcanzado': True,
+                    'message': 'Límite diario de pacientes alcanzado. Vuelve mañana o actualiza tu plan.'}
+
+        # 3. Imágenes adicionales (al spool; ver SubidaService)
         if 'imagen_perfil' in files:
-            nuevo_paciente.imagen_perfil_url = upload_file_to_cloudinary(files['imagen_perfil'], "pacientes_perfil")
+            nuevo_paciente.imagen_perfil_url = SubidaService.guardar_archivo(files['imagen_perfil'])
         if 'imagen_1' in files:
-            nuevo_paciente.imagen_1 = upload_file_to_cloudinary(files['imagen_1'], "paciente_imagenes")
+            nuevo_paciente.imagen_1 = SubidaService.guardar_archivo(files['imagen_1'])
         if 'imagen_2' in files:
-            nuevo_paciente.imagen_2 = upload_file_to_cloudinary(files['imagen_2'], "paciente_imagenes")
+            nuevo_paciente.imagen_2 = SubidaService.guardar_archivo(files['imagen_2'])
 
-        # 4. GUARDAR INICIAL (Obtenemos el ID del paciente)
+        # 4. GUARDAR INICIAL (paciente y cupo en el mismo commit)
         db.session.add(nuevo_paciente)
         db.session.commit()
 
-        # ==============================================================================
-        # ▼▼▼ CORRECCIÓN DEFINITIVA RENOMBRADO (ANTI-DUPLICADOS) ▼▼▼
-        # ==============================================================================
-        # Usamos el public_id_temporal que vino del formulario. Es más seguro que extraerlo de la URL.
-        # Si existe y contiene "temp_", lo renombramos al ID definitivo.
-        if public_id_temporal and "temp_" in public_id_temporal:
-            try:
-                # Nombre final deseado: dentigramas_pacientes/dentigrama_paciente_{id}
-                final_public_id = f"dentigramas_pacientes/dentigrama_paciente_{nuevo_paciente.id}"
-                
-                # Si el input venía solo como nombre (sin carpeta), le agregamos la carpeta para que Cloudinary lo encuentre
-                current_public_id_full = public_id_temporal
-                if "/" not in current_public_id_full:
-                     current_public_id_full = f"dentigramas_pacientes/{public_id_temporal}"
-
-                # Renombrar en Cloudinary (Mueve el archivo, overwrite=True borra si ya existía basura ahí)
-                upload_response = cloudinary.uploader.rename(
-                    current_public_id_full, 
-                    final_public_id, 
-                    overwrite=True
-                )
-                
-                # Actualizar URL en BD con la nueva dirección renombrada
-                nuevo_paciente.dentigrama_canvas = upload_response.get('secure_url')
-                db.session.commit()
-                
-            except Exception as e:
-                # Si falla (ej: no encontró la imagen), registramos el error pero no bloqueamos el flujo
-                current_app.logger.warning(f"No se pudo renombrar dentigrama: {e}")
-
-        # 5. Contador
-        try:
-            from clinica.services.plan_service import PlanService
-            PlanService.incrementar_contador_paciente(usuario.id)
-        except Exception:
-            pass
+        # Subida a Cloudinary en segundo plano; el dentigrama toma su nombre
+        # definitivo (dentigrama_paciente_{id}) sin pasar por un temporal
+        SubidaService.programar_pendientes(nuevo_paciente)
 
         return {'success': True, 'message': 'Paciente guardado con éxito', 'paciente_id': nuevo_paciente.id}
 
@@ -486,17 +415,14 @@ def editar_paciente_service(paciente_id, form_data, files, usuario):
         paciente.codigo_municipio = cod_mpio
         
         if cod_eps:
-            eps_obj = EPS.query.filter(EPS.codigo.ilike(cod_eps)).first()
+            eps_obj = CatalogoCache.buscar_eps(cod_eps)
             paciente.aseguradora = eps_obj.nombre if eps_obj else form_data.get('aseguradora')
         else:
             paciente.aseguradora = form_data.get('aseguradora')
 
         municipio_encontrado = False
         if cod_mpio and cod_dpto:
-            mpio_obj = Municipio.query.filter_by(codigo=cod_mpio).first()
-            if not mpio_obj and len(cod_mpio) > 2:
-                cod_corto = cod_mpio[-3:]
-                mpio_obj = Municipio.query.filter_by(codigo=cod_corto, codigo_departamento=cod_dpto).first()
+            mpio_obj = CatalogoCache.buscar_municipio(cod_mpio, cod_dpto)
             
             if mpio_obj:
                 paciente.municipio = mpio_obj.nombre
@@ -551,19 +477,19 @@ def editar_paciente_service(paciente_id, form_data, files, usuario):
             paciente.imagen_2 = None
 
         if 'imagen_perfil' in files and files['imagen_perfil'].filename != '':
-             nueva_url = upload_file_to_cloudinary(files['imagen_perfil'], "pacientes_perfil")
+             nueva_url = SubidaService.guardar_archivo(files['imagen_perfil'])
              if nueva_url:
                  if paciente.imagen_perfil_url: delete_from_cloudinary(paciente.imagen_perfil_url)
                  paciente.imagen_perfil_url = nueva_url
 
         if 'imagen_1' in files and files['imagen_1'].filename != '':
-             nueva_url = upload_file_to_cloudinary(files['imagen_1'], "paciente_imagenes")
+             nueva_url = SubidaService.guardar_archivo(files['imagen_1'])
              if nueva_url:
                  if paciente.imagen_1: delete_from_cloudinary(paciente.imagen_1)
                  paciente.imagen_1 = nueva_url
 
         if 'imagen_2' in files and files['imagen_2'].filename != '':
-             nueva_url = upload_file_to_cloudinary(files['imagen_2'], "paciente_imagenes")
+             nueva_url = SubidaService.guardar_archivo(files['imagen_2'])
              if nueva_url:
                  if paciente.imagen_2: delete_from_cloudinary(paciente.imagen_2)
                  paciente.imagen_2 = nueva_url
@@ -574,17 +500,22 @@ def editar_paciente_service(paciente_id, form_data, files, usuario):
         raw_dentigrama = form_data.get('dentigrama_url') or form_data.get('dentigrama_canvas')
         
         if raw_dentigrama:
-            # 1. Subimos (o validamos) la imagen. Como usamos el ID del paciente, 
+            # El PNG va al spool y se sube con el nombre fijo dentigrama_paciente_{id}:
             # Cloudinary SOBREESCRIBE el archivo existente.
-            nueva_url = upload_base64_dentigrama(raw_dentigrama, paciente.id)
+            nueva_url = SubidaService.guardar_valor_dentigrama(raw_dentigrama)
             
             if nueva_url:
-                # ⚠️ IMPORTANTE: ELIMINAMOS EL DELETE AQUÍ ⚠️
+                # ⚠️ IMPORTANTE: NO SE BORRA EL ANTERIOR ⚠️
                 # No debemos borrar 'paciente.dentigrama_canvas' antiguo, porque al tener
                 # el mismo nombre público que el nuevo, borraríamos lo que acabamos de subir.
                 paciente.dentigrama_canvas = nueva_url
 
+        # Estado del odontograma: si no cambió (mismo hash) no se toca la fila
+        if form_data.get('dentigrama_estado'):
+            DentigramaService.aplicar(paciente, form_data.get('dentigrama_estado'))
+
         db.session.commit()
+        SubidaService.programar_pendientes(paciente)
         return {'success': True, 'message': 'Paciente actualizado correctamente'}
 
     except Exception as e:
@@ -620,7 +551,8 @@ def borrar_paciente_service(paciente_id, usuario):
         if citas_del_paciente:
             log_descripcion += f" También se movieron {len(citas_del_paciente)} cita(s) asociadas."
             
-        audit_entry = AuditLog(
+        AuditoriaService.registrar(
+            AuditLog,
             action_type="SOFT_DELETE_PACIENTE",
             description=log_descripcion,
             target_model="Paciente",
@@ -628,7 +560,6 @@ def borrar_paciente_service(paciente_id, usuario):
             user_id=usuario.id,
             user_username=usuario.username
         )
-        db.session.add(audit_entry)
         db.session.commit()
         
         return {'success': True, 'message': f"Paciente '{paciente_nombre_completo}' movido a la papelera."}
@@ -640,26 +571,26 @@ def borrar_paciente_service(paciente_id, usuario):
 
 
 def subir_dentigrama_service(image_data, patient_id):
-    """Sube un dentigrama a Cloudinary (Usa Helper Seguro)."""
+    """Guarda un dentigrama en el spool y programa su subida a Cloudinary."""
     if not image_data:
         return {'success': False, 'message': 'No se proporcionaron datos de imagen'}
 
     try:
-        url = upload_base64_dentigrama(image_data, patient_id)
+        url = SubidaService.guardar_base64(image_data)
         
         if url:
-            # Actualizar BD inmediatamente si hay paciente
+            # Actualizar BD inmediatamente si hay paciente (el nombre público es fijo,
+            # así que la subida sobreescribe el dentigrama anterior)
             if patient_id:
-                patient = Paciente.query.get(patient_id)
+                patient = db.session.get(Paciente, patient_id)
                 if patient:
-                     if patient.dentigrama_canvas and patient.dentigrama_canvas != url:
-                        delete_from_cloudinary(patient.dentigrama_canvas)
                      patient.dentigrama_canvas = url
                      db.session.commit()
+                     SubidaService.programar_pendientes(patient)
             
-            return {'success': True, 'url': url, 'message': 'Dentigrama subido exitosamente'}
+            return {'success': True, 'url': url, 'message': 'Dentigrama recibido'}
         else:
-            return {'success': False, 'message': 'Error al subir el dentigrama a Cloudinary.'}
+            return {'success': False, 'message': 'La imagen del dentigrama no es válida.'}
 
     except Exception as e:
-        return {'success': False, 'message': 'Ocurrió un error inesperado al subir el dentigrama.'}
\ No newline at end of file
+        return {'success': False, 'message': 'Ocurrió un error inesperado al subir el dentigrama.'}
@@ -1,14 +1,17 @@
 # clinica/routes/papelera.py
 import os
-import cloudinary.uploader
 from flask import (
     Blueprint, render_template, request, redirect, url_for, flash, current_app
 )
 from flask_login import login_required, current_user
+from datetime import datetime
+from sqlalchemy import func
 from sqlalchemy.orm import joinedload
-from ..utils import extract_public_id_from_url
+from ..paginacion import PaginaKeyset, paginar_keyset
+from ..services.auditoria_service import AuditoriaService
+from ..services.borrados_service import BorradoService
 from ..extensions import db
-from ..models import Paciente, Cita, Evolucion, AuditLog, Procedimiento, Factura
+from ..models import Paciente, Cita, CitaBorrada, Evolucion, AuditLog, Procedimiento, Factura
 try:
     from . import utils
 except ImportError:
@@ -17,47 +20,53 @@ except ImportError:
 papelera_bp = Blueprint('papelera', __name__, template_folder='../templates')
 
 
+# Las filas antiguas pueden no tener deleted_at: se ordenan como las más viejas
+_SIN_FECHA = datetime(1970, 1, 1)
+POR_PAGINA_PAPELERA = 20
+
+
 @papelera_bp.route("/")
 @login_required
 def ver_papelera():
-    """Muestra los elementos que han sido 'soft-deleted', filtrando por usuario."""
+    """
+    Muestra los elementos que han sido 'soft-deleted', filtrando por usuario.
+    Cada lista se pagina por cursor (deleted_at desc, id desc); al paginar una,
+    la otra vuelve a su primera página.
+    """
+    cursor_pacientes = request.args.get('cursor_pacientes')
+    cursor_citas = request.args.get('cursor_citas')
     try:
-        if current_user.is_admin:
-            # El admin ve todo, sin filtros de usuario
-            pacientes_eliminados = Paciente.query.filter_by(is_deleted=True)\
-                                                .order_by(Paciente.deleted_at.desc()).limit(20).all()
-            
-            citas_eliminadas = Cita.query.filter_by(is_deleted=True)\
-                                        .options(joinedload(Cita.paciente))\
-                                        .order_by(Cita.deleted_at.desc()).limit(20).all()
-        else:
+        query_pacientes = Paciente.query.filter_by(is_deleted=True)
+        query_citas = Cita.query.filter(Cita.is_deleted == True).options(joinedload(Cita.paciente))
+        if not current_user.is_admin:
             # --- FILTRO PARA USUARIO NORMAL (DOCTOR) ---
-            
-            # 1. Filtro para pacientes (Este ya estaba correcto, usa 'odontologo_id')
-            pacientes_eliminados = Paciente.query.filter_by(
-                is_deleted=True, 
-                odontologo_id=current_user.id
-            ).order_by(Paciente.deleted_at.desc()).limit(20).all()
-
-            # 2. Filtro para citas (ESTA ES LA CORRECCIÓN)
-            # Usamos .join() para "unir" temporalmente la tabla Cita con la tabla Paciente
-            # y luego filtramos por el 'odontologo_id' del paciente asociado.
-            citas_eliminadas = Cita.query.join(Paciente).filter(
-                Cita.is_deleted == True,
-                Paciente.odontologo_id == current_user.id
-            ).options(joinedload(Cita.paciente))\
-                .order_by(Cita.deleted_at.desc()).limit(20).all()
+            # Las citas se filtran por el 'odontologo_id' del paciente asociado
+            query_pacientes = query_pacientes.filter_by(odontologo_id=current_user.id)
+            query_citas = query_citas.join(Paciente, Cita.paciente_id == Paciente.id)\
+                .filter(Paciente.odontologo_id == current_user.id)
+
+        pacientes_eliminados = paginar_keyset(
+            query_pacientes,
+            [(func.coalesce(Paciente.deleted_at, _SIN_FECHA), True), (Paciente.id, True)],
+            cursor_pacientes, por_pagina=POR_PAGINA_PAPELERA,
+        )
+        citas_eliminadas = paginar_keyset(
+            query_citas,
+            [(func.coalesce(Cita.deleted_at, _SIN_FECHA), True), (Cita.id, True)],
+            cursor_citas, por_pagina=POR_PAGINA_PAPELERA,
+        )
 
     except Exception as e:
         current_app.logger.error(f"Error al cargar la papelera para el usuario {current_user.id}: {e}", exc_info=True)
         flash("Hubo un error al cargar los elementos de la papelera.", "danger")
-        pacientes_eliminados = []
-        citas_eliminadas = []
+        pacientes_eliminados = PaginaKeyset([], POR_PAGINA_PAPELERA)
+        citas_eliminadas = PaginaKeyset([], POR_PAGINA_PAPELERA)
 
     return render_template(
         "papelera.html", 
         pacientes_eliminados=pacientes_eliminados, 
-        citas_eliminadas=citas_eliminadas
+        citas_eliminadas=citas_eliminadas,
+        pestana='citas' if cursor_citas else 'pacientes',
     )
 
 @papelera_bp.route('/restaurar', methods=['POST'])
@@ -99,7 +108,8 @@ def restaurar_elemento():
         
         # Crear log de auditoría
         log_description = f"{target_model_str} (ID: {target_id}) restaurado desde la papelera."
-        audit_entry = AuditLog(
+        AuditoriaService.registrar(
+            AuditLog,
             action_type=f"RESTAURAR_{target_model_str.upper()}",
             description=log_description,
             target_model=target_model_str,
@@ -107,7 +117,6 @@ def restaurar_elemento():
             user_id=current_user.id,
             user_username=current_user.username
         )
-        db.session.add(audit_entry)
         db.session.commit()
         flash(f"{target_model_str} restaurado correctamente.", "success")
     except Exception as e:
@@ -152,33 +161,13 @@ def eliminar_permanentemente():
         
         # --- 👇▼▼▼ INICIO DEL BLOQUE MODIFICADO ▼▼▼👇 ---
         if target_model_str == "Paciente":
-            # --- INICIO DE LA DEPURACIÓN ---
-            print("=============================================")
-            print(f"INICIANDO BORRADO PERMANENTE DEL PACIENTE ID: {objeto_a_eliminar.id}")
-            print(f"URL del Dentigrama: {objeto_a_eliminar.dentigrama_canvas}")
-            print(f"URL de Imagen 1: {objeto_a_eliminar.imagen_1}")
-            print(f"URL de Imagen 2: {objeto_a_eliminar.imagen_2}")
-            print("---------------------------------------------")
-            # --- FIN DE LA DEPURACIÓN ---
-
-            # --- NUEVA LÓGICA: Eliminar imágenes de Cloudinary ---
-            urls_a_borrar = [
+            # --- Imágenes: se borran de Cloudinary tras el commit, por lotes (BorradoService) ---
+            BorradoService.encolar_urls([
+                objeto_a_eliminar.imagen_perfil_url,
                 objeto_a_eliminar.dentigrama_canvas,
                 objeto_a_eliminar.imagen_1,
                 objeto_a_eliminar.imagen_2
-            ]
-
-            for url in urls_a_borrar:
-                if url:
-                    public_id = extract_public_id_from_url(url)
-                    if public_id:
-                        try:
-                            # Le pedimos a Cloudinary que destruya la imagen
-                            cloudinary.uploader.destroy(public_id)
-                            current_app.logger.info(f"Éxito al eliminar de Cloudinary: {public_id}")
-                        except Exception as e_cloud:
-                            # Si falla, solo lo registramos, pero no detenemos el proceso
-                            current_app.logger.error(f"Fallo al eliminar de Cloudinary {public_id}: {e_cloud}")
+            ])
             
             # --- 👇▼▼▼ INICIO DEL BLOQUE DE ELIMINACIÓN EN CASCADA CORREGIDO ▼▼▼👇 ---
 
@@ -193,6 +182,8 @@ def eliminar_permanentemente():
 
         # 3. Eliminar TODAS las CITAS asociadas al paciente
         # ESTE PASO VA AHORA, ANTES DE ELIMINAR LAS FACTURAS
+        # (el DELETE masivo no dispara los eventos del ORM: las lápidas de la agenda se dejan aquí)
+        CitaBorrada.registrar(Cita.paciente_id == target_id)
         Cita.query.filter_by(paciente_id=target_id).delete(synchronize_session=False)
         current_app.logger.info(f"Eliminadas citas del paciente {target_id}.")
 
@@ -207,7 +198,8 @@ def eliminar_permanentemente():
         db.session.delete(objeto_a_eliminar)
 
         # Crear log de auditoría
-        audit_entry = AuditLog(
+        AuditoriaService.registrar(
+            AuditLog,
             action_type=f"DELETE_PERMANENT_{target_model_str.upper()}",
             description=f"{log_descripcion_base} eliminado permanentemente.",
             target_model=target_model_str,
@@ -215,7 +207,6 @@ def eliminar_permanentemente():
             user_id=current_user.id,
             user_username=current_user.username
         )
-        db.session.add(audit_entry)
 
         db.session.commit()
         flash(f"{target_model_str} ha sido eliminado permanentemente.", "success")
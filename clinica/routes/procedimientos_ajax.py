@@ -1,7 +1,7 @@
 from flask import Blueprint, jsonify, request
 from flask_login import login_required
-from sqlalchemy import or_
-from ..models import CUPSCode, CIE10 # Asegúrate de que importas tus modelos correctamente
+from ..services.catalogo_cache import CatalogoCache
+from ..utils import respuesta_json_cacheable
 
 # Creamos un Blueprint separado para no mezclarlo con pacientes
 procedimientos_ajax_bp = Blueprint('procedimientos_ajax', __name__, url_prefix='/api/procedimientos')
@@ -14,13 +14,8 @@ def buscar_cups():
     if not termino or len(termino) < 2:
         return jsonify([])
 
-    # Buscamos coincidencias en código O descripción
-    resultados = CUPSCode.query.filter(
-        or_(
-            CUPSCode.code.ilike(f"%{termino}%"),
-            CUPSCode.description.ilike(f"%{termino}%")
-        )
-    ).limit(10).all()
+    # Buscamos coincidencias en código O descripción (índice en memoria)
+    resultados = CatalogoCache.buscar_cups(termino, limite=10)
 
     # Formateamos para que el JS lo entienda fácil
     sugerencias = [{
@@ -28,7 +23,7 @@ def buscar_cups():
         'label': f"{r.code} - {r.description}"
     } for r in resultados]
     
-    return jsonify(sugerencias)
+    return respuesta_json_cacheable(sugerencias, f"cups:{CatalogoCache.version('cups')}")
 
 @procedimientos_ajax_bp.route('/buscar_cie10')
 @login_required
@@ -38,16 +33,11 @@ def buscar_cie10():
     if not termino or len(termino) < 2:
         return jsonify([])
 
-    resultados = CIE10.query.filter(
-        or_(
-            CIE10.codigo.ilike(f"%{termino}%"),
-            CIE10.descripcion.ilike(f"%{termino}%")
-        )
-    ).limit(10).all()
+    resultados = CatalogoCache.buscar_cie10(termino, limite=10)
 
     sugerencias = [{
         'val': r.codigo, 
         'label': f"{r.codigo} - {r.descripcion}"
     } for r in resultados]
     
-    return jsonify(sugerencias)
\ No newline at end of file
+    return respuesta_json_cacheable(sugerencias, f"cie10:{CatalogoCache.version('cie10')}")
\ No newline at end of file
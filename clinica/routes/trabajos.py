@@ -0,0 +1,100 @@
+# clinica/routes/trabajos.py
+
+from flask import Blueprint, jsonify, request, send_file, url_for, abort
+from flask_login import login_required, current_user
+
+from ..extensions import db
+from ..models import Paciente
+from ..services.busqueda_service import BusquedaService
+from ..services.trabajos_service import TrabajoService, TERMINADO
+
+trabajos_bp = Blueprint('trabajos', __name__)
+
+# Tope de historias por exportación masiva (el ZIP se genera en un solo trabajo)
+MAX_PACIENTES_EXPORTACION = 5000
+
+
+def _trabajo_json(trabajo):
+    datos = trabajo.to_dict()
+    datos['url_estado'] = url_for('trabajos.estado_trabajo', trabajo_id=trabajo.id)
+    datos['url_descarga'] = (
+        url_for('trabajos.descargar_trabajo', trabajo_id=trabajo.id)
+        if trabajo.estado == TERMINADO else None
+    )
+    return datos
+
+
+# --- Encolar la exportación de un paciente (Excel / Word) ---
+@trabajos_bp.route('/exportar/<tipo>', methods=['POST'])
+@login_required
+def encolar_exportacion_paciente(tipo):
+    if tipo not in ('excel', 'word'):
+        return jsonify({'error': 'Tipo de exportación no soportado.'}), 400
+
+    paciente_id = request.form.get('paciente_id', type=int)
+    paciente = db.session.get(Paciente, paciente_id) if paciente_id else None
+    if paciente is None:
+        return jsonify({'error': 'Paciente no encontrado.'}), 404
+    if not current_user.is_admin and paciente.odontologo_id != current_user.id:
+        return jsonify({'error': 'No tienes permiso para exportar este paciente.'}), 403
+
+    trabajo = TrabajoService.encolar(tipo, {'paciente_id': paciente.id}, current_user)
+    return jsonify(_trabajo_json(trabajo)), 202
+
+
+# --- Encolar la exportación masiva de historias clínicas (ZIP de Word) ---
+@trabajos_bp.route('/exportar/historias', methods=['POST'])
+@login_required
+def encolar_exportacion_historias():
+    """
+    Recibe una lista de IDs (paciente_ids=1,2,3) o el mismo filtro del listado
+    de pacientes (buscar=...; vacío = todos). Los IDs se resuelven aquí, con los
+    permisos del usuario, y el trabajo solo recibe la lista final.
+    """
+    query = Paciente.query.filter(Paciente.is_deleted == False)
+    if not current_user.is_admin:
+        query = query.filter(Paciente.odontologo_id == current_user.id)
+
+    ids_texto = request.form.get('paciente_ids', '').strip()
+    if ids_texto:
+        try:
+            ids_pedidos = [int(valor) for valor in ids_texto.split(',') if valor.strip()]
+        except ValueError:
+            return jsonify({'error': 'Lista de pacientes inválida.'}), 400
+        query = query.filter(Paciente.id.in_(ids_pedidos)).order_by(Paciente.id)
+    else:
+        query = BusquedaService.filtrar(query.order_by(Paciente.id.desc()), request.form.get('buscar', '').strip())
+
+    paciente_ids = [fila.id for fila in query.with_entities(Paciente.id).limit(MAX_PACIENTES_EXPORTACION + 1)]
+    if not paciente_ids:
+        return jsonify({'error': 'No hay pacientes para exportar.'}), 404
+    if len(paciente_ids) > MAX_PACIENTES_EXPORTACION:
+        return jsonify({'error': f'Máximo {MAX_PACIENTES_EXPORTACION} pacientes por exportación. Usa un filtro.'}), 400
+
+    trabajo = TrabajoService.encolar('historias', {'paciente_ids': paciente_ids}, current_user)
+    return jsonify(_trabajo_json(trabajo)), 202
+
+
+# --- Consultar el estado (polling desde el navegador) ---
+@trabajos_bp.route('/<trabajo_id>')
+@login_required
+def estado_trabajo(trabajo_id):
+    trabajo = TrabajoService.obtener(trabajo_id, current_user)
+    if trabajo is None:
+        return jsonify({'error': 'Trabajo no encontrado.'}), 404
+    return jsonify(_trabajo_json(trabajo))
+
+
+# --- Descargar el archivo generado ---
+@trabajos_bp.route('/<trabajo_id>/descargar')
+@login_required
+def descargar_trabajo(trabajo_id):
+    trabajo = TrabajoService.obtener(trabajo_id, current_user)
+    if trabajo is None:
+        abort(404)
+    if trabajo.estado != TERMINADO:
+        return jsonify({'error': 'El archivo todavía no está listo.', 'estado': trabajo.estado}), 409
+    if not TrabajoService.archivo_disponible(trabajo):
+        # Vencido o borrado del disco
+        abort(410)
+    return send_file(trabajo.ruta_archivo, download_name=trabajo.nombre_archivo, as_attachment=True)
@@ -0,0 +1,189 @@
+# clinica/services/auditoria_service.py
+
+import atexit
+import queue
+import threading
+import time
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from clinica.extensions import db
+from clinica.models import AuditLog, AuditoriaAcceso
+
+# Clave de session.info donde esperan los registros hasta el commit
+_CLAVE_PENDIENTES = 'auditoria_pendiente'
+
+MODELOS_AUDITORIA = (AuditLog, AuditoriaAcceso)
+
+
+def _fila_completa(modelo, campos):
+    """
+    Todas las columnas insertables del modelo (las que faltan con su default o
+    None). El lote se inserta con un executemany que se compila con las claves
+    de la primera fila: con claves distintas se perderían valores o fallaría
+    el lote entero.
+    """
+    columnas = {columna.key: columna for columna in modelo.__table__.columns if not columna.primary_key}
+    desconocidas = set(campos) - set(columnas)
+    if desconocidas:
+        raise ValueError(f"{modelo.__name__} no tiene las columnas: {', '.join(sorted(desconocidas))}")
+    fila = {}
+    for nombre, columna in columnas.items():
+        if nombre in campos:
+            fila[nombre] = campos[nombre]
+        elif columna.default is not None and columna.default.is_scalar:
+            fila[nombre] = columna.default.arg
+        elif columna.default is not None and columna.default.is_callable:
+            fila[nombre] = columna.default.arg(None)
+        else:
+            fila[nombre] = None
+    return fila
+
+
+class AuditoriaService:
+    """
+    Escritura de AuditLog y AuditoriaAcceso fuera de la transacción del usuario.
+
+    registrar() no toca la sesión: guarda el registro en session.info y, al
+    confirmar la transacción de la petición, lo pasa a una cola acotada del
+    proceso (AUDITORIA_COLA_MAX, 1000 por defecto). Si la transacción hace
+    rollback el registro se descarta, igual que cuando iba en la misma sesión.
+    Con tras_commit=False se encola de inmediato (p. ej. un intento rechazado,
+    donde la petición no confirma nada).
+
+    Un hilo por proceso vacía la cola con un INSERT por modelo cada
+    AUDITORIA_INTERVALO_MS milisegundos (500) o cada AUDITORIA_LOTE registros
+    (100), en una conexión propia. Si la cola está llena el registro se
+    escribe en el momento; al terminar el proceso (atexit o worker_exit de
+    gunicorn) se escribe lo que quede. Con AUDITORIA_SINCRONO (activo en
+    TESTING) todo se escribe dentro de la misma petición.
+    """
+
+    _cola = None
+    _hilo = None
+    _app = None
+    _lock = threading.Lock()
+    _detener = threading.Event()
+
+    @staticmethod
+    def registrar(modelo, tras_commit=True, **campos):
+        """Registra una fila de `modelo` (AuditLog o AuditoriaAcceso) con esos valores de columna."""
+        if modelo not in MODELOS_AUDITORIA:
+            raise ValueError(f"Modelo de auditoría desconocido: {modelo.__name__}")
+        # La hora es la de la acción, no la de la escritura
+        campos.setdefault('timestamp', datetime.utcnow())
+        registro = (modelo, _fila_completa(modelo, campos))
+        if tras_commit:
+            db.session.info.setdefault(_CLAVE_PENDIENTES, []).append(registro)
+        else:
+            AuditoriaService._encolar([registro])
+
+    @classmethod
+    def _encolar(cls, registros):
+        app = current_app._get_current_object()
+        if app.config.get('AUDITORIA_SINCRONO', app.testing):
+            cls._escribir(registros)
+            return
+        cls._iniciar(app)
+        desbordados = []
+        for registro in registros:
+            try:
+                cls._cola.put_nowait(registro)
+            except queue.Full:
+                desbordados.append(registro)
+        if desbordados:
+            app.logger.warning(f"AUDITORIA: cola llena, se escriben {len(desbordados)} registro(s) en la petición.")
+            cls._escribir(desbordados)
+
+    @classmethod
+    def _iniciar(cls, app):
+        with cls._lock:
+            if cls._hilo is not None:
+                return
+            cls._app = app
+            cls._cola = queue.Queue(maxsize=app.config.get('AUDITORIA_COLA_MAX', 1000))
+            cls._detener.clear()
+            cls._hilo = threading.Thread(target=cls._ciclo, name='auditoria', daemon=True)
+            cls._hilo.start()
+
+    @classmethod
+    def _ciclo(cls):
+        app = cls._app
+        intervalo = app.config.get('AUDITORIA_INTERVALO_MS', 500) / 1000
+        tamano_lote = app.config.get('AUDITORIA_LOTE', 100)
+        while not cls._detener.is_set():
+            try:
+                lote = [cls._cola.get(timeout=intervalo)]
+            except queue.Empty:
+                continue
+            # Junta lo que llegue hasta completar el lote o cumplir el intervalo
+            limite = time.monotonic() + intervalo
+            while len(lote) < tamano_lote:
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    break
+                try:
+                    lote.append(cls._cola.get(timeout=restante))
+                except queue.Empty:
+                    break
+            with app.app_context():
+                cls._escribir(lote)
+
+    @staticmethod
+    def _escribir(registros):
+        """Inserta los registros en una transacción propia, un INSERT por modelo."""
+        por_modelo = {}
+        for modelo, campos in registros:
+            por_modelo.setdefault(modelo, []).append(campos)
+        try:
+            with db.engine.begin() as conexion:
+                for modelo, filas in por_modelo.items():
+                    conexion.execute(modelo.__table__.insert(), filas)
+        except Exception as e:
+            # Que al menos quede constancia en el log de lo que no se pudo guardar
+            current_app.logger.error(
+                f"AUDITORIA: no se pudieron guardar {len(registros)} registro(s): {e} "
+                f"{[(modelo.__name__, campos) for modelo, campos in registros]}", exc_info=True)
+
+    @classmethod
+    def vaciar(cls, espera=5):
+        """Detiene el hilo y escribe lo que quede en la cola. Se llama al terminar el proceso."""
+        with cls._lock:
+            hilo, app = cls._hilo, cls._app
+            cls._hilo = None
+        if hilo is None:
+            return 0
+        cls._detener.set()
+        hilo.join(espera)
+        pendientes = []
+        while True:
+            try:
+                pendientes.append(cls._cola.get_nowait())
+            except queue.Empty:
+                break
+        if pendientes:
+            with app.app_context():
+                cls._escribir(pendientes)
+        return len(pendientes)
+
+
+atexit.register(AuditoriaService.vaciar)
+
+
+# =========================================================================
+# === ENCOLADO AL CONFIRMAR (eventos de sesión) ===
+# =========================================================================
+
+@event.listens_for(Session, 'after_commit')
+def _encolar_auditoria(session):
+    pendientes = session.info.pop(_CLAVE_PENDIENTES, None)
+    if pendientes:
+        AuditoriaService._encolar(pendientes)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _descartar_auditoria(session):
+    session.info.pop(_CLAVE_PENDIENTES, None)
@@ -0,0 +1,200 @@
+# clinica/services/borrados_service.py
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import delete, event, func, select, update
+from sqlalchemy.orm import Session
+
+from clinica.extensions import db
+from clinica.models import BorradoPendiente
+from clinica.services.subidas_service import SubidaService
+
+# delete_resources de Cloudinary acepta hasta 100 public_ids por llamada
+TAMANO_LOTE_BORRADOS = 100
+# Espera máxima entre reintentos de un mismo borrado
+MAX_ESPERA_REINTENTO = timedelta(hours=1)
+
+_CLAVE_PENDIENTES = 'borrados_pendientes'
+
+
+class BorradoService:
+    """
+    Bandeja de salida de borrados en Cloudinary.
+
+    encolar_urls() agrega filas a borrados_pendientes dentro de la transacción
+    de la petición: si se hace rollback la imagen no se borra, y si el commit
+    pasa el borrado queda registrado aunque el proceso se reinicie. Un único
+    hilo por proceso drena la tabla en lotes de TAMANO_LOTE_BORRADOS con una
+    llamada a delete_resources por lote: tras cada commit que encola, al
+    arrancar y cada BORRADOS_INTERVALO segundos (ver iniciar()). Los fallos se
+    reintentan con espera exponencial (BORRADOS_ESPERA_BASE s, hasta
+    MAX_ESPERA_REINTENTO). Con BORRADOS_SINCRONO (activo en TESTING) se drena
+    dentro de la misma petición. `python manage.py borrados --drenar` muestra
+    el tamaño de la bandeja y la drena a mano (o desde un cron).
+    """
+
+    _executor = None
+    _lock = threading.Lock()
+    _drenando = False
+    _pedido = False
+    _ciclo_iniciado = False
+
+    @staticmethod
+    def encolar_urls(urls):
+        """Registra el borrado de las imágenes en la sesión actual. El llamador hace el commit."""
+        public_ids = {SubidaService.public_id_de_url(url) for url in urls}
+        public_ids.discard(None)
+        for public_id in public_ids:
+            db.session.add(BorradoPendiente(public_id=public_id))
+        if public_ids:
+            db.session.info[_CLAVE_PENDIENTES] = True
+        return len(public_ids)
+
+    @classmethod
+    def programar(cls):
+        """Lanza el drenado; si ya hay uno en curso en este proceso, le pide otra pasada."""
+        app = current_app._get_current_object()
+        if current_app.config.get('BORRADOS_SINCRONO', current_app.testing):
+            cls.drenar(app)
+            return
+        with cls._lock:
+            if cls._drenando:
+                # El hilo revisa esta marca antes de terminar: no se pierde el aviso
+                cls._pedido = True
+                return
+            cls._drenando = True
+            if cls._executor is None:
+                cls._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='borrados')
+        cls._executor.submit(cls._drenar_en_segundo_plano, app)
+
+    @classmethod
+    def _drenar_en_segundo_plano(cls, app):
+        while True:
+            try:
+                cls.drenar(app)
+            except Exception as e:
+                app.logger.error(f"BORRADOS: error al drenar la bandeja: {e}", exc_info=True)
+            with cls._lock:
+                if not cls._pedido:
+                    cls._drenando = False
+                    return
+                cls._pedido = False
+
+    @classmethod
+    def iniciar(cls, app):
+        """
+        Drena la bandeja al arrancar el proceso y luego cada BORRADOS_INTERVALO
+        segundos (300 por defecto): así se procesan los reintentos vencidos y
+        lo que quedó pendiente si la máquina se detuvo a mitad de un drenado.
+        """
+        with cls._lock:
+            if cls._ciclo_iniciado:
+                return
+            cls._ciclo_iniciado = True
+        intervalo = app.config.get('BORRADOS_INTERVALO', 300)
+
+        def ciclo():
+            while True:
+                try:
+                    with app.app_context():
+                        cls.programar()
+                except Exception as e:
+                    # P. ej. la tabla aún no existe porque faltan las migraciones
+                    app.logger.warning(f"BORRADOS: no se pudo programar el drenado: {e}")
+                time.sleep(intervalo)
+
+        threading.Thread(target=ciclo, name='borrados-ciclo', daemon=True).start()
+
+    @classmethod
+    def drenar(cls, app):
+        """
+        Procesa los borrados vencidos por lotes. Devuelve la fecha del próximo
+        reintento pendiente, o None si la bandeja quedó vacía.
+        """
+        with app.app_context():
+            backend = SubidaService.backend()
+            espera_base = app.config.get('BORRADOS_ESPERA_BASE', 30)
+            # Solo lo que estaba vencido al empezar, avanzando por id: un borrado
+            # que falla en esta pasada espera al siguiente drenado
+            inicio = datetime.utcnow()
+            ultimo_id = 0
+            while True:
+                ahora = datetime.utcnow()
+                with db.engine.begin() as conexion:
+                    # SKIP LOCKED: dos procesos (gunicorn) no toman el mismo lote
+                    lote = conexion.execute(
+                        select(BorradoPendiente.id, BorradoPendiente.public_id, BorradoPendiente.intentos)
+                        .where(BorradoPendiente.proximo_intento <= inicio, BorradoPendiente.id > ultimo_id)
+                        .order_by(BorradoPendiente.id)
+                        .limit(TAMANO_LOTE_BORRADOS)
+                        .with_for_update(skip_locked=True)
+                    ).all()
+                    if not lote:
+                        break
+                    ultimo_id = lote[-1].id
+
+                    try:
+                        errores = backend.borrar(sorted({fila.public_id for fila in lote}))
+                    except Exception as e:
+                        errores = {fila.public_id: str(e) for fila in lote}
+
+                    hechos = [fila.id for fila in lote if errores.get(fila.public_id) is None]
+                    if hechos:
+                        conexion.execute(delete(BorradoPendiente).where(BorradoPendiente.id.in_(hechos)))
+                    for fila in lote:
+                        error = errores.get(fila.public_id)
+                        if error is None:
+                            continue
+                        espera = min(timedelta(seconds=espera_base * 2 ** fila.intentos), MAX_ESPERA_REINTENTO)
+                        conexion.execute(
+                            update(BorradoPendiente).where(BorradoPendiente.id == fila.id)
+                            .values(intentos=fila.intentos + 1, ultimo_error=str(error)[:500],
+                                    proximo_intento=ahora + espera)
+                        )
+                    app.logger.info(f"BORRADOS: lote de {len(lote)}: {len(hechos)} borrados, "
+                                    f"{len(lote) - len(hechos)} con error")
+
+            metricas = cls.metricas()
+            if metricas['pendientes']:
+                app.logger.warning(f"BORRADOS: quedan {metricas['pendientes']} pendientes "
+                                   f"({metricas['con_error']} con error)")
+            return metricas['proximo_intento']
+
+    @staticmethod
+    def metricas():
+        """Tamaño de la bandeja de salida, para monitoreo."""
+        fila = db.session.execute(
+            select(
+                func.count(BorradoPendiente.id),
+                func.count(BorradoPendiente.id).filter(BorradoPendiente.intentos > 0),
+                func.min(BorradoPendiente.creado_en),
+                func.min(BorradoPendiente.proximo_intento),
+                func.max(BorradoPendiente.intentos),
+            )
+        ).one()
+        return {
+            'pendientes': fila[0],
+            'con_error': fila[1],
+            'mas_antiguo': fila[2],
+            'proximo_intento': fila[3],
+            'max_intentos': fila[4] or 0,
+        }
+
+
+# =========================================================================
+# === DRENADO TRAS EL COMMIT (eventos de sesión) ===
+# =========================================================================
+
+@event.listens_for(Session, 'after_commit')
+def _programar_borrados(session):
+    if session.info.pop(_CLAVE_PENDIENTES, None):
+        BorradoService.programar()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _descartar_borrados(session):
+    session.info.pop(_CLAVE_PENDIENTES, None)
@@ -0,0 +1,97 @@
+# clinica/services/busqueda_service.py
+
+import re
+from sqlalchemy import and_, or_, case, func
+from clinica.extensions import db
+from clinica.models import Paciente
+from clinica.utils import normalizar_texto
+
+
+class BusquedaService:
+    """
+    Búsqueda indexada de pacientes.
+
+    Trabaja sobre Paciente.busqueda_normalizada (nombres + apellidos + documento,
+    en minúsculas y sin tildes), que en PostgreSQL tiene un índice GIN trigram,
+    y sobre Paciente.documento con un índice de prefijo (varchar_pattern_ops).
+    """
+
+    @staticmethod
+    def _es_postgresql():
+        return db.session.get_bind().dialect.name == 'postgresql'
+
+    @staticmethod
+    def filtrar(query, termino):
+        """
+        Aplica el filtro de búsqueda y el orden por relevancia a una consulta de Paciente.
+        Cada palabra del término debe aparecer en el campo normalizado; si el término
+        parece un documento, también se aceptan documentos que empiecen por él.
+        Devuelve la consulta sin cambios si el término está vacío.
+        """
+        termino_norm = normalizar_texto(termino)
+        if not termino_norm:
+            return query
+
+        palabras = termino_norm.split()
+        coincide_palabras = and_(*[
+            Paciente.busqueda_normalizada.contains(palabra, autoescape=True)
+            for palabra in palabras
+        ])
+
+        # Documento sin espacios ni separadores (ej: "1.234.567" -> "1234567")
+        documento = re.sub(r'[\s.\-]', '', termino.strip())
+        if documento and len(palabras) == 1:
+            condicion = or_(
+                Paciente.documento.startswith(documento, autoescape=True),
+                coincide_palabras
+            )
+        else:
+            condicion = coincide_palabras
+
+        orden = [BusquedaService._relevancia(termino_norm, documento)]
+        if BusquedaService._es_postgresql():
+            # Desempate por similitud trigram (usa el mismo índice GIN)
+            orden.append(func.similarity(Paciente.busqueda_normalizada, termino_norm).desc())
+        orden.append(Paciente.apellidos)
+        orden.append(Paciente.id.desc())
+
+        return query.filter(condicion).order_by(None).order_by(*orden)
+
+    @staticmethod
+    def _relevancia(termino_norm, documento):
+        # Relevancia: documento exacto > prefijo de documento > empieza por el término
+        # > alguna palabra empieza por el término > coincidencia en medio de palabra
+        ramas = []
+        if documento:
+            ramas.append((Paciente.documento == documento, 0))
+            ramas.append((Paciente.documento.startswith(documento, autoescape=True), 1))
+        ramas.append((Paciente.busqueda_normalizada.startswith(termino_norm, autoescape=True), 2))
+        ramas.append((Paciente.busqueda_normalizada.contains(' ' + termino_norm, autoescape=True), 3))
+        return case(*ramas, else_=4)
+
+    @staticmethod
+    def orden_paginado(termino):
+        """
+        Orden (expresión, descendente) para paginar por clave los resultados de
+        filtrar(): relevancia, apellidos e id. Sin el desempate por similitud,
+        que es un float y no sirve como clave estable de cursor.
+        """
+        termino_norm = normalizar_texto(termino)
+        if not termino_norm:
+            return [(Paciente.id, True)]
+        documento = re.sub(r'[\s.\-]', '', termino.strip())
+        return [
+            (BusquedaService._relevancia(termino_norm, documento), False),
+            (Paciente.apellidos, False),
+            (Paciente.id, True),
+        ]
+
+    @staticmethod
+    def sugerencias(query_base, termino, limite=10):
+        """Devuelve hasta `limite` pacientes ordenados por relevancia para el autocompletado."""
+        if not termino or len(termino.strip()) < 2:
+            return []
+        query = BusquedaService.filtrar(query_base, termino)
+        return query.with_entities(
+            Paciente.id, Paciente.nombres, Paciente.apellidos, Paciente.documento
+        ).limit(limite).all()
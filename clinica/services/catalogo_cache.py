@@ -0,0 +1,218 @@
+# clinica/services/catalogo_cache.py
+
+import json
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy.exc import SQLAlchemyError
+
+from clinica.extensions import db
+from clinica.models import EPS, Municipio, CUPSCode, CIE10, CatalogoVersion
+from clinica.services.indice_catalogo import IndiceCatalogo
+
+# Estructuras livianas (tuplas inmutables) en lugar de objetos ORM:
+# se comparten entre hilos y no dependen de una sesión abierta.
+EPSItem = namedtuple('EPSItem', 'codigo nombre activa')
+MunicipioItem = namedtuple('MunicipioItem', 'codigo nombre codigo_departamento nombre_departamento')
+CupsItem = namedtuple('CupsItem', 'code description')
+Cie10Item = namedtuple('Cie10Item', 'codigo descripcion categoria')
+
+
+def _cargar_eps():
+    filas = db.session.query(EPS.codigo, EPS.nombre, EPS.activa).order_by(EPS.nombre).all()
+    items = [EPSItem(f.codigo, f.nombre, bool(f.activa)) for f in filas]
+    return {
+        'por_codigo': {i.codigo.strip().upper(): i for i in items},
+        'activas': [i for i in items if i.activa],
+    }
+
+
+def _cargar_municipios():
+    filas = db.session.query(
+        Municipio.codigo, Municipio.nombre, Municipio.codigo_departamento, Municipio.nombre_departamento
+    ).order_by(Municipio.nombre).all()
+    items = [MunicipioItem(*f) for f in filas]
+    departamentos = sorted(
+        {(i.codigo_departamento, i.nombre_departamento) for i in items},
+        key=lambda d: d[1]
+    )
+    return {
+        'por_codigo': {i.codigo: i for i in items},
+        'por_departamento_codigo': {(i.codigo_departamento, i.codigo): i for i in items},
+        'departamentos': [{'codigo': c, 'nombre': n} for c, n in departamentos],
+        # El JSON de los formularios se serializa una sola vez por versión
+        'json': json.dumps([
+            {'codigo': i.codigo, 'nombre': i.nombre, 'codigo_departamento': i.codigo_departamento}
+            for i in items
+        ]),
+    }
+
+
+def _cargar_cups():
+    filas = db.session.query(CUPSCode.code, CUPSCode.description).order_by(CUPSCode.code).all()
+    items = [CupsItem(*f) for f in filas]
+    return {'items': items, 'indice': IndiceCatalogo(items, lambda i: i.code, lambda i: i.description)}
+
+
+def _cargar_cie10():
+    filas = db.session.query(CIE10.codigo, CIE10.descripcion, CIE10.categoria).order_by(CIE10.codigo).all()
+    items = [Cie10Item(*f) for f in filas]
+    return {'items': items, 'indice': IndiceCatalogo(items, lambda i: i.codigo, lambda i: i.descripcion)}
+
+
+class CatalogoCache:
+    """
+    Caché en memoria (por proceso) de las tablas de referencia EPS, Municipio,
+    CUPSCode y CIE10.
+
+    Cada catálogo se carga completo la primera vez que se usa. Como máximo cada
+    CATALOGO_VERIFICAR_SEGUNDOS (60 por defecto) se lee la tabla catalogo_version
+    con una sola consulta; si un catálogo cambió de versión se descarta y se
+    recarga en el siguiente uso. Los scripts de importación llaman a
+    incrementar_version() al terminar.
+    """
+
+    CARGADORES = {
+        'eps': _cargar_eps,
+        'municipios': _cargar_municipios,
+        'cups': _cargar_cups,
+        'cie10': _cargar_cie10,
+    }
+
+    _lock = threading.Lock()
+    _datos = {}
+    _versiones_cargadas = {}
+    _versiones_db = {}
+    _ultima_verificacion = 0.0
+
+    # ------------------------------------------------------------------
+    # Núcleo
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def _verificar_versiones(cls):
+        intervalo = current_app.config.get('CATALOGO_VERIFICAR_SEGUNDOS', 60)
+        ahora = time.monotonic()
+        if ahora - cls._ultima_verificacion < intervalo:
+            return
+        cls._ultima_verificacion = ahora
+        try:
+            versiones = dict(db.session.query(CatalogoVersion.nombre, CatalogoVersion.version).all())
+        except SQLAlchemyError as e:
+            # Tabla aún no migrada: seguimos con lo que haya en memoria
+            db.session.rollback()
+            current_app.logger.warning(f"CATALOGO_CACHE: no se pudo leer catalogo_version: {e}")
+            return
+        with cls._lock:
+            cls._versiones_db = versiones
+            for nombre in list(cls._datos):
+                if cls._versiones_cargadas.get(nombre) != versiones.get(nombre, 0):
+                    cls._datos.pop(nombre, None)
+
+    @classmethod
+    def _obtener(cls, nombre):
+        cls._verificar_versiones()
+        datos = cls._datos.get(nombre)
+        if datos is not None:
+            return datos
+        with cls._lock:
+            datos = cls._datos.get(nombre)
+            if datos is None:
+                datos = cls.CARGADORES[nombre]()
+                cls._datos[nombre] = datos
+                cls._versiones_cargadas[nombre] = cls._versiones_db.get(nombre, 0)
+        return datos
+
+    @classmethod
+    def version(cls, nombre):
+        """Versión del catálogo cargado en memoria (útil para ETags)."""
+        cls._obtener(nombre)
+        return cls._versiones_cargadas.get(nombre, 0)
+
+    @classmethod
+    def invalidar(cls, nombre=None):
+        """Descarta la caché local (un catálogo o todos) y fuerza a releer las versiones."""
+        with cls._lock:
+            if nombre:
+                cls._datos.pop(nombre, None)
+            else:
+                cls._datos.clear()
+            cls._ultima_verificacion = 0.0
+
+    @classmethod
+    def incrementar_version(cls, nombre):
+        """
+        Marca un catálogo como modificado para que todos los workers lo recarguen.
+        Hace commit de la sesión actual.
+        """
+        registro = db.session.get(CatalogoVersion, nombre)
+        if registro:
+            registro.version += 1
+            registro.actualizado_en = datetime.utcnow()
+        else:
+            db.session.add(CatalogoVersion(nombre=nombre, version=1))
+        db.session.commit()
+        cls.invalidar(nombre)
+
+    # ------------------------------------------------------------------
+    # Consultas de visualización (O(1), sin ir a la base de datos)
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def buscar_eps(cls, codigo):
+        """Busca una EPS por código sin distinguir mayúsculas (equivale al ilike anterior)."""
+        if not codigo:
+            return None
+        return cls._obtener('eps')['por_codigo'].get(str(codigo).strip().upper())
+
+    @classmethod
+    def eps_activas(cls):
+        """EPS activas ordenadas por nombre, para los selectores de los formularios."""
+        return cls._obtener('eps')['activas']
+
+    @classmethod
+    def buscar_municipio(cls, codigo_municipio, codigo_departamento=None):
+        """
+        Busca un municipio por código DIVIPOLA. Si no existe y se conoce el
+        departamento, intenta con el código corto (últimos 3 dígitos), que es
+        como quedaron guardados algunos municipios ('47189' -> '189').
+        """
+        if not codigo_municipio:
+            return None
+        datos = cls._obtener('municipios')
+        cod_mpio = str(codigo_municipio).strip()
+        municipio = datos['por_codigo'].get(cod_mpio)
+        if not municipio and codigo_departamento and len(cod_mpio) > 2:
+            municipio = datos['por_departamento_codigo'].get((str(codigo_departamento).strip(), cod_mpio[-3:]))
+        return municipio
+
+    @classmethod
+    def departamentos(cls):
+        """Lista de departamentos [{'codigo', 'nombre'}] ordenada por nombre."""
+        return cls._obtener('municipios')['departamentos']
+
+    @classmethod
+    def municipios_json(cls):
+        """JSON ya serializado con todos los municipios, para los formularios de paciente."""
+        return cls._obtener('municipios')['json']
+
+    @classmethod
+    def cups(cls):
+        return cls._obtener('cups')['items']
+
+    @classmethod
+    def cie10(cls):
+        return cls._obtener('cie10')['items']
+
+    @classmethod
+    def buscar_cups(cls, termino, limite=20):
+        """Autocompletado de CUPS sobre el índice en memoria (ver IndiceCatalogo)."""
+        return cls._obtener('cups')['indice'].buscar(termino, limite)
+
+    @classmethod
+    def buscar_cie10(cls, termino, limite=20):
+        """Autocompletado de CIE10 sobre el índice en memoria (ver IndiceCatalogo)."""
+        return cls._obtener('cie10')['indice'].buscar(termino, limite)
@@ -0,0 +1,196 @@
+# clinica/services/dentigrama_service.py
+
+import hashlib
+import json
+
+from flask import url_for
+
+from clinica.cache import CacheTTL
+
+# =========================================================================
+# === MODELO DEL ODONTOGRAMA (mismo dibujo que editor_dentigrama.js) ===
+# =========================================================================
+
+# Filas en notación FDI: (dientes, y, desplazamiento x, cuántos antes de la línea media)
+FILAS_DIENTES = (
+    ((18, 17, 16, 15, 14, 13, 12, 11, 21, 22, 23, 24, 25, 26, 27, 28), 50, 0, 8),
+    ((55, 54, 53, 52, 51, 61, 62, 63, 64, 65), 140, 48 * 3 + 20, 5),
+    ((85, 84, 83, 82, 81, 71, 72, 73, 74, 75), 220, 48 * 3 + 20, 5),
+    ((48, 47, 46, 45, 44, 43, 42, 41, 31, 32, 33, 34, 35, 36, 37, 38), 310, 0, 8),
+)
+DIENTES_VALIDOS = frozenset(d for fila in FILAS_DIENTES for d in fila[0])
+
+# Color de cada material en las caras del diente
+COLORES_CARA = {
+    'caries': '#dc3545',
+    'amalgama': '#0d6efd',
+    'resina': '#198754',
+}
+
+# Trazo de cada cara (la oclusal es el círculo central)
+CARAS = {
+    'vestibular': "M10.8,10.8 L19.3,19.3 A8,8 0 0,1 30.7,19.3 L39.2,10.8 A20,20 0 0,0 10.8,10.8 Z",
+    'derecha': "M39.2,10.8 L30.7,19.3 A8,8 0 0,1 30.7,30.7 L39.2,39.2 A20,20 0 0,0 39.2,10.8 Z",
+    'lingual': "M39.2,39.2 L30.7,30.7 A8,8 0 0,1 19.3,30.7 L10.8,39.2 A20,20 0 0,0 39.2,39.2 Z",
+    'izquierda': "M10.8,39.2 L19.3,30.7 A8,8 0 0,1 19.3,19.3 L10.8,10.8 A20,20 0 0,0 10.8,39.2 Z",
+    'oclusal': None,
+}
+
+# Marcas que afectan al diente completo, en el orden en que se dibujan
+MARCAS = {
+    'extraccion': '<g stroke="#dc3545" stroke-width="4"><line x1="5" y1="5" x2="45" y2="45"/><line x1="45" y1="5" x2="5" y2="45"/></g>',
+    'ausente': '<g stroke="#0d6efd" stroke-width="4"><line x1="5" y1="5" x2="45" y2="45"/><line x1="45" y1="5" x2="5" y2="45"/></g>',
+    'endodoncia': '<text x="25" y="-20" text-anchor="middle" fill="#d63384" font-size="10" font-weight="bold">ENDO</text>',
+    'protesis': '<g stroke="#0d6efd" stroke-width="3"><line x1="0" y1="15" x2="50" y2="15"/><line x1="0" y1="35" x2="50" y2="35"/></g>',
+    'corona': '<circle cx="25" cy="25" r="23" fill="none" stroke="#0d6efd" stroke-width="3"/>',
+    'check': '<path d="M8,25 L22,38 L44,12" fill="none" stroke="#6f42c1" stroke-width="7" stroke-linecap="round" stroke-linejoin="round"/>',
+}
+
+# Un estado completo normalizado ocupa unos pocos KB; más que esto no es un odontograma
+MAX_BYTES_ESTADO = 64 * 1024
+
+# Renders por hash de contenido: el mismo estado nunca se dibuja dos veces
+_cache_render = CacheTTL(ttl=24 * 3600, max_entradas=256)
+
+
+class DentigramaService:
+    """
+    El odontograma se guarda como datos, no como imagen:
+
+        {"dientes": {"16": {"caras": {"oclusal": "caries"}, "marcas": ["corona"]}}}
+
+    El editor envía ese JSON (unos cientos de bytes) y el servidor dibuja la
+    imagen bajo demanda. La URL de la imagen lleva el hash del estado
+    normalizado, así que puede cachearse como inmutable en el navegador, y el
+    dibujo se guarda en una caché LRU local por hash: guardar dos veces el
+    mismo estado no escribe en la BD ni genera un render nuevo.
+
+    Los pacientes con dentigrama antiguo (PNG en dentigrama_canvas) lo siguen
+    mostrando de fondo; el estado se dibuja encima en modo `capa` (sin
+    contornos ni números, igual que el editor cuando hay fondo).
+    """
+
+    @staticmethod
+    def normalizar(estado):
+        """
+        Valida el estado y lo devuelve en forma canónica (sin dientes vacíos,
+        marcas ordenadas y sin repetir). Lanza ValueError si no es válido.
+        """
+        if isinstance(estado, (str, bytes)):
+            if len(estado) > MAX_BYTES_ESTADO:
+                raise ValueError("El dentigrama es demasiado grande.")
+            try:
+                estado = json.loads(estado)
+            except ValueError:
+                raise ValueError("El dentigrama no es un JSON válido.")
+        if estado is None:
+            return None
+        if not isinstance(estado, dict) or not isinstance(estado.get('dientes', {}), dict):
+            raise ValueError("Formato de dentigrama no reconocido.")
+
+        dientes = {}
+        for numero, datos in estado.get('dientes', {}).items():
+            try:
+                numero_int = int(numero)
+            except (TypeError, ValueError):
+                raise ValueError(f"Diente inválido: {numero}")
+            if numero_int not in DIENTES_VALIDOS or not isinstance(datos, dict):
+                raise ValueError(f"Diente inválido: {numero}")
+
+            caras = datos.get('caras') or {}
+            marcas = datos.get('marcas') or []
+            if not isinstance(caras, dict) or not isinstance(marcas, list):
+                raise ValueError(f"Datos inválidos para el diente {numero}")
+            for cara, material in caras.items():
+                if cara not in CARAS or material not in COLORES_CARA:
+                    raise ValueError(f"Cara inválida en el diente {numero}: {cara}={material}")
+            for marca in marcas:
+                if marca not in MARCAS:
+                    raise ValueError(f"Marca inválida en el diente {numero}: {marca}")
+
+            normalizado = {}
+            if caras:
+                normalizado['caras'] = dict(sorted(caras.items()))
+            if marcas:
+                normalizado['marcas'] = sorted(set(marcas))
+            if normalizado:
+                dientes[str(numero_int)] = normalizado
+
+        return {'dientes': dict(sorted(dientes.items(), key=lambda item: int(item[0])))}
+
+    @staticmethod
+    def calcular_hash(estado):
+        """Hash del estado normalizado: mismo contenido, mismo hash."""
+        canonico = json.dumps(estado, sort_keys=True, separators=(',', ':'))
+        return hashlib.sha256(canonico.encode('utf-8')).hexdigest()
+
+    @classmethod
+    def aplicar(cls, paciente, estado):
+        """
+        Guarda el estado en el paciente si cambió. Devuelve True si hubo cambio;
+        el llamador hace el commit. Lanza ValueError si el estado no es válido.
+        """
+        estado = cls.normalizar(estado)
+        if estado is not None and not estado['dientes']:
+            estado = None
+        nuevo_hash = cls.calcular_hash(estado) if estado is not None else None
+        if nuevo_hash == paciente.dentigrama_hash:
+            return False
+        paciente.dentigrama_estado = estado
+        paciente.dentigrama_hash = nuevo_hash
+        return True
+
+    @staticmethod
+    def url_imagen(paciente):
+        """URL versionada de la imagen del estado actual (None si no hay estado)."""
+        if not paciente.dentigrama_hash:
+            return None
+        kwargs = {'paciente_id': paciente.id, 'hash_estado': paciente.dentigrama_hash}
+        if paciente.dentigrama_canvas:
+            kwargs['capa'] = 1
+        return url_for('pacientes.imagen_dentigrama', **kwargs)
+
+    @classmethod
+    def renderizar(cls, estado, hash_estado, capa=False):
+        """SVG del estado, desde la caché LRU si ese hash ya se dibujó en este proceso."""
+        return _cache_render.obtener_o_calcular(
+            ('dentigrama', hash_estado, bool(capa)),
+            lambda: cls._dibujar_svg(estado, capa),
+        )
+
+    @staticmethod
+    def _dibujar_svg(estado, capa=False):
+        dientes = (estado or {}).get('dientes', {})
+        partes = ['<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 860 480" width="860" height="480">']
+        if not capa:
+            partes.append('<rect width="860" height="480" fill="#ffffff"/>')
+
+        for numeros, y, desplazamiento, antes_de_media in FILAS_DIENTES:
+            for i, numero in enumerate(numeros):
+                x = 30 + desplazamiento + i * 48 + (20 if i >= antes_de_media else 0)
+                datos = dientes.get(str(numero), {})
+                caras = datos.get('caras', {})
+                partes.append(f'<g transform="translate({x}, {y})">')
+                if not capa:
+                    partes.append(f'<text x="25" y="-8" font-size="10" font-weight="800" fill="#6c757d" '
+                                  f'text-anchor="middle">{numero}</text>')
+                for cara, trazo in CARAS.items():
+                    material = caras.get(cara)
+                    if capa and material is None:
+                        continue
+                    relleno = COLORES_CARA.get(material, '#ffffff')
+                    borde = '' if capa else ' stroke="#333" stroke-width="1"'
+                    if trazo is None:
+                        partes.append(f'<circle cx="25" cy="25" r="8" fill="{relleno}"{borde}/>')
+                    else:
+                        partes.append(f'<path d="{trazo}" fill="{relleno}"{borde}/>')
+                for marca in MARCAS:
+                    if marca in datos.get('marcas', ()):
+                        partes.append(MARCAS[marca])
+                partes.append('</g>')
+
+        if not capa:
+            partes.append('<text x="40" y="400" fill="#aaa" text-anchor="start">DERECHA</text>')
+            partes.append('<text x="820" y="400" fill="#aaa" text-anchor="end">IZQUIERDA</text>')
+        partes.append('</svg>')
+        return ''.join(partes)
@@ -0,0 +1,154 @@
+# clinica/services/importacion_catalogos.py
+
+import time
+
+import pandas as pd
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.postgresql import insert as insert_postgresql
+from sqlalchemy.dialects.sqlite import insert as insert_sqlite
+
+from clinica.extensions import db
+from clinica.models import EPS, Municipio, CUPSCode, CIE10
+from clinica.services.catalogo_cache import CatalogoCache
+
+# Filas por sentencia INSERT ... ON CONFLICT. Con 4 columnas queda muy por
+# debajo del límite de parámetros por sentencia de PostgreSQL (65535) y SQLite.
+TAMANO_LOTE_IMPORTACION = 2000
+
+# nombre del catálogo -> (modelo, columna clave, columnas de datos)
+CATALOGOS = {
+    'cups': (CUPSCode, 'code', ('description',)),
+    'cie10': (CIE10, 'codigo', ('descripcion', 'categoria')),
+    'eps': (EPS, 'codigo', ('nombre', 'activa')),
+    'municipios': (Municipio, 'codigo', ('nombre', 'codigo_departamento', 'nombre_departamento')),
+}
+
+
+class ImportacionCatalogos:
+    """
+    Carga masiva de las tablas de referencia (CUPS, CIE-10, EPS, municipios).
+
+    La fuente se procesa como DataFrame (sin iterrows) y se compara con lo que
+    ya hay en la tabla usando una sola consulta. Solo las filas nuevas o con
+    cambios se escriben, con INSERT ... ON CONFLICT DO UPDATE en lotes de
+    TAMANO_LOTE_IMPORTACION, todo en una única transacción que también
+    incrementa la versión del catálogo en CatalogoCache.
+    """
+
+    @staticmethod
+    def leer_cups_excel(ruta, columna_codigo=1, columna_descripcion=2):
+        """Lee el Excel de CUPS (por defecto columnas B = código y C = descripción)."""
+        df = pd.read_excel(ruta, dtype=str)
+        return pd.DataFrame({
+            'code': df.iloc[:, columna_codigo],
+            'description': df.iloc[:, columna_descripcion],
+        })
+
+    @staticmethod
+    def desde_tuplas(nombre, filas):
+        """DataFrame a partir de las listas de tuplas de los scripts importar_*.py."""
+        _, clave, columnas = CATALOGOS[nombre]
+        return pd.DataFrame(list(filas), columns=[clave, *columnas])
+
+    @staticmethod
+    def _limpiar(fuente, modelo, clave, columnas):
+        df = fuente[[clave, *columnas]].copy()
+        df = df[df[clave].notna()]
+        df[clave] = df[clave].astype(str)
+        for columna in (clave, *columnas):
+            if df[columna].dtype == object:
+                if not modelo.__table__.c[columna].nullable:
+                    df[columna] = df[columna].fillna('')
+                df[columna] = df[columna].str.strip()
+                # Recorta al largo de la columna en vez de abortar toda la carga
+                largo = getattr(modelo.__table__.c[columna].type, 'length', None)
+                if largo:
+                    df[columna] = df[columna].str.slice(0, largo)
+        df = df[(df[clave] != '') & (df[clave].str.lower() != 'nan')]
+        # Si un código se repite en la fuente, gana la última aparición
+        return df.drop_duplicates(subset=clave, keep='last')
+
+    @staticmethod
+    def _comparable(serie):
+        # NaN/None nunca son iguales entre sí en pandas: se comparan como un marcador
+        return serie.astype(object).where(serie.notna(), '\x00').astype(str)
+
+    @classmethod
+    def importar(cls, nombre, fuente, reemplazar=False):
+        """
+        Sincroniza el catálogo `nombre` con el DataFrame `fuente`.
+
+        Con reemplazar=True también se eliminan los códigos que no están en la
+        fuente. Devuelve un resumen con los conteos y los tiempos de cada fase.
+        """
+        modelo, clave, columnas = CATALOGOS[nombre]
+        tiempos = {}
+        inicio = time.perf_counter()
+
+        df = cls._limpiar(fuente, modelo, clave, columnas)
+        tiempos['lectura'] = time.perf_counter() - inicio
+
+        # --- Diferencias contra la tabla (una sola consulta) ---
+        marca = time.perf_counter()
+        actuales = pd.DataFrame(
+            db.session.execute(select(*(getattr(modelo, c) for c in (clave, *columnas)))).all(),
+            columns=[clave, *columnas],
+        )
+        comparado = df.merge(actuales, on=clave, how='left', suffixes=('', '_actual'), indicator=True)
+        nuevos = comparado['_merge'] == 'left_only'
+        cambiados = pd.Series(False, index=comparado.index)
+        for columna in columnas:
+            cambiados |= cls._comparable(comparado[columna]) != cls._comparable(comparado[f'{columna}_actual'])
+        cambiados &= ~nuevos
+        a_escribir = comparado.loc[nuevos | cambiados, [clave, *columnas]]
+        sobrantes = sorted(set(actuales[clave]) - set(df[clave])) if reemplazar else []
+        tiempos['diferencias'] = time.perf_counter() - marca
+
+        # --- Escritura en una única transacción ---
+        marca = time.perf_counter()
+        registros = a_escribir.astype(object).where(a_escribir.notna(), None).to_dict('records')
+        tabla = modelo.__table__
+        insertar = insert_postgresql if db.engine.dialect.name == 'postgresql' else insert_sqlite
+        try:
+            for i in range(0, len(registros), TAMANO_LOTE_IMPORTACION):
+                sentencia = insertar(tabla).values(registros[i:i + TAMANO_LOTE_IMPORTACION])
+                sentencia = sentencia.on_conflict_do_update(
+                    index_elements=[clave],
+                    set_={c: sentencia.excluded[c] for c in columnas},
+                )
+                db.session.execute(sentencia)
+            for i in range(0, len(sobrantes), TAMANO_LOTE_IMPORTACION):
+                db.session.execute(delete(modelo).where(
+                    getattr(modelo, clave).in_(sobrantes[i:i + TAMANO_LOTE_IMPORTACION])))
+            if registros or sobrantes:
+                # Hace el commit de todo junto y avisa a los workers para que recarguen
+                CatalogoCache.incrementar_version(nombre)
+            else:
+                db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        tiempos['escritura'] = time.perf_counter() - marca
+        tiempos['total'] = time.perf_counter() - inicio
+
+        return {
+            'catalogo': nombre,
+            'filas_fuente': len(df),
+            'nuevos': int(nuevos.sum()),
+            'actualizados': int(cambiados.sum()),
+            'sin_cambios': len(df) - int(nuevos.sum()) - int(cambiados.sum()),
+            'eliminados': len(sobrantes),
+            'tiempos': tiempos,
+        }
+
+    @staticmethod
+    def formatear_resumen(resumen):
+        """Texto para la consola con los conteos y tiempos de importar()."""
+        tiempos = resumen['tiempos']
+        return (
+            f"{resumen['catalogo']}: {resumen['filas_fuente']} filas en la fuente -> "
+            f"{resumen['nuevos']} nuevas, {resumen['actualizados']} actualizadas, "
+            f"{resumen['sin_cambios']} sin cambios, {resumen['eliminados']} eliminadas\n"
+            f"Tiempos: lectura {tiempos['lectura']:.2f}s, diferencias {tiempos['diferencias']:.2f}s, "
+            f"escritura {tiempos['escritura']:.2f}s, total {tiempos['total']:.2f}s"
+        )
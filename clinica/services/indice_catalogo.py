@@ -0,0 +1,137 @@
+# clinica/services/indice_catalogo.py
+
+import heapq
+from bisect import bisect_left, bisect_right
+from clinica.utils import normalizar_texto
+
+
+def _rango_prefijo(ordenados, prefijo):
+    """Índices [inicio, fin) de los elementos de una lista ordenada que empiezan por `prefijo`."""
+    inicio = bisect_left(ordenados, prefijo)
+    # '\uffff' es mayor que cualquier carácter que pueda seguir al prefijo
+    fin = bisect_left(ordenados, prefijo + '\uffff', inicio)
+    return inicio, fin
+
+
+class IndiceCatalogo:
+    """
+    Índice de búsqueda en memoria para un catálogo de códigos (CUPS, CIE10).
+
+    - Códigos: lista ordenada + bisect para coincidencias por prefijo.
+    - Descripciones: lista ordenada (prefijo de la descripción completa) e
+      índice invertido de palabras normalizadas (minúsculas, sin tildes). Cada
+      palabra buscada se expande a las palabras del vocabulario que empiezan
+      por ella (también con bisect) y los resultados se intersectan.
+
+    Orden de relevancia: código exacto, prefijo de código, descripción que
+    empieza por el término, todas las palabras completas, palabras por prefijo
+    y, para completar el límite, coincidencia en medio de palabra. Dentro de cada
+    nivel ganan los códigos más cortos. Los niveles se evalúan en orden y la
+    búsqueda se corta en cuanto hay `limite` resultados.
+    """
+
+    def __init__(self, items, codigo, descripcion):
+        # items: secuencia de tuplas; codigo/descripcion: funciones de acceso.
+        # La posición de cada item es su desempate (código corto primero).
+        self.items = sorted(items, key=lambda i: (len(codigo(i)), codigo(i).upper()))
+        self._codigos = [codigo(i).upper() for i in self.items]
+        self._descripciones = [normalizar_texto(descripcion(i)) for i in self.items]
+        total = len(self.items)
+
+        orden = sorted(range(total), key=self._codigos.__getitem__)
+        self._codigos_ordenados = [self._codigos[n] for n in orden]
+        self._posicion_codigo = orden
+
+        orden = sorted(range(total), key=self._descripciones.__getitem__)
+        self._descripciones_ordenadas = [self._descripciones[n] for n in orden]
+        self._posicion_descripcion = orden
+
+        self._postings = {}
+        for n, texto in enumerate(self._descripciones):
+            for palabra in set(texto.split()):
+                self._postings.setdefault(palabra, []).append(n)
+        self._vocabulario = sorted(self._postings)
+
+        # Texto plano (una línea por item) para el respaldo por subcadena con str.find
+        lineas = [f"{c.lower()} {d}" for c, d in zip(self._codigos, self._descripciones)]
+        self._texto = '\n'.join(lineas)
+        self._inicios = []
+        posicion = 0
+        for linea in lineas:
+            self._inicios.append(posicion)
+            posicion += len(linea) + 1
+
+    def __len__(self):
+        return len(self.items)
+
+    def _por_prefijo_palabra(self, palabra):
+        inicio, fin = _rango_prefijo(self._vocabulario, palabra)
+        encontrados = set()
+        for k in range(inicio, fin):
+            encontrados.update(self._postings[self._vocabulario[k]])
+        return encontrados
+
+    @staticmethod
+    def _intersectar(conjuntos):
+        conjuntos = sorted(conjuntos, key=len)
+        resultado = set(conjuntos[0])
+        for conjunto in conjuntos[1:]:
+            resultado.intersection_update(conjunto)
+            if not resultado:
+                break
+        return resultado
+
+    def _por_subcadena(self, texto, limite, excluir=()):
+        encontrados = []
+        posicion = self._texto.find(texto)
+        while posicion != -1 and len(encontrados) < limite:
+            n = bisect_right(self._inicios, posicion) - 1
+            if n not in excluir:
+                encontrados.append(n)
+            siguiente = self._inicios[n + 1] if n + 1 < len(self._inicios) else len(self._texto)
+            posicion = self._texto.find(texto, siguiente)
+        return encontrados
+
+    def buscar(self, termino, limite=20):
+        """Devuelve hasta `limite` items ordenados por relevancia."""
+        termino_norm = normalizar_texto(termino)
+        if not termino_norm or limite <= 0:
+            return []
+        termino_codigo = termino.strip().upper()
+        palabras = termino_norm.split()
+        resultado = []
+        vistos = set()
+
+        def agregar(candidatos):
+            nuevos = [n for n in candidatos if n not in vistos]
+            for n in heapq.nsmallest(limite - len(resultado), nuevos):
+                resultado.append(n)
+                vistos.add(n)
+            return len(resultado) >= limite
+
+        def niveles():
+            # 1. Código exacto y prefijo de código
+            inicio, fin = _rango_prefijo(self._codigos_ordenados, termino_codigo)
+            prefijo = self._posicion_codigo[inicio:fin]
+            yield [n for n in prefijo if self._codigos[n] == termino_codigo]
+            yield prefijo
+            # 2. La descripción empieza por el término
+            inicio, fin = _rango_prefijo(self._descripciones_ordenadas, termino_norm)
+            yield self._posicion_descripcion[inicio:fin]
+            # 3. Todas las palabras completas
+            yield self._intersectar([self._postings.get(p, ()) for p in palabras])
+            # 4. Todas las palabras por prefijo
+            yield self._intersectar([self._por_prefijo_palabra(p) for p in palabras])
+
+        completo = False
+        for candidatos in niveles():
+            if agregar(candidatos):
+                completo = True
+                break
+
+        # 5. Respaldo: subcadena en código o descripción (equivalente al ilike anterior),
+        # completa lo que falte para no perder coincidencias en medio de palabra
+        if not completo:
+            resultado.extend(self._por_subcadena(termino_norm, limite - len(resultado), excluir=vistos))
+
+        return [self.items[n] for n in resultado]
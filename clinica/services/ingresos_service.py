@@ -0,0 +1,305 @@
+# clinica/services/ingresos_service.py
+
+from datetime import date, datetime, time, timedelta
+
+import pytz
+from sqlalchemy import delete, event, extract, func, inspect, select
+from sqlalchemy.dialects.postgresql import insert as insert_postgresql
+from sqlalchemy.dialects.sqlite import insert as insert_sqlite
+from sqlalchemy.orm import Session
+
+from clinica.extensions import db
+from clinica.models import (Cita, CUPSCode, Factura, IngresoDiario, IngresoProcedimientoMensual,
+                            Paciente, Procedimiento)
+from clinica.utils import MESES_ES
+
+# Los días y meses de los agregados son los de la clínica, no los de UTC
+ZONA_LOCAL = pytz.timezone('America/Bogota')
+
+# Filas por lote al reconstruir los agregados
+TAMANO_LOTE_INGRESOS = 5000
+
+
+def dia_local(fecha_factura):
+    """Día (hora de Bogotá) de una fecha de factura; las fechas sin zona se toman como UTC."""
+    if fecha_factura.tzinfo is None:
+        fecha_factura = pytz.utc.localize(fecha_factura)
+    return fecha_factura.astimezone(ZONA_LOCAL).date()
+
+
+def _inicio_utc(dia):
+    return ZONA_LOCAL.localize(datetime.combine(dia, time.min)).astimezone(pytz.utc)
+
+
+def _primer_dia_mes(dia):
+    return dia.replace(day=1)
+
+
+def _mes_siguiente(dia):
+    return (dia.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def _insertar(conexion):
+    return insert_postgresql if conexion.dialect.name == 'postgresql' else insert_sqlite
+
+
+class IngresosService:
+    """
+    Agregados de ingresos por odontólogo (el del paciente facturado):
+
+    - IngresoDiario: total y número de facturas por día.
+    - IngresoProcedimientoMensual: cantidad y valor por código CUPS y mes.
+
+    Se mantienen dentro de la misma transacción que modifica las facturas
+    (eventos de sesión al final de este módulo): cada flush recalcula solo los
+    días y meses afectados, así que el resultado no depende del orden de los
+    cambios y un rollback también los deshace. Las cargas masivas que no pasan
+    por el ORM se reflejan con `python manage.py reconstruir-ingresos`.
+    """
+
+    # --- Lectura ---
+
+    @staticmethod
+    def total_mes(odontologo_id, anio, mes):
+        """(total facturado, número de facturas) del mes."""
+        desde = date(anio, mes, 1)
+        total, facturas = db.session.query(
+            func.coalesce(func.sum(IngresoDiario.total), 0.0),
+            func.coalesce(func.sum(IngresoDiario.facturas), 0),
+        ).filter(
+            IngresoDiario.odontologo_id == odontologo_id,
+            IngresoDiario.fecha >= desde,
+            IngresoDiario.fecha < _mes_siguiente(desde),
+        ).one()
+        return float(total), int(facturas)
+
+    @staticmethod
+    def comparativo_anual(odontologo_id, anio):
+        """Total de cada mes de `anio` junto al del mismo mes del año anterior."""
+        anio_col = extract('year', IngresoDiario.fecha)
+        mes_col = extract('month', IngresoDiario.fecha)
+        filas = db.session.query(anio_col, mes_col, func.sum(IngresoDiario.total)).filter(
+            IngresoDiario.odontologo_id == odontologo_id,
+            IngresoDiario.fecha >= date(anio - 1, 1, 1),
+            IngresoDiario.fecha < date(anio + 1, 1, 1),
+        ).group_by(anio_col, mes_col).all()
+        totales = {(int(a), int(m)): float(total) for a, m, total in filas}
+
+        meses = []
+        for mes in range(1, 13):
+            actual = totales.get((anio, mes), 0.0)
+            anterior = totales.get((anio - 1, mes), 0.0)
+            meses.append({
+                'mes': mes,
+                'nombre': MESES_ES[mes - 1].capitalize(),
+                'actual': actual,
+                'anterior': anterior,
+                'variacion': round((actual - anterior) / anterior * 100, 1) if anterior else None,
+            })
+        return meses
+
+    @staticmethod
+    def por_procedimiento(odontologo_id, anio, mes):
+        """Procedimientos facturados en el mes, del que más ingresó al que menos."""
+        return db.session.query(
+            IngresoProcedimientoMensual.codigo_cups,
+            CUPSCode.description,
+            IngresoProcedimientoMensual.cantidad,
+            IngresoProcedimientoMensual.total,
+        ).outerjoin(
+            CUPSCode, CUPSCode.code == IngresoProcedimientoMensual.codigo_cups
+        ).filter(
+            IngresoProcedimientoMensual.odontologo_id == odontologo_id,
+            IngresoProcedimientoMensual.mes == date(anio, mes, 1),
+        ).order_by(IngresoProcedimientoMensual.total.desc()).all()
+
+    # --- Mantenimiento incremental ---
+
+    @staticmethod
+    def recalcular(conexion, dias):
+        """
+        Recalcula los agregados de los (odontologo_id, día) indicados y de sus
+        meses, usando la conexión de la transacción en curso.
+        """
+        insertar = _insertar(conexion)
+        for odontologo_id, dia in dias:
+            total, facturas = conexion.execute(
+                select(func.coalesce(func.sum(Factura.valor_total), 0.0), func.count(Factura.id))
+                .join(Paciente, Paciente.id == Factura.paciente_id)
+                .where(Paciente.odontologo_id == odontologo_id,
+                       Factura.fecha_factura >= _inicio_utc(dia),
+                       Factura.fecha_factura < _inicio_utc(dia + timedelta(days=1)))
+            ).one()
+            if facturas:
+                sentencia = insertar(IngresoDiario.__table__).values(
+                    odontologo_id=odontologo_id, fecha=dia, total=total, facturas=facturas)
+                conexion.execute(sentencia.on_conflict_do_update(
+                    index_elements=['odontologo_id', 'fecha'],
+                    set_={'total': sentencia.excluded.total, 'facturas': sentencia.excluded.facturas},
+                ))
+            else:
+                conexion.execute(delete(IngresoDiario.__table__).where(
+                    IngresoDiario.odontologo_id == odontologo_id, IngresoDiario.fecha == dia))
+
+        for odontologo_id, mes in {(o, _primer_dia_mes(dia)) for o, dia in dias}:
+            filas = conexion.execute(
+                select(Procedimiento.codigo_cups, func.count(Procedimiento.id), func.sum(Procedimiento.valor))
+                .join(Cita, Cita.id == Procedimiento.cita_id)
+                .join(Factura, Factura.id == Cita.factura_id)
+                .join(Paciente, Paciente.id == Factura.paciente_id)
+                .where(Paciente.odontologo_id == odontologo_id,
+                       Factura.fecha_factura >= _inicio_utc(mes),
+                       Factura.fecha_factura < _inicio_utc(_mes_siguiente(mes)))
+                .group_by(Procedimiento.codigo_cups)
+            ).all()
+            conexion.execute(delete(IngresoProcedimientoMensual.__table__).where(
+                IngresoProcedimientoMensual.odontologo_id == odontologo_id,
+                IngresoProcedimientoMensual.mes == mes))
+            if filas:
+                sentencia = insertar(IngresoProcedimientoMensual.__table__).values([
+                    {'odontologo_id': odontologo_id, 'mes': mes, 'codigo_cups': codigo,
+                     'cantidad': cantidad, 'total': total or 0.0}
+                    for codigo, cantidad, total in filas
+                ])
+                conexion.execute(sentencia.on_conflict_do_update(
+                    index_elements=['odontologo_id', 'mes', 'codigo_cups'],
+                    set_={'cantidad': sentencia.excluded.cantidad, 'total': sentencia.excluded.total},
+                ))
+
+    @staticmethod
+    def reconstruir(odontologo_id=None):
+        """
+        Vuelve a calcular todos los agregados desde las facturas (o solo los de
+        un odontólogo). Recorre las facturas en streaming y hace el commit.
+        """
+        filtro = [Paciente.odontologo_id == odontologo_id] if odontologo_id else []
+
+        dias = {}
+        facturas = db.session.execute(
+            select(Paciente.odontologo_id, Factura.fecha_factura, Factura.valor_total)
+            .join(Paciente, Paciente.id == Factura.paciente_id).where(*filtro)
+            .execution_options(yield_per=TAMANO_LOTE_INGRESOS)
+        )
+        for odontologo, fecha_factura, valor in facturas:
+            acumulado = dias.setdefault((odontologo, dia_local(fecha_factura)), [0.0, 0])
+            acumulado[0] += valor or 0.0
+            acumulado[1] += 1
+
+        procedimientos = {}
+        filas = db.session.execute(
+            select(Paciente.odontologo_id, Factura.fecha_factura, Procedimiento.codigo_cups, Procedimiento.valor)
+            .join(Cita, Cita.id == Procedimiento.cita_id)
+            .join(Factura, Factura.id == Cita.factura_id)
+            .join(Paciente, Paciente.id == Factura.paciente_id).where(*filtro)
+            .execution_options(yield_per=TAMANO_LOTE_INGRESOS)
+        )
+        for odontologo, fecha_factura, codigo, valor in filas:
+            clave = (odontologo, _primer_dia_mes(dia_local(fecha_factura)), codigo)
+            acumulado = procedimientos.setdefault(clave, [0, 0.0])
+            acumulado[0] += 1
+            acumulado[1] += valor or 0.0
+
+        filas_dias = [{'odontologo_id': o, 'fecha': dia, 'total': total, 'facturas': n}
+                      for (o, dia), (total, n) in dias.items()]
+        filas_procedimientos = [{'odontologo_id': o, 'mes': mes, 'codigo_cups': codigo,
+                                 'cantidad': n, 'total': total}
+                                for (o, mes, codigo), (n, total) in procedimientos.items()]
+        try:
+            for modelo, filas_modelo in ((IngresoDiario, filas_dias),
+                                         (IngresoProcedimientoMensual, filas_procedimientos)):
+                borrar = delete(modelo.__table__)
+                if odontologo_id:
+                    borrar = borrar.where(modelo.odontologo_id == odontologo_id)
+                db.session.execute(borrar)
+                for i in range(0, len(filas_modelo), TAMANO_LOTE_INGRESOS):
+                    db.session.execute(modelo.__table__.insert(), filas_modelo[i:i + TAMANO_LOTE_INGRESOS])
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        return {'dias': len(filas_dias), 'procedimientos': len(filas_procedimientos)}
+
+
+# =========================================================================
+# === MANTENIMIENTO AUTOMÁTICO (eventos de sesión) ===
+# =========================================================================
+
+def _anteriores(obj, atributo):
+    """Valores previos de un atributo modificado en este flush."""
+    return list(inspect(obj).attrs[atributo].history.deleted)
+
+
+def _dias_afectados(session, objetos):
+    conexion = session.connection()
+    facturas_por_resolver = set()
+    # (paciente_id, fecha_factura) de facturas nuevas, editadas o borradas
+    pares = set()
+    pacientes_movidos = {}
+    citas_por_resolver = set()
+
+    for obj in objetos:
+        if isinstance(obj, Factura):
+            pacientes = {obj.paciente_id, *_anteriores(obj, 'paciente_id')}
+            fechas = {obj.fecha_factura, *_anteriores(obj, 'fecha_factura')}
+            pares.update((p, f) for p in pacientes for f in fechas if p and f)
+        elif isinstance(obj, Cita):
+            # Solo importa si la cita entra o sale de una factura
+            if obj in session.new or obj in session.deleted:
+                facturas_por_resolver.add(obj.factura_id)
+            else:
+                historial = inspect(obj).attrs.factura_id.history
+                if historial.has_changes():
+                    facturas_por_resolver.update((*historial.added, *historial.deleted))
+        elif isinstance(obj, Procedimiento):
+            citas_por_resolver.update((obj.cita_id, *_anteriores(obj, 'cita_id')))
+        elif isinstance(obj, Paciente):
+            anteriores = _anteriores(obj, 'odontologo_id')
+            if anteriores and obj.id:
+                pacientes_movidos[obj.id] = anteriores
+
+    dias = set()
+    citas_por_resolver.discard(None)
+    if citas_por_resolver:
+        facturas_por_resolver.update(fila[0] for fila in conexion.execute(
+            select(Cita.factura_id).where(Cita.id.in_(citas_por_resolver), Cita.factura_id.isnot(None))
+        ))
+    facturas_por_resolver.discard(None)
+    if facturas_por_resolver:
+        pares.update(conexion.execute(
+            select(Factura.paciente_id, Factura.fecha_factura).where(Factura.id.in_(facturas_por_resolver))
+        ).all())
+    if pares:
+        odontologos = dict(conexion.execute(
+            select(Paciente.id, Paciente.odontologo_id).where(Paciente.id.in_({p for p, _ in pares}))
+        ).all())
+        dias.update((odontologos[p], dia_local(f)) for p, f in pares if p in odontologos)
+    if pacientes_movidos:
+        # Las facturas del paciente pasan de un odontólogo a otro
+        for paciente_id, fecha_factura, odontologo_id in conexion.execute(
+            select(Factura.paciente_id, Factura.fecha_factura, Paciente.odontologo_id)
+            .join(Paciente, Paciente.id == Factura.paciente_id)
+            .where(Factura.paciente_id.in_(pacientes_movidos))
+        ):
+            dia = dia_local(fecha_factura)
+            dias.add((odontologo_id, dia))
+            dias.update((anterior, dia) for anterior in pacientes_movidos[paciente_id])
+    return dias
+
+
+@event.listens_for(Paciente.odontologo_id, 'set', active_history=True)
+def _cargar_odontologo_anterior(target, value, oldvalue, initiator):
+    # Igual que en panel_service: el valor anterior queda en el historial
+    pass
+
+
+@event.listens_for(Session, 'after_flush')
+def _actualizar_ingresos(session, flush_context):
+    objetos = [
+        obj for obj in (*session.new, *session.dirty, *session.deleted)
+        if isinstance(obj, (Factura, Cita, Procedimiento, Paciente))
+    ]
+    if not objetos:
+        return
+    dias = _dias_afectados(session, objetos)
+    if dias:
+        IngresosService.recalcular(session.connection(), dias)
@@ -0,0 +1,89 @@
+# clinica/services/panel_service.py
+
+from flask import current_app
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from clinica.cache import CacheTTL
+from clinica.models import Cita, Paciente
+from clinica.utils import consultar_citas_panel, armar_datos_panel
+
+# Clave de session.info donde se acumulan los odontólogos afectados hasta el commit
+_CLAVE_PENDIENTES = 'panel_invalidar'
+
+
+class PanelService:
+    """
+    Caché por usuario de los datos del panel de inicio (main.index).
+
+    Se guardan las citas de hoy y la primera futura (consultar_citas_panel),
+    que no dependen de la hora; la próxima cita se elige en cada petición.
+    Las entradas viven PANEL_CACHE_TTL segundos (30 por defecto) y se
+    invalidan al confirmar (commit) cualquier cambio en una Cita o en un
+    Paciente del odontólogo. La caché es por proceso: con varios workers, los
+    demás ven el cambio cuando vence el TTL.
+    """
+
+    cache = CacheTTL(ttl=30, max_entradas=500)
+
+    @staticmethod
+    def obtener_datos(usuario, today_date, current_time):
+        clave = ('panel', 'admin' if usuario.is_admin else 'odontologo', usuario.id, today_date)
+        citas_panel = PanelService.cache.obtener_o_calcular(
+            clave,
+            lambda: consultar_citas_panel(today_date, usuario),
+            ttl=current_app.config.get('PANEL_CACHE_TTL', 30)
+        )
+        return armar_datos_panel(citas_panel, current_time)
+
+    @staticmethod
+    def invalidar(odontologo_ids):
+        """Invalida los paneles de esos odontólogos y los de todos los administradores."""
+        PanelService.cache.eliminar_prefijo(('panel', 'admin'))
+        for odontologo_id in odontologo_ids:
+            PanelService.cache.eliminar_prefijo(('panel', 'odontologo', odontologo_id))
+
+
+# =========================================================================
+# === INVALIDACIÓN AUTOMÁTICA (eventos de sesión) ===
+# =========================================================================
+
+def _odontologos_afectados(objetos):
+    afectados = set()
+    for obj in objetos:
+        # Cita.odontologo_id siempre está (ver models._asignar_odontologo_cita); si la
+        # cita o el paciente cambió de odontólogo, el panel del anterior también cambia
+        afectados.add(obj.odontologo_id)
+        afectados.update(inspect(obj).attrs.odontologo_id.history.deleted)
+    afectados.discard(None)
+    return afectados
+
+
+@event.listens_for(Paciente.odontologo_id, 'set', active_history=True)
+@event.listens_for(Cita.odontologo_id, 'set', active_history=True)
+def _cargar_odontologo_anterior(target, value, oldvalue, initiator):
+    # active_history: carga el valor anterior aunque el atributo esté expirado,
+    # para que _odontologos_afectados lo vea en el historial
+    pass
+
+
+@event.listens_for(Session, 'after_flush')
+def _registrar_cambios_panel(session, flush_context):
+    objetos = [
+        obj for obj in (*session.new, *session.dirty, *session.deleted)
+        if isinstance(obj, (Cita, Paciente))
+    ]
+    if objetos:
+        session.info.setdefault(_CLAVE_PENDIENTES, set()).update(_odontologos_afectados(objetos))
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidar_paneles(session):
+    pendientes = session.info.pop(_CLAVE_PENDIENTES, None)
+    if pendientes:
+        PanelService.invalidar(pendientes)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _descartar_cambios_panel(session):
+    session.info.pop(_CLAVE_PENDIENTES, None)
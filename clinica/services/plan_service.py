@@ -1,11 +1,82 @@
 # clinica/services/plan_service.py
 
 from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import event, select, update
+from sqlalchemy.dialects.postgresql import insert as insert_postgresql
+from sqlalchemy.dialects.sqlite import insert as insert_sqlite
+from sqlalchemy.orm import Session
+
 from clinica import db
-from clinica.models import Plan, Usuario, UsuarioPlan, LimiteDiario
+from clinica.cache import CacheTTL
+from clinica.models import Plan, Usuario, UsuarioPlan, LimiteDiario, SolicitudPago
+
+# Clave de session.info donde se acumulan los usuarios afectados hasta el commit
+_CLAVE_PENDIENTES = 'suscripcion_invalidar'
+# Marca para "invalidar a todos" (cambió la definición de un plan)
+TODOS = object()
+# Marca para guardar en la caché que el usuario no tiene plan activo
+_SIN_PLAN = 'sin_plan'
+
+
+class EstadoSuscripcion:
+    """
+    Copia en memoria del plan activo de un usuario (sin objetos ORM, para
+    poder guardarla en la caché entre peticiones).
+    """
+
+    def __init__(self, usuario_plan, plan):
+        self.usuario_plan_id = usuario_plan.id
+        self.plan_id = plan.id
+        self.plan_nombre = plan.nombre
+        self.es_trial = usuario_plan.es_trial
+        self.trial_pacientes_primeros_7_dias = usuario_plan.trial_pacientes_primeros_7_dias
+        self.fecha_inicio = usuario_plan.fecha_inicio
+        self.fecha_fin = usuario_plan.fecha_fin
+        self.limite_pacientes_diario = plan.limite_pacientes_diario
+        self.limite_pacientes_diario_primeros_7_dias = plan.limite_pacientes_diario_primeros_7_dias
+
+    def vencido(self, ahora=None):
+        return self.fecha_fin is not None and self.fecha_fin < (ahora or datetime.utcnow())
+
+    def limite_para(self, fecha):
+        """Pacientes permitidos ese día (los primeros 7 días del trial tienen otro límite)."""
+        if self.es_trial and self.trial_pacientes_primeros_7_dias and (fecha - self.fecha_inicio.date()).days < 7:
+            return self.limite_pacientes_diario_primeros_7_dias
+        return self.limite_pacientes_diario
+
+    def dia_trial(self, fecha):
+        return (fecha - self.fecha_inicio.date()).days + 1 if self.es_trial else None
+
+
+class EstadoLimiteDiario:
+    """Copia en memoria del contador de pacientes de un usuario en un día."""
+
+    def __init__(self, contador_pacientes, limite_actual, es_dia_trial, dia_numero_trial):
+        self.contador_pacientes = contador_pacientes
+        self.limite_actual = limite_actual
+        self.es_dia_trial = es_dia_trial
+        self.dia_numero_trial = dia_numero_trial
+
+    @property
+    def puede_crear(self):
+        return self.contador_pacientes < self.limite_actual
+
 
 class PlanService:
-    """Servicio para manejar lógica de planes y suscripciones"""
+    """
+    Servicio para manejar lógica de planes y suscripciones.
+
+    Los decoradores de decorators/limites.py corren en cada petición, así que
+    el plan activo y el contador del día se leen de una caché por usuario
+    (PLAN_CACHE_TTL segundos, 300 por defecto). Se invalida al confirmar
+    cambios en UsuarioPlan, SolicitudPago, LimiteDiario o Plan, y al
+    incrementar el contador. La caché es por proceso: el límite real lo impone
+    el UPDATE condicional de reservar_cupo_paciente, no la lectura.
+    """
+
+    cache = CacheTTL(ttl=300, max_entradas=2000)
     
     @staticmethod
     def inicializar_planes():
@@ -136,116 +207,200 @@ class PlanService:
             }
         return None
     
+    @classmethod
+    def obtener_estado_suscripcion(cls, usuario_id):
+        """Plan activo del usuario como EstadoSuscripcion (None si no tiene), desde la caché."""
+        def consultar():
+            fila = db.session.execute(
+                select(UsuarioPlan, Plan)
+                .join(Plan, UsuarioPlan.plan_id == Plan.id)
+                .where(UsuarioPlan.usuario_id == usuario_id, UsuarioPlan.estado == 'activo')
+                .order_by(UsuarioPlan.fecha_inicio.desc())
+                .limit(1)
+            ).first()
+            return EstadoSuscripcion(*fila) if fila else _SIN_PLAN
+
+        estado = cls.cache.obtener_o_calcular(
+            ('suscripcion', usuario_id), consultar, ttl=current_app.config.get('PLAN_CACHE_TTL', 300)
+        )
+        return None if estado == _SIN_PLAN else estado
+
     @staticmethod
-    def verificar_limite_diario(usuario_id, fecha=None):
-        """Verificar y actualizar límite diario para un usuario"""
-        if fecha is None:
-            fecha = datetime.utcnow().date()
-        
-        # Obtener plan actual
-        plan_info = PlanService.obtener_plan_actual_usuario(usuario_id)
-        if not plan_info:
-            return {'error': 'Usuario sin plan activo'}
-        
-        plan = plan_info['plan']
-        usuario_plan = plan_info['usuario_plan']
-        
-        # Obtener o crear límite diario
-        limite_diario = LimiteDiario.query.filter_by(
-            usuario_id=usuario_id,
-            fecha=fecha
-        ).first()
-        
-        if not limite_diario:
-            # Calcular límite según día del trial
-            limite_actual = plan.limite_pacientes_diario
-            
-            if usuario_plan.es_trial and usuario_plan.trial_pacientes_primeros_7_dias:
-                # Calcular días desde inicio del trial
-                dias_desde_inicio = (fecha - usuario_plan.fecha_inicio.date()).days
-                if dias_desde_inicio < 7:
-                    limite_actual = plan.limite_pacientes_diario_primeros_7_dias
-            
-            limite_diario = LimiteDiario(
+    def _insertar_limite_diario(usuario_id, fecha, suscripcion):
+        """Crea la fila del día si no existe (sin carrera entre peticiones simultáneas)."""
+        insertar = insert_postgresql if db.engine.dialect.name == 'postgresql' else insert_sqlite
+        db.session.execute(
+            insertar(LimiteDiario.__table__).values(
                 usuario_id=usuario_id,
                 fecha=fecha,
-                limite_actual=limite_actual,
-                es_dia_trial=usuario_plan.es_trial,
-                dia_numero_trial=(fecha - usuario_plan.fecha_inicio.date()).days + 1 if usuario_plan.es_trial else None
-            )
-            db.session.add(limite_diario)
+                contador_pacientes=0,
+                limite_actual=suscripcion.limite_para(fecha),
+                es_dia_trial=suscripcion.es_trial,
+                dia_numero_trial=suscripcion.dia_trial(fecha),
+            ).on_conflict_do_nothing(index_elements=['usuario_id', 'fecha'])
+        )
+
+    @classmethod
+    def _consultar_limite_diario(cls, usuario_id, fecha, suscripcion):
+        fila = db.session.execute(
+            select(LimiteDiario.contador_pacientes, LimiteDiario.limite_actual,
+                   LimiteDiario.es_dia_trial, LimiteDiario.dia_numero_trial)
+            .where(LimiteDiario.usuario_id == usuario_id, LimiteDiario.fecha == fecha)
+        ).first()
+        if fila is None:
+            cls._insertar_limite_diario(usuario_id, fecha, suscripcion)
             db.session.commit()
-        
+            return EstadoLimiteDiario(0, suscripcion.limite_para(fecha), suscripcion.es_trial,
+                                      suscripcion.dia_trial(fecha))
+        return EstadoLimiteDiario(*fila)
+
+    @classmethod
+    def verificar_limite_diario(cls, usuario_id, fecha=None):
+        """Verificar límite diario para un usuario (crea la fila del día si no existe)"""
+        if fecha is None:
+            fecha = datetime.utcnow().date()
+
+        suscripcion = cls.obtener_estado_suscripcion(usuario_id)
+        if not suscripcion:
+            return {'error': 'Usuario sin plan activo'}
+
+        limite_diario = cls.cache.obtener_o_calcular(
+            ('limite', usuario_id, fecha),
+            lambda: cls._consultar_limite_diario(usuario_id, fecha, suscripcion),
+            ttl=current_app.config.get('PLAN_CACHE_TTL', 300)
+        )
         return {
             'limite_diario': limite_diario,
-            'plan': plan,
-            'usuario_plan': usuario_plan,
-            'puede_crear': limite_diario.contador_pacientes < limite_diario.limite_actual
+            'suscripcion': suscripcion,
+            'puede_crear': limite_diario.puede_crear
         }
-    
-    @staticmethod
-    def incrementar_contador_paciente(usuario_id):
-        """Incrementar contador de pacientes creados hoy"""
+
+    @classmethod
+    def reservar_cupo_paciente(cls, usuario_id):
+        """
+        Reserva un cupo del día en la transacción de la sesión, sin hacer commit:
+        el llamador confirma el paciente y el cupo juntos, o hace rollback de ambos.
+
+        El cupo se toma con un solo UPDATE ... SET contador = contador + 1
+        WHERE contador < limite: dos peticiones simultáneas no pueden pasarse
+        del límite ni perder un incremento (la segunda espera el bloqueo de la
+        fila y vuelve a evaluar la condición).
+        """
         fecha_hoy = datetime.utcnow().date()
-        
-        # Verificar límite primero
-        verificacion = PlanService.verificar_limite_diario(usuario_id, fecha_hoy)
-        if 'error' in verificacion:
-            return verificacion
-        
-        limite_diario = verificacion['limite_diario']
-        
-        # Verificar si puede crear más pacientes
-        if limite_diario.contador_pacientes >= limite_diario.limite_actual:
-            return {
-                'exito': False,
-                'error': 'Límite diario alcanzado',
-                'limite_diario': limite_diario
-            }
-        
-        # Incrementar contador
-        limite_diario.contador_pacientes += 1
-        db.session.commit()
-        
+
+        suscripcion = cls.obtener_estado_suscripcion(usuario_id)
+        if not suscripcion:
+            return {'error': 'Usuario sin plan activo'}
+
+        condicion = (LimiteDiario.usuario_id == usuario_id, LimiteDiario.fecha == fecha_hoy)
+        incrementar = (
+            update(LimiteDiario)
+            .where(*condicion, LimiteDiario.contador_pacientes < LimiteDiario.limite_actual)
+            .values(contador_pacientes=LimiteDiario.contador_pacientes + 1)
+            .returning(LimiteDiario.contador_pacientes, LimiteDiario.limite_actual,
+                       LimiteDiario.es_dia_trial, LimiteDiario.dia_numero_trial)
+            .execution_options(synchronize_session=False)
+        )
+        fila = db.session.execute(incrementar).first()
+        if fila is None:
+            # No había fila del día o el límite ya se alcanzó
+            cls._insertar_limite_diario(usuario_id, fecha_hoy, suscripcion)
+            fila = db.session.execute(incrementar).first()
+        # El UPDATE no pasa por el ORM: el contador en caché se descarta al confirmar
+        db.session.info.setdefault(_CLAVE_PENDIENTES, set()).add(usuario_id)
+
+        if fila is None:
+            return {'exito': False, 'error': 'Límite diario alcanzado'}
+        limite_diario = EstadoLimiteDiario(*fila)
         return {
             'exito': True,
             'limite_diario': limite_diario,
             'restantes': limite_diario.limite_actual - limite_diario.contador_pacientes
         }
+
+    @classmethod
+    def incrementar_contador_paciente(cls, usuario_id):
+        """Reserva un cupo (reservar_cupo_paciente) y lo confirma en su propia transacción."""
+        try:
+            resultado = cls.reservar_cupo_paciente(usuario_id)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        if resultado.get('exito') is False:
+            resultado['limite_diario'] = cls.verificar_limite_diario(usuario_id)['limite_diario']
+        elif resultado.get('exito'):
+            cls.cache.guardar(('limite', usuario_id, datetime.utcnow().date()), resultado['limite_diario'],
+                              ttl=current_app.config.get('PLAN_CACHE_TTL', 300))
+        return resultado
+
+    @classmethod
+    def invalidar(cls, usuario_ids):
+        """Descarta el plan y los contadores en caché de esos usuarios."""
+        if TODOS in usuario_ids:
+            cls.cache.limpiar()
+            return
+        for usuario_id in usuario_ids:
+            cls.cache.eliminar(('suscripcion', usuario_id))
+            cls.cache.eliminar_prefijo(('limite', usuario_id))
     
 
     @staticmethod
     def obtener_estadisticas_usuario(usuario_id):
         """Obtener estadísticas del usuario para mostrar en dashboard"""
-        from datetime import datetime
-        
         fecha_hoy = datetime.utcnow().date()
         
-        # Obtener plan actual
-        plan_info = PlanService.obtener_plan_actual_usuario(usuario_id)
-        if not plan_info:
-            return None
-        
-        # Obtener límite diario
+        # Plan actual y límite diario (desde la caché)
         limite_info = PlanService.verificar_limite_diario(usuario_id, fecha_hoy)
         if 'error' in limite_info:
             return None
         
+        suscripcion = limite_info['suscripcion']
         limite_diario = limite_info['limite_diario']
         
         # Calcular días restantes de trial
         dias_restantes = None
-        if plan_info['es_trial'] and plan_info['fecha_fin']:
-            dias_restantes = (plan_info['fecha_fin'].date() - fecha_hoy).days
+        if suscripcion.es_trial and suscripcion.fecha_fin:
+            dias_restantes = (suscripcion.fecha_fin.date() - fecha_hoy).days
             dias_restantes = max(0, dias_restantes)  # No negativo
         
         return {
-            'plan_actual': plan_info['plan'].nombre,
-            'es_trial': plan_info['es_trial'],
+            'plan_actual': suscripcion.plan_nombre,
+            'es_trial': suscripcion.es_trial,
             'dias_restantes_trial': dias_restantes,
             'pacientes_hoy': limite_diario.contador_pacientes,
             'limite_hoy': limite_diario.limite_actual,
             'dia_trial_actual': limite_diario.dia_numero_trial if limite_diario.es_dia_trial else None,
-            'fecha_fin_plan': plan_info['fecha_fin'],
-            'limite_alcanzado': limite_diario.contador_pacientes >= limite_diario.limite_actual
-        }
\ No newline at end of file
+            'fecha_fin_plan': suscripcion.fecha_fin,
+            'limite_alcanzado': not limite_diario.puede_crear
+        }
+
+
+# =========================================================================
+# === INVALIDACIÓN AUTOMÁTICA (eventos de sesión) ===
+# =========================================================================
+
+@event.listens_for(Session, 'after_flush')
+def _registrar_cambios_suscripcion(session, flush_context):
+    afectados = set()
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, (UsuarioPlan, LimiteDiario)):
+            afectados.add(obj.usuario_id)
+        elif isinstance(obj, SolicitudPago):
+            afectados.add(obj.user_id)
+        elif isinstance(obj, Plan):
+            afectados.add(TODOS)
+    if afectados:
+        session.info.setdefault(_CLAVE_PENDIENTES, set()).update(afectados)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidar_suscripciones(session):
+    pendientes = session.info.pop(_CLAVE_PENDIENTES, None)
+    if pendientes:
+        PlanService.invalidar(pendientes)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _descartar_cambios_suscripcion(session):
+    session.info.pop(_CLAVE_PENDIENTES, None)
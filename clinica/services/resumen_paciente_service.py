@@ -0,0 +1,186 @@
+# clinica/services/resumen_paciente_service.py
+
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import and_, event, func, inspect, or_, select, true
+from sqlalchemy.orm import Session
+
+from clinica import db
+from clinica.cache import CacheTTL
+from clinica.models import Cita, Paciente
+
+# Clave de session.info donde se acumulan los pacientes afectados hasta el commit
+_CLAVE_PENDIENTES = 'resumen_paciente_invalidar'
+
+# Columnas del paciente que muestra la tarjeta
+_COLUMNAS_PACIENTE = (
+    Paciente.id, Paciente.odontologo_id, Paciente.nombres, Paciente.apellidos, Paciente.genero,
+    Paciente.edad, Paciente.fecha_nacimiento, Paciente.estado_civil, Paciente.documento,
+    Paciente.telefono, Paciente.direccion, Paciente.email, Paciente.ocupacion, Paciente.aseguradora,
+    Paciente.alergias, Paciente.enfermedad_actual, Paciente.imagen_1, Paciente.imagen_2,
+    Paciente.dentigrama_canvas,
+)
+
+
+class ResumenPacienteService:
+    """
+    Tarjeta de resumen de un paciente (pacientes_ajax.obtener_paciente_ajax):
+    datos del paciente, última cita, próxima cita y motivo más frecuente.
+
+    Todo sale de una sola sentencia: cada dato de citas es una subconsulta
+    con LIMIT 1 filtrada por el id del paciente (idx_cita_paciente_fecha) y
+    unida con LEFT JOIN ... ON true. Como el id va como parámetro no hace
+    falta LATERAL, así que funciona igual en Postgres y en SQLite.
+
+    El resultado se guarda por paciente y día RESUMEN_PACIENTE_CACHE_TTL
+    segundos (300 por defecto) y se invalida al confirmar cambios en el
+    paciente o en sus citas. Si la próxima cita es hoy, la entrada vence a esa
+    hora, cuando deja de ser la próxima. La caché es por proceso.
+    """
+
+    cache = CacheTTL(ttl=300, max_entradas=2000)
+
+    @staticmethod
+    def obtener(paciente_id, usuario, ahora=None):
+        """Datos de la tarjeta, o None si el paciente no existe o no es del usuario."""
+        ahora = ahora or datetime.now()
+        clave = ('resumen', paciente_id, ahora.date())
+        entrada = ResumenPacienteService.cache.obtener(clave)
+        if entrada is None or (entrada['vence'] is not None and ahora >= entrada['vence']):
+            entrada = ResumenPacienteService._consultar(paciente_id, ahora)
+            if entrada is None:
+                return None
+            ResumenPacienteService.cache.guardar(
+                clave, entrada, ttl=current_app.config.get('RESUMEN_PACIENTE_CACHE_TTL', 300)
+            )
+        # La propiedad se comprueba sobre la copia en caché: un acierto no toca la BD
+        if not usuario.is_admin and entrada['odontologo_id'] != usuario.id:
+            return None
+        return entrada['tarjeta']
+
+    @staticmethod
+    def invalidar(paciente_ids):
+        for paciente_id in paciente_ids:
+            ResumenPacienteService.cache.eliminar_prefijo(('resumen', paciente_id))
+
+    @staticmethod
+    def _consultar(paciente_id, ahora):
+        hoy, hora_actual = ahora.date(), ahora.time()
+        activas = (Cita.paciente_id == paciente_id, Cita.is_deleted == False)
+
+        ultima = select(Cita.fecha, Cita.motivo)\
+            .where(*activas, Cita.fecha < hoy)\
+            .order_by(Cita.fecha.desc(), Cita.hora.desc())\
+            .limit(1).subquery('ultima')
+        proxima = select(Cita.fecha, Cita.hora, Cita.motivo)\
+            .where(*activas, Cita.fecha >= hoy,
+                   or_(Cita.fecha > hoy, and_(Cita.fecha == hoy, Cita.hora > hora_actual)))\
+            .order_by(Cita.fecha, Cita.hora)\
+            .limit(1).subquery('proxima')
+        frecuente = select(Cita.motivo)\
+            .where(*activas, Cita.motivo != None, Cita.motivo != '')\
+            .group_by(Cita.motivo)\
+            .order_by(func.count().desc(), Cita.motivo)\
+            .limit(1).subquery('frecuente')
+
+        consulta = select(
+            *_COLUMNAS_PACIENTE,
+            ultima.c.fecha.label('ultima_fecha'), ultima.c.motivo.label('ultima_motivo'),
+            proxima.c.fecha.label('proxima_fecha'), proxima.c.hora.label('proxima_hora'),
+            proxima.c.motivo.label('proxima_motivo'),
+            frecuente.c.motivo.label('motivo_frecuente'),
+        ).select_from(Paciente)\
+            .outerjoin(ultima, true())\
+            .outerjoin(proxima, true())\
+            .outerjoin(frecuente, true())\
+            .where(Paciente.id == paciente_id, Paciente.is_deleted == False)
+
+        fila = db.session.execute(consulta).first()
+        if fila is None:
+            return None
+
+        vence = None
+        if fila.proxima_fecha == hoy:
+            vence = datetime.combine(hoy, fila.proxima_hora)
+        return {'odontologo_id': fila.odontologo_id, 'vence': vence, 'tarjeta': _armar_tarjeta(fila)}
+
+
+def _armar_tarjeta(fila):
+    ultima_cita_str = "No hay citas anteriores registradas"
+    if fila.ultima_fecha:
+        ultima_cita_str = f"{fila.ultima_fecha.strftime('%d %b, %Y')} - {fila.ultima_motivo or 'Consulta'}"
+
+    proxima_cita_str = "No tiene próximas citas"
+    if fila.proxima_fecha:
+        proxima_cita_str = f"{fila.proxima_fecha.strftime('%d %b, %Y')} a las {fila.proxima_hora.strftime('%I:%M %p')} ({fila.proxima_motivo or 'Consulta'})"
+
+    return {
+        'id': fila.id,
+        'nombre': f"{fila.nombres} {fila.apellidos}",
+        'nombres': fila.nombres,
+        'apellidos': fila.apellidos,
+        'genero': fila.genero or 'No especificado',
+        'edad': fila.edad if fila.edad is not None else 'No especificada',
+        'fecha_nacimiento': fila.fecha_nacimiento.strftime('%d/%m/%Y') if fila.fecha_nacimiento else 'No especificada',
+        'estado': fila.estado_civil or 'No especificado',
+        'documento': fila.documento or 'No especificado',
+        'telefono': fila.telefono or 'No especificado',
+        'direccion': fila.direccion or 'No especificado',
+        'email': fila.email or 'No especificado',
+        'ocupacion': fila.ocupacion or 'No especificado',
+        'aseguradora': fila.aseguradora or 'No especificado',
+        'alergias': fila.alergias or 'No especificado',
+        'enfermedad_actual': fila.enfermedad_actual or 'No especificado',
+        'imagen_1': fila.imagen_1 or None,
+        'imagen_2': fila.imagen_2 or None,
+        'dentigrama_url': fila.dentigrama_canvas or None,
+        'ultima_cita_info': ultima_cita_str,
+        'proxima_cita_paciente_info': proxima_cita_str,
+        'motivo_frecuente_info': fila.motivo_frecuente or "No especificado",
+    }
+
+
+# =========================================================================
+# === INVALIDACIÓN AUTOMÁTICA (eventos de sesión) ===
+# =========================================================================
+
+def _pacientes_afectados(objetos):
+    afectados = set()
+    for obj in objetos:
+        if isinstance(obj, Paciente):
+            afectados.add(obj.id)
+        else:
+            # Si la cita cambió de paciente, la tarjeta del anterior también cambia
+            afectados.add(obj.paciente_id)
+            afectados.update(inspect(obj).attrs.paciente_id.history.deleted)
+    afectados.discard(None)
+    return afectados
+
+
+@event.listens_for(Cita.paciente_id, 'set', active_history=True)
+def _cargar_paciente_anterior(target, value, oldvalue, initiator):
+    # active_history: carga el valor anterior aunque el atributo esté expirado
+    pass
+
+
+@event.listens_for(Session, 'after_flush')
+def _registrar_cambios_resumen(session, flush_context):
+    objetos = [
+        obj for obj in (*session.new, *session.dirty, *session.deleted)
+        if isinstance(obj, (Cita, Paciente))
+    ]
+    if objetos:
+        session.info.setdefault(_CLAVE_PENDIENTES, set()).update(_pacientes_afectados(objetos))
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidar_resumenes(session):
+    pendientes = session.info.pop(_CLAVE_PENDIENTES, None)
+    if pendientes:
+        ResumenPacienteService.invalidar(pendientes)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _descartar_cambios_resumen(session):
+    session.info.pop(_CLAVE_PENDIENTES, None)
@@ -0,0 +1,291 @@
+# clinica/services/rips_service.py
+
+import shutil
+import tempfile
+import zipfile
+from datetime import date, datetime, time, timedelta
+
+import pytz
+from sqlalchemy import func, select
+from sqlalchemy.orm import joinedload
+
+from clinica.extensions import db
+from clinica.models import Factura, Cita, Procedimiento
+from clinica.utils import limpiar_texto_rips
+
+# ==============================================================================
+# CONFIGURACIÓN DEL PRESTADOR (EDITA ESTO CON TUS DATOS REALES)
+# ==============================================================================
+DATOS_PRESTADOR = {
+    "codigo_habilitacion": "050012362501",  # TU CÓDIGO DE 12 DÍGITOS
+    "nit": "900123456-7",                   # TU NIT
+    "nombre": "CLINICA ODONTOLOGICA SAS"    # TU RAZÓN SOCIAL
+}
+
+# Facturas por lote: acota la memoria sin importar el tamaño del período
+TAMANO_LOTE = 200
+# Hasta este tamaño los archivos temporales viven en memoria; después pasan a disco
+MAX_SPOOL_ARCHIVO = 1024 * 1024
+MAX_SPOOL_ZIP = 4 * 1024 * 1024
+
+
+class _ArchivoRips:
+    """Archivo plano RIPS que se escribe línea a línea en un temporal y cuenta sus registros."""
+
+    def __init__(self, prefijo):
+        self.prefijo = prefijo
+        self.registros = 0
+        self._temporal = tempfile.SpooledTemporaryFile(max_size=MAX_SPOOL_ARCHIVO, mode='w+b')
+
+    def escribir(self, campos):
+        # Mismo formato que antes: líneas separadas por "\n", sin salto final
+        if self.registros:
+            self._temporal.write(b"\n")
+        self._temporal.write(",".join(campos).encode('utf-8'))
+        self.registros += 1
+
+    def copiar_a_zip(self, zf, nombre):
+        self._temporal.seek(0)
+        with zf.open(nombre, 'w') as destino:
+            shutil.copyfileobj(self._temporal, destino)
+
+    def cerrar(self):
+        self._temporal.close()
+
+
+class RipsService:
+    """
+    Generación de RIPS (AF, US, AC, AP y CT) en streaming.
+
+    Las facturas se leen con yield_per en lotes de TAMANO_LOTE; por cada lote
+    se cargan sus citas y procedimientos con una consulta cada uno, se escriben
+    las líneas en archivos temporales y se liberan los objetos de la sesión.
+    Los conteos del CT se llevan mientras se escribe.
+    """
+
+    @staticmethod
+    def rango_utc(fecha_inicio_local, fecha_fin_local):
+        """Fechas locales (Bogotá, ambas inclusive) -> [inicio, fin) en UTC para filtrar fecha_factura."""
+        local_timezone = pytz.timezone('America/Bogota')
+        rango_inicio_utc = local_timezone.localize(datetime.combine(fecha_inicio_local, time.min)).astimezone(pytz.utc)
+        rango_fin_siguiente_dia_local = fecha_fin_local + timedelta(days=1)
+        rango_fin_utc = local_timezone.localize(datetime.combine(rango_fin_siguiente_dia_local, time.min)).astimezone(pytz.utc)
+        return rango_inicio_utc, rango_fin_utc
+
+    @staticmethod
+    def contar_facturas(rango_inicio_utc, rango_fin_utc):
+        return db.session.scalar(select(func.count(Factura.id)).filter(
+            Factura.fecha_factura >= rango_inicio_utc,
+            Factura.fecha_factura < rango_fin_utc
+        ))
+
+    @staticmethod
+    def _lotes_facturas(rango_inicio_utc, rango_fin_utc):
+        consulta = select(Factura).options(joinedload(Factura.paciente)).filter(
+            Factura.fecha_factura >= rango_inicio_utc,
+            Factura.fecha_factura < rango_fin_utc
+        ).order_by(Factura.fecha_factura.desc(), Factura.id.desc()).execution_options(yield_per=TAMANO_LOTE)
+        yield from db.session.execute(consulta).scalars().partitions()
+
+    @staticmethod
+    def _citas_y_procedimientos(facturas):
+        """Citas por factura y procedimientos por cita del lote (dos consultas)."""
+        ids_factura = [f.id for f in facturas]
+        citas_por_factura = {}
+        citas = Cita.query.filter(Cita.factura_id.in_(ids_factura)).order_by(Cita.id).all()
+        for cita in citas:
+            citas_por_factura.setdefault(cita.factura_id, []).append(cita)
+
+        procedimientos_por_cita = {}
+        if citas:
+            procedimientos = Procedimiento.query.filter(
+                Procedimiento.cita_id.in_([c.id for c in citas])
+            ).order_by(Procedimiento.id).all()
+            for proc in procedimientos:
+                procedimientos_por_cita.setdefault(proc.cita_id, []).append(proc)
+        return citas_por_factura, procedimientos_por_cita
+
+    @staticmethod
+    def _liberar(facturas, citas_por_factura, procedimientos_por_cita):
+        objetos = [*facturas, *(f.paciente for f in facturas if f.paciente)]
+        objetos += [c for citas in citas_por_factura.values() for c in citas]
+        objetos += [p for procs in procedimientos_por_cita.values() for p in procs]
+        for obj in objetos:
+            if obj in db.session:
+                db.session.expunge(obj)
+
+    @staticmethod
+    def generar_zip(rango_inicio_utc, rango_fin_utc, datos_prestador, fecha_nombre_archivo, fecha_remision,
+                    progreso=None):
+        """
+        Escribe el ZIP de RIPS del período en un SpooledTemporaryFile (en la
+        posición 0, listo para send_file). Devuelve None si no hay facturas.
+        Si se pasa `progreso`, se llama con el total de facturas escritas
+        después de cada lote.
+        """
+        archivos = {prefijo: _ArchivoRips(prefijo) for prefijo in ('AF', 'US', 'AC', 'AP')}
+        pacientes_procesados = set()  # Evitar duplicar usuarios en el archivo US
+        hoy = date.today()
+        hay_facturas = False
+        procesadas = 0
+
+        try:
+            for lote in RipsService._lotes_facturas(rango_inicio_utc, rango_fin_utc):
+                hay_facturas = True
+                citas_por_factura, procedimientos_por_cita = RipsService._citas_y_procedimientos(lote)
+                for factura in lote:
+                    RipsService._escribir_factura(
+                        factura, citas_por_factura.get(factura.id, []), procedimientos_por_cita,
+                        archivos, pacientes_procesados, datos_prestador, hoy
+                    )
+                # Liberar los objetos del lote antes de leer el siguiente (solo los del
+                # lote: expunge_all también soltaría al usuario de la sesión)
+                RipsService._liberar(lote, citas_por_factura, procedimientos_por_cita)
+                procesadas += len(lote)
+                if progreso:
+                    progreso(procesadas)
+
+            if not hay_facturas:
+                return None
+
+            # --- ARCHIVO CT (CONTROL): conteos acumulados durante la escritura ---
+            lineas_ct = [
+                f"{datos_prestador['codigo_habilitacion']},{fecha_remision},{prefijo}{fecha_nombre_archivo},{archivo.registros}"
+                for prefijo, archivo in archivos.items() if archivo.registros
+            ]
+
+            salida = tempfile.SpooledTemporaryFile(max_size=MAX_SPOOL_ZIP, mode='w+b')
+            with zipfile.ZipFile(salida, mode='w', compression=zipfile.ZIP_DEFLATED) as zf:
+                for prefijo, archivo in archivos.items():
+                    if archivo.registros:
+                        archivo.copiar_a_zip(zf, f'{prefijo}{fecha_nombre_archivo}.txt')
+                if lineas_ct:
+                    zf.writestr(f'CT{fecha_nombre_archivo}.txt', "\n".join(lineas_ct))
+            salida.seek(0)
+            return salida
+        finally:
+            for archivo in archivos.values():
+                archivo.cerrar()
+
+    @staticmethod
+    def _escribir_factura(factura, citas, procedimientos_por_cita, archivos, pacientes_procesados,
+                          datos_prestador, hoy):
+        paciente = factura.paciente
+        if not paciente:
+            return
+
+        # Calculamos edad actual
+        edad = (hoy - paciente.fecha_nacimiento).days // 365 if paciente.fecha_nacimiento else 0
+
+        # ----------------------------------------------------------
+        # 1. ARCHIVO US (USUARIOS)
+        # ----------------------------------------------------------
+        if paciente.id not in pacientes_procesados:
+            # El departamento OBLIGATORIAMENTE son los 2 primeros dígitos del municipio
+            mpio_final = paciente.codigo_municipio if paciente.codigo_municipio else "05001"
+            depto_final = mpio_final[:2]
+
+            archivos['US'].escribir([
+                paciente.tipo_documento_rips or '',
+                paciente.documento or '',
+                limpiar_texto_rips(paciente.codigo_aseguradora or paciente.aseguradora, 6),
+                str(paciente.tipo_usuario_rips or '1'),
+                limpiar_texto_rips(paciente.primer_apellido),
+                limpiar_texto_rips(paciente.segundo_apellido),
+                limpiar_texto_rips(paciente.primer_nombre),
+                limpiar_texto_rips(paciente.segundo_nombre),
+                str(edad),
+                "1",  # Unidad de medida de la edad
+                paciente.genero_rips or paciente.get_genero_rips() or "M",
+                depto_final,
+                mpio_final,
+                paciente.zona_residencia or "U"
+            ])
+            pacientes_procesados.add(paciente.id)
+
+        # ----------------------------------------------------------
+        # 2. ARCHIVO AF (FACTURACIÓN)
+        # ----------------------------------------------------------
+        f_inicio = factura.fecha_inicio_periodo.strftime('%d/%m/%Y') if factura.fecha_inicio_periodo else factura.fecha_factura.strftime('%d/%m/%Y')
+        f_fin = factura.fecha_final_periodo.strftime('%d/%m/%Y') if factura.fecha_final_periodo else factura.fecha_factura.strftime('%d/%m/%Y')
+
+        # No confiamos en factura.valor_total guardado: el precio del procedimiento
+        # pudo editarse después de crear la factura. Se recalcula siempre.
+        valor_total_reporte = sum(
+            (p.valor or 0) for c in citas for p in procedimientos_por_cita.get(c.id, [])
+        )
+        # Si la suma dio 0 (raro), usamos el valor guardado como respaldo
+        if valor_total_reporte == 0 and factura.valor_total:
+            valor_total_reporte = factura.valor_total
+
+        numero_factura = limpiar_texto_rips(factura.numero_factura)
+        archivos['AF'].escribir([
+            datos_prestador["codigo_habilitacion"],
+            limpiar_texto_rips(datos_prestador["nombre"]),
+            "NI",
+            datos_prestador["nit"],
+            numero_factura,
+            f_inicio,
+            f_fin,
+            limpiar_texto_rips(paciente.codigo_aseguradora or paciente.aseguradora, 6),
+            limpiar_texto_rips(paciente.aseguradora),
+            "",
+            "",
+            "",
+            str(int(factura.valor_copago or 0)),
+            str(int(factura.valor_comision or 0)),
+            str(int(factura.valor_descuentos or 0)),
+            str(int(valor_total_reporte))
+        ])
+
+        # ----------------------------------------------------------
+        # 3. CITAS (CONSULTAS - AC) Y PROCEDIMIENTOS (AP)
+        # ----------------------------------------------------------
+        for cita in citas:
+            fecha_cita_str = cita.fecha.strftime('%d/%m/%Y')
+
+            # Solo generamos línea AC si la cita tiene código de consulta
+            if cita.codigo_consulta_cups:
+                archivos['AC'].escribir([
+                    numero_factura,
+                    datos_prestador["codigo_habilitacion"],
+                    paciente.tipo_documento_rips or '',
+                    paciente.documento or '',
+                    fecha_cita_str,
+                    "",  # Número Autorización
+                    cita.codigo_consulta_cups,
+                    cita.finalidad_consulta or "10",
+                    cita.causa_externa or "13",
+                    cita.diagnostico_principal or "K029",
+                    cita.diagnostico_relacionado1 or "",
+                    cita.diagnostico_relacionado2 or "",
+                    cita.diagnostico_relacionado3 or "",
+                    cita.tipo_diagnostico_principal or "1",
+                    str(int(valor_total_reporte or 0)),  # Valor consulta
+                    str(int(factura.valor_cuota_moderadora or 0)),
+                    str(int(valor_total_reporte or 0))  # Valor neto
+                ])
+
+            for proc in procedimientos_por_cita.get(cita.id, []):
+                # Diagnóstico de 3 caracteres (Ej: "K02") -> "K029" para evitar rechazo por longitud
+                dx_principal = (proc.diagnostico_cie10 or "K029").strip()
+                if len(dx_principal) == 3:
+                    dx_principal += "9"
+
+                archivos['AP'].escribir([
+                    numero_factura,
+                    datos_prestador["codigo_habilitacion"],
+                    paciente.tipo_documento_rips or '',
+                    paciente.documento or '',
+                    fecha_cita_str,
+                    "",  # Número Autorización
+                    proc.codigo_cups or '',
+                    "1",  # Ámbito (1=Ambulatorio)
+                    "1",  # Finalidad (1=Diagnóstico/Terapéutico)
+                    "",   # Personal que atiende
+                    dx_principal,
+                    "",   # Diag Relacionado
+                    "",   # Complicación
+                    "1",  # Forma realización (1=Directa)
+                    str(int(proc.valor or 0))
+                ])
@@ -0,0 +1,361 @@
+# clinica/services/subidas_service.py
+
+import base64
+import binascii
+import glob
+import json
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import cloudinary.api
+import cloudinary.uploader
+from flask import current_app
+from sqlalchemy import update
+
+from clinica.extensions import db
+from clinica.models import Paciente
+from clinica.utils import allowed_file, extract_public_id_from_url
+
+# Columnas de Paciente que maneja el pipeline y su carpeta en el backend
+CARPETAS_POR_COLUMNA = {
+    'imagen_perfil_url': 'pacientes_perfil',
+    'imagen_1': 'paciente_imagenes',
+    'imagen_2': 'paciente_imagenes',
+    'dentigrama_canvas': 'dentigramas_pacientes',
+}
+# URL provisional con la que se guarda la imagen mientras sube (la sirve pacientes.ver_subida)
+PREFIJO_URL_SPOOL = '/pacientes/subidas/'
+# Archivos del spool que nadie programó y resultados ya aplicados se borran pasado este tiempo
+MAX_EDAD_SPOOL = 24 * 3600
+
+_TOKEN_VALIDO = re.compile(r'^[0-9a-f]{32}$')
+# Subtipos aceptados en 'data:image/<subtipo>;base64,' y la extensión con la que se guardan
+EXTENSION_POR_SUBTIPO = {'png': 'png', 'jpeg': 'jpg', 'jpg': 'jpg', 'gif': 'gif', 'webp': 'webp'}
+# Tipo con el que ver_subida sirve cada extensión del spool (nunca se deduce del nombre)
+TIPO_POR_EXTENSION = {
+    'png': 'image/png', 'jpg': 'image/jpeg', 'jpeg': 'image/jpeg', 'gif': 'image/gif',
+    'webp': 'image/webp', 'pdf': 'application/pdf',
+}
+
+
+class BackendCloudinary:
+    def subir(self, ruta, carpeta, public_id=None):
+        opciones = {'folder': carpeta}
+        if public_id:
+            # Nombre fijo (dentigrama): sobreescribe el anterior y limpia la caché de la CDN
+            opciones.update(public_id=public_id, overwrite=True, invalidate=True, resource_type='image')
+        return cloudinary.uploader.upload(ruta, **opciones).get('secure_url')
+
+    def borrar(self, public_ids):
+        """Borra hasta 100 recursos en una llamada. Devuelve {public_id: None si se borró, o el error}."""
+        respuesta = cloudinary.api.delete_resources(list(public_ids))
+        resultado = respuesta.get('deleted', {})
+        # 'not_found' cuenta como borrado: el recurso ya no está
+        return {
+            public_id: None if resultado.get(public_id) in ('deleted', 'not_found') else (resultado.get(public_id) or 'sin respuesta')
+            for public_id in public_ids
+        }
+
+
+class BackendLocal:
+    """Copia los archivos a una carpeta local (static/uploads). Para desarrollo y pruebas sin red."""
+
+    def __init__(self, directorio, url_base):
+        self.directorio = directorio
+        self.url_base = url_base
+
+    def subir(self, ruta, carpeta, public_id=None):
+        nombre = f"{public_id or uuid.uuid4().hex}{os.path.splitext(ruta)[1]}"
+        destino = os.path.join(self.directorio, carpeta)
+        os.makedirs(destino, exist_ok=True)
+        shutil.copyfile(ruta, os.path.join(destino, nombre))
+        return f"{self.url_base}/{carpeta}/{nombre}"
+
+    def borrar(self, public_ids):
+        for public_id in public_ids:
+            for ruta in glob.glob(os.path.join(self.directorio, f"{public_id}.*")):
+                os.remove(ruta)
+        return {public_id: None for public_id in public_ids}
+
+
+class SubidaService:
+    """
+    Subida de imágenes de pacientes en segundo plano.
+
+    1. En la petición, el archivo (o el PNG base64 del dentigrama) se guarda en
+       el spool local (SUBIDAS_DIR, instance/subidas por defecto) y la columna
+       del paciente toma una URL provisional servida desde ese spool.
+    2. Tras el commit, programar_pendientes() encola la subida en un pool de
+       SUBIDAS_MAX_HILOS hilos (2 por defecto). Cada subida se reintenta hasta
+       SUBIDAS_REINTENTOS veces con espera exponencial (SUBIDAS_ESPERA_BASE s).
+    3. Al terminar se reemplaza la URL provisional por la definitiva, solo si
+       la columna no cambió mientras tanto.
+
+    Cada subida programada deja un manifiesto <token>.json junto al archivo;
+    al arrancar el pool se reencolan las que quedaron pendientes. El backend se
+    elige con UPLOAD_BACKEND: 'cloudinary' (por defecto) o 'local'.
+
+    El spool tiene que sobrevivir a un reinicio: en Fly el disco raíz se
+    pierde al detener la máquina, así que SUBIDAS_DIR debe apuntar a un
+    volumen ([mounts] en fly.toml). Sin SUBIDAS_DIR configurado, y siempre en
+    TESTING, la subida ocurre dentro de la misma petición (SUBIDAS_SINCRONO)
+    con un solo intento y sin esperas; si falla, la imagen se sigue sirviendo
+    desde el spool (los reintentos son solo del spool en segundo plano).
+    """
+
+    _executor = None
+    _lock = threading.Lock()
+
+    # --- Spool ---
+
+    @staticmethod
+    def directorio():
+        ruta = current_app.config.get('SUBIDAS_DIR') or os.path.join(current_app.instance_path, 'subidas')
+        os.makedirs(ruta, exist_ok=True)
+        return ruta
+
+    @staticmethod
+    def es_url_spool(url):
+        return bool(url) and url.startswith(PREFIJO_URL_SPOOL)
+
+    @staticmethod
+    def token_de_url(url):
+        token = url[len(PREFIJO_URL_SPOOL):] if SubidaService.es_url_spool(url) else ''
+        return token if _TOKEN_VALIDO.match(token) else None
+
+    @staticmethod
+    def guardar_archivo(archivo):
+        """Guarda un FileStorage en el spool y devuelve su URL provisional (None si no es válido)."""
+        if not archivo or archivo.filename == '' or not allowed_file(archivo.filename):
+            return None
+        token = uuid.uuid4().hex
+        extension = archivo.filename.rsplit('.', 1)[1].lower()
+        archivo.seek(0)
+        archivo.save(os.path.join(SubidaService.directorio(), f"{token}.{extension}"))
+        return PREFIJO_URL_SPOOL + token
+
+    @staticmethod
+    def guardar_base64(data_url):
+        """Guarda una imagen 'data:image/...;base64,' en el spool y devuelve su URL provisional."""
+        if not data_url or not data_url.startswith('data:image'):
+            return None
+        cabecera, _, contenido = data_url.partition(',')
+        # El subtipo lo manda el cliente: solo se aceptan los de la lista (nada de html, svg...)
+        extension = EXTENSION_POR_SUBTIPO.get(cabecera[len('data:image/'):].split(';')[0].lower())
+        if extension is None:
+            return None
+        try:
+            datos = base64.b64decode(contenido, validate=True)
+        except (binascii.Error, ValueError):
+            return None
+        token = uuid.uuid4().hex
+        with open(os.path.join(SubidaService.directorio(), f"{token}.{extension}"), 'wb') as destino:
+            destino.write(datos)
+        return PREFIJO_URL_SPOOL + token
+
+    @staticmethod
+    def guardar_valor_dentigrama(valor):
+        """
+        Valor a guardar en dentigrama_canvas: un PNG base64 va al spool; una URL
+        (ya subida o provisional) se conserva tal cual.
+        """
+        if not valor:
+            return None
+        if valor.startswith('data:image'):
+            return SubidaService.guardar_base64(valor)
+        if valor.startswith('http') or SubidaService.es_url_spool(valor):
+            return valor
+        return None
+
+    @staticmethod
+    def _archivo_de(token):
+        for ruta in glob.glob(os.path.join(SubidaService.directorio(), f"{token}.*")):
+            if not ruta.endswith('.json'):
+                return ruta
+        return None
+
+    @staticmethod
+    def _leer_manifiesto(token):
+        try:
+            with open(os.path.join(SubidaService.directorio(), f"{token}.json")) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    @staticmethod
+    def _escribir_manifiesto(token, manifiesto):
+        ruta = os.path.join(SubidaService.directorio(), f"{token}.json")
+        with open(ruta + '.tmp', 'w') as f:
+            json.dump(manifiesto, f)
+        os.replace(ruta + '.tmp', ruta)
+
+    @staticmethod
+    def tipo_mime(ruta):
+        """Tipo con el que se sirve un archivo del spool (None si su extensión no está permitida)."""
+        return TIPO_POR_EXTENSION.get(ruta.rsplit('.', 1)[-1].lower())
+
+    @staticmethod
+    def resolver(token):
+        """Para servir la URL provisional: ('archivo', ruta), ('url', url_final) o None."""
+        if not _TOKEN_VALIDO.match(token or ''):
+            return None
+        ruta = SubidaService._archivo_de(token)
+        if ruta:
+            return 'archivo', ruta
+        manifiesto = SubidaService._leer_manifiesto(token)
+        if manifiesto and manifiesto.get('url'):
+            return 'url', manifiesto['url']
+        return None
+
+    # --- Programación y subida ---
+
+    @staticmethod
+    def sincrono():
+        """Sin un spool persistente (SUBIDAS_DIR) no se difiere la subida: el archivo podría perderse."""
+        return current_app.config.get(
+            'SUBIDAS_SINCRONO', current_app.testing or not current_app.config.get('SUBIDAS_DIR')
+        )
+
+    @staticmethod
+    def backend():
+        if current_app.config.get('UPLOAD_BACKEND', 'cloudinary') == 'local':
+            return BackendLocal(
+                current_app.config.get('SUBIDAS_LOCAL_DIR') or os.path.join(current_app.static_folder, 'uploads'),
+                current_app.config.get('SUBIDAS_LOCAL_URL', '/static/uploads')
+            )
+        return BackendCloudinary()
+
+    @staticmethod
+    def public_id_de_url(url):
+        """public_id para borrar la imagen de su backend (None si no es una URL subida)."""
+        if not url:
+            return None
+        if 'cloudinary.com' in url:
+            return extract_public_id_from_url(url)
+        url_local = current_app.config.get('SUBIDAS_LOCAL_URL', '/static/uploads') + '/'
+        if url.startswith(url_local):
+            return os.path.splitext(url[len(url_local):])[0] or None
+        return None
+
+    @classmethod
+    def _pool(cls):
+        with cls._lock:
+            if cls._executor is None:
+                cls._executor = ThreadPoolExecutor(
+                    max_workers=current_app.config.get('SUBIDAS_MAX_HILOS', 2),
+                    thread_name_prefix='subidas'
+                )
+                cls._recuperar(current_app._get_current_object())
+            return cls._executor
+
+    @classmethod
+    def programar_pendientes(cls, paciente):
+        """Encola las columnas del paciente que aún tienen URL provisional. Llamar después del commit."""
+        for columna, carpeta in CARPETAS_POR_COLUMNA.items():
+            url_spool = getattr(paciente, columna)
+            if cls.es_url_spool(url_spool):
+                public_id = f"dentigrama_paciente_{paciente.id}" if columna == 'dentigrama_canvas' else None
+                cls.programar(url_spool, paciente.id, columna, carpeta, public_id)
+
+    @classmethod
+    def programar(cls, url_spool, paciente_id, columna, carpeta, public_id=None):
+        token = cls.token_de_url(url_spool)
+        if token is None:
+            return
+        manifiesto = cls._leer_manifiesto(token)
+        if manifiesto:
+            # Ya programada (el formulario volvió a enviar la misma URL provisional)
+            if manifiesto.get('url'):
+                cls._aplicar_url(manifiesto, manifiesto['url'])
+            return
+        if cls._archivo_de(token) is None:
+            current_app.logger.warning(f"SUBIDAS: el archivo {token} no está en el spool")
+            return
+
+        cls._escribir_manifiesto(token, {
+            'estado': 'pendiente', 'paciente_id': paciente_id, 'columna': columna,
+            'carpeta': carpeta, 'public_id': public_id, 'url_spool': url_spool,
+        })
+        app = current_app._get_current_object()
+        if cls.sincrono():
+            # Dentro de la petición: un solo intento y sin esperas, para no retener el
+            # hilo de gunicorn si el backend está caído (la URL provisional sigue sirviendo)
+            cls._subir(app, token, reintentos=1)
+        else:
+            cls._pool().submit(cls._subir, app, token)
+
+    @staticmethod
+    def _aplicar_url(manifiesto, url):
+        columna = getattr(Paciente, manifiesto['columna'])
+        with db.engine.begin() as conexion:
+            resultado = conexion.execute(
+                update(Paciente)
+                .where(Paciente.id == manifiesto['paciente_id'], columna == manifiesto['url_spool'])
+                .values({manifiesto['columna']: url})
+            )
+        return resultado.rowcount
+
+    @classmethod
+    def _subir(cls, app, token, reintentos=None):
+        with app.app_context():
+            manifiesto = cls._leer_manifiesto(token)
+            ruta = cls._archivo_de(token)
+            if not manifiesto or manifiesto.get('estado') != 'pendiente' or ruta is None:
+                return
+
+            if reintentos is None:
+                reintentos = app.config.get('SUBIDAS_REINTENTOS', 4)
+            espera_base = app.config.get('SUBIDAS_ESPERA_BASE', 2)
+            backend = cls.backend()
+            for intento in range(1, reintentos + 1):
+                try:
+                    url = backend.subir(ruta, manifiesto['carpeta'], manifiesto['public_id'])
+                    if not url:
+                        raise RuntimeError('el backend no devolvió URL')
+                    break
+                except Exception as e:
+                    app.logger.warning(f"SUBIDAS: intento {intento}/{reintentos} fallido para {token}: {e}")
+                    if intento == reintentos:
+                        # Se queda en el spool (la URL provisional sigue sirviendo la imagen)
+                        manifiesto['estado'] = 'fallida'
+                        cls._escribir_manifiesto(token, manifiesto)
+                        app.logger.error(f"SUBIDAS: no se pudo subir {token} tras {reintentos} intento(s)")
+                        return
+                    time.sleep(espera_base * 2 ** (intento - 1))
+
+            if not cls._aplicar_url(manifiesto, url):
+                app.logger.info(f"SUBIDAS: el paciente {manifiesto['paciente_id']} cambió "
+                                f"{manifiesto['columna']} mientras subía {token}; se descarta la subida")
+                if not manifiesto['public_id']:
+                    from clinica.services.borrados_service import BorradoService
+                    BorradoService.encolar_urls([url])
+                    db.session.commit()
+            manifiesto.update(estado='subida', url=url, terminado=time.time())
+            cls._escribir_manifiesto(token, manifiesto)
+            os.remove(ruta)
+
+    @classmethod
+    def _recuperar(cls, app):
+        """Reencola las subidas pendientes (o fallidas) del spool y limpia lo viejo."""
+        with app.app_context():
+            directorio = cls.directorio()
+            limite = time.time() - MAX_EDAD_SPOOL
+            for ruta in glob.glob(os.path.join(directorio, '*')):
+                nombre = os.path.basename(ruta)
+                token = nombre.split('.', 1)[0]
+                if nombre.endswith('.json'):
+                    manifiesto = cls._leer_manifiesto(token) or {}
+                    if manifiesto.get('estado') in ('pendiente', 'fallida'):
+                        manifiesto['estado'] = 'pendiente'
+                        cls._escribir_manifiesto(token, manifiesto)
+                        cls._executor.submit(cls._subir, app, token)
+                    elif manifiesto.get('estado') == 'subida' and os.path.getmtime(ruta) < limite:
+                        os.remove(ruta)
+                elif not os.path.exists(os.path.join(directorio, f"{token}.json")) and os.path.getmtime(ruta) < limite:
+                    # Archivo que nunca se asoció a un paciente (formulario abandonado)
+                    os.remove(ruta)
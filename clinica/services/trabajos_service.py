@@ -0,0 +1,246 @@
+# clinica/services/trabajos_service.py
+
+import os
+import shutil
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+
+import pytz
+from flask import current_app
+from sqlalchemy import update
+
+from clinica.extensions import db
+from clinica.models import TrabajoExportacion, Paciente
+from clinica.services.exportacion_service import ExportacionService
+from clinica.services.rips_service import RipsService, DATOS_PRESTADOR
+
+# Estados de TrabajoExportacion.estado
+PENDIENTE = 'PENDIENTE'
+PROCESANDO = 'PROCESANDO'
+TERMINADO = 'TERMINADO'
+ERROR = 'ERROR'
+
+# Un trabajo que sigue PENDIENTE/PROCESANDO pasado este tiempo quedó huérfano
+# (el proceso se reinició mientras lo generaba)
+MAX_DURACION_TRABAJO = timedelta(hours=1)
+# Procesos de render para la exportación masiva: deja una CPU para las
+# peticiones; con una sola CPU se renderiza en el hilo del trabajo
+PROCESOS_RENDER = max(0, min(2, (os.cpu_count() or 1) - 1))
+
+
+class TrabajoSinResultado(Exception):
+    """El trabajo terminó sin archivo que entregar (p. ej. período sin facturas)."""
+
+
+# =========================================================================
+# === GENERADORES: parametros -> (archivo, nombre_descarga) ===
+# =========================================================================
+
+def _generar_rips(parametros, progreso):
+    fecha_inicio = date.fromisoformat(parametros['fecha_inicio'])
+    fecha_fin = date.fromisoformat(parametros['fecha_fin'])
+    rango_inicio_utc, rango_fin_utc = RipsService.rango_utc(fecha_inicio, fecha_fin)
+
+    total = RipsService.contar_facturas(rango_inicio_utc, rango_fin_utc)
+    if not total:
+        raise TrabajoSinResultado('No se encontraron facturas generadas en el período seleccionado.')
+
+    ahora_local = datetime.now(pytz.timezone('America/Bogota'))
+    zip_rips = RipsService.generar_zip(
+        rango_inicio_utc, rango_fin_utc, DATOS_PRESTADOR,
+        ahora_local.strftime("%d%m%Y"), ahora_local.strftime('%d/%m/%Y'),
+        progreso=lambda procesadas: progreso(min(99, procesadas * 100 // total))
+    )
+    if zip_rips is None:
+        raise TrabajoSinResultado('No se encontraron facturas generadas en el período seleccionado.')
+    return zip_rips, f"RIPS_{fecha_inicio:%m-%d-%Y}_al_{fecha_fin:%m-%d-%Y}.zip"
+
+
+def _paciente_del_trabajo(parametros):
+    paciente = db.session.get(Paciente, parametros['paciente_id'])
+    if paciente is None:
+        raise TrabajoSinResultado('El paciente ya no existe.')
+    return paciente
+
+
+def _generar_excel(parametros, progreso):
+    return ExportacionService.generar_excel(_paciente_del_trabajo(parametros))
+
+
+def _generar_word(parametros, progreso):
+    return ExportacionService.generar_word(_paciente_del_trabajo(parametros))
+
+
+def _generar_historias(parametros, progreso):
+    paciente_ids = parametros['paciente_ids']
+    if not paciente_ids:
+        raise TrabajoSinResultado('No hay pacientes para exportar.')
+    total = len(paciente_ids)
+    zip_historias = ExportacionService.generar_zip_historias(
+        paciente_ids,
+        procesos=current_app.config.get('EXPORT_PROCESOS', 0 if current_app.testing else PROCESOS_RENDER),
+        progreso=lambda escritos: progreso(min(99, escritos * 100 // total))
+    )
+    fecha = datetime.now(pytz.timezone('America/Bogota'))
+    return zip_historias, f"Historias_Clinicas_{fecha:%d-%m-%Y_%H%M}.zip"
+
+
+GENERADORES = {
+    'rips': _generar_rips,
+    'excel': _generar_excel,
+    'word': _generar_word,
+    'historias': _generar_historias,
+}
+
+
+class TrabajoService:
+    """
+    Cola de exportaciones en segundo plano.
+
+    El trabajo se registra en la tabla trabajos_exportacion y se procesa en un
+    ThreadPoolExecutor del propio proceso (EXPORT_MAX_TRABAJOS hilos, 2 por
+    defecto), de modo que los hilos de gunicorn quedan libres mientras se
+    genera el documento. El archivo se guarda en EXPORT_DIR
+    (instance/exportaciones por defecto) y se borra junto con su fila al pasar
+    EXPORT_EXPIRA_HORAS (24 por defecto).
+
+    El progreso y el estado se escriben con una conexión aparte: la sesión del
+    hilo puede estar recorriendo un cursor en streaming (RIPS con yield_per) y
+    un commit en ella lo cerraría. Con EXPORT_SINCRONO (activo en TESTING) el
+    trabajo se ejecuta dentro de la misma petición.
+    """
+
+    _executor = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def _pool(cls):
+        with cls._lock:
+            if cls._executor is None:
+                cls._executor = ThreadPoolExecutor(
+                    max_workers=current_app.config.get('EXPORT_MAX_TRABAJOS', 2),
+                    thread_name_prefix='exportacion'
+                )
+            return cls._executor
+
+    @staticmethod
+    def directorio():
+        ruta = current_app.config.get('EXPORT_DIR') or os.path.join(current_app.instance_path, 'exportaciones')
+        os.makedirs(ruta, exist_ok=True)
+        return ruta
+
+    @classmethod
+    def encolar(cls, tipo, parametros, usuario):
+        if tipo not in GENERADORES:
+            raise ValueError(f"Tipo de exportación no soportado: {tipo}")
+
+        cls.limpiar_expirados()
+        trabajo = TrabajoExportacion(
+            id=uuid.uuid4().hex, usuario_id=usuario.id, tipo=tipo,
+            parametros=parametros, estado=PENDIENTE, progreso=0
+        )
+        db.session.add(trabajo)
+        db.session.commit()
+
+        app = current_app._get_current_object()
+        if current_app.config.get('EXPORT_SINCRONO', current_app.testing):
+            cls._ejecutar(app, trabajo.id)
+            db.session.refresh(trabajo)
+        else:
+            cls._pool().submit(cls._ejecutar, app, trabajo.id)
+        return trabajo
+
+    @staticmethod
+    def obtener(trabajo_id, usuario):
+        """El trabajo solo es visible para quien lo pidió."""
+        trabajo = db.session.get(TrabajoExportacion, trabajo_id)
+        if trabajo is None or trabajo.usuario_id != usuario.id:
+            return None
+        return trabajo
+
+    @staticmethod
+    def recientes(usuario, tipo=None, limite=10):
+        consulta = TrabajoExportacion.query.filter_by(usuario_id=usuario.id)
+        if tipo:
+            consulta = consulta.filter_by(tipo=tipo)
+        return consulta.order_by(TrabajoExportacion.creado_en.desc()).limit(limite).all()
+
+    @staticmethod
+    def archivo_disponible(trabajo):
+        return (
+            trabajo.estado == TERMINADO and trabajo.ruta_archivo
+            and (trabajo.expira_en is None or trabajo.expira_en > datetime.utcnow())
+            and os.path.exists(trabajo.ruta_archivo)
+        )
+
+    @staticmethod
+    def _actualizar(trabajo_id, **valores):
+        with db.engine.begin() as conexion:
+            conexion.execute(
+                update(TrabajoExportacion).where(TrabajoExportacion.id == trabajo_id).values(**valores)
+            )
+
+    @classmethod
+    def _ejecutar(cls, app, trabajo_id):
+        with app.app_context():
+            trabajo = db.session.get(TrabajoExportacion, trabajo_id)
+            if trabajo is None or trabajo.estado != PENDIENTE:
+                return
+            tipo, parametros = trabajo.tipo, dict(trabajo.parametros or {})
+            cls._actualizar(trabajo_id, estado=PROCESANDO, iniciado_en=datetime.utcnow())
+
+            expira = timedelta(hours=app.config.get('EXPORT_EXPIRA_HORAS', 24))
+            try:
+                archivo, nombre_archivo = GENERADORES[tipo](
+                    parametros, lambda porcentaje: cls._actualizar(trabajo_id, progreso=porcentaje)
+                )
+                # Se escribe con otro nombre y se renombra: nunca se sirve un archivo a medias
+                ruta = os.path.join(cls.directorio(), f"{trabajo_id}{os.path.splitext(nombre_archivo)[1]}")
+                try:
+                    with open(ruta + '.parcial', 'wb') as destino:
+                        shutil.copyfileobj(archivo, destino)
+                finally:
+                    archivo.close()
+                os.replace(ruta + '.parcial', ruta)
+
+                ahora = datetime.utcnow()
+                cls._actualizar(
+                    trabajo_id, estado=TERMINADO, progreso=100, nombre_archivo=nombre_archivo,
+                    ruta_archivo=ruta, terminado_en=ahora, expira_en=ahora + expira
+                )
+            except TrabajoSinResultado as e:
+                ahora = datetime.utcnow()
+                cls._actualizar(trabajo_id, estado=ERROR, mensaje=str(e), terminado_en=ahora, expira_en=ahora + expira)
+            except Exception as e:
+                app.logger.error(f"Error en el trabajo de exportación {trabajo_id} ({tipo}): {e}", exc_info=True)
+                ahora = datetime.utcnow()
+                cls._actualizar(
+                    trabajo_id, estado=ERROR, mensaje='Error al generar el archivo.',
+                    terminado_en=ahora, expira_en=ahora + expira
+                )
+
+    @staticmethod
+    def limpiar_expirados():
+        """Borra los trabajos vencidos con su archivo y marca como fallidos los huérfanos."""
+        ahora = datetime.utcnow()
+        vencidos = TrabajoExportacion.query.filter(TrabajoExportacion.expira_en < ahora).all()
+        for trabajo in vencidos:
+            if trabajo.ruta_archivo:
+                try:
+                    os.remove(trabajo.ruta_archivo)
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    current_app.logger.warning(f"No se pudo borrar la exportación {trabajo.ruta_archivo}: {e}")
+            db.session.delete(trabajo)
+
+        TrabajoExportacion.query.filter(
+            TrabajoExportacion.estado.in_((PENDIENTE, PROCESANDO)),
+            TrabajoExportacion.creado_en < ahora - MAX_DURACION_TRABAJO
+        ).update({
+            'estado': ERROR, 'mensaje': 'El trabajo se interrumpió. Vuelve a solicitarlo.',
+            'terminado_en': ahora, 'expira_en': ahora + MAX_DURACION_TRABAJO
+        }, synchronize_session=False)
+        db.session.commit()
@@ -99,4 +99,130 @@ document.addEventListener("DOMContentLoaded", function() {
             closeAllPopups();
         }
     });
-});
\ No newline at end of file
+});
+
+// --- Sincronización incremental de la agenda (calendario mensual) ---
+// Cada INTERVALO_MS pide a /calendario/agenda solo las citas modificadas desde
+// el último cursor y redibuja únicamente los días afectados, en lugar de
+// recargar el mes completo.
+document.addEventListener("DOMContentLoaded", function() {
+    const grid = document.querySelector(".calendar-grid[data-agenda-url]");
+    if (!grid) {
+        return;
+    }
+
+    const INTERVALO_MS = 30000;
+    const citasPorId = new Map();
+    let cursor = grid.dataset.cursor;
+    let etag = null;
+    let sincronizando = false;
+
+    // Estado inicial: las citas que ya vienen en el HTML (data-citas de cada día)
+    grid.querySelectorAll(".dia-citas").forEach(contenedor => {
+        const boton = contenedor.querySelector("[data-citas]");
+        if (!boton) return;
+        try {
+            JSON.parse(boton.getAttribute("data-citas")).forEach(cita => citasPorId.set(cita.id, cita));
+        } catch (e) {
+            console.error("Error JSON:", e);
+        }
+    });
+
+    function crearBotonModal(fecha, citas) {
+        const boton = document.createElement("button");
+        boton.className = "absolute inset-0 w-full h-full cursor-pointer pointer-events-auto";
+        boton.setAttribute("data-bs-toggle", "modal");
+        boton.setAttribute("data-bs-target", "#modalCitas");
+        boton.setAttribute("data-fecha", fecha);
+        boton.setAttribute("data-citas", JSON.stringify(citas));
+        return boton;
+    }
+
+    function crearPildora(texto, clasesExtra, fecha, citas) {
+        const envoltura = document.createElement("div");
+        envoltura.className = "relative w-full";
+        const pildora = document.createElement("div");
+        pildora.className = "event-pill" + (clasesExtra ? " " + clasesExtra : "");
+        pildora.textContent = texto;
+        envoltura.appendChild(pildora);
+        envoltura.appendChild(crearBotonModal(fecha, citas));
+        return envoltura;
+    }
+
+    // Mismo marcado que calendario.html (píldoras si hay 1-2 citas, contador si hay más)
+    function redibujarDia(fecha) {
+        const contenedor = grid.querySelector(`.dia-citas[data-fecha="${fecha}"]`);
+        if (!contenedor) return;  // El día no está en el mes visible
+
+        const citas = Array.from(citasPorId.values())
+            .filter(cita => cita.fecha === fecha)
+            .sort((a, b) => (a.hora < b.hora ? -1 : 1));
+
+        contenedor.innerHTML = "";
+        if (citas.length === 0) return;
+
+        const lista = document.createElement("div");
+        lista.className = "w-full px-1 flex flex-col gap-1 items-center z-20 pointer-events-none";
+        if (citas.length <= 2) {
+            citas.forEach(cita => {
+                const primerNombre = (cita.paciente_nombre_completo || "").split(" ")[0];
+                lista.appendChild(crearPildora(`${cita.hora} ${primerNombre}`, "", fecha, citas));
+            });
+        } else {
+            lista.appendChild(crearPildora(
+                `${citas.length} Citas`,
+                "bg-gray-100 text-gray-600 border-l-4 border-gray-400 text-center font-bold",
+                fecha, citas
+            ));
+        }
+        contenedor.appendChild(lista);
+    }
+
+    async function sincronizar() {
+        if (document.hidden || sincronizando) return;
+        sincronizando = true;
+        try {
+            const url = new URL(grid.dataset.agendaUrl, window.location.origin);
+            url.searchParams.set("updated_since", cursor);
+            const headers = etag ? { "If-None-Match": etag } : {};
+            const respuesta = await fetch(url, { headers: headers, credentials: "same-origin" });
+            // 304: nada cambió en el rango, se conserva el cursor
+            if (respuesta.status === 304 || !respuesta.ok) return;
+
+            etag = respuesta.headers.get("ETag");
+            const datos = await respuesta.json();
+            const diasAfectados = new Set();
+
+            if (!datos.incremental) {
+                // Cursor vencido: llegó la agenda completa y reemplaza a la anterior
+                citasPorId.forEach(cita => diasAfectados.add(cita.fecha));
+                citasPorId.clear();
+            }
+            datos.eliminadas.forEach(id => {
+                const anterior = citasPorId.get(id);
+                if (anterior) {
+                    diasAfectados.add(anterior.fecha);
+                    citasPorId.delete(id);
+                }
+            });
+            datos.citas.forEach(cita => {
+                const anterior = citasPorId.get(cita.id);
+                if (anterior) diasAfectados.add(anterior.fecha);
+                citasPorId.set(cita.id, cita);
+                diasAfectados.add(cita.fecha);
+            });
+
+            diasAfectados.forEach(redibujarDia);
+            cursor = datos.cursor;
+        } catch (e) {
+            console.error("Error sincronizando la agenda:", e);
+        } finally {
+            sincronizando = false;
+        }
+    }
+
+    setInterval(sincronizar, INTERVALO_MS);
+    document.addEventListener("visibilitychange", function() {
+        if (!document.hidden) sincronizar();
+    });
+});
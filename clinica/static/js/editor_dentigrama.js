@@ -1,8 +1,9 @@
 // Archivo: clinica/static/js/editor_dentigrama.js
-// VERSIÓN V20 - SAFETY LOCK & ANTI-CACHÉ AGRESIVO
-// Objetivo: Evitar la pérdida de historial y forzar la visualización actualizada.
+// VERSIÓN V21 - ESTADO ESTRUCTURADO
+// El odontograma se guarda como JSON por diente y cara; la imagen la dibuja el servidor.
+// Los dentigramas antiguos (PNG) se siguen mostrando de fondo.
 
-console.log("--- EDITOR DENTIGRAMA V20 (SAFETY LOCK) CARGADO ---");
+console.log("--- EDITOR DENTIGRAMA V21 (ESTADO JSON) CARGADO ---");
 
 let svgDentigrama;
 let herramientaActual = 'caries';
@@ -30,7 +31,7 @@ document.addEventListener('DOMContentLoaded', function() {
 
         // 1. DETECCIÓN DE FONDO (CRÍTICO)
         // Solo activamos modo "fondo transparente" si hay una URL válida.
-        if (inputUrl && inputUrl.value && inputUrl.value !== "None" && inputUrl.value.trim() !== "" && inputUrl.value.startsWith('http')) {
+        if (inputUrl && inputUrl.value && inputUrl.value !== "None" && inputUrl.value.trim() !== "" && (inputUrl.value.startsWith('http') || inputUrl.value.startsWith('/'))) {
             tieneFondo = true;
             cargarFondoVisual(inputUrl.value);
         } else {
@@ -44,6 +45,8 @@ document.addEventListener('DOMContentLoaded', function() {
         
         // 3. RENDERIZADO INICIAL
         renderizarDentigrama();
+        aplicarEstadoGuardado(leerEstadoGuardado());
+        actualizarEstadoInput();
         setupHerramientas();
         setupGuardadoManual(); // Botón específico del dentigrama
     }
@@ -217,10 +220,14 @@ function handleClickGlobal(e, grupo) {
         e.stopPropagation(); e.preventDefault(); 
         if (herramientaActual === 'borrador') limpiarDiente(grupo); 
         else aplicarEstado(grupo); 
+        actualizarEstadoInput();
         return; 
     } 
     
-    if (e.target.classList.contains('zona')) pintarZona(e.target); 
+    if (e.target.classList.contains('zona')) {
+        pintarZona(e.target);
+        actualizarEstadoInput();
+    }
 }
 
 function aplicarEstado(grupo) { 
@@ -256,19 +263,23 @@ function pintarZona(zona) {
         zona.style.fill = ""; 
         zona.style.opacity = ""; 
     } else { 
-        let colorHex = '#ffffff'; 
-        if(herramientaActual === 'caries') colorHex = '#dc3545'; 
-        if(herramientaActual === 'amalgama') colorHex = '#0d6efd'; 
-        if(herramientaActual === 'resina') colorHex = '#198754'; 
-        
-        zona.style.setProperty('fill', colorHex, 'important'); 
-        zona.style.setProperty('opacity', '1', 'important'); 
-        zona.style.setProperty('fill-opacity', '1', 'important'); 
-        zona.classList.add(`pintado-${herramientaActual}`); 
+        colorearZona(zona, herramientaActual);
     } 
     logAction(`Zona marcada: ${herramientaActual}`); 
 }
 
+function colorearZona(zona, material) {
+    let colorHex = '#ffffff'; 
+    if(material === 'caries') colorHex = '#dc3545'; 
+    if(material === 'amalgama') colorHex = '#0d6efd'; 
+    if(material === 'resina') colorHex = '#198754'; 
+    
+    zona.style.setProperty('fill', colorHex, 'important'); 
+    zona.style.setProperty('opacity', '1', 'important'); 
+    zona.style.setProperty('fill-opacity', '1', 'important'); 
+    zona.classList.add(`pintado-${material}`); 
+}
+
 function limpiarDiente(grupo) { 
     // Ocultar todas las capas estructurales
     grupo.querySelectorAll('.layer-structure').forEach(l => l.setAttribute('display', 'none'));
@@ -293,107 +304,75 @@ function logAction(mensaje) {
 }
 
 
-// === FUNCIÓN DE EXPORTACIÓN V23.4 (SVG AUTO-REPARABLE) ===
-// Si la imagen de fondo falla, convierte los dientes transparentes en visibles
-// forzando bordes oscuros y relleno blanco.
-
-window.svgToPng = function(svgElement) {
-    return new Promise(async (resolve, reject) => {
-        try {
-            const width = 860;
-            const height = 480;
-            const canvas = document.createElement('canvas');
-            canvas.width = width;
-            canvas.height = height;
-            const ctx = canvas.getContext('2d');
-            
-            // 1. PINTAR FONDO BLANCO BASE
-            ctx.fillStyle = '#ffffff';
-            ctx.fillRect(0, 0, width, height);
-
-            let backgroundLoaded = false; // Bandera para saber si cargó el fondo
-
-            // 2. INTENTAR CARGAR FONDO HISTÓRICO (Cloudinary)
-            const inputUrl = document.getElementById('dentigrama_url_input');
-            
-            if (inputUrl && inputUrl.value && inputUrl.value.startsWith('http')) {
-                try {
-                    let secureUrl = inputUrl.value.replace(/^http:\/\//i, 'https://');
-                    const cacheBuster = (secureUrl.indexOf('?') > -1 ? '&' : '?') + 't=' + new Date().getTime();
-                    
-                    const response = await fetch(secureUrl + cacheBuster, { 
-                        mode: 'cors', cache: 'no-store' 
-                    });
-                    
-                    if (response.ok) {
-                        const blob = await response.blob();
-                        const img = await createImageBitmap(blob);
-                        ctx.drawImage(img, 0, 0, width, height);
-                        backgroundLoaded = true; // ¡Éxito! Tenemos fondo real.
-                    } else {
-                        console.warn("⚠️ Imagen de fondo no encontrada (404). Se reconstruirá el dibujo.");
-                    }
-                } catch (err) {
-                    console.warn("⚠️ Error cargando fondo:", err);
-                }
-            }
+// === ESTADO DEL ODONTOGRAMA (JSON) ===
+// El dentigrama se guarda como datos: {"dientes": {"16": {"caras": {"oclusal": "caries"}, "marcas": ["corona"]}}}
+// El servidor dibuja la imagen a partir de este estado (DentigramaService).
 
-            // 3. PROCESAR EL SVG (AQUÍ ESTÁ LA MAGIA)
-            const serializer = new XMLSerializer();
-            let svgString = serializer.serializeToString(svgElement);
-            
-            // CORRECCIÓN CRÍTICA: "REVELADO DIGITAL"
-            // Si NO cargó el fondo (backgroundLoaded === false), los dientes son invisibles.
-            // Los forzamos a ser visibles modificando el texto del SVG.
-            
-            if (!backgroundLoaded) {
-                console.log("🛠️ Reparando visualización: Pintando dientes...");
-                
-                // 1. Cambiar relleno transparente por blanco
-                // Reemplaza todas las ocurrencias de fill="transparent"
-                svgString = svgString.split('fill="transparent"').join('fill="#ffffff"');
-                
-                // 2. Cambiar sin borde por borde gris oscuro
-                // Reemplaza stroke="none" por un color visible
-                svgString = svgString.split('stroke="none"').join('stroke="#333333"');
-                
-                // 3. Asegurar grosor de línea si falta
-                // Si por alguna razón el stroke-width es 0, lo ponemos a 1
-                svgString = svgString.split('stroke-width="0"').join('stroke-width="1"');
-            }
+const MARCAS_POR_CAPA = {
+    'layer-extraccion': 'extraccion',
+    'layer-ausente': 'ausente',
+    'layer-endo': 'endodoncia',
+    'layer-protesis': 'protesis',
+    'layer-corona': 'corona',
+    'layer-check': 'check'
+};
 
-            // Ajuste de tamaño standard
-            if(!svgElement.getAttribute('width')) {
-                svgString = svgString.replace('<svg', `<svg width="${width}" height="${height}"`);
-            }
-            
-            // 4. DIBUJAR EL SVG FINAL AL CANVAS
-            const svgBlob = new Blob([svgString], {type: 'image/svg+xml;charset=utf-8'});
-            const url = URL.createObjectURL(svgBlob);
-            const svgImg = new Image();
-
-            svgImg.onload = function() {
-                ctx.drawImage(svgImg, 0, 0, width, height);
-                const pngData = canvas.toDataURL('image/png');
-                URL.revokeObjectURL(url);
-                resolve(pngData);
-            };
-            
-            svgImg.onerror = (e) => {
-                URL.revokeObjectURL(url);
-                reject(new Error("Error procesando los trazos del dentigrama."));
-            };
-
-            svgImg.src = url;
-
-        } catch (e) {
-            console.error("Error crítico exportando:", e);
-            reject(e); 
-        }
+function serializarEstado() {
+    const dientes = {};
+    svgDentigrama.querySelectorAll('.diente-group').forEach(grupo => {
+        const caras = {};
+        grupo.querySelectorAll('.zona').forEach(zona => {
+            const material = ['caries', 'amalgama', 'resina'].find(m => zona.classList.contains(`pintado-${m}`));
+            if (material) caras[zona.getAttribute('data-cara')] = material;
+        });
+        const marcas = [];
+        Object.entries(MARCAS_POR_CAPA).forEach(([clase, marca]) => {
+            const capa = grupo.querySelector(`.${clase}`);
+            if (capa && capa.getAttribute('display') !== 'none') marcas.push(marca);
+        });
+        const datos = {};
+        if (Object.keys(caras).length) datos.caras = caras;
+        if (marcas.length) datos.marcas = marcas;
+        if (Object.keys(datos).length) dientes[grupo.getAttribute('data-diente')] = datos;
     });
-};
+    return { dientes };
+}
+
+function actualizarEstadoInput() {
+    const inputEstado = document.getElementById('dentigrama_estado_input');
+    if (inputEstado) inputEstado.value = JSON.stringify(serializarEstado());
+}
+
+function aplicarEstadoGuardado(estado) {
+    const dientes = (estado && estado.dientes) || {};
+    Object.entries(dientes).forEach(([numero, datos]) => {
+        const grupo = svgDentigrama.querySelector(`.diente-group[data-diente="${numero}"]`);
+        if (!grupo) return;
+        Object.entries(datos.caras || {}).forEach(([cara, material]) => {
+            const zona = grupo.querySelector(`.zona[data-cara="${cara}"]`);
+            if (zona) colorearZona(zona, material);
+        });
+        (datos.marcas || []).forEach(marca => {
+            const clase = Object.keys(MARCAS_POR_CAPA).find(c => MARCAS_POR_CAPA[c] === marca);
+            const capa = clase && grupo.querySelector(`.${clase}`);
+            if (capa) capa.setAttribute('display', 'block');
+        });
+    });
+}
+
+function leerEstadoGuardado() {
+    const inputEstado = document.getElementById('dentigrama_estado_input');
+    if (!inputEstado || !inputEstado.value) return null;
+    try {
+        return JSON.parse(inputEstado.value);
+    } catch (e) {
+        console.warn("⚠️ Estado del dentigrama ilegible:", e);
+        return null;
+    }
+}
 
 // === GUARDADO MANUAL (BOTÓN PEQUEÑO DEL DENTIGRAMA) ===
+// Envía solo el estado (unos cientos de bytes). Si no cambió, el servidor no escribe nada.
 function setupGuardadoManual() {
     const btnGuardar = document.getElementById('btnGuardarDentigrama');
     if(btnGuardar) {
@@ -401,60 +380,29 @@ function setupGuardadoManual() {
         btnGuardar.parentNode.replaceChild(newBtn, btnGuardar);
 
         newBtn.addEventListener('click', async function() {
+            actualizarEstadoInput();
+
+            const patientId = document.getElementById('patientIdHiddenInput')?.value;
+            if (!patientId || patientId === "None" || patientId.trim() === "") {
+                // Paciente nuevo: el estado viaja con el formulario al registrar
+                alert('Dentigrama preparado. Dale a "Registrar" para finalizar.');
+                return;
+            }
+
             newBtn.disabled = true;
             newBtn.innerHTML = '<i class="fas fa-spinner fa-spin"></i> Procesando...';
 
             try {
-                const base64Img = await window.svgToPng(svgDentigrama);
-
-                const inputUrl = document.getElementById('dentigrama_url_input');
-                if(inputUrl) inputUrl.value = base64Img;
-
-                let patientId = document.getElementById('patientIdHiddenInput')?.value;
-                let idToSend = "";
-
-                if (patientId && patientId !== "None" && patientId.trim() !== "") {
-                    idToSend = patientId;
-                } else if (tempSessionId) {
-                    idToSend = tempSessionId;
-                }
-
-                if (!idToSend && (!patientId || patientId === "None")) {
-                    alert('Dentigrama preparado. Dale a "Registrar" para finalizar.');
-                    newBtn.disabled = false;
-                    newBtn.innerHTML = '💾 Guardar Cambios al Dentigrama';
-                    return;
-                }
-
-                const response = await fetch('/pacientes/upload_dentigrama', {
+                const response = await fetch(`/pacientes/${patientId}/dentigrama`, {
                     method: 'POST',
                     headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify({ image_data: base64Img, patient_id: idToSend }),
+                    body: JSON.stringify({ estado: serializarEstado() }),
                 });
 
                 const data = await response.json();
 
-                if (response.ok && (data.success || data.url)) {
-                    if(data.url) {
-                        inputUrl.value = data.url;
-
-                        // ▼▼▼ SOLUCIÓN DUPLICADOS: Guardar el Public ID ▼▼▼
-                        const publicIdInput = document.getElementById('dentigrama_public_id_input');
-                        if (publicIdInput && data.public_id) {
-                            publicIdInput.value = data.public_id;
-                        }
-
-                        // ▼▼▼ SOLUCIÓN EFECTO FANTASMA ▼▼▼
-                        // 1. Actualizamos el estado: ahora SÍ tiene fondo
-                        tieneFondo = true;
-                        // 2. Re-renderizamos el SVG. Al ser tieneFondo=true,
-                        // se dibujará SIN los textos ni números, evitando el dobleimpreso.
-                        renderizarDentigrama();
-                        // 3. Cargamos la nueva imagen como fondo visual
-                        cargarFondoVisual(data.url);
-                        // ▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲
-                    }
-                    alert('Dentigrama actualizado correctamente.');
+                if (response.ok && data.success) {
+                    alert(data.sin_cambios ? 'El dentigrama no tenía cambios.' : 'Dentigrama actualizado correctamente.');
                 } else {
                     throw new Error(data.error || 'Error desconocido');
                 }
@@ -468,4 +416,4 @@ function setupGuardadoManual() {
             }
         });
     }
-}
\ No newline at end of file
+}
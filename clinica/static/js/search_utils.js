@@ -142,4 +142,121 @@ export async function preloadPatient(patientId, searchInput, hiddenPatientIdInpu
         }
     }
     return null;
-}
\ No newline at end of file
+}
+
+// Selector de pacientes para formularios (editar cita). Pide a /pacientes/selector_ajax
+// páginas de 20 pacientes (id y nombre) en lugar de traer todos en un <select>.
+// Recibe:
+// - searchInput: <input> visible donde se muestra el nombre y se escribe la búsqueda
+// - resultsContainer: <div> donde se listan los resultados
+// - hiddenPatientIdInput: <input type="hidden" name="paciente_id"> con el ID elegido
+// Si el usuario escribe y no elige nada, al salir se restaura el paciente que estaba elegido.
+export function initializePatientPicker(searchInput, resultsContainer, hiddenPatientIdInput) {
+    let searchTimeout;
+    let selectedName = searchInput.value;
+    let currentQuery = null;
+    let nextCursor = null;
+
+    const buildUrl = (query, cursor) => {
+        const params = new URLSearchParams();
+        if (query) params.set('q', query);
+        if (cursor) params.set('cursor', cursor);
+        if (!cursor && hiddenPatientIdInput.value) params.set('seleccionado', hiddenPatientIdInput.value);
+        return `/pacientes/selector_ajax?${params.toString()}`;
+    };
+
+    const selectPatient = (paciente) => {
+        hiddenPatientIdInput.value = paciente.id;
+        searchInput.value = paciente.nombre;
+        selectedName = paciente.nombre;
+        resultsContainer.classList.add('hidden');
+    };
+
+    const renderItem = (paciente) => {
+        const item = document.createElement('div');
+        item.className = 'px-4 py-2 cursor-pointer hover:bg-gray-100 rounded-md text-sm';
+        if (String(paciente.id) === hiddenPatientIdInput.value) {
+            item.classList.add('font-semibold', 'bg-blue-50');
+        }
+        item.textContent = paciente.documento ? `${paciente.nombre} (${paciente.documento})` : paciente.nombre;
+        item.addEventListener('click', () => selectPatient(paciente));
+        return item;
+    };
+
+    const loadPage = async (query, cursor) => {
+        try {
+            const response = await fetch(buildUrl(query, cursor));
+            if (!response.ok) {
+                throw new Error(`Error HTTP: ${response.status}`);
+            }
+            const data = await response.json();
+            // Respuesta de una búsqueda anterior: se descarta
+            if (query !== currentQuery) return;
+
+            if (!cursor) resultsContainer.innerHTML = '';
+            resultsContainer.querySelector('[data-cargar-mas]')?.remove();
+
+            data.resultados.forEach(paciente => resultsContainer.appendChild(renderItem(paciente)));
+            if (!cursor && data.resultados.length === 0) {
+                const vacio = document.createElement('div');
+                vacio.className = 'px-4 py-2 text-sm text-gray-500';
+                vacio.textContent = 'No se encontraron pacientes.';
+                resultsContainer.appendChild(vacio);
+            }
+
+            nextCursor = data.cursor_siguiente;
+            if (nextCursor) {
+                const more = document.createElement('button');
+                more.type = 'button';
+                more.dataset.cargarMas = '1';
+                more.className = 'w-full px-4 py-2 text-sm text-blue-600 hover:bg-gray-100 rounded-md';
+                more.textContent = 'Cargar más';
+                more.addEventListener('click', () => loadPage(currentQuery, nextCursor));
+                resultsContainer.appendChild(more);
+            }
+            resultsContainer.classList.remove('hidden');
+        } catch (error) {
+            console.error('Error al cargar pacientes:', error);
+            resultsContainer.classList.add('hidden');
+        }
+    };
+
+    const search = (query) => {
+        currentQuery = query;
+        nextCursor = null;
+        loadPage(query, null);
+    };
+
+    // Al enfocar se lista desde el principio (por apellidos)
+    searchInput.addEventListener('focus', () => {
+        searchInput.select();
+        search(searchInput.value === selectedName ? '' : searchInput.value.trim());
+    });
+
+    searchInput.addEventListener('input', () => {
+        clearTimeout(searchTimeout);
+        const query = searchInput.value.trim();
+        // Una sola letra no filtra: se sigue mostrando la lista completa
+        searchTimeout = setTimeout(() => search(query.length >= 2 ? query : ''), 300); // Debounce
+    });
+
+    document.addEventListener('click', (e) => {
+        if (!searchInput.contains(e.target) && !resultsContainer.contains(e.target)) {
+            resultsContainer.classList.add('hidden');
+            searchInput.value = selectedName;
+        }
+    });
+
+    // Paciente asignado sin nombre en la página (p. ej. de otro odontólogo): se pide al servidor
+    if (hiddenPatientIdInput.value && !searchInput.value) {
+        fetch(buildUrl('', null))
+            .then(response => response.json())
+            .then(data => {
+                if (data.seleccionado) {
+                    searchInput.value = data.seleccionado.nombre;
+                    selectedName = data.seleccionado.nombre;
+                }
+            })
+            .catch(error => console.error('Error al precargar el paciente:', error));
+    }
+}
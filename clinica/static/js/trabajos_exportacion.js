@@ -0,0 +1,72 @@
+// static/js/trabajos_exportacion.js
+// Exportaciones en segundo plano (ver routes/trabajos.py): el botón encola el
+// trabajo, se consulta su estado cada INTERVALO_MS y al terminar se descarga.
+// Sin JavaScript los enlaces siguen funcionando con la descarga directa.
+(function() {
+    const INTERVALO_MS = 1500;
+
+    function esperar(ms) {
+        return new Promise(resolve => setTimeout(resolve, ms));
+    }
+
+    async function esperarTrabajo(urlEstado) {
+        while (true) {
+            const respuesta = await fetch(urlEstado, { credentials: "same-origin" });
+            if (!respuesta.ok) throw new Error("No se pudo consultar el trabajo.");
+            const trabajo = await respuesta.json();
+            if (trabajo.estado === "TERMINADO" || trabajo.estado === "ERROR") return trabajo;
+            await esperar(INTERVALO_MS);
+        }
+    }
+
+    // --- Botones de exportación (paciente o historias en lote) ---
+    document.addEventListener("click", async function(event) {
+        const boton = event.target.closest("[data-exportar-url]");
+        if (!boton) return;
+        event.preventDefault();
+        if (boton.dataset.generando) return;
+
+        boton.dataset.generando = "1";
+        const contenidoOriginal = boton.innerHTML;
+        boton.textContent = "Generando...";
+        try {
+            const datos = new FormData();
+            if ("pacienteId" in boton.dataset) datos.append("paciente_id", boton.dataset.pacienteId);
+            if ("pacienteIds" in boton.dataset) datos.append("paciente_ids", boton.dataset.pacienteIds);
+            if ("buscar" in boton.dataset) datos.append("buscar", boton.dataset.buscar);
+            const respuesta = await fetch(boton.dataset.exportarUrl, {
+                method: "POST", body: datos, credentials: "same-origin"
+            });
+            const encolado = await respuesta.json();
+            if (!respuesta.ok) throw new Error(encolado.error || "No se pudo iniciar la exportación.");
+
+            const trabajo = await esperarTrabajo(encolado.url_estado);
+            if (trabajo.estado === "ERROR") throw new Error(trabajo.mensaje || "Error al generar el archivo.");
+            window.location.href = trabajo.url_descarga;
+        } catch (e) {
+            alert(e.message);
+        } finally {
+            boton.innerHTML = contenidoOriginal;
+            delete boton.dataset.generando;
+            if (typeof lucide !== "undefined") lucide.createIcons();
+        }
+    });
+
+    // --- Historial de reportes: actualizar los trabajos en curso ---
+    document.addEventListener("DOMContentLoaded", function() {
+        const enCurso = document.querySelectorAll("[data-trabajo-estado-url]");
+        if (enCurso.length === 0) return;
+
+        Promise.all(Array.from(enCurso).map(async fila => {
+            const progreso = fila.querySelector("[data-trabajo-progreso]");
+            while (true) {
+                const respuesta = await fetch(fila.dataset.trabajoEstadoUrl, { credentials: "same-origin" });
+                if (!respuesta.ok) return;
+                const trabajo = await respuesta.json();
+                if (trabajo.estado === "TERMINADO" || trabajo.estado === "ERROR") return;
+                if (progreso) progreso.textContent = `Generando... ${trabajo.progreso}%`;
+                await esperar(INTERVALO_MS);
+            }
+        })).then(() => window.location.reload()).catch(e => console.error("Error consultando trabajos:", e));
+    });
+})();
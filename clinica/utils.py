@@ -1,20 +1,19 @@
 # clinica/utils.py
 
 import os
-import calendar
-import locale
+import hashlib
+import unicodedata
 from datetime import date, datetime, time
 from sqlalchemy import func, case, or_, and_
 from sqlalchemy.orm import joinedload
 from .extensions import db
 from .models import Paciente, Cita
-from flask import current_app
+from flask import current_app, jsonify, request
 from flask_login import current_user
 
 import logging
 logger = logging.getLogger(__name__)
 
-nombres_meses = [calendar.month_name[i] for i in range(1, 13)]
 
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'pdf'}
 
@@ -34,6 +33,28 @@ def eliminar_imagen(ruta_imagen_relativa):
     except Exception as e:
         current_app.logger.error(f"Error crítico al eliminar imagen {ruta_imagen_relativa}: {e}", exc_info=True)
 
+def normalizar_texto(texto):
+    """
+    Devuelve el texto en minúsculas y sin tildes ni diacríticos, con los
+    espacios colapsados. Es la forma canónica usada por la búsqueda de pacientes
+    y los índices de catálogos ("José  Peña" -> "jose pena").
+    """
+    if not texto:
+        return ''
+    descompuesto = unicodedata.normalize('NFKD', str(texto))
+    sin_tildes = ''.join(c for c in descompuesto if not unicodedata.combining(c))
+    return ' '.join(sin_tildes.lower().split())
+
+def respuesta_json_cacheable(datos, etag_base, max_age=300):
+    """
+    Respuesta JSON con ETag y Cache-Control privado. Si el navegador envía
+    If-None-Match con el mismo ETag se responde 304 sin cuerpo.
+    """
+    respuesta = jsonify(datos)
+    respuesta.set_etag(hashlib.md5(f"{etag_base}|{request.full_path}".encode()).hexdigest())
+    respuesta.headers['Cache-Control'] = f'private, max-age={max_age}'
+    return respuesta.make_conditional(request)
+
 def convertir_a_fecha(valor_str):
     if not valor_str or not isinstance(valor_str, str):
         return None
@@ -42,109 +63,105 @@ def convertir_a_fecha(valor_str):
     except (ValueError, TypeError):
         return None
 
-# --- FUNCIÓN get_index_panel_data (¡CORREGIDA PARA NO DEVOLVER FECHAS FORMATADAS!) ---
-def get_index_panel_data(today_date: date, current_time: time):
-    """Función para obtener los datos necesarios para el panel de inicio."""
-    datos_panel = {}
-
-    # Las variables 'fecha_actual_formateada' y 'fecha_actual_corta'
-    # ya no se gestionan ni se devuelven desde aquí.
-    # Ahora se formatean y se pasan directamente desde main.py al template.
-
-
-    # --- CONSULTA BASE PARA CITAS DEL DASHBOARD ---
-    base_query_citas = Cita.query.outerjoin(Paciente, Cita.paciente_id == Paciente.id).filter(
+# --- FECHAS EN ESPAÑOL (tablas fijas, sin locale.setlocale) ---
+# locale.setlocale cambia el estado global del proceso: no es seguro con
+# varios hilos por worker y depende de que el locale esté instalado.
+DIAS_SEMANA_ES = ['lunes', 'martes', 'miércoles', 'jueves', 'viernes', 'sábado', 'domingo']
+DIAS_SEMANA_ABREV_ES = ['lun', 'mar', 'mié', 'jue', 'vie', 'sáb', 'dom']
+MESES_ES = ['enero', 'febrero', 'marzo', 'abril', 'mayo', 'junio', 'julio',
+            'agosto', 'septiembre', 'octubre', 'noviembre', 'diciembre']
+MESES_ABREV_ES = ['ene', 'feb', 'mar', 'abr', 'may', 'jun', 'jul', 'ago', 'sep', 'oct', 'nov', 'dic']
+
+
+def strftime_es(valor, formato):
+    """strftime con nombres de días y meses en español (%A, %a, %B, %b)."""
+    formato = (formato
+               .replace('%A', DIAS_SEMANA_ES[valor.weekday()])
+               .replace('%a', DIAS_SEMANA_ABREV_ES[valor.weekday()])
+               .replace('%B', MESES_ES[valor.month - 1])
+               .replace('%b', MESES_ABREV_ES[valor.month - 1]))
+    return valor.strftime(formato)
+
+
+# --- DATOS DEL PANEL DE INICIO ---
+def _nombre_paciente_cita(fila):
+    if fila.paciente_id and fila.nombres is not None and not fila.is_deleted:
+        return f"{fila.nombres} {fila.apellidos}"
+    if fila.paciente_nombres_str and fila.paciente_apellidos_str:
+        return f"{fila.paciente_nombres_str} {fila.paciente_apellidos_str}"
+    if fila.paciente_nombres_str:
+        return fila.paciente_nombres_str
+    return "Paciente sin registrar"
+
+
+def consultar_citas_panel(today_date: date, usuario):
+    """
+    Consulta las citas que necesita el panel de inicio: las de hoy (de donde
+    salen el contador, la lista y la próxima cita si queda alguna hoy) y la
+    primera de los días siguientes. No depende de la hora actual, así que el
+    resultado se puede guardar en caché durante el día (ver PanelService).
+    """
+    base_query_citas = db.session.query(
+        Cita.id, Cita.fecha, Cita.hora, Cita.motivo, Cita.doctor, Cita.estado,
+        Cita.paciente_id, Cita.paciente_nombres_str, Cita.paciente_apellidos_str,
+        Paciente.nombres, Paciente.apellidos, Paciente.is_deleted
+    ).select_from(Cita).outerjoin(Paciente, Cita.paciente_id == Paciente.id).filter(
         Cita.is_deleted == False
     )
 
-    if hasattr(current_user, 'is_admin') and not current_user.is_admin:
-        base_query_citas = base_query_citas.filter(
-            or_(
-                Paciente.odontologo_id == current_user.id,
-                Cita.paciente_id == None
-            )
-        )
-
-    # 2. Estadísticas: Citas de hoy
-    citas_hoy_count = base_query_citas.filter(Cita.fecha == today_date).count()
-    datos_panel['estadisticas'] = {'citas_hoy': citas_hoy_count or 0}
-
-    # 3. Próxima cita
-    proxima_cita_obj = base_query_citas.filter(
-        or_(
-            Cita.fecha > today_date,
-            and_(Cita.fecha == today_date, Cita.hora >= current_time)
-        )
-    ).options(joinedload(Cita.paciente))\
-     .order_by(Cita.fecha, Cita.hora)\
-     .first()
-
-    proxima_cita_data = None
-    if proxima_cita_obj:
-        # Guardamos el locale original antes de cambiarlo
-        locale_original_time = locale.getlocale(locale.LC_TIME)
-        try:
-            locale.setlocale(locale.LC_TIME, 'es_ES.UTF-8')
-            fecha_cita_str_buffer = proxima_cita_obj.fecha.strftime("%d %b, %Y")
-        except locale.Error:
-            logger.warning("Locale 'es_ES.UTF-8' no disponible. Usando locale por defecto.")
-            locale.setlocale(locale.LC_TIME, '')
-            fecha_cita_str_buffer = proxima_cita_obj.fecha.strftime("%d %b, %Y")
-        finally:
-            # Restaurar el locale original
-            if locale_original_time != (None, None):
-                try:
-                    locale.setlocale(locale.LC_TIME, locale_original_time)
-                except locale.Error:
-                    logger.warning(f"Advertencia: No se pudo restaurar el locale original {locale_original_time} para LC_TIME.")
-
-        hora_cita_str = proxima_cita_obj.hora.strftime("%I:%M %p")
-
-        paciente_nombre_proxima_cita = "Paciente sin registrar"
-        if proxima_cita_obj.paciente and not proxima_cita_obj.paciente.is_deleted:
-            paciente_nombre_proxima_cita = f"{proxima_cita_obj.paciente.nombres} {proxima_cita_obj.paciente.apellidos}"
-        elif proxima_cita_obj.paciente_nombres_str and proxima_cita_obj.paciente_apellidos_str:
-            paciente_nombre_proxima_cita = f"{proxima_cita_obj.paciente_nombres_str} {proxima_cita_obj.paciente_apellidos_str}"
-        elif proxima_cita_obj.paciente_nombres_str:
-            paciente_nombre_proxima_cita = proxima_cita_obj.paciente_nombres_str
-
-        proxima_cita_data = {
-            'fecha_formateada': f"{fecha_cita_str_buffer} a las {hora_cita_str}",
-            'paciente_nombre': paciente_nombre_proxima_cita,
-            'motivo': proxima_cita_obj.motivo or "No especificado"
+    if hasattr(usuario, 'is_admin') and not usuario.is_admin:
+        base_query_citas = base_query_citas.filter(Cita.odontologo_id == usuario.id)
+
+    def a_dict(fila):
+        return {
+            'id': fila.id,
+            'fecha': fila.fecha,
+            'hora': fila.hora,
+            'paciente_nombre_completo': _nombre_paciente_cita(fila),
+            'motivo': fila.motivo,
+            'doctor': fila.doctor,
+            'estado': fila.estado,
         }
-    datos_panel['proxima_cita'] = proxima_cita_data
-
-
-    # 5. Lista de citas de hoy
-    citas_de_hoy_lista_query = base_query_citas.filter(Cita.fecha == today_date)
-    citas_de_hoy_lista = citas_de_hoy_lista_query.options(joinedload(Cita.paciente))\
-                                                .order_by(Cita.hora)\
-                                                .all()
-
-    citas_hoy_procesadas = []
-    for cita_item in citas_de_hoy_lista:
-        paciente_nombre_completo = "Paciente sin registrar"
-        if cita_item.paciente and not cita_item.paciente.is_deleted:
-            paciente_nombre_completo = f"{cita_item.paciente.nombres} {cita_item.paciente.apellidos}"
-        elif cita_item.paciente_nombres_str and cita_item.paciente_apellidos_str:
-            paciente_nombre_completo = f"{cita_item.paciente_nombres_str} {cita_item.paciente_apellidos_str}"
-        elif cita_item.paciente_nombres_str:
-            paciente_nombre_completo = cita_item.paciente_nombres_str
-
-        citas_hoy_procesadas.append({
-            'id': cita_item.id,
-            'hora_formateada': cita_item.hora.strftime("%I:%M %p"),
-            'paciente_nombre_completo': paciente_nombre_completo,
-            'motivo': cita_item.motivo,
-            'doctor': cita_item.doctor,
-            'estado': cita_item.estado,
-        })
-    datos_panel['citas_del_dia'] = citas_hoy_procesadas
 
+    citas_hoy = [a_dict(f) for f in base_query_citas.filter(Cita.fecha == today_date).order_by(Cita.hora)]
+    siguiente = base_query_citas.filter(Cita.fecha > today_date).order_by(Cita.fecha, Cita.hora).first()
+    return {
+        'citas_hoy': citas_hoy,
+        'siguiente_futura': a_dict(siguiente) if siguiente else None,
+    }
+
+
+def armar_datos_panel(citas_panel, current_time: time):
+    """Arma el diccionario del panel a partir de consultar_citas_panel y la hora actual."""
+    citas_hoy = citas_panel['citas_hoy']
+    datos_panel = {'estadisticas': {'citas_hoy': len(citas_hoy)}}
+
+    # Próxima cita: la primera de hoy que no haya pasado o, si no hay, la siguiente futura
+    proxima = next((c for c in citas_hoy if c['hora'] >= current_time), None) or citas_panel['siguiente_futura']
+    datos_panel['proxima_cita'] = None
+    if proxima:
+        datos_panel['proxima_cita'] = {
+            'fecha_formateada': f"{strftime_es(proxima['fecha'], '%d %b, %Y')} a las {proxima['hora'].strftime('%I:%M %p')}",
+            'paciente_nombre': proxima['paciente_nombre_completo'],
+            'motivo': proxima['motivo'] or "No especificado"
+        }
+
+    datos_panel['citas_del_dia'] = [{
+        'id': c['id'],
+        'hora_formateada': c['hora'].strftime("%I:%M %p"),
+        'paciente_nombre_completo': c['paciente_nombre_completo'],
+        'motivo': c['motivo'],
+        'doctor': c['doctor'],
+        'estado': c['estado'],
+    } for c in citas_hoy]
     return datos_panel
 
 
+def get_index_panel_data(today_date: date, current_time: time):
+    """Datos del panel de inicio sin caché (la versión cacheada está en PanelService)."""
+    return armar_datos_panel(consultar_citas_panel(today_date, current_user), current_time)
+
+
 # --- VERSIÓN MEJORADA DE extract_public_id_from_url (se mantiene igual) ---
 def extract_public_id_from_url(url):
     """
@@ -200,32 +217,17 @@ def extract_public_id_from_url(url):
 
 # Función auxiliar para borrar archivos de Cloudinary
 def delete_from_cloudinary(url):
-    """Borra un recurso de Cloudinary dada su URL."""
+    """
+    Registra el borrado de un recurso de Cloudinary dada su URL. El borrado
+    real ocurre tras el commit de la sesión, por lotes (ver BorradoService).
+    """
+    # Importación diferida: services.borrados_service importa este módulo
+    from .services.borrados_service import BorradoService
+    if BorradoService.encolar_urls([url]):
+        return True
     if url:
-        public_id = extract_public_id_from_url(url)
-        current_app.logger.debug(f"CLOUDINARY_DELETE_DEBUG: Intentando borrar URL: {url}, Public ID extraído: {public_id}") # <-- NUEVO LOG
-        if public_id:
-            try:
-                result = cloudinary.uploader.destroy(public_id) # Captura el resultado de la destrucción
-                current_app.logger.debug(f"CLOUDINARY_DELETE_DEBUG: Resultado de Cloudinary.destroy para {public_id}: {result}") # <-- NUEVO LOG
-
-                # Cloudinary devuelve un diccionario, y "result":"ok" es el éxito.
-                if result and result.get("result") == "ok":
-                    current_app.logger.info(f"CLOUDINARY: Recurso {public_id} eliminado exitosamente.")
-                    return True
-                else:
-                    # Si no es "ok", es un fallo o un error diferente.
-                    error_message = result.get("error", {}).get("message", "Mensaje de error no disponible") if result and "error" in result else "Error desconocido"
-                    current_app.logger.warning(f"CLOUDINARY: Fallo al eliminar recurso {public_id} de Cloudinary. Resultado: {result}. Error: {error_message}") # <-- MEJOR LOG
-                    return False
-            except Exception as e:
-                current_app.logger.error(f"CLOUDINARY_DELETE_ERROR: Excepción al intentar eliminar recurso {public_id} de Cloudinary: {e}", exc_info=True) # <-- LOG MÁS ESPECÍFICO
-                return False
-        else:
-            current_app.logger.warning(f"CLOUDINARY_DELETE_WARNING: No se pudo extraer public_id de la URL: {url}. No se intentó eliminar.") # <-- NUEVO LOG
-            return False # No hay public_id para borrar
-    current_app.logger.debug("CLOUDINARY_DELETE_DEBUG: URL de imagen vacía o None, no hay nada que borrar.") # <-- NUEVO LOG
-    return False # La URL estaba vacía
+        current_app.logger.warning(f"CLOUDINARY_DELETE_WARNING: No se pudo extraer public_id de la URL: {url}. No se intentó eliminar.")
+    return False
 
 
 # =========================================================================
@@ -3,6 +3,6 @@
 echo "Ejecutando migraciones de base de datos..."
 flask db upgrade
 
-# Iniciar la aplicación
+# Iniciar la aplicación (workers, hilos y puerto en gunicorn.conf.py)
 echo "Iniciando Gunicorn..."
-exec gunicorn --bind :$PORT --workers 1 --threads 8 --timeout 0 run:app
\ No newline at end of file
+exec gunicorn -c gunicorn.conf.py run:app
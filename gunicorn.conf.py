@@ -0,0 +1,39 @@
+# gunicorn.conf.py
+"""
+Configuración de gunicorn compartida por entrypoint.sh, el Procfile y el
+Dockerfile (gunicorn -c gunicorn.conf.py run:app).
+
+WEB_CONCURRENCY procesos x GUNICORN_THREADS hilos. create_app lee las mismas
+variables para dimensionar el pool de conexiones (ver clinica/conexiones.py),
+así que subir los hilos agranda el pool en la misma medida; DB_MAX_CONEXIONES
+pone el tope total.
+"""
+
+import os
+
+bind = f":{os.environ.get('PORT', '8080')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+# Las exportaciones largas corren en trabajos de fondo, pero se conserva el
+# comportamiento anterior (sin timeout) salvo que se configure
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 0))
+
+# Sin preload_app: cada worker crea su app y su motor después del fork, así
+# no se heredan conexiones abiertas por el proceso maestro.
+preload_app = False
+
+# Los workers leen estos valores al crear el pool
+os.environ['WEB_CONCURRENCY'] = str(workers)
+os.environ['GUNICORN_THREADS'] = str(threads)
+
+
+def post_worker_init(worker):
+    """Abre unas conexiones antes de aceptar peticiones (DB_PRECALENTAR)."""
+    from clinica.conexiones import precalentar_pool
+    precalentar_pool(worker.wsgi)
+
+
+def worker_exit(server, worker):
+    """Escribe los registros de auditoría que sigan en cola antes de salir."""
+    from clinica.services.auditoria_service import AuditoriaService
+    AuditoriaService.vaciar()
@@ -1,11 +1,12 @@
 """
 Script para importar códigos CIE-10 de odontología a la base de datos
 Ejecutar desde la raíz del proyecto: python importar_cie10.py
+
+Equivale a: python manage.py importar-catalogo cie10
 """
 
 from clinica import create_app
-from clinica.extensions import db
-from clinica.models import CIE10
+from clinica.services.importacion_catalogos import ImportacionCatalogos
 
 # Códigos CIE-10 más comunes en odontología (K00-K14)
 CODIGOS_CIE10 = [
@@ -167,7 +168,7 @@ CODIGOS_CIE10 = [
     ("S032", "Luxación del diente", "Traumatismo"),
 ]
 
-def importar_cie10():
+def importar_cie10(reemplazar=False):
     """Importa códigos CIE-10 odontológicos a la base de datos"""
     app = create_app()
     
@@ -178,73 +179,15 @@ def importar_cie10():
         print()
         
         try:
-            # Preguntar si eliminar existentes
-            respuesta = input("⚠️  ¿Deseas eliminar los códigos CIE-10 existentes antes de importar? (s/n): ")
-            if respuesta.lower() == 's':
-                CIE10.query.delete()
-                db.session.commit()
-                print("🗑️  Códigos existentes eliminados")
-                print()
-            
-            # Importar códigos
-            print(f"⏳ Importando {len(CODIGOS_CIE10)} códigos CIE-10...")
-            total_importados = 0
-            errores = 0
-            
-            for codigo, descripcion, categoria in CODIGOS_CIE10:
-                try:
-                    # Verificar si existe
-                    existe = CIE10.query.filter_by(codigo=codigo).first()
-                    
-                    if existe:
-                        # Actualizar
-                        existe.descripcion = descripcion
-                        existe.categoria = categoria
-                    else:
-                        # Crear nuevo
-                        nuevo_cie10 = CIE10(
-                            codigo=codigo,
-                            descripcion=descripcion,
-                            categoria=categoria
-                        )
-                        db.session.add(nuevo_cie10)
-                    
-                    total_importados += 1
-                    
-                    # Commit cada 50
-                    if total_importados % 50 == 0:
-                        db.session.commit()
-                        print(f"  ✅ Importados {total_importados} códigos...")
-                
-                except Exception as e:
-                    errores += 1
-                    print(f"  ⚠️  Error con código {codigo}: {e}")
-                    continue
+            fuente = ImportacionCatalogos.desde_tuplas('cie10', CODIGOS_CIE10)
+            resumen = ImportacionCatalogos.importar('cie10', fuente, reemplazar=reemplazar)
             
-            # Commit final
-            db.session.commit()
-            
-            print()
             print("=" * 60)
             print("✅ IMPORTACIÓN COMPLETADA")
             print("=" * 60)
-            print(f"📊 Total importados: {total_importados}")
-            print(f"⚠️  Errores: {errores}")
-            print()
-            
-            # Verificar
-            total_en_bd = CIE10.query.count()
-            print(f"🔍 Total de códigos CIE-10 en la base de datos: {total_en_bd}")
-            print()
-            
-            # Mostrar por categorías
-            print("📋 Códigos por categoría:")
-            categorias = db.session.query(CIE10.categoria, db.func.count(CIE10.id)).group_by(CIE10.categoria).all()
-            for cat, count in categorias:
-                print(f"   {cat}: {count} códigos")
+            print(ImportacionCatalogos.formatear_resumen(resumen))
             
         except Exception as e:
-            db.session.rollback()
             print()
             print("=" * 60)
             print("❌ ERROR EN LA IMPORTACIÓN")
@@ -253,4 +196,5 @@ def importar_cie10():
             raise
 
 if __name__ == "__main__":
-    importar_cie10()
\ No newline at end of file
+    respuesta = input("⚠️  ¿Deseas eliminar los códigos CIE-10 que no estén en este script? (s/n): ")
+    importar_cie10(reemplazar=respuesta.lower() == 's')
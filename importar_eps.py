@@ -1,11 +1,12 @@
 """
 Script para importar códigos de EPS a la base de datos
 Ejecutar desde la raíz del proyecto: python importar_eps.py
+
+Equivale a: python manage.py importar-catalogo eps
 """
 
 from clinica import create_app
-from clinica.extensions import db
-from clinica.models import EPS
+from clinica.services.importacion_catalogos import ImportacionCatalogos
 
 # Códigos oficiales de EPS en Colombia (actualizados 2024)
 CODIGOS_EPS = [
@@ -76,7 +77,7 @@ CODIGOS_EPS = [
     ("EPS034", "Medimás EPS S.A.S.", True),
 ]
 
-def importar_eps():
+def importar_eps(reemplazar=False):
     """Importa códigos de EPS a la base de datos"""
     app = create_app()
     
@@ -87,78 +88,15 @@ def importar_eps():
         print()
         
         try:
-            # Preguntar si eliminar existentes
-            respuesta = input("⚠️  ¿Deseas eliminar los códigos de EPS existentes antes de importar? (s/n): ")
-            if respuesta.lower() == 's':
-                EPS.query.delete()
-                db.session.commit()
-                print("🗑️  Códigos existentes eliminados")
-                print()
-            
-            # Importar códigos
-            print(f"⏳ Importando {len(CODIGOS_EPS)} códigos de EPS...")
-            total_importados = 0
-            errores = 0
-            
-            for codigo, nombre, activa in CODIGOS_EPS:
-                try:
-                    # Verificar si existe
-                    existe = EPS.query.filter_by(codigo=codigo).first()
-                    
-                    if existe:
-                        # Actualizar
-                        existe.nombre = nombre
-                        existe.activa = activa
-                    else:
-                        # Crear nuevo
-                        nuevo_eps = EPS(
-                            codigo=codigo,
-                            nombre=nombre,
-                            activa=activa
-                        )
-                        db.session.add(nuevo_eps)
-                    
-                    total_importados += 1
-                    
-                    # Commit cada 20
-                    if total_importados % 20 == 0:
-                        db.session.commit()
-                        print(f"  ✅ Importadas {total_importados} EPS...")
-                
-                except Exception as e:
-                    errores += 1
-                    print(f"  ⚠️  Error con código {codigo}: {e}")
-                    continue
+            fuente = ImportacionCatalogos.desde_tuplas('eps', CODIGOS_EPS)
+            resumen = ImportacionCatalogos.importar('eps', fuente, reemplazar=reemplazar)
             
-            # Commit final
-            db.session.commit()
-            
-            print()
             print("=" * 60)
             print("✅ IMPORTACIÓN COMPLETADA")
             print("=" * 60)
-            print(f"📊 Total importadas: {total_importados}")
-            print(f"⚠️  Errores: {errores}")
-            print()
-            
-            # Verificar
-            total_en_bd = EPS.query.count()
-            print(f"🔍 Total de EPS en la base de datos: {total_en_bd}")
-            print()
-            
-            # Mostrar estadísticas
-            activas = EPS.query.filter_by(activa=True).count()
-            inactivas = EPS.query.filter_by(activa=False).count()
-            
-            print("📋 Estadísticas:")
-            print(f"   EPS Activas: {activas}")
-            print(f"   EPS Inactivas/En liquidación: {inactivas}")
-            print()
-            
-            print("💡 Nota: Las EPS inactivas se mantienen para registros históricos")
+            print(ImportacionCatalogos.formatear_resumen(resumen))
             
         except Exception as e:
-            db.session.rollback()
             print()
             print("=" * 60)
             print("❌ ERROR EN LA IMPORTACIÓN")
@@ -167,4 +105,5 @@ def importar_eps():
             raise
 
 if __name__ == "__main__":
-    importar_eps()
\ No newline at end of file
+    respuesta = input("⚠️  ¿Deseas eliminar las EPS que no estén en este script? (s/n): ")
+    importar_eps(reemplazar=respuesta.lower() == 's')
@@ -1,11 +1,12 @@
 """
 Script para importar municipios principales de Colombia (códigos DIVIPOLA)
 Ejecutar desde la raíz del proyecto: python importar_municipios.py
+
+Equivale a: python manage.py importar-catalogo municipios
 """
 
 from clinica import create_app
-from clinica.extensions import db
-from clinica.models import Municipio
+from clinica.services.importacion_catalogos import ImportacionCatalogos
 
 # Municipios principales de Colombia con códigos DIVIPOLA
 # Formato: (codigo_municipio, nombre_municipio, codigo_departamento, nombre_departamento)
@@ -175,7 +176,7 @@ MUNICIPIOS = [
     ("99001", "Puerto Carreño", "99", "Vichada"),
 ]
 
-def importar_municipios():
+def importar_municipios(reemplazar=False):
     """Importa municipios principales de Colombia a la base de datos"""
     app = create_app()
     
@@ -186,79 +187,15 @@ def importar_municipios():
         print()
         
         try:
-            # Preguntar si eliminar existentes
-            respuesta = input("⚠️  ¿Deseas eliminar los municipios existentes antes de importar? (s/n): ")
-            if respuesta.lower() == 's':
-                Municipio.query.delete()
-                db.session.commit()
-                print("🗑️  Municipios existentes eliminados")
-                print()
-            
-            # Importar municipios
-            print(f"⏳ Importando {len(MUNICIPIOS)} municipios principales...")
-            total_importados = 0
-            errores = 0
-            
-            for codigo, nombre, codigo_depto, nombre_depto in MUNICIPIOS:
-                try:
-                    # Verificar si existe
-                    existe = Municipio.query.filter_by(codigo=codigo).first()
-                    
-                    if existe:
-                        # Actualizar
-                        existe.nombre = nombre
-                        existe.codigo_departamento = codigo_depto
-                        existe.nombre_departamento = nombre_depto
-                    else:
-                        # Crear nuevo
-                        nuevo_municipio = Municipio(
-                            codigo=codigo,
-                            nombre=nombre,
-                            codigo_departamento=codigo_depto,
-                            nombre_departamento=nombre_depto
-                        )
-                        db.session.add(nuevo_municipio)
-                    
-                    total_importados += 1
-                    
-                    # Commit cada 30
-                    if total_importados % 30 == 0:
-                        db.session.commit()
-                        print(f"  ✅ Importados {total_importados} municipios...")
-                
-                except Exception as e:
-                    errores += 1
-                    print(f"  ⚠️  Error con código {codigo}: {e}")
-                    continue
+            fuente = ImportacionCatalogos.desde_tuplas('municipios', MUNICIPIOS)
+            resumen = ImportacionCatalogos.importar('municipios', fuente, reemplazar=reemplazar)
             
-            # Commit final
-            db.session.commit()
-            
-            print()
             print("=" * 60)
             print("✅ IMPORTACIÓN COMPLETADA")
             print("=" * 60)
-            print(f"📊 Total importados: {total_importados}")
-            print(f"⚠️  Errores: {errores}")
-            print()
-            
-            # Verificar
-            total_en_bd = Municipio.query.count()
-            print(f"🔍 Total de municipios en la base de datos: {total_en_bd}")
-            print()
-            
-            # Mostrar por departamento
-            print("📋 Municipios por departamento:")
-            departamentos = db.session.query(
-                Municipio.nombre_departamento, 
-                db.func.count(Municipio.id)
-            ).group_by(Municipio.nombre_departamento).order_by(Municipio.nombre_departamento).all()
-            
-            for depto, count in departamentos:
-                print(f"   {depto}: {count} municipios")
+            print(ImportacionCatalogos.formatear_resumen(resumen))
             
         except Exception as e:
-            db.session.rollback()
             print()
             print("=" * 60)
             print("❌ ERROR EN LA IMPORTACIÓN")
@@ -267,4 +204,5 @@ def importar_municipios():
             raise
 
 if __name__ == "__main__":
-    importar_municipios()
\ No newline at end of file
+    respuesta = input("⚠️  ¿Deseas eliminar los municipios que no estén en este script? (s/n): ")
+    importar_municipios(reemplazar=respuesta.lower() == 's')
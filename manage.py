@@ -37,7 +37,65 @@ def crear_usuario(username, email, password, admin):
     db.session.commit()
     print(f"¡Usuario '{username}' creado exitosamente!")
 
+@click.command("borrados")
+@with_appcontext
+@click.option("--drenar", is_flag=True, help="Procesar ahora los borrados vencidos.")
+def borrados(drenar):
+    """Muestra (y opcionalmente drena) la cola de borrados pendientes en Cloudinary."""
+    from clinica.services.borrados_service import BorradoService
+    if drenar:
+        BorradoService.drenar(app)
+    metricas = BorradoService.metricas()
+    print(f"Pendientes: {metricas['pendientes']} (con error: {metricas['con_error']}, "
+          f"máx. intentos: {metricas['max_intentos']})")
+    if metricas['mas_antiguo']:
+        print(f"Más antiguo: {metricas['mas_antiguo']:%Y-%m-%d %H:%M} UTC")
+
+@click.command("importar-catalogo")
+@with_appcontext
+@click.argument("catalogo", type=click.Choice(["cups", "cie10", "eps", "municipios"]))
+@click.option("--archivo", type=click.Path(exists=True, dir_okay=False),
+              help="Excel de origen (obligatorio para cups).")
+@click.option("--reemplazar", is_flag=True, help="Eliminar los códigos que no estén en la fuente.")
+def importar_catalogo(catalogo, archivo, reemplazar):
+    """Importa un catálogo de referencia en bloque (sin preguntas)."""
+    import time
+    from clinica.services.importacion_catalogos import ImportacionCatalogos
+
+    inicio = time.perf_counter()
+    if catalogo == "cups":
+        if not archivo:
+            raise click.UsageError("El catálogo cups requiere --archivo con el Excel de CUPS.")
+        fuente = ImportacionCatalogos.leer_cups_excel(archivo)
+    else:
+        # Los demás catálogos viven como listas en los scripts importar_*.py
+        from importar_cie10 import CODIGOS_CIE10
+        from importar_eps import CODIGOS_EPS
+        from importar_municipios import MUNICIPIOS
+        filas = {"cie10": CODIGOS_CIE10, "eps": CODIGOS_EPS, "municipios": MUNICIPIOS}[catalogo]
+        fuente = ImportacionCatalogos.desde_tuplas(catalogo, filas)
+    print(f"Fuente leída en {time.perf_counter() - inicio:.2f}s ({len(fuente)} filas)")
+
+    resumen = ImportacionCatalogos.importar(catalogo, fuente, reemplazar=reemplazar)
+    print(ImportacionCatalogos.formatear_resumen(resumen))
+
+@click.command("reconstruir-ingresos")
+@with_appcontext
+@click.option("--odontologo", type=int, help="Solo los agregados de este odontólogo (ID).")
+def reconstruir_ingresos(odontologo):
+    """Recalcula los agregados de ingresos desde las facturas (backfill)."""
+    import time
+    from clinica.services.ingresos_service import IngresosService
+
+    inicio = time.perf_counter()
+    resumen = IngresosService.reconstruir(odontologo)
+    print(f"Ingresos reconstruidos en {time.perf_counter() - inicio:.2f}s: "
+          f"{resumen['dias']} días, {resumen['procedimientos']} filas por procedimiento y mes")
+
 cli.add_command(crear_usuario)
+cli.add_command(borrados)
+cli.add_command(importar_catalogo)
+cli.add_command(reconstruir_ingresos)
 
 if __name__ == "__main__":
     cli()
\ No newline at end of file
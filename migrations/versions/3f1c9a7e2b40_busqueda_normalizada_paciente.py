@@ -0,0 +1,88 @@
+"""busqueda normalizada de pacientes con indice trigram
+
+Revision ID: 3f1c9a7e2b40
+Revises: afc78509f6bc
+Create Date: 2026-10-17 09:12:41.503217
+
+"""
+import unicodedata
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c9a7e2b40'
+down_revision = 'afc78509f6bc'
+branch_labels = None
+depends_on = None
+
+
+def _normalizar(texto):
+    # Copia de clinica.utils.normalizar_texto (las migraciones no importan la app)
+    descompuesto = unicodedata.normalize('NFKD', texto or '')
+    sin_tildes = ''.join(c for c in descompuesto if not unicodedata.combining(c))
+    return ' '.join(sin_tildes.lower().split())[:300]
+
+
+def upgrade():
+    bind = op.get_bind()
+    es_postgresql = bind.dialect.name == 'postgresql'
+
+    with op.batch_alter_table('paciente', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('busqueda_normalizada', sa.String(length=300), nullable=True))
+
+    # Backfill por lotes
+    paciente = sa.table(
+        'paciente',
+        sa.column('id', sa.Integer),
+        sa.column('nombres', sa.String),
+        sa.column('apellidos', sa.String),
+        sa.column('documento', sa.String),
+        sa.column('busqueda_normalizada', sa.String),
+    )
+    actualizacion = (
+        paciente.update()
+        .where(paciente.c.id == sa.bindparam('pid'))
+        .values(busqueda_normalizada=sa.bindparam('valor'))
+    )
+    # Keyset por id: en memoria solo vive un lote de TAMANO_LOTE filas
+    TAMANO_LOTE = 1000
+    ultimo_id = 0
+    while True:
+        filas = bind.execute(
+            sa.select(paciente.c.id, paciente.c.nombres, paciente.c.apellidos, paciente.c.documento)
+            .where(paciente.c.id > ultimo_id)
+            .order_by(paciente.c.id)
+            .limit(TAMANO_LOTE)
+        ).fetchall()
+        if not filas:
+            break
+        bind.execute(actualizacion, [
+            {'pid': fila.id,
+             'valor': _normalizar(' '.join(p for p in (fila.nombres, fila.apellidos, fila.documento) if p))}
+            for fila in filas
+        ])
+        ultimo_id = filas[-1].id
+
+    if es_postgresql:
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        op.create_index(
+            'idx_paciente_busqueda_trgm', 'paciente', ['busqueda_normalizada'],
+            unique=False, postgresql_using='gin',
+            postgresql_ops={'busqueda_normalizada': 'gin_trgm_ops'}
+        )
+        op.create_index(
+            'idx_paciente_documento_prefijo', 'paciente', ['documento'],
+            unique=False, postgresql_ops={'documento': 'varchar_pattern_ops'}
+        )
+    else:
+        op.create_index('idx_paciente_busqueda_trgm', 'paciente', ['busqueda_normalizada'], unique=False)
+        op.create_index('idx_paciente_documento_prefijo', 'paciente', ['documento'], unique=False)
+
+
+def downgrade():
+    op.drop_index('idx_paciente_documento_prefijo', table_name='paciente')
+    op.drop_index('idx_paciente_busqueda_trgm', table_name='paciente')
+    with op.batch_alter_table('paciente', schema=None) as batch_op:
+        batch_op.drop_column('busqueda_normalizada')
@@ -0,0 +1,38 @@
+"""updated_at en cita para la sincronizacion incremental de la agenda
+
+Revision ID: 5d8a0c3e7f16
+Revises: c47e91d0b5a2
+Create Date: 2026-10-17 12:20:44.905126
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d8a0c3e7f16'
+down_revision = 'c47e91d0b5a2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('cita', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+
+    # Las citas existentes toman la hora de la migración como última modificación
+    op.get_bind().execute(
+        sa.text('UPDATE cita SET updated_at = :ahora WHERE updated_at IS NULL'),
+        {'ahora': datetime.utcnow()}
+    )
+
+    with op.batch_alter_table('cita', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_cita_updated_at'), ['updated_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('cita', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_cita_updated_at'))
+        batch_op.drop_column('updated_at')
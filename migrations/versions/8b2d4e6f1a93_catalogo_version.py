@@ -0,0 +1,35 @@
+"""tabla catalogo_version para la cache de catalogos
+
+Revision ID: 8b2d4e6f1a93
+Revises: 3f1c9a7e2b40
+Create Date: 2026-10-17 10:05:18.274913
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b2d4e6f1a93'
+down_revision = '3f1c9a7e2b40'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    catalogo_version = op.create_table('catalogo_version',
+    sa.Column('nombre', sa.String(length=30), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.Column('actualizado_en', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('nombre')
+    )
+    op.bulk_insert(catalogo_version, [
+        {'nombre': nombre, 'version': 1, 'actualizado_en': datetime.utcnow()}
+        for nombre in ('eps', 'municipios', 'cups', 'cie10')
+    ])
+
+
+def downgrade():
+    op.drop_table('catalogo_version')
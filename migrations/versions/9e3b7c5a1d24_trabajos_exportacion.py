@@ -0,0 +1,47 @@
+"""tabla trabajos_exportacion para las exportaciones en segundo plano
+
+Revision ID: 9e3b7c5a1d24
+Revises: 5d8a0c3e7f16
+Create Date: 2026-10-17 14:02:37.518204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9e3b7c5a1d24'
+down_revision = '5d8a0c3e7f16'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('trabajos_exportacion',
+    sa.Column('id', sa.String(length=32), nullable=False),
+    sa.Column('usuario_id', sa.Integer(), nullable=False),
+    sa.Column('tipo', sa.String(length=20), nullable=False),
+    sa.Column('parametros', sa.JSON(), nullable=True),
+    sa.Column('estado', sa.String(length=20), nullable=False),
+    sa.Column('progreso', sa.Integer(), nullable=False),
+    sa.Column('mensaje', sa.Text(), nullable=True),
+    sa.Column('nombre_archivo', sa.String(length=255), nullable=True),
+    sa.Column('ruta_archivo', sa.String(length=500), nullable=True),
+    sa.Column('creado_en', sa.DateTime(), nullable=False),
+    sa.Column('iniciado_en', sa.DateTime(), nullable=True),
+    sa.Column('terminado_en', sa.DateTime(), nullable=True),
+    sa.Column('expira_en', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['usuario_id'], ['usuarios.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('trabajos_exportacion', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_trabajos_exportacion_usuario_id'), ['usuario_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_trabajos_exportacion_expira_en'), ['expira_en'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('trabajos_exportacion', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_trabajos_exportacion_expira_en'))
+        batch_op.drop_index(batch_op.f('ix_trabajos_exportacion_usuario_id'))
+
+    op.drop_table('trabajos_exportacion')
@@ -0,0 +1,53 @@
+"""indices compuestos y parciales de las rutas frecuentes
+
+Revision ID: a2c9e7d4b816
+Revises: f3b8d2c5a917
+Create Date: 2026-10-17 21:05:12.284917
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a2c9e7d4b816'
+down_revision = 'f3b8d2c5a917'
+branch_labels = None
+depends_on = None
+
+
+# Solo filas fuera de la papelera: es lo que filtran todas las pantallas
+SOLO_ACTIVOS = {'postgresql_where': sa.text('is_deleted = false'), 'sqlite_where': sa.text('is_deleted = 0')}
+
+# (nombre, tabla, columnas, opciones)
+INDICES = [
+    # Lista de pacientes (keyset por id) y selector de pacientes (por apellidos)
+    ('idx_paciente_odontologo_activos', 'paciente', ['odontologo_id', 'id'], SOLO_ACTIVOS),
+    ('idx_paciente_odontologo_apellidos', 'paciente', ['odontologo_id', 'apellidos', 'nombres'], SOLO_ACTIVOS),
+    # Historial del paciente y última / próxima cita
+    ('idx_cita_paciente_fecha', 'cita', ['paciente_id', 'fecha', 'hora'], SOLO_ACTIVOS),
+    # Agenda de la semana en el panel
+    ('idx_cita_odontologo_fecha', 'cita', ['odontologo_id', 'fecha', 'hora'], SOLO_ACTIVOS),
+    # Citas por facturar de un paciente
+    ('idx_cita_paciente_sin_factura', 'cita', ['paciente_id'], {
+        'postgresql_where': sa.text('factura_id IS NULL AND is_deleted = false'),
+        'sqlite_where': sa.text('factura_id IS NULL AND is_deleted = 0'),
+    }),
+    ('idx_cita_factura', 'cita', ['factura_id'], {}),
+    ('idx_factura_fecha', 'facturas', ['fecha_factura'], {}),
+    ('idx_factura_paciente_fecha', 'facturas', ['paciente_id', 'fecha_factura'], {}),
+    ('idx_evolucion_paciente_fecha', 'evolucion', ['paciente_id', 'fecha'], {}),
+    ('idx_procedimiento_cita', 'procedimientos', ['cita_id'], {}),
+]
+
+
+def upgrade():
+    # limites_diarios(usuario_id, fecha) ya es único (uq_usuario_fecha) y
+    # usuarios_planes(usuario_id, estado) ya tiene idx_usuario_plan_activo
+    for nombre, tabla, columnas, opciones in INDICES:
+        op.create_index(nombre, tabla, columnas, unique=False, **opciones)
+
+
+def downgrade():
+    for nombre, tabla, _, _ in reversed(INDICES):
+        op.drop_index(nombre, table_name=tabla)
@@ -0,0 +1,37 @@
+"""tabla borrados_pendientes (bandeja de salida de borrados en Cloudinary)
+
+Revision ID: b4f1e8a2c703
+Revises: 9e3b7c5a1d24
+Create Date: 2026-10-17 16:41:09.372815
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b4f1e8a2c703'
+down_revision = '9e3b7c5a1d24'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('borrados_pendientes',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('public_id', sa.String(length=255), nullable=False),
+    sa.Column('intentos', sa.Integer(), nullable=False),
+    sa.Column('ultimo_error', sa.Text(), nullable=True),
+    sa.Column('creado_en', sa.DateTime(), nullable=False),
+    sa.Column('proximo_intento', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('borrados_pendientes', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_borrados_pendientes_proximo_intento'), ['proximo_intento'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('borrados_pendientes', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_borrados_pendientes_proximo_intento'))
+
+    op.drop_table('borrados_pendientes')
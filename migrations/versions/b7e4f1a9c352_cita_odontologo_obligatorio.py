@@ -0,0 +1,54 @@
+"""cita.odontologo_id obligatorio (dueño de la cita)
+
+Revision ID: b7e4f1a9c352
+Revises: a2c9e7d4b816
+Create Date: 2026-10-17 22:10:48.530216
+
+Backfill antes del NOT NULL:
+- Citas con paciente: el odontólogo del paciente (corrige también las que
+  guardaron al administrador que las agendó).
+- Citas sin paciente y sin odontólogo: el primer administrador o, si no hay,
+  el primer usuario. Antes eran visibles para todos los odontólogos; ahora
+  las ve el administrador y las puede reasignar editándolas.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e4f1a9c352'
+down_revision = 'a2c9e7d4b816'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    cita = sa.table('cita', sa.column('odontologo_id', sa.Integer), sa.column('paciente_id', sa.Integer))
+    paciente = sa.table('paciente', sa.column('id', sa.Integer), sa.column('odontologo_id', sa.Integer))
+    usuarios = sa.table('usuarios', sa.column('id', sa.Integer), sa.column('is_admin', sa.Boolean))
+
+    odontologo_del_paciente = (
+        sa.select(paciente.c.odontologo_id).where(paciente.c.id == cita.c.paciente_id).scalar_subquery()
+    )
+    bind.execute(
+        cita.update()
+        .where(cita.c.paciente_id.isnot(None))
+        .values(odontologo_id=odontologo_del_paciente)
+    )
+
+    huerfanas = bind.scalar(sa.select(sa.func.count()).select_from(cita).where(cita.c.odontologo_id.is_(None)))
+    if huerfanas:
+        responsable = bind.scalar(
+            sa.select(usuarios.c.id).order_by(usuarios.c.is_admin.desc(), usuarios.c.id).limit(1)
+        )
+        bind.execute(cita.update().where(cita.c.odontologo_id.is_(None)).values(odontologo_id=responsable))
+
+    with op.batch_alter_table('cita', schema=None) as batch_op:
+        batch_op.alter_column('odontologo_id', existing_type=sa.Integer(), nullable=False)
+
+
+def downgrade():
+    with op.batch_alter_table('cita', schema=None) as batch_op:
+        batch_op.alter_column('odontologo_id', existing_type=sa.Integer(), nullable=True)
@@ -0,0 +1,26 @@
+"""indice compuesto (fecha, hora) en cita para el calendario
+
+Revision ID: c47e91d0b5a2
+Revises: 8b2d4e6f1a93
+Create Date: 2026-10-17 11:02:37.618440
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c47e91d0b5a2'
+down_revision = '8b2d4e6f1a93'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('cita', schema=None) as batch_op:
+        batch_op.create_index('idx_cita_fecha_hora', ['fecha', 'hora'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('cita', schema=None) as batch_op:
+        batch_op.drop_index('idx_cita_fecha_hora')
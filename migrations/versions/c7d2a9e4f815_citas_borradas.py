@@ -0,0 +1,35 @@
+"""tabla citas_borradas (lápidas de la agenda incremental)
+
+Revision ID: c7d2a9e4f815
+Revises: b4f1e8a2c703
+Create Date: 2026-10-17 18:12:44.105237
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7d2a9e4f815'
+down_revision = 'b4f1e8a2c703'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('citas_borradas',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('cita_id', sa.Integer(), nullable=False),
+    sa.Column('odontologo_id', sa.Integer(), nullable=True),
+    sa.Column('borrado_en', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('citas_borradas', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_citas_borradas_borrado_en'), ['borrado_en'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('citas_borradas', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_citas_borradas_borrado_en'))
+
+    op.drop_table('citas_borradas')
@@ -0,0 +1,28 @@
+"""estado estructurado del dentigrama en paciente
+
+Revision ID: e1a6c3f9b208
+Revises: c7d2a9e4f815
+Create Date: 2026-10-17 19:05:31.482913
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e1a6c3f9b208'
+down_revision = 'c7d2a9e4f815'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('paciente', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('dentigrama_estado', sa.JSON(), nullable=True))
+        batch_op.add_column(sa.Column('dentigrama_hash', sa.String(length=64), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('paciente', schema=None) as batch_op:
+        batch_op.drop_column('dentigrama_hash')
+        batch_op.drop_column('dentigrama_estado')
@@ -0,0 +1,48 @@
+"""agregados de ingresos por día y por procedimiento/mes
+
+Revision ID: f3b8d2c5a917
+Revises: e1a6c3f9b208
+Create Date: 2026-10-17 20:14:07.318465
+
+Después de aplicarla, llenar las tablas con las facturas existentes:
+    python manage.py reconstruir-ingresos
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3b8d2c5a917'
+down_revision = 'e1a6c3f9b208'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('ingresos_diarios',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('odontologo_id', sa.Integer(), nullable=False),
+    sa.Column('fecha', sa.Date(), nullable=False),
+    sa.Column('total', sa.Float(), nullable=False),
+    sa.Column('facturas', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['odontologo_id'], ['usuarios.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('odontologo_id', 'fecha', name='uq_ingreso_diario_odontologo_fecha')
+    )
+    op.create_table('ingresos_procedimientos_mensuales',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('odontologo_id', sa.Integer(), nullable=False),
+    sa.Column('mes', sa.Date(), nullable=False),
+    sa.Column('codigo_cups', sa.String(length=20), nullable=False),
+    sa.Column('cantidad', sa.Integer(), nullable=False),
+    sa.Column('total', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['odontologo_id'], ['usuarios.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('odontologo_id', 'mes', 'codigo_cups', name='uq_ingreso_procedimiento_mes')
+    )
+
+
+def downgrade():
+    op.drop_table('ingresos_procedimientos_mensuales')
+    op.drop_table('ingresos_diarios')
@@ -0,0 +1,105 @@
+# scripts/benchmark_busqueda_pacientes.py
+"""
+Mide la latencia (p50/p95) de la búsqueda de pacientes del autocompletado
+con 10k, 100k y 1M de pacientes sintéticos.
+
+Uso:
+    python scripts/benchmark_busqueda_pacientes.py
+    python scripts/benchmark_busqueda_pacientes.py --tamanos 10000,100000 --consultas 300
+
+Por defecto usa una base SQLite temporal. Para medir contra PostgreSQL (índice
+trigram real) define BENCH_DATABASE_URL apuntando a una base DESECHABLE:
+las tablas se crean y se borran en cada tamaño.
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+# Agregar la raíz del proyecto al path para poder importar
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_tmp = tempfile.NamedTemporaryFile(suffix='.db', delete=False)
+os.environ['DATABASE_URL'] = os.environ.get('BENCH_DATABASE_URL', f"sqlite:///{_tmp.name}")
+os.environ.pop('FLASK_DEBUG', None)
+
+from clinica import create_app, db
+from clinica.models import Usuario, Paciente
+from clinica.services.busqueda_service import BusquedaService
+from clinica.utils import normalizar_texto
+
+NOMBRES = ['María', 'José', 'Juan', 'Andrés', 'Lucía', 'Camila', 'Sebastián', 'Valentina',
+           'Mateo', 'Sofía', 'Jesús', 'Ángela', 'Martín', 'Isabel', 'Óscar', 'Ramón']
+APELLIDOS = ['Gómez', 'Pérez', 'Rodríguez', 'Martínez', 'García', 'López', 'Hernández',
+             'Díaz', 'Muñoz', 'Álvarez', 'Peña', 'Castaño', 'Zúñiga', 'Ortiz', 'Núñez']
+
+
+def sembrar(total, odontologo_id, rnd):
+    tabla = Paciente.__table__
+    lote = []
+    for i in range(total):
+        nombres = f"{rnd.choice(NOMBRES)} {rnd.choice(NOMBRES)}"
+        apellidos = f"{rnd.choice(APELLIDOS)} {rnd.choice(APELLIDOS)}"
+        documento = str(10_000_000 + i * 7)
+        lote.append({
+            'nombres': nombres, 'apellidos': apellidos, 'documento': documento,
+            'telefono': '3000000000', 'odontologo_id': odontologo_id, 'is_deleted': False,
+            'busqueda_normalizada': normalizar_texto(f"{nombres} {apellidos} {documento}"),
+        })
+        if len(lote) == 5000:
+            db.session.execute(tabla.insert(), lote)
+            lote = []
+    if lote:
+        db.session.execute(tabla.insert(), lote)
+    db.session.commit()
+
+
+def medir(odontologo_id, consultas, rnd):
+    terminos = [rnd.choice(NOMBRES)[:3].lower() for _ in range(consultas // 3)]
+    terminos += [rnd.choice(APELLIDOS).lower() for _ in range(consultas // 3)]
+    terminos += [str(10_000_000 + rnd.randrange(0, 1000) * 7)[:5] for _ in range(consultas - len(terminos))]
+    tiempos = []
+    for termino in terminos:
+        query_base = Paciente.query.filter(Paciente.is_deleted == False, Paciente.odontologo_id == odontologo_id)
+        inicio = time.perf_counter()
+        BusquedaService.sugerencias(query_base, termino, limite=10)
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    tiempos.sort()
+    return statistics.median(tiempos), tiempos[int(len(tiempos) * 0.95) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tamanos', default='10000,100000,1000000')
+    parser.add_argument('--consultas', type=int, default=200)
+    args = parser.parse_args()
+
+    app = create_app()
+    rnd = random.Random(42)
+    print(f"Base de datos: {app.config['SQLALCHEMY_DATABASE_URI'].split('@')[-1]}")
+    print(f"{'pacientes':>10} | {'p50 (ms)':>9} | {'p95 (ms)':>9}")
+    with app.app_context():
+        for total in [int(t) for t in args.tamanos.split(',')]:
+            db.drop_all()
+            if db.engine.dialect.name == 'postgresql':
+                db.session.execute(db.text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+                db.session.commit()
+            db.create_all()
+            usuario = Usuario(username='bench', email='bench@example.com')
+            usuario.set_password('bench')
+            db.session.add(usuario)
+            db.session.commit()
+            sembrar(total, usuario.id, rnd)
+            p50, p95 = medir(usuario.id, args.consultas, rnd)
+            print(f"{total:>10} | {p50:>9.2f} | {p95:>9.2f}")
+        db.session.remove()
+        db.drop_all()
+    os.unlink(_tmp.name)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+# scripts/benchmark_calendario.py
+"""
+Mide el tiempo de render del calendario mensual (/calendario/) con 5.000 citas
+en el mes, y por separado el de la consulta + agrupación por día.
+
+Uso:
+    python scripts/benchmark_calendario.py
+    python scripts/benchmark_calendario.py --citas 5000 --repeticiones 30
+
+Por defecto usa una base SQLite temporal. Para medir contra PostgreSQL define
+BENCH_DATABASE_URL apuntando a una base DESECHABLE (las tablas se borran).
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, time as dtime
+
+# Agregar la raíz del proyecto al path para poder importar
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_tmp = tempfile.NamedTemporaryFile(suffix='.db', delete=False)
+os.environ['DATABASE_URL'] = os.environ.get('BENCH_DATABASE_URL', f"sqlite:///{_tmp.name}")
+os.environ.pop('FLASK_DEBUG', None)
+
+from clinica import create_app, db
+from clinica.models import Usuario, Paciente, Cita
+from clinica.routes.calendario import agrupar_citas_por_dia
+
+ANIO, MES = 2026, 3
+
+
+def sembrar(total_citas, usuario_id, rnd):
+    pacientes = [{
+        'nombres': f'Paciente {i}', 'apellidos': 'Benchmark', 'documento': str(20_000_000 + i),
+        'telefono': '3000000000', 'odontologo_id': usuario_id, 'is_deleted': False,
+    } for i in range(500)]
+    db.session.execute(Paciente.__table__.insert(), pacientes)
+    # Citas de los meses vecinos para que el filtro por rango tenga algo que descartar
+    citas = []
+    for i in range(total_citas * 3):
+        mes = (MES - 1, MES, MES + 1)[i % 3]
+        citas.append({
+            'paciente_id': rnd.randint(1, 500), 'paciente_nombres_str': 'Paciente',
+            'paciente_apellidos_str': 'Benchmark', 'paciente_telefono_str': '',
+            'fecha': date(ANIO, mes, rnd.randint(1, 28)),
+            'hora': dtime(rnd.randint(7, 18), rnd.choice((0, 15, 30, 45))),
+            'motivo': 'Control', 'doctor': 'Dr. Bench', 'odontologo_id': usuario_id,
+            'estado': 'pendiente', 'is_deleted': False,
+        })
+    db.session.execute(Cita.__table__.insert(), citas)
+    db.session.commit()
+
+
+def percentiles(tiempos):
+    tiempos = sorted(tiempos)
+    return statistics.median(tiempos), tiempos[max(int(len(tiempos) * 0.95) - 1, 0)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--citas', type=int, default=5000)
+    parser.add_argument('--repeticiones', type=int, default=20)
+    args = parser.parse_args()
+
+    app = create_app()
+    app.config['TESTING'] = True
+    rnd = random.Random(42)
+    print(f"Base de datos: {app.config['SQLALCHEMY_DATABASE_URI'].split('@')[-1]}")
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        usuario = Usuario(username='bench', email='bench@example.com')
+        usuario.set_password('bench')
+        db.session.add(usuario)
+        db.session.commit()
+        sembrar(args.citas, usuario.id, rnd)
+
+        with app.test_request_context(f'/calendario/?anio={ANIO}&mes={MES}'):
+            tiempos = []
+            for _ in range(args.repeticiones):
+                inicio = time.perf_counter()
+                agrupar_citas_por_dia(ANIO, MES, usuario, f'/calendario/?anio={ANIO}&mes={MES}')
+                tiempos.append((time.perf_counter() - inicio) * 1000)
+        p50, p95 = percentiles(tiempos)
+        print(f"consulta + agrupación ({args.citas} citas): p50 {p50:.1f} ms | p95 {p95:.1f} ms")
+
+    cliente = app.test_client()
+    cliente.post('/login', data={'usuario': 'bench', 'contrasena': 'bench'})
+    tiempos = []
+    for _ in range(args.repeticiones):
+        inicio = time.perf_counter()
+        respuesta = cliente.get(f'/calendario/?anio={ANIO}&mes={MES}')
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+        assert respuesta.status_code == 200, respuesta.status_code
+    p50, p95 = percentiles(tiempos)
+    print(f"render completo de /calendario/:       p50 {p50:.1f} ms | p95 {p95:.1f} ms")
+
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+    os.unlink(_tmp.name)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+# scripts/benchmark_exportacion_historias.py
+"""
+Mide el rendimiento (documentos por segundo) de la exportación masiva de
+historias clínicas (ExportacionService.generar_zip_historias) con distinto
+número de procesos de render, y lo compara con el camino anterior: un
+generar_word por paciente, con su consulta de evoluciones (N+1).
+
+Uso:
+    python scripts/benchmark_exportacion_historias.py
+    python scripts/benchmark_exportacion_historias.py --pacientes 500 --evoluciones 15 --procesos 0 1 2 4
+
+Por defecto usa una base SQLite temporal. Para medir contra PostgreSQL define
+BENCH_DATABASE_URL apuntando a una base DESECHABLE (las tablas se borran).
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import zipfile
+from datetime import datetime, timedelta
+
+# Agregar la raíz del proyecto al path para poder importar
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_tmp = tempfile.NamedTemporaryFile(suffix='.db', delete=False)
+os.environ['DATABASE_URL'] = os.environ.get('BENCH_DATABASE_URL', f"sqlite:///{_tmp.name}")
+os.environ.pop('FLASK_DEBUG', None)
+
+from clinica import create_app, db
+from clinica.models import Usuario, Paciente, Evolucion
+from clinica.services.exportacion_service import ExportacionService
+
+
+def sembrar(total_pacientes, evoluciones_por_paciente, usuario_id, rnd):
+    pacientes = [{
+        'nombres': f'Paciente {i}', 'apellidos': 'Benchmark', 'documento': str(30_000_000 + i),
+        'telefono': '3000000000', 'odontologo_id': usuario_id, 'is_deleted': False,
+        'motivo_consulta': 'Dolor en molar inferior derecho al masticar.',
+        'antecedentes_personales': 'Hipertensión controlada.', 'alergias': 'Ninguna conocida.',
+        'plan_tratamiento': 'Profilaxis, resina en 46 y control en 6 meses.',
+    } for i in range(total_pacientes)]
+    db.session.execute(Paciente.__table__.insert(), pacientes)
+    inicio = datetime(2024, 1, 1, 14, 0)
+    evoluciones = [{
+        'paciente_id': paciente_id,
+        'descripcion': 'Control. Paciente asintomático, se realiza profilaxis y se dan indicaciones de higiene. ' * 2,
+        'fecha': inicio + timedelta(days=rnd.randint(0, 700), minutes=rnd.randint(0, 600)),
+    } for paciente_id in range(1, total_pacientes + 1) for _ in range(evoluciones_por_paciente)]
+    db.session.execute(Evolucion.__table__.insert(), evoluciones)
+    db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pacientes', type=int, default=300)
+    parser.add_argument('--evoluciones', type=int, default=10)
+    parser.add_argument('--procesos', type=int, nargs='+', default=[0, 1, 2, 4])
+    args = parser.parse_args()
+
+    app = create_app()
+    rnd = random.Random(42)
+    print(f"Base de datos: {app.config['SQLALCHEMY_DATABASE_URI'].split('@')[-1]}")
+    print(f"{args.pacientes} pacientes x {args.evoluciones} evoluciones | CPUs: {os.cpu_count()}")
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        usuario = Usuario(username='bench', email='bench@example.com')
+        usuario.set_password('bench')
+        db.session.add(usuario)
+        db.session.commit()
+        sembrar(args.pacientes, args.evoluciones, usuario.id, rnd)
+        ids = [fila.id for fila in db.session.query(Paciente.id).order_by(Paciente.id)]
+
+        # Camino anterior: un documento por paciente, cada uno con su consulta
+        inicio = time.perf_counter()
+        for paciente_id in ids:
+            ExportacionService.generar_word(db.session.get(Paciente, paciente_id))
+        segundos = time.perf_counter() - inicio
+        db.session.expunge_all()
+        print(f"generar_word uno a uno:       {len(ids) / segundos:7.1f} docs/s ({segundos:.2f} s)")
+
+        for procesos in args.procesos:
+            inicio = time.perf_counter()
+            salida = ExportacionService.generar_zip_historias(ids, procesos=procesos)
+            segundos = time.perf_counter() - inicio
+            with zipfile.ZipFile(salida) as zf:
+                assert len(zf.namelist()) == len(ids)
+            tamano_mb = salida.seek(0, os.SEEK_END) / 1024 / 1024
+            salida.close()
+            etiqueta = f"zip, {procesos} procesos" if procesos else "zip, mismo hilo"
+            print(f"{etiqueta:<28}  {len(ids) / segundos:7.1f} docs/s ({segundos:.2f} s, {tamano_mb:.1f} MB)")
+
+        db.session.remove()
+        db.drop_all()
+    os.unlink(_tmp.name)
+
+
+if __name__ == '__main__':
+    main()
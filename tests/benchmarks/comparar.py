@@ -0,0 +1,73 @@
+# tests/benchmarks/comparar.py
+"""
+Compara dos JSON de resultados de la suite de benchmarks.
+
+Uso:
+    python tests/benchmarks/comparar.py .benchmarks/abc123.json .benchmarks/def456.json
+    python tests/benchmarks/comparar.py base.json nuevo.json --umbral 15
+
+Muestra el p50 y las consultas SQL de cada endpoint en las dos corridas y
+termina con código 1 si algún p50 empeoró más del umbral (en %) y además en
+más de --minimo-ms (los endpoints de menos de un milisegundo varían mucho en
+porcentaje entre corridas), para poder usarlo en CI. Solo tiene sentido
+entre corridas con la misma escala y semilla.
+"""
+
+import argparse
+import json
+import sys
+
+
+def cargar(ruta):
+    with open(ruta, encoding='utf-8') as archivo:
+        return json.load(archivo)
+
+
+def comparar(base, nuevo, umbral, minimo_ms=1.0):
+    """Devuelve (líneas de la tabla, nombres de las mediciones que empeoraron)."""
+    lineas = [f"{'medición':<22} {'p50 base':>10} {'p50 nuevo':>10} {'cambio':>8} {'consultas':>11}"]
+    regresiones = []
+    for nombre in sorted(set(base['resultados']) | set(nuevo['resultados'])):
+        antes = base['resultados'].get(nombre)
+        despues = nuevo['resultados'].get(nombre)
+        if antes is None or despues is None:
+            lineas.append(f"{nombre:<22} {'(solo en ' + ('nuevo' if antes is None else 'base') + ')':>43}")
+            continue
+        cambio = (despues['p50_ms'] - antes['p50_ms']) / antes['p50_ms'] * 100 if antes['p50_ms'] else 0.0
+        marca = ''
+        if cambio > umbral and despues['p50_ms'] - antes['p50_ms'] > minimo_ms:
+            regresiones.append(nombre)
+            marca = '  <-- más lento'
+        lineas.append(
+            f"{nombre:<22} {antes['p50_ms']:>8.1f}ms {despues['p50_ms']:>8.1f}ms {cambio:>+7.1f}% "
+            f"{antes['consultas']:>5} -> {despues['consultas']:<3}{marca}"
+        )
+    return lineas, regresiones
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('base')
+    parser.add_argument('nuevo')
+    parser.add_argument('--umbral', type=float, default=20.0,
+                        help='Porcentaje de aumento del p50 que se considera regresión (20 por defecto).')
+    parser.add_argument('--minimo-ms', type=float, default=1.0,
+                        help='Aumento absoluto mínimo del p50 para contar como regresión (1 ms por defecto).')
+    args = parser.parse_args()
+
+    base, nuevo = cargar(args.base), cargar(args.nuevo)
+    print(f"base:  {base['commit']} ({base['fecha']}, escala {base['escala']}, {base['motor']})")
+    print(f"nuevo: {nuevo['commit']} ({nuevo['fecha']}, escala {nuevo['escala']}, {nuevo['motor']})")
+    if (base['escala'], base['semilla']) != (nuevo['escala'], nuevo['semilla']):
+        print("AVISO: las corridas usan clínicas distintas (escala o semilla); la comparación no es directa.")
+    print()
+
+    lineas, regresiones = comparar(base, nuevo, args.umbral, args.minimo_ms)
+    print('\n'.join(lineas))
+    if regresiones:
+        print(f"\n{len(regresiones)} regresión(es) de más de {args.umbral:.0f}%: {', '.join(regresiones)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
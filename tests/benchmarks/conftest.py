@@ -0,0 +1,134 @@
+# tests/benchmarks/conftest.py
+"""
+Fixtures de la suite de rendimiento.
+
+La clínica sintética se genera una vez por módulo sobre la misma base en
+memoria de las pruebas funcionales. Cada medición queda en RESULTADOS y al
+final de la sesión se escriben todas en un JSON (ver comparar.py para
+contrastar dos corridas).
+"""
+
+import json
+import os
+import platform
+import statistics
+import subprocess
+import time
+from datetime import datetime
+
+import pytest
+
+from clinica import db
+from clinica.instrumentacion import contar_consultas
+from clinica.services.catalogo_cache import CatalogoCache
+from clinica.services.panel_service import PanelService
+from tests.benchmarks.generador import CONTRASENA, generar_clinica, tamanos_para_escala
+
+# nombre de la medición -> estadísticas
+RESULTADOS = {}
+# Datos de la clínica usada, para el encabezado del JSON
+_CONTEXTO = {}
+
+
+def _commit_actual(raiz):
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=raiz, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or 'sin-commit'
+    except (OSError, subprocess.SubprocessError):
+        return 'sin-commit'
+
+
+def _percentil(valores, fraccion):
+    ordenados = sorted(valores)
+    return ordenados[min(int(len(ordenados) * fraccion), len(ordenados) - 1)]
+
+
+@pytest.fixture(scope='module')
+def clinica_sintetica(app, request):
+    """Crea las tablas, siembra la clínica y la borra al terminar el módulo."""
+    escala = request.config.getoption('--benchmark-escala')
+    tamanos = tamanos_para_escala(escala)
+    with app.app_context():
+        db.create_all()
+        inicio = time.perf_counter()
+        datos = generar_clinica(**tamanos)
+        CatalogoCache.invalidar()
+        PanelService.cache.limpiar()
+        _CONTEXTO.update({'escala': escala, 'tamanos': tamanos, 'conteos': datos['conteos'],
+                          'semilla': datos['semilla'], 'motor': db.engine.dialect.name,
+                          'segundos_siembra': round(time.perf_counter() - inicio, 2)})
+
+        yield datos
+
+        db.session.remove()
+        db.drop_all()
+        CatalogoCache.invalidar()
+        PanelService.cache.limpiar()
+
+
+@pytest.fixture(scope='module')
+def cliente_bench(app, clinica_sintetica):
+    """Cliente autenticado como el primer odontólogo sintético."""
+    cliente = app.test_client()
+    cliente.post('/login', data={'usuario': clinica_sintetica['usuarios'][0], 'contrasena': CONTRASENA})
+    return cliente
+
+
+@pytest.fixture
+def medir(request):
+    """
+    Devuelve medir(nombre, peticion, preparar=None): ejecuta `peticion` una vez
+    para calentar y luego --benchmark-repeticiones veces, cronometrando cada
+    una. `preparar` corre antes de cada repetición, fuera del tiempo medido
+    (p. ej. para vaciar una caché y medir el caso frío).
+    """
+    repeticiones = request.config.getoption('--benchmark-repeticiones')
+
+    def _medir(nombre, peticion, preparar=None):
+        if preparar:
+            preparar()
+        respuesta = peticion()
+        assert respuesta.status_code < 400, f'{nombre}: HTTP {respuesta.status_code}'
+
+        tiempos = []
+        for _ in range(repeticiones):
+            if preparar:
+                preparar()
+            with contar_consultas() as consultas:
+                inicio = time.perf_counter()
+                respuesta = peticion()
+                tiempos.append((time.perf_counter() - inicio) * 1000)
+            assert respuesta.status_code < 400, f'{nombre}: HTTP {respuesta.status_code}'
+
+        RESULTADOS[nombre] = {
+            'p50_ms': round(statistics.median(tiempos), 2),
+            'p95_ms': round(_percentil(tiempos, 0.95), 2),
+            'media_ms': round(statistics.fmean(tiempos), 2),
+            'min_ms': round(min(tiempos), 2),
+            'repeticiones': repeticiones,
+            'consultas': consultas.total,
+            'bytes': len(respuesta.get_data()),
+        }
+        return RESULTADOS[nombre]
+
+    return _medir
+
+
+def pytest_sessionfinish(session, exitstatus):
+    if not RESULTADOS:
+        return
+    raiz = str(session.config.rootpath)
+    commit = _commit_actual(raiz)
+    ruta = session.config.getoption('--benchmark-json') or os.path.join(raiz, '.benchmarks', f'{commit}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(ruta)), exist_ok=True)
+    with open(ruta, 'w', encoding='utf-8') as archivo:
+        json.dump({
+            'commit': commit,
+            'fecha': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'plataforma': platform.platform(),
+            **_CONTEXTO,
+            'resultados': dict(sorted(RESULTADOS.items())),
+        }, archivo, indent=2, ensure_ascii=False)
+    session.config.pluginmanager.get_plugin('terminalreporter').write_line(
+        f'Resultados de benchmarks guardados en {ruta}')
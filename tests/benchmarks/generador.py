@@ -0,0 +1,196 @@
+# tests/benchmarks/generador.py
+"""
+Generador determinista de clínicas sintéticas para los benchmarks.
+
+Con la misma semilla y los mismos tamaños produce siempre los mismos datos
+(nombres, documentos, horarios, valores), así que dos corridas en commits
+distintos miden exactamente la misma carga. Las fechas se ubican alrededor de
+`hoy` para que el panel y el calendario del mes actual tengan citas.
+
+Las filas se insertan con INSERT masivos sobre las tablas (sin pasar por el
+ORM), por eso los campos que normalmente calculan los eventos del modelo
+(busqueda_normalizada) se llenan aquí.
+"""
+
+import random
+from datetime import date, datetime, time, timedelta
+
+import pytz
+
+from clinica.extensions import db
+from clinica.models import (Usuario, Paciente, Cita, Evolucion, Factura, Procedimiento,
+                            CUPSCode, CIE10)
+from clinica.utils import normalizar_texto
+
+NOMBRES = ['María', 'José', 'Juan', 'Andrés', 'Lucía', 'Camila', 'Sebastián', 'Valentina',
+           'Mateo', 'Sofía', 'Jesús', 'Ángela', 'Martín', 'Isabel', 'Óscar', 'Ramón']
+APELLIDOS = ['Gómez', 'Pérez', 'Rodríguez', 'Martínez', 'García', 'López', 'Hernández',
+             'Díaz', 'Muñoz', 'Álvarez', 'Peña', 'Castaño', 'Zúñiga', 'Ortiz', 'Núñez']
+MOTIVOS = ['Control', 'Limpieza', 'Urgencia', 'Resina', 'Endodoncia', 'Valoración']
+ESTADOS_CITA = ['pendiente', 'confirmada', 'completada', 'cancelada']
+CUPS_ODONTOLOGICOS = ['890203', '232101', '997002', '237301', '232200', '245101']
+CIE10_ODONTOLOGICOS = ['K021', 'K029', 'K040', 'K050', 'K051', 'K083']
+
+# Contraseña de todos los odontólogos sintéticos (bench0, bench1, ...)
+CONTRASENA = 'bench123'
+
+# Filas por INSERT masivo
+TAMANO_LOTE = 5000
+
+# Tamaños de la clínica con --benchmark-escala=1
+TAMANOS_BASE = {
+    'odontologos': 3,
+    'pacientes_por_odontologo': 1000,
+    'citas_por_paciente': 4,
+    'evoluciones_por_paciente': 2,
+    'codigos_cups': 5000,
+    'codigos_cie10': 2000,
+}
+
+
+def tamanos_para_escala(escala):
+    """Tamaños de TAMANOS_BASE multiplicados por `escala` (los odontólogos no escalan)."""
+    return {
+        clave: valor if clave in ('odontologos', 'citas_por_paciente', 'evoluciones_por_paciente')
+        else max(int(valor * escala), 1)
+        for clave, valor in TAMANOS_BASE.items()
+    }
+
+
+def _insertar(modelo, filas):
+    for i in range(0, len(filas), TAMANO_LOTE):
+        db.session.execute(modelo.__table__.insert(), filas[i:i + TAMANO_LOTE])
+
+
+def _ids(modelo, columna_orden):
+    return [fila[0] for fila in db.session.query(modelo.id).order_by(columna_orden)]
+
+
+def generar_clinica(semilla=1234, hoy=None, odontologos=3, pacientes_por_odontologo=1000,
+                    citas_por_paciente=4, evoluciones_por_paciente=2,
+                    codigos_cups=5000, codigos_cie10=2000):
+    """
+    Llena la base (ya creada y vacía) con una clínica sintética y devuelve un
+    resumen con los usuarios, algunos IDs útiles y los conteos de cada tabla.
+
+    Aproximadamente la mitad de las citas pasadas quedan completadas con
+    factura y dos procedimientos, como en un consultorio con RIPS al día.
+    """
+    rnd = random.Random(semilla)
+    hoy = hoy or date.today()
+
+    # --- Catálogos ---
+    _insertar(CUPSCode, [
+        {'code': codigo, 'description': f'PROCEDIMIENTO ODONTOLOGICO {codigo}'}
+        for codigo in CUPS_ODONTOLOGICOS
+    ] + [
+        {'code': f'{900000 + i:06d}', 'description': f'{rnd.choice(MOTIVOS).upper()} TIPO {i}'}
+        for i in range(max(codigos_cups - len(CUPS_ODONTOLOGICOS), 0))
+    ])
+    _insertar(CIE10, [
+        {'codigo': codigo, 'descripcion': f'DIAGNOSTICO BUCAL {codigo}', 'categoria': 'Enfermedades bucales'}
+        for codigo in CIE10_ODONTOLOGICOS
+    ] + [
+        {'codigo': f'{chr(65 + i // 1000 % 26)}{i % 1000:03d}', 'descripcion': f'DIAGNOSTICO {i}',
+         'categoria': None}
+        for i in range(max(codigos_cie10 - len(CIE10_ODONTOLOGICOS), 0))
+        if chr(65 + i // 1000 % 26) != 'K'
+    ])
+
+    # --- Odontólogos ---
+    usuarios = []
+    for i in range(odontologos):
+        usuario = Usuario(username=f'bench{i}', email=f'bench{i}@example.com',
+                          nombre_completo=f'Dr. Bench {i}')
+        usuario.set_password(CONTRASENA)
+        usuarios.append(usuario)
+    db.session.add_all(usuarios)
+    db.session.flush()
+
+    # --- Pacientes ---
+    pacientes = []
+    for u, usuario in enumerate(usuarios):
+        for i in range(pacientes_por_odontologo):
+            nombres = f'{rnd.choice(NOMBRES)} {rnd.choice(NOMBRES)}'
+            apellidos = f'{rnd.choice(APELLIDOS)} {rnd.choice(APELLIDOS)}'
+            documento = str(10_000_000 + (u * pacientes_por_odontologo + i) * 7)
+            pacientes.append({
+                'nombres': nombres, 'apellidos': apellidos, 'documento': documento,
+                'tipo_documento': 'Cédula de ciudadanía', 'genero': rnd.choice(['Masculino', 'Femenino']),
+                'fecha_nacimiento': date(1950, 1, 1) + timedelta(days=rnd.randint(0, 25000)),
+                'telefono': f'300{rnd.randint(1_000_000, 9_999_999)}',
+                'odontologo_id': usuario.id, 'is_deleted': rnd.random() < 0.02,
+                'busqueda_normalizada': normalizar_texto(f'{nombres} {apellidos} {documento}')[:300],
+                'motivo_consulta': rnd.choice(MOTIVOS), 'antecedentes_personales': 'Niega',
+                'codigo_municipio': '05001', 'codigo_departamento': '05', 'tipo_usuario_rips': '01',
+                'tipo_documento_rips': 'CC',
+            })
+    _insertar(Paciente, pacientes)
+    paciente_ids = _ids(Paciente, Paciente.id)
+
+    # --- Evoluciones ---
+    _insertar(Evolucion, [
+        {'paciente_id': paciente_id, 'descripcion': f'{rnd.choice(MOTIVOS)}: evolución sin complicaciones.',
+         'fecha': datetime.combine(hoy - timedelta(days=rnd.randint(1, 365)), time(rnd.randint(7, 18), 0))}
+        for paciente_id in paciente_ids
+        for _ in range(evoluciones_por_paciente)
+    ])
+
+    # --- Facturas y citas ---
+    citas, facturas = [], []
+    for indice, paciente in enumerate(pacientes):
+        paciente_id = paciente_ids[indice]
+        for _ in range(citas_por_paciente):
+            # Citas entre seis meses atrás y un mes adelante
+            fecha = hoy + timedelta(days=rnd.randint(-180, 30))
+            estado = rnd.choice(ESTADOS_CITA) if fecha >= hoy else rnd.choice(('completada', 'cancelada'))
+            con_factura = fecha < hoy and estado == 'completada'
+            if con_factura:
+                facturas.append({
+                    'numero_factura': f'FE-{len(facturas) + 1}', 'paciente_id': paciente_id, 'valor_total': 0,
+                    'fecha_factura': datetime.combine(fecha, time(15, 0), tzinfo=pytz.utc),
+                })
+            citas.append({
+                'paciente_id': paciente_id, 'paciente_nombres_str': paciente['nombres'],
+                'paciente_apellidos_str': paciente['apellidos'], 'paciente_telefono_str': paciente['telefono'],
+                'fecha': fecha, 'hora': time(rnd.randint(7, 18), rnd.choice((0, 15, 30, 45))),
+                'motivo': rnd.choice(MOTIVOS), 'doctor': f"Dr. Bench {paciente['odontologo_id']}",
+                'odontologo_id': paciente['odontologo_id'], 'estado': estado, 'is_deleted': False,
+                'codigo_consulta_cups': '890203', 'finalidad_consulta': '10',
+                'diagnostico_principal': rnd.choice(CIE10_ODONTOLOGICOS),
+                '_factura': len(facturas) if con_factura else None,
+            })
+    _insertar(Factura, facturas)
+    factura_ids = _ids(Factura, Factura.id)
+    for cita in citas:
+        numero = cita.pop('_factura')
+        cita['factura_id'] = factura_ids[numero - 1] if numero else None
+    _insertar(Cita, citas)
+
+    # --- Procedimientos de las citas facturadas ---
+    citas_facturadas = [fila[0] for fila in db.session.query(Cita.id)
+                        .filter(Cita.factura_id.isnot(None)).order_by(Cita.id)]
+    _insertar(Procedimiento, [
+        {'cita_id': cita_id, 'codigo_cups': rnd.choice(CUPS_ODONTOLOGICOS),
+         'diagnostico_cie10': rnd.choice(CIE10_ODONTOLOGICOS), 'valor': rnd.choice((30000, 50000, 80000)),
+         'descripcion': 'Procedimiento sintético'}
+        for cita_id in citas_facturadas
+        for _ in range(2)
+    ])
+    db.session.commit()
+
+    primer_odontologo = usuarios[0].id
+    return {
+        'semilla': semilla,
+        'usuarios': [usuario.username for usuario in usuarios],
+        'paciente_muestra': next(paciente_ids[i] for i, p in enumerate(pacientes)
+                                 if p['odontologo_id'] == primer_odontologo and not p['is_deleted']),
+        'conteos': {
+            'odontologos': len(usuarios),
+            'pacientes': len(pacientes),
+            'citas': len(citas),
+            'facturas': len(facturas),
+            'procedimientos': len(citas_facturadas) * 2,
+            'evoluciones': len(paciente_ids) * evoluciones_por_paciente,
+        },
+    }
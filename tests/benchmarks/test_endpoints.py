@@ -0,0 +1,64 @@
+# tests/benchmarks/test_endpoints.py
+"""
+Tiempos de los endpoints más usados sobre una clínica sintética.
+
+Solo corren con --benchmarks:
+
+    pytest tests/benchmarks --benchmarks
+    pytest tests/benchmarks --benchmarks --benchmark-escala 5 --benchmark-json base.json
+"""
+
+from datetime import date, timedelta
+
+import pytest
+
+from clinica.services.panel_service import PanelService
+
+pytestmark = pytest.mark.benchmark
+
+
+class TestBenchmarkEndpoints:
+    """Una medición por endpoint; los resultados se guardan en el JSON de la sesión"""
+
+    def test_panel(self, cliente_bench, medir):
+        # Caché del panel vacía en cada repetición: se mide el caso frío
+        medir('panel', lambda: cliente_bench.get('/'), preparar=PanelService.cache.limpiar)
+
+    def test_calendario_mes(self, cliente_bench, medir):
+        hoy = date.today()
+        medir('calendario_mes', lambda: cliente_bench.get(f'/calendario/?anio={hoy.year}&mes={hoy.month}'))
+
+    def test_lista_pacientes(self, cliente_bench, medir):
+        medir('lista_pacientes', lambda: cliente_bench.get('/pacientes/lista'))
+
+    def test_busqueda_pacientes(self, cliente_bench, medir):
+        medir('busqueda_pacientes', lambda: cliente_bench.get('/pacientes/lista?buscar=gomez'))
+
+    def test_perfil_paciente(self, cliente_bench, clinica_sintetica, medir):
+        paciente_id = clinica_sintetica['paciente_muestra']
+        medir('perfil_paciente', lambda: cliente_bench.get(f'/pacientes/{paciente_id}'))
+
+    def test_sugerencias_ajax(self, cliente_bench, medir):
+        medir('sugerencias_ajax', lambda: cliente_bench.get('/pacientes/buscar_sugerencias_ajax?q=mar'))
+
+    def test_busqueda_cups(self, cliente_bench, medir):
+        medir('busqueda_cups', lambda: cliente_bench.get('/api/cups/search?q=resina'))
+
+    def test_busqueda_cie10(self, cliente_bench, medir):
+        medir('busqueda_cie10', lambda: cliente_bench.get('/api/cie10/search?q=K02'))
+
+    def test_exportar_rips(self, app, cliente_bench, medir, tmp_path):
+        # En TESTING el trabajo corre dentro de la petición, así que se mide la generación completa
+        hoy = date.today()
+        datos = {'fecha_inicio': (hoy - timedelta(days=30)).strftime('%m/%d/%Y'),
+                 'fecha_fin': hoy.strftime('%m/%d/%Y')}
+        directorio_anterior = app.config.get('EXPORT_DIR')
+        app.config['EXPORT_DIR'] = str(tmp_path)
+        try:
+            medir('exportar_rips', lambda: cliente_bench.post('/reportes', data=datos))
+        finally:
+            app.config['EXPORT_DIR'] = directorio_anterior
+
+    def test_exportar_word(self, cliente_bench, clinica_sintetica, medir):
+        paciente_id = clinica_sintetica['paciente_muestra']
+        medir('exportar_word', lambda: cliente_bench.get(f'/export/exportar_word/{paciente_id}'))
@@ -14,6 +14,33 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')
 
 from clinica import create_app, db
 from clinica.models import Usuario, Paciente, Cita
+from clinica.services.catalogo_cache import CatalogoCache
+from clinica.services.panel_service import PanelService
+from clinica.services.plan_service import PlanService
+from clinica.services.resumen_paciente_service import ResumenPacienteService
+
+
+def pytest_addoption(parser):
+    """Opciones de la suite de rendimiento (tests/benchmarks)."""
+    grupo = parser.getgroup('benchmarks', 'Benchmarks de la clínica')
+    grupo.addoption('--benchmarks', action='store_true', default=False,
+                    help='Ejecuta las pruebas marcadas con @pytest.mark.benchmark (se omiten por defecto).')
+    grupo.addoption('--benchmark-json', default=None,
+                    help='Archivo JSON de resultados (por defecto .benchmarks/<commit>.json).')
+    grupo.addoption('--benchmark-escala', type=float, default=1.0,
+                    help='Multiplica el tamaño de la clínica sintética (1 = 3.000 pacientes).')
+    grupo.addoption('--benchmark-repeticiones', type=int, default=10,
+                    help='Mediciones por endpoint (más una de calentamiento).')
+
+
+def pytest_collection_modifyitems(config, items):
+    """Los benchmarks son opcionales: solo corren con --benchmarks."""
+    if config.getoption('--benchmarks'):
+        return
+    omitir = pytest.mark.skip(reason='benchmark: ejecutar con --benchmarks')
+    for item in items:
+        if 'benchmark' in item.keywords:
+            item.add_marker(omitir)
 
 
 @pytest.fixture(scope='session')
@@ -53,6 +80,11 @@ def init_database(app):
     """
     with app.app_context():
         db.create_all()
+        # Las cachés son por proceso: no deben arrastrar datos entre pruebas
+        CatalogoCache.invalidar()
+        PanelService.cache.limpiar()
+        PlanService.cache.limpiar()
+        ResumenPacienteService.cache.limpiar()
         
         # Crear un usuario de prueba
         usuario_test = Usuario(
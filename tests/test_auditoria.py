@@ -0,0 +1,97 @@
+# tests/test_auditoria.py
+"""
+Pruebas de AuditoriaService (escritura de auditoría fuera de la transacción del usuario)
+"""
+
+import queue
+from datetime import date, datetime
+
+import pytest
+
+from clinica import db
+from clinica.models import AuditLog, AuditoriaAcceso, Cita, Usuario
+from clinica.services.auditoria_service import AuditoriaService
+
+
+class TestAuditoria:
+    """Registro tras el commit, descarte en rollback y escritura por lotes"""
+
+    def test_eliminar_cita_registra_auditoria(self, app, authenticated_client):
+        with app.app_context():
+            usuario = Usuario.query.filter_by(username='testuser').first()
+            cita = Cita(paciente_nombres_str='Auditada', fecha=date(2026, 3, 10),
+                        hora=datetime(2026, 1, 1, 9, 0).time(), estado='pendiente', doctor='Dr. Test',
+                        odontologo_id=usuario.id)
+            db.session.add(cita)
+            db.session.commit()
+            cita_id = cita.id
+
+        authenticated_client.post(f'/calendario/eliminar_cita/{cita_id}')
+
+        with app.app_context():
+            registro = AuditLog.query.one()
+            assert registro.action_type == 'SOFT_DELETE_CITA'
+            assert registro.target_id == cita_id
+            assert registro.user_username == 'testuser'
+
+    def test_rollback_descarta_registro(self, app, init_database):
+        with app.app_context():
+            usuario = Usuario.query.filter_by(username='testuser').first()
+            usuario.email = 'cambio@example.com'
+            AuditoriaService.registrar(AuditLog, action_type='PRUEBA', description='No debe quedar')
+            db.session.rollback()
+            db.session.commit()
+            assert AuditLog.query.count() == 0
+
+    def test_sin_commit_se_escribe_de_inmediato(self, app, init_database):
+        with app.app_context():
+            AuditoriaService.registrar(AuditoriaAcceso, tras_commit=False, tipo_accion='exceder_limite',
+                                       metadatos={'limite': 5})
+            db.session.remove()
+            assert AuditoriaAcceso.query.one().metadatos == {'limite': 5}
+
+    def test_hilo_escribe_por_lotes_y_vacia_al_terminar(self, app, init_database, monkeypatch):
+        monkeypatch.setitem(app.config, 'AUDITORIA_SINCRONO', False)
+        monkeypatch.setitem(app.config, 'AUDITORIA_INTERVALO_MS', 20)
+        monkeypatch.setitem(app.config, 'AUDITORIA_LOTE', 2)
+        with app.app_context():
+            for i in range(3):
+                AuditoriaService.registrar(AuditLog, action_type='PRUEBA', description=f'Registro {i}')
+            AuditoriaService.registrar(AuditoriaAcceso, tipo_accion='login')
+            db.session.commit()
+            AuditoriaService.vaciar()
+
+            assert sorted(r.description for r in AuditLog.query.all()) == ['Registro 0', 'Registro 1', 'Registro 2']
+            assert AuditoriaAcceso.query.count() == 1
+
+    def test_cola_llena_escribe_en_la_peticion(self, app, init_database, monkeypatch):
+        monkeypatch.setitem(app.config, 'AUDITORIA_SINCRONO', False)
+        # Sin hilo: la cola de un lugar se llena con el primer registro
+        monkeypatch.setattr(AuditoriaService, '_iniciar', classmethod(lambda cls, app: None))
+        monkeypatch.setattr(AuditoriaService, '_cola', queue.Queue(maxsize=1))
+        with app.app_context():
+            AuditoriaService.registrar(AuditLog, action_type='PRUEBA', description='En cola')
+            AuditoriaService.registrar(AuditLog, action_type='PRUEBA', description='Desbordado')
+            db.session.commit()
+            assert [r.description for r in AuditLog.query.all()] == ['Desbordado']
+            assert AuditoriaService._cola.qsize() == 1
+
+    def test_lote_con_columnas_distintas(self, app, init_database):
+        with app.app_context():
+            usuario = Usuario.query.filter_by(username='testuser').first()
+            AuditoriaService.registrar(AuditoriaAcceso, tipo_accion='login', usuario_id=usuario.id)
+            AuditoriaService.registrar(AuditoriaAcceso, tipo_accion='crear_paciente', recurso_tipo='paciente',
+                                       recurso_id=7, metadatos={'origen': 'importacion'})
+            AuditoriaService.registrar(AuditoriaAcceso, tipo_accion='logout')
+            db.session.commit()  # Los tres van en el mismo lote
+
+            filas = {r.tipo_accion: r for r in AuditoriaAcceso.query.all()}
+            assert filas['login'].usuario_id == usuario.id and filas['login'].recurso_id is None
+            assert filas['crear_paciente'].recurso_id == 7
+            assert filas['crear_paciente'].metadatos == {'origen': 'importacion'}
+            assert filas['logout'].usuario_id is None and filas['logout'].timestamp is not None
+
+    def test_columna_desconocida_falla_al_registrar(self, app, init_database):
+        with app.app_context():
+            with pytest.raises(ValueError):
+                AuditoriaService.registrar(AuditLog, action_type='PRUEBA', description='x', recurso=1)
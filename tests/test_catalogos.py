@@ -0,0 +1,155 @@
+# tests/test_catalogos.py
+"""
+Pruebas para la caché en memoria de catálogos (EPS, municipios, CUPS, CIE10)
+"""
+
+import pytest
+from clinica.models import EPS, Municipio, CUPSCode, CIE10
+from clinica.services.catalogo_cache import CatalogoCache
+from clinica import db
+
+
+class TestCatalogoCache:
+    """Pruebas para CatalogoCache"""
+
+    def _sembrar(self):
+        db.session.add_all([
+            EPS(codigo='EPS037', nombre='Nueva EPS', activa=True),
+            EPS(codigo='EPS099', nombre='EPS Liquidada', activa=False),
+            Municipio(codigo='189', nombre='Ciénaga', codigo_departamento='47', nombre_departamento='Magdalena'),
+            Municipio(codigo='05001', nombre='Medellín', codigo_departamento='05', nombre_departamento='Antioquia'),
+        ])
+        db.session.commit()
+
+    def test_busquedas_desde_memoria(self, app, init_database):
+        """Prueba las búsquedas de EPS y municipio, incluido el código corto"""
+        with app.app_context():
+            self._sembrar()
+
+            assert CatalogoCache.buscar_eps('eps037').nombre == 'Nueva EPS'
+            assert CatalogoCache.buscar_eps('NOEXISTE') is None
+            assert [e.codigo for e in CatalogoCache.eps_activas()] == ['EPS037']
+
+            assert CatalogoCache.buscar_municipio('05001').nombre == 'Medellín'
+            # '47189' no existe, pero sí '189' en el departamento 47
+            municipio = CatalogoCache.buscar_municipio('47189', '47')
+            assert municipio.nombre == 'Ciénaga'
+            assert municipio.nombre_departamento == 'Magdalena'
+            # Con 3 dígitos el código corto es el mismo código: umbral > 2 o > 3 da lo mismo
+            assert CatalogoCache.buscar_municipio('189', '47').nombre == 'Ciénaga'
+            assert CatalogoCache.buscar_municipio('999', '47') is None
+
+            assert CatalogoCache.departamentos()[0] == {'codigo': '05', 'nombre': 'Antioquia'}
+
+    def test_recarga_al_incrementar_version(self, app, init_database):
+        """Prueba que un cambio de versión obliga a recargar el catálogo"""
+        with app.app_context():
+            self._sembrar()
+            assert CatalogoCache.buscar_eps('EPS037').nombre == 'Nueva EPS'
+
+            eps = EPS.query.filter_by(codigo='EPS037').first()
+            eps.nombre = 'Nueva EPS S.A.'
+            db.session.commit()
+
+            # Sin cambio de versión se sigue sirviendo la copia en memoria
+            assert CatalogoCache.buscar_eps('EPS037').nombre == 'Nueva EPS'
+
+            CatalogoCache.incrementar_version('eps')
+            assert CatalogoCache.buscar_eps('EPS037').nombre == 'Nueva EPS S.A.'
+            assert CatalogoCache.version('eps') == 1
+
+
+class TestBusquedaCatalogos:
+    """Pruebas para el índice en memoria de CUPS/CIE10 y sus endpoints"""
+
+    def _sembrar(self):
+        db.session.add_all([
+            CUPSCode(code='232101', description='Obturación dental con resina'),
+            CUPSCode(code='232102', description='Obturación dental con amalgama'),
+            CUPSCode(code='997002', description='Aplicación de sellantes de fotocurado'),
+            CIE10(codigo='K021', descripcion='Caries de la dentina', categoria='Enfermedades bucales'),
+        ])
+        db.session.commit()
+
+    def test_indice_prefijo_codigo_y_palabras(self, app, init_database):
+        """Prueba prefijo de código, palabras sin tildes y orden por relevancia"""
+        with app.app_context():
+            self._sembrar()
+
+            assert [c.code for c in CatalogoCache.buscar_cups('2321')] == ['232101', '232102']
+            assert [c.code for c in CatalogoCache.buscar_cups('232102')][0] == '232102'
+            # Sin tildes y con palabras incompletas
+            assert [c.code for c in CatalogoCache.buscar_cups('obturacion resi')] == ['232101']
+            assert [c.code for c in CatalogoCache.buscar_cups('APLICACIÓN')] == ['997002']
+            # Respaldo: subcadena en medio de palabra
+            assert [c.code for c in CatalogoCache.buscar_cups('fotocur')] == ['997002']
+            assert [c.code for c in CatalogoCache.buscar_cups('curado')] == ['997002']
+
+    def test_indice_completa_con_subcadena(self):
+        """Con pocos resultados por palabra, el respaldo por subcadena completa el límite"""
+        from clinica.services.indice_catalogo import IndiceCatalogo
+        indice = IndiceCatalogo([('A1', 'Curado simple'), ('B2', 'Fotocurado dental'), ('C3', 'Limpieza')],
+                                codigo=lambda i: i[0], descripcion=lambda i: i[1])
+        assert [i[0] for i in indice.buscar('curado')] == ['A1', 'B2']
+        assert [i[0] for i in indice.buscar('curado', limite=1)] == ['A1']
+
+    def test_endpoint_cups_etag(self, authenticated_client, app):
+        """Prueba que el endpoint conserva el formato y responde 304 con el mismo ETag"""
+        with app.app_context():
+            self._sembrar()
+
+        response = authenticated_client.get('/api/cups/search?q=amalgama')
+        assert response.status_code == 200
+        assert response.get_json() == [{
+            'code': '232102',
+            'description': 'Obturación dental con amalgama',
+            'label': '232102 - Obturación dental con amalgama'
+        }]
+        assert 'max-age' in response.headers['Cache-Control']
+        etag = response.headers['ETag']
+
+        response = authenticated_client.get('/api/cups/search?q=amalgama', headers={'If-None-Match': etag})
+        assert response.status_code == 304
+
+        response = authenticated_client.get('/api/procedimientos/buscar_cie10?q=caries')
+        assert response.get_json() == [{'val': 'K021', 'label': 'K021 - Caries de la dentina'}]
+
+
+class TestImportacionCatalogos:
+    """Carga masiva de catálogos con diferencias y upsert por lotes"""
+
+    def test_importar_solo_escribe_diferencias(self, app, init_database):
+        import pandas as pd
+        from clinica.services.importacion_catalogos import ImportacionCatalogos
+
+        with app.app_context():
+            fuente = pd.DataFrame({
+                'code': [' 890201 ', '890202', None, '890201'],
+                'description': ['Consulta general', 'Consulta especialista', 'sin código', 'Consulta odontológica'],
+            })
+            resumen = ImportacionCatalogos.importar('cups', fuente)
+            assert (resumen['nuevos'], resumen['actualizados']) == (2, 0)
+            # El código repetido conserva la última descripción
+            assert CUPSCode.query.filter_by(code='890201').one().description == 'Consulta odontológica'
+            version = CatalogoCache.version('cups')
+
+            # Misma fuente: nada que escribir ni versión nueva
+            resumen = ImportacionCatalogos.importar('cups', fuente)
+            assert (resumen['nuevos'], resumen['actualizados'], resumen['sin_cambios']) == (0, 0, 2)
+            assert CatalogoCache.version('cups') == version
+
+            fuente = pd.DataFrame({'code': ['890201'], 'description': ['Consulta de primera vez']})
+            resumen = ImportacionCatalogos.importar('cups', fuente, reemplazar=True)
+            assert (resumen['actualizados'], resumen['eliminados']) == (1, 1)
+            assert [c.code for c in CUPSCode.query.all()] == ['890201']
+            assert CatalogoCache.version('cups') == version + 1
+
+    def test_importar_columnas_nulas(self, app, init_database):
+        from clinica.services.importacion_catalogos import ImportacionCatalogos
+
+        with app.app_context():
+            filas = [('K02', 'Caries dental', None), ('K021', 'Caries de la dentina', 'Caries')]
+            fuente = ImportacionCatalogos.desde_tuplas('cie10', filas)
+            assert ImportacionCatalogos.importar('cie10', fuente)['nuevos'] == 2
+            # Una categoría nula no cuenta como cambio al reimportar
+            assert ImportacionCatalogos.importar('cie10', fuente)['actualizados'] == 0
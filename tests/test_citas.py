@@ -154,3 +154,206 @@ class TestCitas:
         
         response = authenticated_client.get(f'/calendario/historial_citas_paciente/{paciente_id}')
         assert response.status_code == 200
+
+    def test_calendario_agrupa_citas_del_mes(self, authenticated_client, init_database, app):
+        """Prueba que el calendario solo trae las citas del mes pedido (límites incluidos)"""
+        from clinica.models import Usuario
+        with app.app_context():
+            usuario = Usuario.query.filter_by(username='testuser').first()
+            for fecha, nombre in [(date(2025, 12, 31), 'Diciembre'), (date(2026, 1, 1), 'Primero'),
+                                  (date(2026, 1, 31), 'Ultimo'), (date(2026, 2, 1), 'Febrero')]:
+                db.session.add(Cita(
+                    paciente_nombres_str=f'Visitante{nombre}',
+                    fecha=fecha,
+                    hora=datetime(2026, 1, 1, 9, 30).time(),
+                    estado='pendiente',
+                    doctor='Dr. Test',
+                    odontologo_id=usuario.id
+                ))
+            db.session.commit()
+
+        response = authenticated_client.get('/calendario/?anio=2026&mes=1')
+        assert response.status_code == 200
+        assert b'VisitantePrimero' in response.data
+        assert b'VisitanteUltimo' in response.data
+        assert b'VisitanteDiciembre' not in response.data
+        assert b'VisitanteFebrero' not in response.data
+
+    def test_agenda_json_incremental(self, authenticated_client, init_database, app):
+        """Prueba la agenda JSON: rango, ETag/304 y cambios desde un cursor"""
+        from clinica.models import Usuario
+        with app.app_context():
+            usuario = Usuario.query.filter_by(username='testuser').first()
+            citas = [Cita(paciente_nombres_str=f'Agenda{i}', fecha=date(2026, 3, 10 + i),
+                          hora=datetime(2026, 1, 1, 8, 0).time(), estado='pendiente', doctor='Dr. Test',
+                          odontologo_id=usuario.id)
+                     for i in range(3)]
+            db.session.add_all(citas)
+            db.session.commit()
+            ids = [c.id for c in citas]
+
+        url = '/calendario/agenda?desde=2026-03-01&hasta=2026-04-01'
+        response = authenticated_client.get(url)
+        assert response.status_code == 200
+        datos = response.get_json()
+        assert [c['id'] for c in datos['citas']] == ids
+        assert datos['citas'][0]['fecha'] == '2026-03-10'
+        etag = response.headers['ETag']
+
+        # Sin cambios: 304
+        response = authenticated_client.get(url, headers={'If-None-Match': etag})
+        assert response.status_code == 304
+
+        with app.app_context():
+            db.session.get(Cita, ids[0]).motivo = 'Control'
+            db.session.get(Cita, ids[1]).is_deleted = True
+            db.session.get(Cita, ids[2]).fecha = date(2026, 5, 2)  # Sale del rango
+            db.session.commit()
+
+        response = authenticated_client.get(f"{url}&updated_since={datos['cursor']}",
+                                            headers={'If-None-Match': etag})
+        assert response.status_code == 200
+        delta = response.get_json()
+        assert delta['incremental'] is True
+        assert [c['id'] for c in delta['citas']] == [ids[0]]
+        assert delta['citas'][0]['motivo'] == 'Control'
+        assert sorted(delta['eliminadas']) == sorted(ids[1:])
+
+    def test_agenda_incremental_informa_borrados_definitivos(self, authenticated_client, init_database, app):
+        """Las citas borradas de la papelera (DELETE masivo) llegan en 'eliminadas'"""
+        from clinica.models import Usuario, Paciente
+        with app.app_context():
+            usuario = Usuario.query.filter_by(username='testuser').first()
+            paciente = Paciente(nombres='Borrar', apellidos='Definitivo', documento='88001122',
+                                telefono='3000000000', odontologo_id=usuario.id)
+            db.session.add(paciente)
+            db.session.flush()
+            cita = Cita(paciente_id=paciente.id, fecha=date(2026, 3, 12), hora=datetime(2026, 1, 1, 9, 0).time(),
+                        estado='pendiente', doctor='Dr. Test', odontologo_id=usuario.id)
+            db.session.add(cita)
+            db.session.commit()
+            paciente_id, cita_id = paciente.id, cita.id
+
+        url = '/calendario/agenda?desde=2026-03-01&hasta=2026-04-01'
+        datos = authenticated_client.get(url).get_json()
+        assert [c['id'] for c in datos['citas']] == [cita_id]
+
+        with app.app_context():
+            paciente = db.session.get(Paciente, paciente_id)
+            paciente.is_deleted = True
+            db.session.get(Cita, cita_id).is_deleted = True
+            db.session.commit()
+        cursor_papelera = authenticated_client.get(url).get_json()['cursor']
+        authenticated_client.post('/papelera/eliminar-permanente',
+                                  data={'target_model': 'Paciente', 'target_id': paciente_id})
+
+        delta = authenticated_client.get(f"{url}&updated_since={cursor_papelera}").get_json()
+        assert delta['incremental'] is True
+        assert delta['eliminadas'] == [cita_id]
+
+    def test_agenda_rango_invalido(self, authenticated_client):
+        """Verifica que la agenda rechaza rangos inválidos o demasiado largos"""
+        assert authenticated_client.get('/calendario/agenda?desde=2026-03-01').status_code == 400
+        assert authenticated_client.get('/calendario/agenda?desde=2026-01-01&hasta=2026-06-01').status_code == 400
+
+    def test_panel_inicio_se_invalida_al_guardar_cita(self, authenticated_client, init_database, app):
+        """Prueba que el panel de inicio (en caché) refleja una cita nueva de hoy"""
+        import pytz
+        hoy = datetime.now(pytz.timezone('America/Bogota')).date()
+
+        response = authenticated_client.get('/')
+        assert response.status_code == 200
+        assert b'VisitantePanel' not in response.data
+
+        from clinica.models import Usuario
+        with app.app_context():
+            usuario = Usuario.query.filter_by(username='testuser').first()
+            db.session.add(Cita(paciente_nombres_str='VisitantePanel', fecha=hoy,
+                                hora=datetime(2026, 1, 1, 23, 59).time(), estado='pendiente',
+                                doctor='Dr. Test', odontologo_id=usuario.id))
+            db.session.commit()
+
+        response = authenticated_client.get('/')
+        assert b'VisitantePanel' in response.data
+
+    def test_panel_invalida_ambos_odontologos_al_reasignar_paciente(self, init_database, app, monkeypatch):
+        """Al cambiar el odontólogo de un paciente se invalidan el panel anterior y el nuevo"""
+        from clinica.models import Usuario, Paciente
+        from clinica.services.panel_service import PanelService
+        with app.app_context():
+            anterior = Usuario.query.filter_by(username='testuser').first()
+            nuevo = Usuario(username='otro_odontologo', email='otro@example.com')
+            nuevo.set_password('x')
+            db.session.add(nuevo)
+            paciente = Paciente(nombres='Reasignado', apellidos='Uno', documento='99001122',
+                                telefono='3000000000', odontologo_id=anterior.id)
+            db.session.add(paciente)
+            db.session.commit()
+
+            invalidados = []
+            monkeypatch.setattr(PanelService, 'invalidar', staticmethod(invalidados.append))
+            ids = {anterior.id, nuevo.id}
+            paciente.odontologo_id = nuevo.id
+            db.session.commit()
+
+        assert invalidados == [ids]
+
+    def test_cita_de_admin_pertenece_al_odontologo_del_paciente(self, admin_client, init_database, app):
+        """Una cita que agenda el administrador queda a nombre del odontólogo del paciente"""
+        from clinica.models import Usuario
+        with app.app_context():
+            usuario = Usuario.query.filter_by(username='testuser').first()
+            paciente = Paciente(nombres='Dueño', apellidos='Cita', documento='77001122',
+                                telefono='3000000000', odontologo_id=usuario.id)
+            db.session.add(paciente)
+            db.session.commit()
+            paciente_id, usuario_id = paciente.id, usuario.id
+
+        admin_client.post('/calendario/registrar_cita', data={
+            'paciente_id': paciente_id, 'fecha': '2026-03-10', 'hora': '09:00', 'doctor': 'Dr. Test'})
+
+        with app.app_context():
+            cita = Cita.query.filter_by(paciente_id=paciente_id).one()
+            assert cita.odontologo_id == usuario_id
+
+    def test_cita_sin_paciente_no_es_visible_para_otro_odontologo(self, client, admin_client, init_database, app):
+        """La cita de un visitante sin ficha es de quien la agenda y no aparece en otras agendas"""
+        admin_client.post('/calendario/registrar_cita', data={
+            'paciente_nombres_str': 'Visitante', 'paciente_apellidos_str': 'Ajeno',
+            'paciente_telefono_str': '3000000000', 'fecha': '2026-03-10', 'hora': '09:00',
+            'doctor': 'Dr. Test'})
+        with app.app_context():
+            assert Cita.query.filter_by(paciente_nombres_str='Visitante').count() == 1
+        client.get('/logout')
+        client.post('/login', data={'usuario': 'testuser', 'contrasena': 'password123'})
+
+        datos = client.get('/calendario/agenda?desde=2026-03-01&hasta=2026-04-01').get_json()
+        assert datos['citas'] == []
+
+    def test_citas_siguen_al_paciente_reasignado(self, init_database, app):
+        """Al reasignar un paciente, sus citas pasan al nuevo odontólogo"""
+        from clinica.models import Usuario
+        with app.app_context():
+            anterior = Usuario.query.filter_by(username='testuser').first()
+            nuevo = Usuario.query.filter_by(username='admin').first()
+            paciente = Paciente(nombres='Traslado', apellidos='Citas', documento='66001122',
+                                telefono='3000000000', odontologo_id=anterior.id)
+            db.session.add(paciente)
+            db.session.flush()
+            # Sin odontologo_id explícito: se toma del paciente al insertar
+            cita = Cita(paciente_id=paciente.id, fecha=date(2026, 3, 10),
+                        hora=datetime(2026, 1, 1, 9, 0).time(), estado='pendiente', doctor='Dr. Test')
+            db.session.add(cita)
+            db.session.commit()
+            assert cita.odontologo_id == anterior.id
+
+            paciente.odontologo_id = nuevo.id
+            db.session.commit()
+            db.session.expire_all()
+            assert db.session.get(Cita, cita.id).odontologo_id == nuevo.id
+
+    def test_fechas_en_espanol_sin_locale(self):
+        """Verifica el formateo de fechas con las tablas en español"""
+        from clinica.utils import strftime_es
+        assert strftime_es(date(2026, 10, 16), '%A, %d de %B de %Y') == 'viernes, 16 de octubre de 2026'
+        assert strftime_es(date(2026, 1, 5), '%d %b, %Y') == '05 ene, 2026'
@@ -0,0 +1,76 @@
+# tests/test_indices.py
+"""
+Los índices compuestos y parciales (migración a2c9e7d4b816) deben ser los que
+usan las consultas de las rutas frecuentes. Se capturan las sentencias que
+ejecuta cada ruta y se pasa cada una por EXPLAIN.
+"""
+
+import pytest
+from sqlalchemy import event, text
+
+from clinica import db
+from tests.benchmarks.generador import CONTRASENA, generar_clinica
+
+# (ruta, índices que deben aparecer en algún plan); {paciente} = paciente del primer odontólogo
+RUTAS = [
+    ('/pacientes/lista', ['idx_paciente_odontologo_activos']),
+    ('/pacientes/selector_ajax', ['idx_paciente_odontologo_apellidos']),
+    ('/calendario/historial_citas_paciente/{paciente}', ['idx_cita_paciente_fecha', 'idx_cita_paciente_sin_factura']),
+    ('/pacientes/obtener_paciente_ajax/{paciente}', ['idx_cita_paciente_fecha']),
+    ('/pacientes/{paciente}', ['idx_evolucion_paciente_fecha']),
+    ('/', ['idx_cita_odontologo_fecha', 'idx_cita_factura']),
+    ('/ingresos', ['idx_factura_fecha']),
+]
+
+
+def _plan(conexion, sentencia, parametros):
+    """Texto del plan de la sentencia (índices usados incluidos)."""
+    if conexion.dialect.name == 'postgresql':
+        # Con tablas pequeñas Postgres prefiere recorrerlas completas
+        conexion.exec_driver_sql('SET LOCAL enable_seqscan = off')
+        filas = conexion.exec_driver_sql('EXPLAIN ' + sentencia, parametros).fetchall()
+        return '\n'.join(fila[0] for fila in filas)
+    filas = conexion.exec_driver_sql('EXPLAIN QUERY PLAN ' + sentencia, parametros).fetchall()
+    return '\n'.join(fila[-1] for fila in filas)
+
+
+@pytest.fixture
+def clinica_pequena(app, init_database):
+    """Varios odontólogos: con uno solo el índice por odontólogo no filtraría nada."""
+    with app.app_context():
+        datos = generar_clinica(odontologos=6, pacientes_por_odontologo=40, citas_por_paciente=3,
+                                codigos_cups=20, codigos_cie10=20)
+        # Estadísticas para el planificador, como las que mantiene autovacuum en producción
+        db.session.execute(text('ANALYZE'))
+        db.session.commit()
+    cliente = app.test_client()
+    cliente.post('/login', data={'usuario': datos['usuarios'][0], 'contrasena': CONTRASENA})
+    return cliente, datos
+
+
+class TestIndicesRutas:
+    """Cada ruta frecuente resuelve sus filtros con un índice"""
+
+    @pytest.mark.parametrize('ruta, indices', RUTAS)
+    def test_ruta_usa_indice(self, app, clinica_pequena, ruta, indices):
+        cliente, datos = clinica_pequena
+        capturadas = []
+
+        def capturar(conn, cursor, sentencia, parametros, context, executemany):
+            if sentencia.lstrip().upper().startswith('SELECT') and not executemany:
+                capturadas.append((sentencia, parametros))
+
+        with app.app_context():
+            motor = db.engine
+        event.listen(motor, 'before_cursor_execute', capturar)
+        try:
+            respuesta = cliente.get(ruta.format(paciente=datos['paciente_muestra']))
+        finally:
+            event.remove(motor, 'before_cursor_execute', capturar)
+        assert respuesta.status_code == 200
+
+        with app.app_context():
+            with db.engine.connect() as conexion:
+                planes = '\n'.join(_plan(conexion, sentencia, parametros) for sentencia, parametros in capturadas)
+        for indice in indices:
+            assert indice in planes, f'{ruta} no usa {indice}:\n{planes}'
@@ -0,0 +1,38 @@
+# tests/test_instrumentacion.py
+"""
+Pruebas de la instrumentación por petición y de /admin/metricas
+"""
+
+import logging
+
+from clinica.instrumentacion import EstadisticasEndpoints
+
+
+class TestInstrumentacion:
+    """Consultas y tiempos agregados por endpoint"""
+
+    def test_metricas_por_endpoint(self, app, admin_client):
+        EstadisticasEndpoints.reiniciar()
+        admin_client.get('/pacientes/lista')
+        admin_client.get('/pacientes/lista')
+
+        respuesta = admin_client.get('/admin/metricas')
+        assert respuesta.status_code == 200
+        filas = {fila['endpoint']: fila for fila in respuesta.get_json()['endpoints']}
+        lista = filas['pacientes.lista_pacientes']
+        assert lista['peticiones'] == 2
+        assert lista['consultas_max'] >= 1
+        assert lista['bytes_promedio'] > 0
+
+    def test_solo_admin(self, authenticated_client):
+        assert authenticated_client.get('/admin/metricas').status_code == 403
+
+    def test_peticion_lenta_en_log(self, app, admin_client, caplog):
+        app.config['INSTRUMENTACION_UMBRAL_CONSULTAS'] = 1
+        try:
+            with caplog.at_level(logging.WARNING, logger=app.logger.name):
+                admin_client.get('/pacientes/lista')
+        finally:
+            app.config['INSTRUMENTACION_UMBRAL_CONSULTAS'] = 50
+        registro = next(r.getMessage() for r in caplog.records if 'PETICION_LENTA' in r.getMessage())
+        assert 'pacientes.lista_pacientes' in registro and 'SELECT' in registro
@@ -3,6 +3,8 @@
 Pruebas para el módulo de pacientes
 """
 
+import re
+
 import pytest
 from datetime import date
 from clinica.models import Paciente
@@ -124,3 +126,498 @@ class TestPacientes:
         response = authenticated_client.get('/pacientes/99999/editar')
         # Debe redirigir o mostrar error 404
         assert response.status_code in [302, 404]
+    
+    def test_sugerencias_ignoran_tildes_y_mayusculas(self, authenticated_client, init_database, app):
+        """La búsqueda del autocompletado encuentra 'María' escribiendo 'maria'"""
+        with app.app_context():
+            from clinica.models import Usuario
+            usuario = Usuario.query.filter_by(username='testuser').first()
+            db.session.add(Paciente(nombres='María José', apellidos='Peña', documento='55443322',
+                                    telefono='3000000000', odontologo_id=usuario.id))
+            db.session.commit()
+        
+        response = authenticated_client.get('/pacientes/buscar_sugerencias_ajax?q=maria pena')
+        assert response.status_code == 200
+        assert [s['nombre'] for s in response.get_json()] == ['María José Peña']
+    
+    def test_sugerencias_por_prefijo_de_documento(self, authenticated_client, init_database, app):
+        """Un prefijo de documento trae primero la coincidencia de documento"""
+        with app.app_context():
+            from clinica.models import Usuario
+            usuario = Usuario.query.filter_by(username='testuser').first()
+            db.session.add(Paciente(nombres='Luis', apellidos='Vega', documento='98765432',
+                                    telefono='3000000000', odontologo_id=usuario.id))
+            db.session.add(Paciente(nombres='Ana', apellidos='Ríos', documento='11198765',
+                                    telefono='3000000000', odontologo_id=usuario.id))
+            db.session.commit()
+        
+        response = authenticated_client.get('/pacientes/buscar_sugerencias_ajax?q=9876')
+        nombres = [s['nombre'] for s in response.get_json()]
+        assert nombres[0] == 'Luis Vega'
+        assert 'Ana Ríos' in nombres
+    
+    def test_perfil_paciente_consultas_fijas(self, authenticated_client, init_database, app):
+        """El perfil se arma con dos consultas (paciente + evoluciones), sin importar cuántas evoluciones haya"""
+        from datetime import datetime
+        from clinica.models import Usuario, Evolucion, EPS
+        from clinica.instrumentacion import contar_consultas
+        from clinica.routes.pacientes_services import obtener_paciente_service
+        with app.app_context():
+            usuario = Usuario.query.filter_by(username='testuser').first()
+            db.session.add(EPS(codigo='EPS001', nombre='EPS Prueba', activa=True))
+            paciente = Paciente(nombres='Rosa', apellidos='Díaz', documento='77001122', telefono='3000000000',
+                                codigo_aseguradora='EPS001', odontologo_id=usuario.id)
+            db.session.add(paciente)
+            db.session.flush()
+            for dia in (3, 1, 2):
+                db.session.add(Evolucion(paciente_id=paciente.id, descripcion=f'Control día {dia}',
+                                         fecha=datetime(2026, 3, dia, 10, 0)))
+            db.session.commit()
+
+            obtener_paciente_service(paciente.id, usuario)  # Calienta la caché de catálogos
+            with contar_consultas() as consultas:
+                datos, evoluciones, _ = obtener_paciente_service(paciente.id, usuario)
+
+        assert consultas.total == 2
+        assert datos['aseguradora'] == 'EPS Prueba'
+        assert [e['descripcion'] for e in evoluciones] == ['Control día 3', 'Control día 2', 'Control día 1']
+
+
+class TestSubidasPaciente:
+    """Subida de imágenes en segundo plano (SubidaService) con el backend local"""
+
+    @pytest.fixture
+    def subidas_locales(self, app, monkeypatch, tmp_path):
+        monkeypatch.setitem(app.config, 'UPLOAD_BACKEND', 'local')
+        monkeypatch.setitem(app.config, 'SUBIDAS_DIR', str(tmp_path / 'spool'))
+        monkeypatch.setitem(app.config, 'SUBIDAS_LOCAL_DIR', str(tmp_path / 'uploads'))
+        monkeypatch.setitem(app.config, 'SUBIDAS_ESPERA_BASE', 0)
+        return tmp_path
+
+    def test_crear_paciente_sube_imagenes_y_actualiza_urls(self, app, init_database, subidas_locales):
+        import base64
+        from io import BytesIO
+        from werkzeug.datastructures import FileStorage
+        from clinica.models import Usuario
+        from clinica.routes.pacientes_services import crear_paciente_service
+        png = base64.b64encode(b'\x89PNG dentigrama').decode()
+        with app.test_request_context():
+            usuario = Usuario.query.filter_by(username='testuser').first()
+            resultado = crear_paciente_service(
+                {'documento': '55001122', 'primer_nombre': 'Luz', 'primer_apellido': 'Mora', 'telefono': '3000000000',
+                 'dentigrama_canvas': f'data:image/png;base64,{png}'},
+                {'imagen_perfil': FileStorage(BytesIO(b'foto'), filename='perfil.jpg')},
+                usuario
+            )
+            assert resultado['success']
+            paciente = db.session.get(Paciente, resultado['paciente_id'])
+            db.session.refresh(paciente)
+
+        assert paciente.imagen_perfil_url.startswith('/static/uploads/pacientes_perfil/')
+        assert paciente.dentigrama_canvas == f"/static/uploads/dentigramas_pacientes/dentigrama_paciente_{paciente.id}.png"
+        subido = subidas_locales / 'uploads' / 'dentigramas_pacientes' / f"dentigrama_paciente_{paciente.id}.png"
+        assert subido.read_bytes() == b'\x89PNG dentigrama'
+        # En el spool solo quedan los manifiestos con la URL final
+        assert all(p.suffix == '.json' for p in (subidas_locales / 'spool').iterdir())
+
+    def test_un_intento_en_la_peticion_y_reintentos_en_segundo_plano(self, app, authenticated_client, init_database,
+                                                          subidas_locales, monkeypatch):
+        from clinica.models import Usuario
+        from clinica.services.subidas_service import SubidaService
+
+        class BackendCaido:
+            intentos = 0
+
+            def subir(self, ruta, carpeta, public_id=None):
+                BackendCaido.intentos += 1
+                raise ConnectionError('sin red')
+
+        monkeypatch.setattr(SubidaService, 'backend', staticmethod(BackendCaido))
+        with app.test_request_context():
+            usuario = Usuario.query.filter_by(username='testuser').first()
+            paciente = Paciente(nombres='Eva', apellidos='Gil', documento='55003344',
+                                telefono='3000000000', odontologo_id=usuario.id)
+            db.session.add(paciente)
+            db.session.commit()
+            paciente_id = paciente.id
+
+        respuesta = authenticated_client.post('/pacientes/upload_dentigrama', json={'image_data': 'data:image/png;base64,aG9sYQ=='})
+        url_spool = respuesta.get_json()['url']
+        with app.test_request_context():
+            paciente = db.session.get(Paciente, paciente_id)
+            paciente.dentigrama_canvas = url_spool
+            db.session.commit()
+            SubidaService.programar_pendientes(paciente)
+            db.session.refresh(paciente)
+            assert paciente.dentigrama_canvas == url_spool
+
+        # Dentro de la petición no se reintenta ni se espera
+        assert BackendCaido.intentos == 1
+        # La URL provisional sigue sirviendo la imagen desde el spool
+        assert authenticated_client.get(url_spool).data == b'hola'
+
+        # El spool en segundo plano sí reintenta (como al reencolar una subida fallida)
+        token = SubidaService.token_de_url(url_spool)
+        with app.app_context():
+            manifiesto = SubidaService._leer_manifiesto(token)
+            assert manifiesto['estado'] == 'fallida'
+            SubidaService._escribir_manifiesto(token, {**manifiesto, 'estado': 'pendiente'})
+        SubidaService._subir(app, token)
+        assert BackendCaido.intentos == 1 + app.config.get('SUBIDAS_REINTENTOS', 4)
+
+    def test_spool_solo_acepta_y_sirve_imagenes(self, app, authenticated_client, subidas_locales):
+        from clinica.services.subidas_service import SubidaService
+        with app.test_request_context():
+            for cabecera in ('data:image/html', 'data:image/svg+xml', 'data:image/../x', 'data:image'):
+                assert SubidaService.guardar_base64(f'{cabecera};base64,PHNjcmlwdD4=') is None
+
+        respuesta = authenticated_client.post('/pacientes/upload_dentigrama',
+                                              json={'image_data': 'data:image/jpeg;base64,aG9sYQ=='})
+        respuesta = authenticated_client.get(respuesta.get_json()['url'])
+        assert respuesta.mimetype == 'image/jpeg'
+        assert respuesta.headers['X-Content-Type-Options'] == 'nosniff'
+
+
+class TestDentigramaEstado:
+    """Odontograma guardado como estado JSON y dibujado en el servidor"""
+
+    def _crear_paciente(self, app):
+        from clinica.models import Usuario
+        with app.test_request_context():
+            usuario = Usuario.query.filter_by(username='testuser').first()
+            paciente = Paciente(nombres='Luz', apellidos='Mar', documento='55009911',
+                                telefono='3000000000', odontologo_id=usuario.id)
+            db.session.add(paciente)
+            db.session.commit()
+            return paciente.id
+
+    def test_estado_igual_no_cambia_hash(self, app, authenticated_client):
+        paciente_id = self._crear_paciente(app)
+        estado = {'dientes': {'16': {'caras': {'oclusal': 'caries'}, 'marcas': ['corona', 'endodoncia']}}}
+
+        primera = authenticated_client.post(f'/pacientes/{paciente_id}/dentigrama', json={'estado': estado})
+        assert primera.status_code == 200
+        assert primera.get_json()['sin_cambios'] is False
+
+        # Mismo contenido en otro orden: mismo hash, sin escritura
+        estado['dientes']['16']['marcas'] = ['endodoncia', 'corona']
+        segunda = authenticated_client.post(f'/pacientes/{paciente_id}/dentigrama', json={'estado': estado})
+        assert segunda.get_json()['sin_cambios'] is True
+        assert segunda.get_json()['hash'] == primera.get_json()['hash']
+
+        imagen = authenticated_client.get(primera.get_json()['url'])
+        assert imagen.status_code == 200
+        assert imagen.mimetype == 'image/svg+xml'
+        assert 'immutable' in imagen.headers['Cache-Control']
+        assert b'#dc3545' in imagen.data and b'ENDO' in imagen.data
+
+        revalidada = authenticated_client.get(primera.get_json()['url'],
+                                              headers={'If-None-Match': imagen.headers['ETag']})
+        assert revalidada.status_code == 304
+
+    def test_estado_invalido_rechazado(self, app, authenticated_client):
+        paciente_id = self._crear_paciente(app)
+        respuesta = authenticated_client.post(f'/pacientes/{paciente_id}/dentigrama',
+                                              json={'estado': {'dientes': {'99': {'marcas': ['corona']}}}})
+        assert respuesta.status_code == 400
+        with app.app_context():
+            assert db.session.get(Paciente, paciente_id).dentigrama_estado is None
+
+
+class TestPaginacionKeyset:
+    """Listas de pacientes y papelera paginadas por cursor"""
+
+    def _sembrar(self, app, cantidad=16, prefijo='77'):
+        from datetime import datetime, timedelta
+        from clinica.models import Usuario
+        with app.app_context():
+            usuario = Usuario.query.filter_by(username='testuser').first()
+            for i in range(cantidad):
+                db.session.add(Paciente(nombres=f'Ana {i}', apellidos='Ruiz', documento=f'{prefijo}00{i:03d}',
+                                        telefono='3000000000', odontologo_id=usuario.id,
+                                        is_deleted=i % 4 == 0,
+                                        deleted_at=datetime(2026, 1, 1) + timedelta(days=i) if i % 8 == 0 else None))
+            db.session.commit()
+            return usuario.id
+
+    def test_recorrido_completo_sin_repetir(self, app, init_database):
+        from clinica.models import Usuario
+        from clinica.routes.pacientes_services import listar_pacientes_service
+        usuario_id = self._sembrar(app)
+        with app.test_request_context():
+            usuario = db.session.get(Usuario, usuario_id)
+            esperados = [p.id for p in Paciente.query.filter_by(is_deleted=False).order_by(Paciente.id.desc())]
+
+            paginas, cursor = [], None
+            while True:
+                pagina = listar_pacientes_service(usuario, cursor, '', por_pagina=5)
+                paginas.append([p.id for p in pagina.items])
+                if not pagina.hay_siguiente:
+                    break
+                cursor = pagina.cursor_siguiente
+            assert sum(paginas, []) == esperados
+            assert pagina.total == len(esperados)
+
+            # Volver desde la última página da la penúltima
+            anterior = listar_pacientes_service(usuario, pagina.cursor_anterior, '', por_pagina=5)
+            assert [p.id for p in anterior.items] == paginas[-2]
+
+            # Un cursor manipulado se ignora y se muestra la primera página
+            assert [p.id for p in listar_pacientes_service(usuario, 'xx', '', por_pagina=5).items] == paginas[0]
+
+    def test_cursor_con_valores_de_otro_tipo_se_ignora(self, app, init_database):
+        from datetime import datetime
+        from sqlalchemy import func
+        from clinica.models import Usuario
+        from clinica.paginacion import codificar_cursor, decodificar_cursor
+        from clinica.routes.pacientes_services import listar_pacientes_service
+        from clinica.services.busqueda_service import BusquedaService
+        usuario_id = self._sembrar(app)
+        por_id = [(Paciente.id, True)]
+        papelera = [(func.coalesce(Paciente.deleted_at, datetime(1970, 1, 1)), True), (Paciente.id, True)]
+        busqueda = BusquedaService.orden_paginado('ana')
+        with app.test_request_context():
+            # Bien formados (base64 + JSON) pero con tipos que no son los de la clave
+            assert decodificar_cursor(codificar_cursor('s', ['abc']), por_id) is None
+            assert decodificar_cursor(codificar_cursor('s', [True]), por_id) is None
+            assert decodificar_cursor(codificar_cursor('s', [None]), por_id) is None
+            assert decodificar_cursor(codificar_cursor('s', ['2026-01-01', 5]), papelera) is None
+            assert decodificar_cursor(codificar_cursor('s', [datetime(2026, 1, 1), '5']), papelera) is None
+            assert decodificar_cursor(codificar_cursor('s', [0, ['Ruiz'], 5]), busqueda) is None
+            # Los que genera la paginación siguen valiendo
+            assert decodificar_cursor(codificar_cursor('a', [12]), por_id) == ('a', [12])
+            assert decodificar_cursor(codificar_cursor('s', [datetime(2026, 1, 1), 5]), papelera) is not None
+            assert decodificar_cursor(codificar_cursor('s', [0, 'Ruiz', 5]), busqueda) is not None
+
+            usuario = db.session.get(Usuario, usuario_id)
+            primera = [p.id for p in listar_pacientes_service(usuario, None, '', por_pagina=5).items]
+            manipulado = codificar_cursor('s', ['abc'])
+            assert [p.id for p in listar_pacientes_service(usuario, manipulado, '', por_pagina=5).items] == primera
+
+    def test_papelera_paginada(self, app, authenticated_client):
+        self._sembrar(app, cantidad=45)
+        respuesta = authenticated_client.get('/papelera/')
+        assert respuesta.status_code == 200
+        assert b'cursor_pacientes=' not in respuesta.data  # 12 en papelera: una sola página
+
+        self._sembrar(app, cantidad=45, prefijo='78')
+        respuesta = authenticated_client.get('/papelera/')
+        assert b'cursor_pacientes=' in respuesta.data
+        cursor = re.search(rb'cursor_pacientes=([\w-]+)', respuesta.data).group(1).decode()
+        segunda = authenticated_client.get(f'/papelera/?cursor_pacientes={cursor}')
+        assert segunda.status_code == 200 and b'cursor_pacientes=' in segunda.data  # enlace "más recientes"
+        assert authenticated_client.get('/pacientes/lista?buscar=ana').status_code == 200
+
+
+class TestBorradosImagenes:
+    """Bandeja de salida de borrados en Cloudinary (BorradoService)"""
+
+    @pytest.fixture
+    def backend_falso(self, app, monkeypatch):
+        from clinica.services.subidas_service import SubidaService
+
+        class BackendFalso:
+            lotes = []
+            error = None
+
+            def borrar(self, public_ids):
+                BackendFalso.lotes.append(list(public_ids))
+                return {public_id: BackendFalso.error for public_id in public_ids}
+
+        monkeypatch.setattr(SubidaService, 'backend', staticmethod(BackendFalso))
+        monkeypatch.setitem(app.config, 'BORRADOS_ESPERA_BASE', 0)
+        return BackendFalso
+
+    def _paciente_en_papelera(self, app):
+        from clinica.models import Usuario
+        base = 'https://res.cloudinary.com/demo/image/upload/v1/paciente_imagenes'
+        usuario = Usuario.query.filter_by(username='testuser').first()
+        paciente = Paciente(nombres='Olga', apellidos='Paz', documento='66001122', telefono='3000000000',
+                            odontologo_id=usuario.id, is_deleted=True,
+                            imagen_1=f'{base}/uno.jpg', imagen_2=f'{base}/dos.jpg',
+                            dentigrama_canvas='https://res.cloudinary.com/demo/image/upload/v1/dentigramas_pacientes/d.png')
+        db.session.add(paciente)
+        db.session.commit()
+        return paciente.id
+
+    def test_borrado_permanente_borra_imagenes_en_un_lote(self, app, authenticated_client, init_database, backend_falso):
+        from clinica.models import BorradoPendiente
+        with app.app_context():
+            paciente_id = self._paciente_en_papelera(app)
+
+        authenticated_client.post('/papelera/eliminar-permanente',
+                                  data={'target_model': 'Paciente', 'target_id': paciente_id})
+
+        assert backend_falso.lotes == [['dentigramas_pacientes/d', 'paciente_imagenes/dos', 'paciente_imagenes/uno']]
+        with app.app_context():
+            assert db.session.get(Paciente, paciente_id) is None
+            assert BorradoPendiente.query.count() == 0
+
+    def test_fallo_se_reintenta(self, app, authenticated_client, init_database, backend_falso):
+        from clinica.models import BorradoPendiente
+        from clinica.services.borrados_service import BorradoService
+        backend_falso.error = 'rate limited'
+        with app.app_context():
+            paciente_id = self._paciente_en_papelera(app)
+
+        authenticated_client.post('/papelera/eliminar-permanente',
+                                  data={'target_model': 'Paciente', 'target_id': paciente_id})
+
+        with app.app_context():
+            metricas = BorradoService.metricas()
+            assert metricas['pendientes'] == 3 and metricas['con_error'] == 3
+            # Una sola pasada por drenado: el lote fallido no se reintenta en la misma
+            assert len(backend_falso.lotes) == 1
+            assert {b.intentos for b in BorradoPendiente.query} == {1}
+            assert BorradoPendiente.query.first().ultimo_error == 'rate limited'
+
+            backend_falso.error = None
+            BorradoService.drenar(app)
+            assert BorradoService.metricas()['pendientes'] == 0
+
+
+class TestSelectorPacientes:
+    """Selector asíncrono de pacientes (editar cita)"""
+
+    def _sembrar(self, app, cantidad):
+        from datetime import time
+        from clinica.models import Usuario, Cita
+        with app.app_context():
+            usuario = Usuario.query.filter_by(username='testuser').first()
+            admin = Usuario.query.filter_by(username='admin').first()
+            for i in range(cantidad):
+                db.session.add(Paciente(nombres=f'Luis {i:02d}', apellidos=f'Zapata {i % 3}',
+                                        documento=f'6600{i:03d}', telefono='3000000000',
+                                        odontologo_id=usuario.id, is_deleted=i == 5))
+            db.session.add(Paciente(nombres='Ajeno', apellidos='Otro', documento='99999', telefono='3000000000',
+                                    odontologo_id=admin.id))
+            db.session.flush()
+            paciente = Paciente.query.filter_by(documento='6600007').first()
+            cita = Cita(paciente_id=paciente.id, odontologo_id=usuario.id, fecha=date(2026, 5, 4),
+                        hora=time(9, 0), doctor='Dr. Test', estado='pendiente')
+            db.session.add(cita)
+            db.session.commit()
+            return cita.id, paciente.id
+
+    def test_recorre_paginas_en_orden_alfabetico(self, app, authenticated_client):
+        self._sembrar(app, cantidad=45)
+        with app.app_context():
+            esperados = [p.id for p in Paciente.query.filter(Paciente.is_deleted == False,
+                                                             Paciente.nombres != 'Ajeno')
+                         .order_by(Paciente.apellidos, Paciente.nombres, Paciente.id)]
+
+        vistos, cursor = [], None
+        while True:
+            datos = authenticated_client.get('/pacientes/selector_ajax' + (f'?cursor={cursor}' if cursor else '')).get_json()
+            assert len(datos['resultados']) <= 20
+            vistos += [fila['id'] for fila in datos['resultados']]
+            cursor = datos['cursor_siguiente']
+            if not cursor:
+                break
+        assert vistos == esperados  # sin borrados ni pacientes de otro odontólogo
+
+    def test_busqueda_y_preseleccion(self, app, authenticated_client):
+        _, paciente_id = self._sembrar(app, cantidad=12)
+        datos = authenticated_client.get(f'/pacientes/selector_ajax?q=6600011&seleccionado={paciente_id}').get_json()
+        assert [fila['nombre'] for fila in datos['resultados']] == ['Luis 11 Zapata 2']
+        assert datos['seleccionado'] == {'id': paciente_id, 'nombre': 'Luis 07 Zapata 1', 'documento': '6600007'}
+
+        ajeno = authenticated_client.get('/pacientes/selector_ajax?q=ajeno').get_json()
+        assert ajeno['resultados'] == []
+
+    def test_editar_cita_no_carga_todos_los_pacientes(self, app, authenticated_client):
+        from clinica.instrumentacion import contar_consultas
+        cita_id, _ = self._sembrar(app, cantidad=30)
+        with contar_consultas() as consultas:
+            respuesta = authenticated_client.get(f'/calendario/editar_cita/{cita_id}')
+        assert respuesta.status_code == 200
+        html = respuesta.get_data(as_text=True)
+        assert 'value="Luis 07 Zapata 1"' in html
+        assert 'Luis 08' not in html and '<option' not in html
+        # Ninguna consulta sobre pacientes además de la cita con su paciente (y sus procedimientos)
+        assert sum('FROM pacientes' in sentencia for sentencia in consultas.sentencias) <= 1
+
+
+class TestResumenPaciente:
+    """Tarjeta de resumen (obtener_paciente_ajax) en una consulta y con caché por paciente"""
+
+    def _sembrar(self, app):
+        from datetime import date, time
+        from clinica.models import Usuario, Cita
+        with app.app_context():
+            usuario = Usuario.query.filter_by(username='testuser').first()
+            paciente = Paciente(nombres='Marta', apellidos='Gil', documento='55001122',
+                                telefono='3000000000', odontologo_id=usuario.id)
+            db.session.add(paciente)
+            db.session.flush()
+            for fecha, hora, motivo in [(date(2026, 3, 1), time(9, 0), 'Limpieza'),
+                                        (date(2026, 3, 5), time(9, 0), 'Control'),
+                                        (date(2026, 3, 10), time(8, 0), 'Control'),
+                                        (date(2026, 3, 10), time(15, 0), 'Resina'),
+                                        (date(2026, 3, 20), time(10, 0), 'Control')]:
+                db.session.add(Cita(paciente_id=paciente.id, fecha=fecha, hora=hora, motivo=motivo,
+                                    estado='pendiente', doctor='Dr. Test'))
+            db.session.commit()
+            return paciente.id
+
+    def test_una_consulta_y_luego_ninguna(self, app, init_database):
+        from datetime import datetime
+        from clinica.models import Usuario
+        from clinica.instrumentacion import contar_consultas
+        from clinica.services.resumen_paciente_service import ResumenPacienteService
+        paciente_id = self._sembrar(app)
+        ahora = datetime(2026, 3, 10, 12, 0)
+        with app.app_context():
+            usuario = Usuario.query.filter_by(username='testuser').first()
+            with contar_consultas() as consultas:
+                tarjeta = ResumenPacienteService.obtener(paciente_id, usuario, ahora=ahora)
+            assert consultas.total == 1
+            with contar_consultas() as consultas:
+                assert ResumenPacienteService.obtener(paciente_id, usuario, ahora=ahora) == tarjeta
+            assert consultas.total == 0
+
+        assert tarjeta['nombre'] == 'Marta Gil'
+        # Las citas de hoy ya pasadas no cuentan como "última" (solo días anteriores)
+        assert tarjeta['ultima_cita_info'].startswith('05 ') and tarjeta['ultima_cita_info'].endswith('- Control')
+        assert tarjeta['proxima_cita_paciente_info'].endswith('a las 03:00 PM (Resina)')
+        assert tarjeta['motivo_frecuente_info'] == 'Control'
+
+    def test_vence_cuando_pasa_la_proxima_cita_de_hoy(self, app, init_database):
+        from datetime import datetime
+        from clinica.models import Usuario
+        from clinica.services.resumen_paciente_service import ResumenPacienteService
+        paciente_id = self._sembrar(app)
+        with app.app_context():
+            usuario = Usuario.query.filter_by(username='testuser').first()
+            ResumenPacienteService.obtener(paciente_id, usuario, ahora=datetime(2026, 3, 10, 12, 0))
+            tarjeta = ResumenPacienteService.obtener(paciente_id, usuario, ahora=datetime(2026, 3, 10, 15, 30))
+        assert tarjeta['proxima_cita_paciente_info'].endswith('(Control)')
+
+    def test_se_invalida_al_guardar_cita(self, app, authenticated_client):
+        from clinica.models import Cita
+        paciente_id = self._sembrar(app)
+        url = f'/pacientes/obtener_paciente_ajax/{paciente_id}'
+        assert authenticated_client.get(url).get_json()['motivo_frecuente_info'] == 'Control'
+
+        with app.app_context():
+            for cita in Cita.query.filter_by(paciente_id=paciente_id, motivo='Control').all():
+                cita.motivo = 'Ortodoncia'
+            db.session.commit()
+
+        assert authenticated_client.get(url).get_json()['motivo_frecuente_info'] == 'Ortodoncia'
+
+    def test_otro_odontologo_recibe_404_aunque_este_en_cache(self, app, client, admin_client):
+        from clinica.models import Usuario
+        paciente_id = self._sembrar(app)
+        url = f'/pacientes/obtener_paciente_ajax/{paciente_id}'
+        assert admin_client.get(url).status_code == 200
+        client.get('/logout')
+
+        with app.app_context():
+            otro = Usuario(username='otro', email='otro@example.com', is_admin=False)
+            otro.set_password('x')
+            db.session.add(otro)
+            db.session.commit()
+        client.post('/login', data={'usuario': 'otro', 'contrasena': 'x'})
+        assert client.get(url).status_code == 404
+        assert client.get('/pacientes/obtener_paciente_ajax/999999').status_code == 404
@@ -0,0 +1,85 @@
+# tests/test_planes.py
+"""
+Pruebas de la caché de planes y del contador diario de pacientes
+"""
+
+from datetime import datetime, timedelta
+
+from flask_login import login_user
+
+from clinica import db
+from clinica.decorators.limites import verificar_suscripcion_activa, solo_lectura_si_expirado
+from clinica.instrumentacion import contar_consultas
+from clinica.models import Usuario, Plan, UsuarioPlan, LimiteDiario
+from clinica.services.plan_service import PlanService
+
+
+def _asignar_plan(limite=2, fecha_fin=None):
+    usuario = Usuario.query.filter_by(username='testuser').first()
+    plan = Plan(nombre='basico', limite_pacientes_diario=limite, limite_pacientes_diario_primeros_7_dias=limite)
+    db.session.add(plan)
+    db.session.flush()
+    usuario_plan = UsuarioPlan(usuario_id=usuario.id, plan_id=plan.id, estado='activo',
+                               fecha_fin=fecha_fin or datetime.utcnow() + timedelta(days=30))
+    db.session.add(usuario_plan)
+    db.session.commit()
+    return usuario, usuario_plan
+
+
+class TestPlanCache:
+    """Estado de suscripción en caché y contador atómico"""
+
+    def test_decoradores_sin_consultas_en_caso_comun(self, app, init_database):
+        with app.app_context():
+            usuario, _ = _asignar_plan()
+            vista = verificar_suscripcion_activa(solo_lectura_si_expirado(lambda: 'ok'))
+            with app.test_request_context('/', method='POST'):
+                login_user(usuario)
+                assert vista() == 'ok'
+                PlanService.verificar_limite_diario(usuario.id)
+                # La creación de la fila del día hizo commit; en una petición nueva
+                # el usuario llega cargado por el user_loader
+                db.session.refresh(usuario)
+                with contar_consultas() as consultas:
+                    assert vista() == 'ok'
+                    assert PlanService.verificar_limite_diario(usuario.id)['puede_crear']
+                assert consultas.total == 0
+
+    def test_contador_no_pasa_del_limite(self, app, init_database):
+        with app.app_context():
+            usuario, _ = _asignar_plan(limite=2)
+            resultados = [PlanService.incrementar_contador_paciente(usuario.id) for _ in range(3)]
+            assert [r['exito'] for r in resultados] == [True, True, False]
+            assert resultados[1]['restantes'] == 0
+            assert LimiteDiario.query.filter_by(usuario_id=usuario.id).one().contador_pacientes == 2
+            assert not PlanService.verificar_limite_diario(usuario.id)['puede_crear']
+
+    def test_crear_paciente_reserva_cupo_en_la_misma_transaccion(self, app, init_database):
+        from clinica.models import Paciente
+        from clinica.routes.pacientes_services import crear_paciente_service
+        with app.test_request_context():
+            usuario, _ = _asignar_plan(limite=1)
+            # Lectura en caché hecha antes de crear: sigue diciendo que hay cupo
+            assert PlanService.verificar_limite_diario(usuario.id)['puede_crear']
+            datos = {'primer_nombre': 'Cupo', 'primer_apellido': 'Uno', 'telefono': '3000000000'}
+            primero = crear_paciente_service({**datos, 'documento': '44001122'}, {}, usuario)
+            segundo = crear_paciente_service({**datos, 'documento': '44001123'}, {}, usuario)
+
+            assert primero['success']
+            assert not segundo['success'] and segundo['limite_alcanzado']
+            assert Paciente.query.filter_by(odontologo_id=usuario.id).count() == 1
+            assert LimiteDiario.query.filter_by(usuario_id=usuario.id).one().contador_pacientes == 1
+            assert not PlanService.verificar_limite_diario(usuario.id)['puede_crear']
+
+    def test_cambio_de_plan_invalida_la_cache(self, app, init_database):
+        with app.app_context():
+            usuario, usuario_plan = _asignar_plan()
+            assert not PlanService.obtener_estado_suscripcion(usuario.id).vencido()
+
+            usuario_plan.fecha_fin = datetime.utcnow() - timedelta(days=1)
+            db.session.commit()
+            assert PlanService.obtener_estado_suscripcion(usuario.id).vencido()
+
+            usuario_plan.estado = 'cancelado'
+            db.session.commit()
+            assert PlanService.obtener_estado_suscripcion(usuario.id) is None
@@ -0,0 +1,232 @@
+# tests/test_reportes.py
+"""
+Pruebas para la generación de RIPS
+"""
+
+import io
+import zipfile
+import pytest
+from datetime import datetime, date, time
+import pytz
+from docx import Document
+from clinica.models import Usuario, Paciente, Cita, Factura, Procedimiento, Evolucion, TrabajoExportacion
+from clinica.services import rips_service, exportacion_service
+from clinica import db
+
+
+class TestRips:
+    """Pruebas para la generación de RIPS en streaming"""
+
+    def _sembrar(self, total_facturas):
+        usuario = Usuario.query.filter_by(username='testuser').first()
+        paciente = Paciente(nombres='Ana', apellidos='Gómez', documento='1001', telefono='300',
+                            fecha_nacimiento=date(1990, 1, 1), odontologo_id=usuario.id)
+        db.session.add(paciente)
+        db.session.flush()
+        for i in range(total_facturas):
+            factura = Factura(numero_factura=f'FE-{i}', paciente_id=paciente.id, valor_total=0,
+                              fecha_factura=datetime(2026, 3, 10, 15, 0, tzinfo=pytz.utc))
+            db.session.add(factura)
+            db.session.flush()
+            cita = Cita(paciente_id=paciente.id, fecha=date(2026, 3, 10), hora=time(10, 0),
+                        doctor='Dr. Test', factura_id=factura.id, codigo_consulta_cups='890203')
+            db.session.add(cita)
+            db.session.flush()
+            db.session.add_all([
+                Procedimiento(cita_id=cita.id, codigo_cups='232101', diagnostico_cie10='K02', valor=50000),
+                Procedimiento(cita_id=cita.id, codigo_cups='997002', diagnostico_cie10='K021', valor=30000),
+            ])
+        db.session.commit()
+
+    def test_generar_zip_por_lotes(self, app, init_database, monkeypatch):
+        """Prueba que los archivos y el CT cuadran aunque se procese en varios lotes"""
+        monkeypatch.setattr(rips_service, 'TAMANO_LOTE', 2)
+        with app.app_context():
+            self._sembrar(5)
+            inicio = datetime(2026, 3, 1, tzinfo=pytz.utc)
+            fin = datetime(2026, 4, 1, tzinfo=pytz.utc)
+            prestador = {'codigo_habilitacion': '050012362501', 'nit': '900123456-7', 'nombre': 'CLINICA'}
+
+            salida = rips_service.RipsService.generar_zip(inicio, fin, prestador, '01042026', '01/04/2026')
+            with zipfile.ZipFile(io.BytesIO(salida.read())) as zf:
+                contenido = {nombre: zf.read(nombre).decode('utf-8') for nombre in zf.namelist()}
+
+            assert len(contenido['AF01042026.txt'].split('\n')) == 5
+            assert len(contenido['US01042026.txt'].split('\n')) == 1
+            assert len(contenido['AC01042026.txt'].split('\n')) == 5
+            lineas_ap = contenido['AP01042026.txt'].split('\n')
+            assert len(lineas_ap) == 10
+            assert ',K029,' in lineas_ap[0]
+            # Valor de la factura recalculado con los procedimientos
+            assert contenido['AF01042026.txt'].split('\n')[0].endswith(',80000')
+            assert contenido['CT01042026.txt'].split('\n') == [
+                '050012362501,01/04/2026,AF01042026,5',
+                '050012362501,01/04/2026,US01042026,1',
+                '050012362501,01/04/2026,AC01042026,5',
+                '050012362501,01/04/2026,AP01042026,10',
+            ]
+
+            assert rips_service.RipsService.generar_zip(
+                datetime(2025, 1, 1, tzinfo=pytz.utc), datetime(2025, 2, 1, tzinfo=pytz.utc),
+                prestador, '01042026', '01/04/2026'
+            ) is None
+
+
+class TestTrabajosExportacion:
+    """Pruebas para las exportaciones en segundo plano (síncronas en TESTING)"""
+
+    def test_rips_se_encola_y_se_descarga(self, app, authenticated_client, monkeypatch, tmp_path):
+        """Prueba que el RIPS queda en el historial y se descarga desde el trabajo"""
+        monkeypatch.setitem(app.config, 'EXPORT_DIR', str(tmp_path))
+        with app.app_context():
+            TestRips()._sembrar(3)
+
+        response = authenticated_client.post('/reportes', data={
+            'fecha_inicio': '03/01/2026', 'fecha_fin': '03/31/2026'
+        })
+        assert response.status_code == 302
+
+        with app.app_context():
+            trabajo = TrabajoExportacion.query.one()
+            assert trabajo.estado == 'TERMINADO'
+            assert trabajo.progreso == 100
+            assert trabajo.nombre_archivo == 'RIPS_03-01-2026_al_03-31-2026.zip'
+            trabajo_id = trabajo.id
+
+        estado = authenticated_client.get(f'/trabajos/{trabajo_id}').get_json()
+        assert estado['url_descarga'] == f'/trabajos/{trabajo_id}/descargar'
+
+        descarga = authenticated_client.get(estado['url_descarga'])
+        assert descarga.status_code == 200
+        with zipfile.ZipFile(io.BytesIO(descarga.data)) as zf:
+            archivo_af = next(nombre for nombre in zf.namelist() if nombre.startswith('AF'))
+            assert len(zf.read(archivo_af).decode('utf-8').split('\n')) == 3
+
+        # Historial en la página de reportes
+        assert b'Descargar' in authenticated_client.get('/reportes').data
+
+    def test_periodo_sin_facturas_y_trabajo_ajeno(self, app, authenticated_client, monkeypatch, tmp_path):
+        """Prueba el mensaje sin facturas y que otro usuario no ve el trabajo"""
+        monkeypatch.setitem(app.config, 'EXPORT_DIR', str(tmp_path))
+        authenticated_client.post('/reportes', data={'fecha_inicio': '01/01/2025', 'fecha_fin': '01/31/2025'})
+
+        with app.app_context():
+            trabajo = TrabajoExportacion.query.one()
+            assert trabajo.estado == 'ERROR'
+            assert 'No se encontraron facturas' in trabajo.mensaje
+            trabajo_id = trabajo.id
+
+        authenticated_client.get('/logout')
+        authenticated_client.post('/login', data={'usuario': 'admin', 'contrasena': 'admin123'})
+        assert authenticated_client.get(f'/trabajos/{trabajo_id}').status_code == 404
+
+    def test_exportar_word_paciente(self, app, authenticated_client, monkeypatch, tmp_path):
+        """Prueba la exportación a Word encolada desde la ficha del paciente"""
+        monkeypatch.setitem(app.config, 'EXPORT_DIR', str(tmp_path))
+        with app.app_context():
+            usuario = Usuario.query.filter_by(username='testuser').first()
+            paciente = Paciente(nombres='Ana', apellidos='Gómez', documento='1001', telefono='300',
+                                odontologo_id=usuario.id)
+            db.session.add(paciente)
+            db.session.commit()
+            paciente_id = paciente.id
+
+        response = authenticated_client.post('/trabajos/exportar/word', data={'paciente_id': paciente_id})
+        assert response.status_code == 202
+        datos = response.get_json()
+        assert datos['estado'] == 'TERMINADO'
+        assert datos['nombre_archivo'] == 'Historia_Clinica_1001.docx'
+
+        descarga = authenticated_client.get(datos['url_descarga'])
+        assert descarga.status_code == 200
+        assert descarga.data[:2] == b'PK'
+
+    def _sembrar_historias(self, total, evoluciones_por_paciente=2):
+        usuario = Usuario.query.filter_by(username='testuser').first()
+        pacientes = []
+        for i in range(total):
+            paciente = Paciente(nombres=f'Paciente{i}', apellidos='Lote', documento=f'50{i}', telefono='300',
+                                odontologo_id=usuario.id)
+            db.session.add(paciente)
+            db.session.flush()
+            for j in range(evoluciones_por_paciente):
+                db.session.add(Evolucion(paciente_id=paciente.id, descripcion=f'Control {j}',
+                                         fecha=datetime(2026, 3, 1 + j, 15, 0)))
+            pacientes.append(paciente.id)
+        db.session.commit()
+        return pacientes
+
+    def test_exportacion_masiva_historias(self, app, authenticated_client, monkeypatch, tmp_path):
+        """Prueba el ZIP de historias por lista de IDs, con lotes pequeños"""
+        monkeypatch.setitem(app.config, 'EXPORT_DIR', str(tmp_path))
+        monkeypatch.setattr(exportacion_service, 'TAMANO_LOTE_HISTORIAS', 2)
+        with app.app_context():
+            ids = self._sembrar_historias(5)
+
+        response = authenticated_client.post('/trabajos/exportar/historias',
+                                             data={'paciente_ids': ','.join(map(str, ids[:3]))})
+        assert response.status_code == 202
+        datos = response.get_json()
+        assert datos['estado'] == 'TERMINADO'
+
+        descarga = authenticated_client.get(datos['url_descarga'])
+        with zipfile.ZipFile(io.BytesIO(descarga.data)) as zf:
+            assert sorted(zf.namelist()) == [f'Historia_Clinica_50{i}.docx' for i in range(3)]
+            documento = Document(io.BytesIO(zf.read('Historia_Clinica_500.docx')))
+            evoluciones = [fila.cells[1].text for fila in documento.tables[-1].rows[1:]]
+            assert evoluciones == ['Control 0', 'Control 1']
+
+    def test_historias_en_pool_de_procesos(self, app, init_database):
+        """Prueba que el render en procesos produce los mismos documentos"""
+        with app.app_context():
+            ids = self._sembrar_historias(3, evoluciones_por_paciente=1)
+            salida = exportacion_service.ExportacionService.generar_zip_historias(ids, procesos=2)
+            with zipfile.ZipFile(salida) as zf:
+                assert len(zf.namelist()) == 3
+                assert all(zf.read(nombre)[:2] == b'PK' for nombre in zf.namelist())
+
+
+class TestIngresosAgregados:
+    """Agregados de ingresos mantenidos al guardar facturas"""
+
+    def test_agregados_siguen_a_las_facturas(self, app, init_database):
+        from clinica.models import IngresoDiario, IngresoProcedimientoMensual
+        from clinica.services.ingresos_service import IngresosService
+        with app.app_context():
+            TestRips()._sembrar(3)
+            usuario = Usuario.query.filter_by(username='testuser').first()
+
+            dia = IngresoDiario.query.one()
+            assert (dia.fecha, dia.facturas, dia.total) == (date(2026, 3, 10), 3, 0)
+            procedimientos = {p.codigo_cups: (p.cantidad, p.total) for p in IngresoProcedimientoMensual.query}
+            assert procedimientos == {'232101': (3, 150000), '997002': (3, 90000)}
+
+            # Editar y borrar facturas recalcula solo el día afectado
+            factura = Factura.query.filter_by(numero_factura='FE-0').one()
+            factura.valor_total = 80000
+            db.session.commit()
+            assert IngresosService.total_mes(usuario.id, 2026, 3) == (80000, 3)
+
+            factura = Factura.query.filter_by(numero_factura='FE-1').one()
+            Cita.query.filter_by(factura_id=factura.id).update({'factura_id': None})
+            db.session.delete(factura)
+            db.session.commit()
+            assert IngresosService.total_mes(usuario.id, 2026, 3) == (80000, 2)
+
+            # La reconstrucción completa produce lo mismo que el mantenimiento incremental
+            antes = [(d.fecha, d.facturas, d.total) for d in IngresoDiario.query.order_by(IngresoDiario.fecha)]
+            assert IngresosService.reconstruir() == {'dias': 1, 'procedimientos': 2}
+            assert [(d.fecha, d.facturas, d.total) for d in IngresoDiario.query] == antes
+
+            comparativo = IngresosService.comparativo_anual(usuario.id, 2026)
+            assert comparativo[2]['actual'] == 80000 and comparativo[2]['variacion'] is None
+
+    def test_pagina_ingresos_desde_agregados(self, app, authenticated_client):
+        with app.app_context():
+            TestRips()._sembrar(2)
+        respuesta = authenticated_client.get('/ingresos?anio=2026&mes=3')
+        assert respuesta.status_code == 200
+        html = respuesta.get_data(as_text=True)
+        assert 'FE-0' in html and 'FE-1' in html
+        assert '232101' in html
+        assert '$100,000' in html